@@ -0,0 +1,153 @@
+"""Детерминированный генератор синтетических данных о деревьях для бенчмарков.
+
+Данные строятся порциями по BLOCK_SIZE строк, генератор каждой порции
+инициализируется парой (seed, номер порции). Поэтому любая строка зависит
+только от seed и своего номера: диапазон [start, stop) выдает одни и те же
+значения независимо от того, как его читать, а память ограничена порцией
+даже на масштабе 1e7.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, Optional, Tuple
+from uuid import UUID
+import numpy as np
+from green_platform.core.data_analysis.application.ingest import tree_data_batch
+from green_platform.core.data_analysis.domain.batch_processing import TreeDataBatch
+from green_platform.core.data_analysis.domain.entities import TreeData
+from green_platform.tree_analysis.domain.columnar import TreeColumns
+from green_platform.tree_analysis.domain.entities import TreeAnalysis, TreeCharacteristics
+
+BLOCK_SIZE = 65536
+
+SPECIES = ('Липа мелколистная', 'Береза повислая', 'Клен остролистный', 'Дуб черешчатый',
+           'Ясень обыкновенный', 'Тополь бальзамический', 'Рябина обыкновенная', 'Ель колючая',
+           'Сосна обыкновенная', 'Вяз гладкий', 'Каштан конский', 'Ива белая')
+# Частоты видов убывают как в реальных городских посадках (распределение Ципфа)
+SPECIES_WEIGHTS = 1.0 / np.arange(1, len(SPECIES) + 1)
+SPECIES_WEIGHTS /= SPECIES_WEIGHTS.sum()
+
+# Состояние в терминах core (TreeData) и tree_analysis (TreeCharacteristics)
+HEALTH_STATUSES = ('good', 'fair', 'poor')
+HEALTH_CONDITIONS = ('healthy', 'stressed', 'diseased')
+HEALTH_WEIGHTS = np.array([0.7, 0.2, 0.1])
+
+CENTER = (55.75, 37.62)
+BASE_DATE = datetime(2024, 1, 1)
+
+class SyntheticTrees:
+    """Синтетическая инвентаризация из count деревьев"""
+
+    def __init__(self, count: int, seed: int = 42, center: Tuple[float, float] = CENTER,
+                 spread_deg: float = 0.15):
+        self.count = int(count)
+        self.seed = seed
+        self.center = center
+        self.spread_deg = spread_deg
+
+    def __len__(self) -> int:
+        return self.count
+
+    def tree_id(self, index: int) -> str:
+        return str(UUID(int=(self.seed << 64) | index))
+
+    def _block(self, block: int) -> Dict[str, np.ndarray]:
+        start = block * BLOCK_SIZE
+        n = min(BLOCK_SIZE, self.count - start)
+        rng = np.random.default_rng([self.seed, block])
+        age = rng.integers(5, 120, n)
+        height = np.clip(age * rng.normal(0.25, 0.05, n), 1.0, 45.0)
+        diameter = np.clip(age * rng.normal(0.6, 0.15, n), 2.0, 250.0)
+        biomass = 0.12 * diameter ** 2.4
+        return {
+            'index': np.arange(start, start + n),
+            'species': rng.choice(len(SPECIES), n, p=SPECIES_WEIGHTS).astype(np.int8),
+            'health': rng.choice(len(HEALTH_STATUSES), n, p=HEALTH_WEIGHTS).astype(np.int8),
+            'age': age,
+            'height': height,
+            'diameter': diameter,
+            'crown_density': rng.uniform(0.2, 0.95, n),
+            'latitude': self.center[0] + rng.normal(0.0, self.spread_deg, n),
+            'longitude': self.center[1] + rng.normal(0.0, self.spread_deg * 1.8, n),
+            'biomass': biomass,
+            'co2_absorption': biomass * rng.uniform(0.02, 0.05, n),
+            'days': rng.integers(0, 365, n)
+        }
+
+    def blocks(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Колонки строк [start, stop) порциями не больше BLOCK_SIZE"""
+        stop = self.count if stop is None else min(stop, self.count)
+        for block in range(start // BLOCK_SIZE, (stop + BLOCK_SIZE - 1) // BLOCK_SIZE):
+            data = self._block(block)
+            first = max(start - block * BLOCK_SIZE, 0)
+            last = min(stop - block * BLOCK_SIZE, len(data['index']))
+            yield {name: values[first:last] for name, values in data.items()}
+
+    def arrays(self, start: int = 0, stop: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Все колонки диапазона одним набором массивов"""
+        parts = list(self.blocks(start, stop))
+        return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]} if parts else {}
+
+    def tree_data(self, start: int = 0, stop: Optional[int] = None) -> Iterator[TreeData]:
+        """Сущности core: TreeData"""
+        for data in self.blocks(start, stop):
+            for row in zip(data['index'].tolist(), data['species'].tolist(), data['height'].tolist(),
+                           data['diameter'].tolist(), data['health'].tolist(), data['latitude'].tolist(),
+                           data['longitude'].tolist(), data['days'].tolist()):
+                index, species, height, diameter, health, latitude, longitude, days = row
+                yield TreeData(id=self.tree_id(index), species=SPECIES[species], height=height,
+                               diameter=diameter, health_status=HEALTH_STATUSES[health],
+                               location_coordinates=(latitude, longitude),
+                               last_inspection_date=BASE_DATE + timedelta(days=days))
+
+    def tree_analyses(self, start: int = 0, stop: Optional[int] = None) -> Iterator[TreeAnalysis]:
+        """Сущности tree_analysis: TreeAnalysis с TreeCharacteristics"""
+        for data in self.blocks(start, stop):
+            for row in zip(data['index'].tolist(), data['species'].tolist(), data['height'].tolist(),
+                           data['diameter'].tolist(), data['crown_density'].tolist(), data['age'].tolist(),
+                           data['health'].tolist(), data['latitude'].tolist(), data['longitude'].tolist(),
+                           data['co2_absorption'].tolist(), data['biomass'].tolist(), data['days'].tolist()):
+                (index, species, height, diameter, crown_density, age, health, latitude, longitude,
+                 co2_absorption, biomass, days) = row
+                yield TreeAnalysis(
+                    characteristics=TreeCharacteristics(
+                        height=height, trunk_diameter=diameter, crown_density=crown_density, age=age,
+                        species=SPECIES[species], location_latitude=latitude, location_longitude=longitude,
+                        health_condition=HEALTH_CONDITIONS[health], co2_absorption=co2_absorption,
+                        biomass=biomass),
+                    measurement_date=BASE_DATE + timedelta(days=days),
+                    id=UUID(self.tree_id(index)))
+
+    def tree_columns(self, start: int = 0, stop: Optional[int] = None) -> TreeColumns:
+        """Колоночный набор без создания объектов на каждое дерево"""
+        data = self.arrays(start, stop)
+        return TreeColumns(
+            ids=np.array([self.tree_id(index) for index in data['index'].tolist()], dtype=object),
+            latitude=data['latitude'],
+            longitude=data['longitude'],
+            height=data['height'],
+            trunk_diameter=data['diameter'],
+            crown_density=data['crown_density'],
+            age=data['age'].astype(np.int64),
+            co2_absorption=data['co2_absorption'],
+            biomass=data['biomass'],
+            species=np.array(SPECIES, dtype=object)[data['species']],
+            health_condition=np.array(HEALTH_CONDITIONS, dtype=object)[data['health']],
+            measurement_date=np.datetime64(BASE_DATE, 'us') + data['days'].astype('timedelta64[D]')
+        )
+
+    def batch_payloads(self, start: int = 0, stop: Optional[int] = None) -> Iterator[TreeDataBatch]:
+        """Батчи конвейера tree_data (location хранится как [долгота, широта])"""
+        for tree_data in self.tree_data(start, stop):
+            yield tree_data_batch(tree_data)
+
+    def validation_columns(self, start: int = 0, stop: Optional[int] = None) -> Dict[str, Any]:
+        """Колонки в формате DataValidationService.validate_batch"""
+        data = self.arrays(start, stop)
+        return {
+            'id': np.array([self.tree_id(index) for index in data['index'].tolist()], dtype=object),
+            'species': np.array(SPECIES, dtype=object)[data['species']],
+            'health_status': np.array(HEALTH_STATUSES, dtype=object)[data['health']],
+            'height': data['height'],
+            'diameter': data['diameter'],
+            'latitude': data['latitude'],
+            'longitude': data['longitude']
+        }
@@ -0,0 +1,116 @@
+"""Время импорта и RSS при холодном старте процессов платформы.
+
+Каждый сценарий запускается в отдельном интерпретаторе. Результат выводится
+в JSON; при превышении порогов или загрузке тяжелых библиотек, которые
+сценарию не нужны, код возврата 1.
+
+    python -m benchmarks.startup [--repeat 3] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Библиотеки, которые должны загружаться только при первом использовании
+HEAVY_MODULES = ('sklearn', 'scipy', 'plotly', 'pandas', 'pyarrow', 'torch')
+
+SCENARIOS: Dict[str, str] = {
+    # ASGI-приложение: FastAPI, Django и маршруты API
+    'web': "import green_platform.asgi",
+    # Воркер конвейера батчей: пул обработчиков, репозиторий, метрики, загрузка
+    'worker': (
+        "import green_platform.core.data_analysis.infrastructure.load_balancer.batch_processor_pool\n"
+        "import green_platform.core.data_analysis.infrastructure.database.batch_repository\n"
+        "import green_platform.core.data_analysis.infrastructure.metrics.batch_metrics\n"
+        "import green_platform.core.data_analysis.application.ingest"
+    ),
+    # Сервисы анализа и графиков до первого прогноза и первого графика
+    'analytics': (
+        "import green_platform.tree_analysis.domain.services\n"
+        "import green_platform.visualization.services"
+    ),
+    # Команда manage.py без обращения к базе
+    'manage': (
+        "import django\n"
+        "django.setup()\n"
+        "from django.core.management import call_command\n"
+        "call_command('check', verbosity=0)"
+    ),
+}
+
+# Пороги с запасом относительно замеров на машине разработчика
+THRESHOLDS: Dict[str, Dict[str, float]] = {
+    'web': {'import_seconds': 3.0, 'rss_mb': 160.0},
+    'worker': {'import_seconds': 1.5, 'rss_mb': 80.0},
+    'analytics': {'import_seconds': 0.8, 'rss_mb': 60.0},
+    'manage': {'import_seconds': 2.0, 'rss_mb': 100.0},
+}
+
+_PROBE = """
+import json, os, resource, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'green_platform.settings')
+started = time.perf_counter()
+exec(compile({code!r}, '<scenario>', 'exec'))
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'import_seconds': elapsed,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'heavy_modules': sorted(name for name in {heavy!r} if name in sys.modules)
+}}))
+"""
+
+def measure(name: str) -> Dict[str, Any]:
+    """Один холодный запуск сценария в новом интерпретаторе"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(code=SCENARIOS[name], heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, 'PYTHONPATH': ROOT}
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{completed.stderr}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['wall_seconds'] = wall
+    return result
+
+def run(scenarios: List[str], repeat: int = 3) -> Dict[str, Any]:
+    """Лучший из repeat запусков по каждому сценарию и список нарушений порогов"""
+    results: Dict[str, Any] = {}
+    violations: List[str] = []
+    for name in scenarios:
+        runs = [measure(name) for _ in range(repeat)]
+        best = min(runs, key=lambda item: item['import_seconds'])
+        best['rss_mb'] = min(item['rss_mb'] for item in runs)
+        results[name] = best
+
+        for metric, limit in THRESHOLDS[name].items():
+            if best[metric] > limit:
+                violations.append(f"{name}: {metric} {best[metric]:.2f} > {limit}")
+        if best['heavy_modules']:
+            violations.append(f"{name}: heavy modules imported at startup: {', '.join(best['heavy_modules'])}")
+    return {'python': sys.version.split()[0], 'results': results, 'violations': violations}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS))
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    report = run(args.scenario or list(SCENARIOS), args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(text)
+    print(text)
+    for violation in report['violations']:
+        print(f"REGRESSION {violation}", file=sys.stderr)
+    return 1 if report['violations'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
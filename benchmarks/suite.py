@@ -0,0 +1,294 @@
+"""Набор бенчмарков: загрузка, анализ, графики и репозитории на синтетических данных.
+
+Каждый бенчмарк запускается на масштабах из --scales (не выше своего
+max_scale). Подготовка данных не входит в замер. Результаты выводятся в JSON
+и сравниваются с сохраненным базовым замером по паре (имя, масштаб).
+
+    python -m benchmarks.suite --scales 1e3,1e4 --output results.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --update-baseline benchmarks/baseline.json
+
+Репозитории PostgreSQL замеряются, если задана переменная BENCH_DSN
+(используйте отдельную базу: бенчмарк пишет в data_batches).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import numpy as np
+from green_platform.core.data_analysis.domain.repositories import TreeDataRepository
+from green_platform.core.data_analysis.infrastructure.load_balancer.round_robin import RoundRobinBalancer
+from green_platform.core.data_analysis.infrastructure.memory_repositories import InMemoryTreeDataRepository
+from green_platform.core.data_analysis.infrastructure.metrics.batch_metrics import BatchMetricsCollector
+from green_platform.core.data_analysis.infrastructure.services import TreeDataValidationService
+from green_platform.tree_analysis.domain.entities import AnalysisResult
+from green_platform.tree_analysis.domain.services import (AdvancedDataProcessing, BatchProcessor,
+                                                          StandardDataProcessing, TreeAnalysisService)
+from green_platform.tree_analysis.domain.timeseries import MeasurementRollup
+from green_platform.tree_analysis.infrastructure.memory_repositories import InMemoryAnalysisResultRepository
+from green_platform.visualization.services import CHART_TYPES, VisualizationService
+from .generator import BASE_DATE, SyntheticTrees
+
+DEFAULT_SCALES = (1e3, 1e4, 1e5)
+
+@dataclass
+class Benchmark:
+    """Бенчмарк: setup(масштаб) готовит данные и возвращает замеряемую операцию без аргументов"""
+    name: str
+    setup: Callable[[int], Callable[[], Any]]
+    max_scale: int = 10 ** 7
+    requires: Optional[str] = None  # переменная окружения, без которой бенчмарк пропускается
+
+BENCHMARKS: List[Benchmark] = []
+
+def benchmark(name: str, max_scale: float = 1e7, requires: Optional[str] = None):
+    """Регистрация бенчмарка; декорируемая функция - setup"""
+    def register(setup: Callable[[int], Callable[[], Any]]) -> Callable[[int], Callable[[], Any]]:
+        BENCHMARKS.append(Benchmark(name, setup, int(max_scale), requires))
+        return setup
+    return register
+
+def run_async(coroutine_function: Callable[[], Any]) -> Callable[[], Any]:
+    """Замер асинхронной операции в собственном цикле событий"""
+    loop = asyncio.new_event_loop()
+    return lambda: loop.run_until_complete(coroutine_function())
+
+# Метрики и балансировка
+
+@benchmark('metrics.record_batch_processing', max_scale=1e4)
+def _metrics_record(scale: int) -> Callable[[], Any]:
+    times = np.random.default_rng(0).uniform(0.01, 0.5, scale).tolist()
+
+    def run():
+        collector = BatchMetricsCollector()
+        for index, processing_time in enumerate(times):
+            collector.record_batch_processing(processing_time, index % 10 != 0, 'timeout')
+    return run
+
+@benchmark('balancer.get_next_worker', max_scale=1e6)
+def _balancer_select(scale: int) -> Callable[[], Any]:
+    balancer = RoundRobinBalancer[object]()
+    for index in range(16):
+        balancer.add_worker(object(), str(index))
+
+    def run():
+        for _ in range(scale):
+            balancer.get_next_worker()
+    return run
+
+# Анализ
+
+@benchmark('analysis.process_batch', max_scale=1e6)
+def _process_batch(scale: int) -> Callable[[], Any]:
+    trees = list(SyntheticTrees(scale).tree_analyses())
+    processor = BatchProcessor(StandardDataProcessing())
+    return lambda: processor.process_batch(trees)
+
+@benchmark('analysis.advanced_processing')
+def _advanced_processing(scale: int) -> Callable[[], Any]:
+    data = SyntheticTrees(scale).arrays()
+    features = np.column_stack([data['height'], data['diameter'], data['crown_density'], data['co2_absorption']])
+    strategy = AdvancedDataProcessing()
+    return lambda: strategy.process_data(features)
+
+@benchmark('analysis.create_analysis_result', max_scale=1e6)
+def _create_analysis_result(scale: int) -> Callable[[], Any]:
+    trees = list(SyntheticTrees(scale).tree_analyses())
+    service = TreeAnalysisService(BatchProcessor(StandardDataProcessing()))
+    return lambda: service.create_analysis_result(trees)
+
+@benchmark('validation.validate_batch', max_scale=1e6)
+def _validate_batch(scale: int) -> Callable[[], Any]:
+    columns = SyntheticTrees(scale).validation_columns()
+    service = TreeDataValidationService()
+    return lambda: service.validate_batch(columns)
+
+@benchmark('timeseries.add_columns', max_scale=1e6)
+def _timeseries_add(scale: int) -> Callable[[], Any]:
+    columns = SyntheticTrees(scale).tree_columns()
+    return lambda: MeasurementRollup().add_columns(columns)
+
+@benchmark('timeseries.query', max_scale=1e6)
+def _timeseries_query(scale: int) -> Callable[[], Any]:
+    rollup = MeasurementRollup().add_columns(SyntheticTrees(scale).tree_columns())
+    return lambda: rollup.query('species', 'Липа мелколистная', max_points=300)
+
+# Графики
+
+def _chart_benchmark(chart_type: str) -> None:
+    @benchmark(f'charts.{chart_type}', max_scale=1e5)
+    def setup(scale: int) -> Callable[[], Any]:
+        trees = list(SyntheticTrees(scale).tree_analyses())
+        result = TreeAnalysisService(BatchProcessor(StandardDataProcessing())).create_analysis_result(trees)
+        return lambda: VisualizationService.render_chart(chart_type, result)
+
+for _chart_type in CHART_TYPES:
+    _chart_benchmark(_chart_type)
+
+@benchmark('charts.dashboard', max_scale=1e6)
+def _dashboard(scale: int) -> Callable[[], Any]:
+    columns = SyntheticTrees(scale).tree_columns()
+    return lambda: VisualizationService.build_dashboard(columns, zoom=11)
+
+# Репозитории
+
+def _repository_factory() -> TreeDataRepository:
+    return InMemoryTreeDataRepository()
+
+@benchmark('repository.memory.save', max_scale=1e6)
+def _memory_save(scale: int) -> Callable[[], Any]:
+    trees = list(SyntheticTrees(scale).tree_data())
+
+    async def run():
+        repository = _repository_factory()
+        for tree_data in trees:
+            await repository.save(tree_data)
+    return run_async(run)
+
+@benchmark('repository.memory.get_by_ids', max_scale=1e6)
+def _memory_get_by_ids(scale: int) -> Callable[[], Any]:
+    synthetic = SyntheticTrees(scale)
+    repository = _repository_factory()
+    asyncio.run(_fill(repository, synthetic.tree_data()))
+    tree_ids = [synthetic.tree_id(index) for index in range(0, scale, 2)]
+    return run_async(lambda: repository.get_by_ids(tree_ids))
+
+@benchmark('repository.memory.find_ids', max_scale=1e6)
+def _memory_find_ids(scale: int) -> Callable[[], Any]:
+    repository = _repository_factory()
+    asyncio.run(_fill(repository, SyntheticTrees(scale).tree_data()))
+    return run_async(lambda: repository.find_ids(species='Дуб черешчатый', health_status='good'))
+
+@benchmark('repository.memory.get_results_by_date_range', max_scale=1e6)
+def _memory_results_by_date(scale: int) -> Callable[[], Any]:
+    repository = InMemoryAnalysisResultRepository()
+    # Результаты раз в минуту; запрос выбирает первую десятую часть периода
+    results = [AnalysisResult(trees=[], total_co2_absorption=0.0, average_health_score=0.0, biodiversity_index=0.0,
+                              analysis_date=BASE_DATE + timedelta(minutes=index)) for index in range(scale)]
+    asyncio.run(_fill(repository, results, 'save_result'))
+    end = (BASE_DATE + timedelta(minutes=scale // 10)).isoformat()
+    return run_async(lambda: repository.get_results_by_date_range(BASE_DATE.isoformat(), end))
+
+async def _fill(repository: Any, items, method: str = 'save') -> None:
+    save = getattr(repository, method)
+    for item in items:
+        await save(item)
+
+@benchmark('repository.postgres.create_batches', max_scale=1e6, requires='BENCH_DSN')
+def _postgres_create_batches(scale: int) -> Callable[[], Any]:
+    import asyncpg
+    from green_platform.core.data_analysis.infrastructure.database.batch_repository import BatchRepository
+    from green_platform.core.data_analysis.infrastructure.database.transaction_manager import TransactionManager
+
+    batches = list(SyntheticTrees(scale).batch_payloads())
+    loop = asyncio.new_event_loop()
+    pool = loop.run_until_complete(asyncpg.create_pool(os.environ['BENCH_DSN'], min_size=1, max_size=2))
+    repository = BatchRepository(pool, TransactionManager(pool))
+
+    async def run():
+        for start in range(0, len(batches), 10000):
+            await repository.create_batches(batches[start:start + 10000])
+    return lambda: loop.run_until_complete(run())
+
+@benchmark('repository.postgres.find_tree_ids', max_scale=1e7, requires='BENCH_DSN')
+def _postgres_find_tree_ids(scale: int) -> Callable[[], Any]:
+    import asyncpg
+    from green_platform.core.data_analysis.infrastructure.database.transaction_manager import TransactionManager
+    from green_platform.core.data_analysis.infrastructure.database.tree_repository import TreeRepository
+
+    loop = asyncio.new_event_loop()
+    pool = loop.run_until_complete(asyncpg.create_pool(os.environ['BENCH_DSN'], min_size=1, max_size=2))
+    repository = TreeRepository(pool, TransactionManager(pool))
+    return lambda: loop.run_until_complete(repository.find_tree_ids(species='Дуб черешчатый'))
+
+# Запуск и сравнение
+
+def measure(bench: Benchmark, scale: int, repeat: int = 3) -> Dict[str, Any]:
+    """Лучшее и медианное время repeat запусков после подготовки состояния"""
+    operation = bench.setup(scale)
+    # Прогревочный запуск: ленивые импорты (pandas, plotly) и кэши не попадают в замер
+    operation()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    return {
+        'name': bench.name,
+        'scale': scale,
+        'seconds': best,
+        'median_seconds': statistics.median(timings),
+        'items_per_second': scale / best if best > 0 else None,
+        'repeat': repeat
+    }
+
+def run_suite(scales: Sequence[float] = DEFAULT_SCALES, pattern: Optional[str] = None,
+              repeat: int = 3) -> Dict[str, Any]:
+    """Запуск подходящих бенчмарков; вывод прогресса идет в stderr"""
+    results = []
+    for bench in BENCHMARKS:
+        if pattern and pattern not in bench.name:
+            continue
+        if bench.requires and not os.getenv(bench.requires):
+            continue
+        for scale in sorted(int(value) for value in scales):
+            if scale > bench.max_scale:
+                continue
+            result = measure(bench, scale, repeat)
+            print(f"{bench.name} [{scale}]: {result['seconds']:.4f}s", file=sys.stderr)
+            results.append(result)
+    return {'environment': environment(), 'results': results}
+
+def environment() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> List[Dict[str, Any]]:
+    """Замеры, которые медленнее базовых больше чем на tolerance"""
+    previous = {(item['name'], item['scale']): item['seconds'] for item in baseline.get('results', [])}
+    regressions = []
+    for item in report['results']:
+        before = previous.get((item['name'], item['scale']))
+        if before and item['seconds'] > before * (1 + tolerance):
+            regressions.append({'name': item['name'], 'scale': item['scale'], 'baseline_seconds': before,
+                                'seconds': item['seconds'], 'ratio': item['seconds'] / before})
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default=','.join(f'{scale:g}' for scale in DEFAULT_SCALES),
+                        help='масштабы через запятую, например 1e3,1e4,1e7')
+    parser.add_argument('--filter', help='подстрока имени бенчмарка')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='файл для JSON с результатами')
+    parser.add_argument('--baseline', help='JSON базового замера для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--update-baseline', metavar='PATH', help='сохранить результаты как базовый замер')
+    args = parser.parse_args()
+
+    report = run_suite([float(value) for value in args.scales.split(',')], args.filter, args.repeat)
+    if args.baseline:
+        with open(args.baseline) as handle:
+            report['regressions'] = compare(report, json.load(handle), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    for path in filter(None, (args.output, args.update_baseline)):
+        with open(path, 'w') as handle:
+            handle.write(text)
+    print(text)
+    return 1 if report.get('regressions') else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncpg
+from django.core.asgi import get_asgi_application
+from fastapi import FastAPI, Request
+from starlette.responses import PlainTextResponse
+from starlette.types import Receive, Scope, Send
+from .core.data_analysis.application.api import TreeAnalysisAPI, create_router as analysis_router
+from .core.data_analysis.application.cache import AnalysisResultCache
+from .core.data_analysis.application.ingest import BulkIngestService
+from .core.data_analysis.application.services import TreeAnalysisApplicationService
+from .core.data_analysis.infrastructure.database.batch_repository import BatchRepository
+from .core.data_analysis.infrastructure.database.pool_manager import ANALYTICS, INGEST, READ, PoolManager
+from .core.data_analysis.infrastructure.database.postgres_config import PostgresConfig
+from .core.data_analysis.infrastructure.database.rollups import RollupRepository
+from .core.data_analysis.infrastructure.database.tile_repository import TileRepository
+from .core.data_analysis.infrastructure.database.transaction_manager import TransactionManager
+from .core.data_analysis.infrastructure.database.tree_repository import WARMUP_QUERIES
+from .core.data_analysis.infrastructure.repositories import SQLAnalysisResultRepository, SQLTreeDataRepository
+from .core.data_analysis.infrastructure.services import MLTreeAnalysisService, TreeDataValidationService
+from .visualization.api import VisualizationAPI, create_router as visualization_router
+from .visualization.cache import ChartCache
+from .visualization.tiles import DiskTileCache, TileService
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'green_platform.settings')
+
+django_application = get_asgi_application()
+
+# Запросы горячего пути: их подготовка при старте выполняет разбор на сервере
+# и интроспекцию типов (uuid, point, jsonb) на каждом соединении пула
+WARMUP_STATEMENTS = {
+    READ: WARMUP_QUERIES,
+    INGEST: (
+        """
+        INSERT INTO data_batches (tree_id, data_type, batch_data)
+        VALUES ($1, $2, $3)
+        """,
+    ),
+}
+
+def model_path_from_env() -> str:
+    """Путь к модели из MODEL_PATH; без обученной модели воркер не запускается"""
+    model_path = os.getenv('MODEL_PATH', 'models/tree_health.joblib')
+    if not os.path.isfile(model_path):
+        raise ValueError(f"Model file {model_path!r} not found: set MODEL_PATH to a trained model "
+                         f"(joblib) before starting the ASGI application")
+    return model_path
+
+async def init_connection(connection: asyncpg.Connection) -> None:
+    """Настройка нового соединения: JSON-колонки принимают и возвращают dict"""
+    for type_name in ('json', 'jsonb'):
+        await connection.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads,
+                                        schema='pg_catalog')
+
+class WorkerRoutes:
+    """Маршруты API, собранные текущим запуском lifespan (app.state.routes).
+
+    Роутеры создаются заново при каждом запуске, поэтому второе приложение
+    или повторный запуск lifespan (например, в тестах) не регистрируют
+    маршруты повторно. До старта и после остановки отвечает 503.
+    """
+
+    def __init__(self, app: FastAPI):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        routes = getattr(self.app.state, 'routes', None)
+        if routes is None:
+            await PlainTextResponse('Service is not started', status_code=503)(scope, receive, send)
+            return
+        await routes(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Жизненный цикл воркера: пулы, прогрев и сборка маршрутов до первого запроса"""
+    # Конфигурация проверяется до открытия соединений
+    model_path = model_path_from_env()
+    # Обслуживание выполняется командами manage.py в отдельных процессах
+    pools = PoolManager(PostgresConfig(), workloads=(READ, INGEST, ANALYTICS), init=init_connection)
+    app.state.pools = pools
+    tile_service: Optional[TileService] = None
+    try:
+        await pools.start(WARMUP_STATEMENTS)
+        read_pool, ingest_pool, analytics_pool = pools.pool(READ), pools.pool(INGEST), pools.pool(ANALYTICS)
+
+        analysis_service = MLTreeAnalysisService(model_path)
+        # Загрузка модели (joblib, mmap) выполняется вне цикла событий
+        await asyncio.to_thread(analysis_service.model_registry.warm, analysis_service.model_version)
+
+        tile_cache_dir = os.getenv('TILE_CACHE_DIR')
+        if tile_cache_dir:
+            tile_service = TileService(TileRepository(analytics_pool), DiskTileCache(tile_cache_dir))
+            tile_service.start()
+
+        # Чтения идут через пул чтения, запись версий и результатов - через пул записи
+        writes = TransactionManager(ingest_pool)
+        application_service = TreeAnalysisApplicationService(
+            SQLTreeDataRepository(read_pool, writes),
+            SQLAnalysisResultRepository(read_pool, writes),
+            analysis_service,
+            TreeDataValidationService(),
+            result_cache=AnalysisResultCache()
+        )
+        ingest_service = BulkIngestService(BatchRepository(ingest_pool, writes),
+                                           TreeDataValidationService())
+
+        routes = FastAPI(title='Green Platform')
+        api = TreeAnalysisAPI(application_service, tile_service=tile_service,
+                              ingest_service=ingest_service, rollup_source=RollupRepository(analytics_pool))
+        router = analysis_router()
+        await api.register_routes(router)
+        routes.include_router(router)
+
+        # Групповые результаты анализа в базе не хранятся, поэтому графики
+        # строятся только по снимкам деревьев
+        snapshot_dir = os.getenv('SNAPSHOT_DIR')
+        if snapshot_dir:
+            # pyarrow загружается только при настроенных снимках
+            from .data_processing.snapshots import SnapshotReader
+            visualization_api = VisualizationAPI(chart_cache=ChartCache(disk_dir=os.getenv('CHART_CACHE_DIR')),
+                                                 snapshot_source=SnapshotReader(snapshot_dir))
+            router = visualization_router()
+            await visualization_api.register_routes(router)
+            routes.include_router(router)
+        # Остальные пути (админка, NinjaAPI) обслуживает Django
+        routes.mount('/', django_application)
+        app.state.routes = routes
+        yield
+    finally:
+        app.state.routes = None
+        # Накопленные изменения тайлов низкого зума сбрасываются до закрытия пулов
+        if tile_service is not None:
+            await tile_service.close()
+        await pools.close(timeout=30)
+
+def create_application() -> FastAPI:
+    """ASGI-приложение; маршруты API подключаются при старте lifespan"""
+    # Документация OpenAPI собирается вместе с маршрутами API
+    app = FastAPI(title='Green Platform', lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+    app.state.routes = None
+
+    @app.get('/health/pools')
+    async def pool_metrics(request: Request):
+        """Загрузка и ожидание соединений по пулам"""
+        return request.app.state.pools.get_metrics()
+
+    app.mount('/', WorkerRoutes(app))
+    return app
+
+application = create_application()
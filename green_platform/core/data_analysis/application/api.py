@@ -1,16 +1,44 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+import json
+import tempfile
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Protocol
 from datetime import datetime
 from ..domain.entities import TreeData, AnalysisResult
 from .services import TreeAnalysisApplicationService
+from .ingest import BulkIngestService, CSV, NDJSON
+from ....visualization.tiles import TileService, TILE_MEDIA_TYPE
 
-router = APIRouter(prefix="/api/v1/analysis", tags=["tree-analysis"])
+def create_router() -> APIRouter:
+    """Новый роутер API; маршруты регистрирует register_routes"""
+    return APIRouter(prefix="/api/v1/analysis", tags=["tree-analysis"])
+
+router = create_router()
+
+class BulkAnalyzeRequest(BaseModel):
+    """Запрос пакетного анализа: список ID или фильтр по актуальным данным"""
+    tree_ids: Optional[List[str]] = None
+    species: Optional[str] = None
+    health_status: Optional[str] = None
+    batch_size: int = 500
+
+class RollupSource(Protocol):
+    """Источник сводок по видам и состоянию (например, RollupRepository)"""
+    async def get_species_summary(self) -> List[Dict[str, Any]]: ...
+    async def get_health_distribution(self, species: Optional[str] = None) -> Dict[str, int]: ...
 
 class TreeAnalysisAPI:
     """API для анализа данных о деревьях"""
     
-    def __init__(self, analysis_service: TreeAnalysisApplicationService):
+    def __init__(self, analysis_service: TreeAnalysisApplicationService,
+                 tile_service: Optional[TileService] = None,
+                 ingest_service: Optional[BulkIngestService] = None,
+                 rollup_source: Optional[RollupSource] = None):
         self.analysis_service = analysis_service
+        self.tile_service = tile_service
+        self.ingest_service = ingest_service
+        self.rollup_source = rollup_source
         
     async def register_routes(self, router: APIRouter) -> None:
         """Регистрация маршрутов API"""
@@ -24,6 +52,40 @@ class TreeAnalysisAPI:
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
         
+        if self.ingest_service is not None:
+            @router.post("/trees/bulk")
+            async def add_tree_data_bulk(request: Request):
+                """Потоковая загрузка измерений (application/x-ndjson или text/csv)"""
+                content_type = request.headers.get("content-type", "")
+                fmt = CSV if "csv" in content_type else NDJSON
+
+                # Тело читается и записывается порциями; отчет копится во
+                # временном файле (в памяти до 1 МБ) и отдается после чтения тела
+                report = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+                async for entry in self.ingest_service.ingest(request.stream(), fmt):
+                    report.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+                report.seek(0)
+
+                def stream_report():
+                    with report:
+                        yield from report
+
+                return StreamingResponse(stream_report(), media_type="application/x-ndjson")
+        
+        @router.post("/trees/analyze")
+        async def analyze_trees(request: BulkAnalyzeRequest):
+            """Пакетный анализ деревьев; результаты отдаются потоком NDJSON по мере готовности"""
+            if request.batch_size < 1:
+                raise HTTPException(status_code=400, detail="batch_size must be positive")
+
+            async def stream_results():
+                async for entry in self.analysis_service.analyze_trees(
+                        request.tree_ids, species=request.species,
+                        health_status=request.health_status, batch_size=request.batch_size):
+                    yield json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+
+            return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+        
         @router.post("/trees/{tree_id}/analyze")
         async def analyze_tree(tree_id: str):
             """Запуск анализа дерева"""
@@ -35,6 +97,18 @@ class TreeAnalysisAPI:
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
         
+        if self.rollup_source is not None:
+            @router.get("/summary")
+            async def get_summary(species: Optional[str] = None):
+                """Сводка по видам и состоянию из поддерживаемых таблиц сводок"""
+                summary = await self.rollup_source.get_species_summary()
+                if species is not None:
+                    summary = [item for item in summary if item['species'] == species]
+                return {
+                    "species": summary,
+                    "health_distribution": await self.rollup_source.get_health_distribution(species)
+                }
+        
         @router.get("/trees/{tree_id}/history")
         async def get_analysis_history(tree_id: str):
             """Получение истории анализов дерева"""
@@ -42,4 +116,15 @@ class TreeAnalysisAPI:
                 history = await self.analysis_service.get_tree_analysis_history(tree_id)
                 return history
             except Exception as e:
-                raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+                raise HTTPException(status_code=500, detail=str(e))
+        
+        if self.tile_service is not None:
+            @router.get("/tiles/{z}/{x}/{y}.mvt")
+            async def get_tile(z: int, x: int, y: int):
+                """Векторный тайл карты деревьев"""
+                try:
+                    tile = await self.tile_service.get_tile(z, x, y)
+                except ValueError as e:
+                    raise HTTPException(status_code=404, detail=str(e))
+                return Response(content=tile, media_type=TILE_MEDIA_TYPE,
+                                headers={"Cache-Control": "public, max-age=60"})
\ No newline at end of file
@@ -0,0 +1,184 @@
+import asyncio
+import math
+import pickle
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple
+from ..domain.entities import AnalysisResult
+
+class SharedCacheBackend(Protocol):
+    """Протокол общего для рабочих процессов хранилища (например, Redis)"""
+    async def get(self, key: str) -> Optional[bytes]: ...
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+    async def incr(self, key: str) -> int: ...
+
+@dataclass
+class _CacheEntry:
+    value: AnalysisResult
+    expires_at: float
+    compute_time: float  # длительность расчета, используется для раннего обновления
+
+@dataclass
+class CacheMetrics:
+    """Метрики кэша результатов анализа"""
+    hits: int = 0
+    shared_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0  # запросы, дождавшиеся уже идущего расчета
+    early_refreshes: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+class AnalysisResultCache:
+    """Кэш результатов анализа с ключом (дерево, версия дерева, версия модели).
+
+    Версия дерева - номер его актуальной версии в хранилище (tree_version),
+    поэтому запись новых данных любым путем, включая пакетную загрузку и ETL,
+    меняет ключ без явной инвалидации. Если номер не передан, используется
+    счетчик, увеличиваемый invalidate_tree.
+
+    Локальный уровень - LRU с ограничением числа записей и TTL. Общий уровень
+    (необязательный) позволяет рабочим процессам использовать чужие результаты
+    и хранит счетчик версий деревьев, поэтому запись новых данных в одном
+    процессе инвалидирует кэш во всех. Без общего уровня устаревание в других
+    процессах ограничено TTL.
+
+    От лавины запросов при истечении горячего ключа защищают объединение
+    одновременных промахов в один расчет и вероятностное раннее обновление
+    (XFetch), разносящее обновления разных процессов во времени.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0,
+                 backend: Optional[SharedCacheBackend] = None,
+                 early_refresh_beta: float = 1.0,
+                 serializer: Any = pickle):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.early_refresh_beta = early_refresh_beta
+        self.serializer = serializer
+        self._entries: 'OrderedDict[Tuple[str, int, str], _CacheEntry]' = OrderedDict()
+        self._tree_versions: Dict[str, int] = {}
+        self._inflight: Dict[Tuple[str, int, str], asyncio.Future] = {}
+        self.metrics = CacheMetrics()
+
+    async def get_or_compute(self, tree_id: str, model_version: Optional[str],
+                             compute: Callable[[], Awaitable[Optional[AnalysisResult]]],
+                             tree_version: Optional[int] = None) -> Optional[AnalysisResult]:
+        """Получение результата из кэша или расчет с объединением одновременных промахов"""
+        if tree_version is None:
+            tree_version = await self._tree_version(str(tree_id))
+        key = (str(tree_id), tree_version, str(model_version))
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if not self._should_refresh(entry):
+                self._entries.move_to_end(key)
+                self.metrics.hits += 1
+                return entry.value
+            if key in self._inflight or entry.expires_at > time.monotonic():
+                # Ключ еще действителен: обновление запускается, но ответ не ждет
+                self.metrics.hits += 1
+                if key not in self._inflight:
+                    self.metrics.early_refreshes += 1
+                    self._start_compute(key, compute)
+                return entry.value
+
+        shared = await self._get_shared(key)
+        if shared is not None:
+            self.metrics.shared_hits += 1
+            self._store_local(key, shared, compute_time=0.0)
+            return shared
+
+        if key in self._inflight:
+            self.metrics.coalesced += 1
+            return await asyncio.shield(self._inflight[key])
+
+        self.metrics.misses += 1
+        return await asyncio.shield(self._start_compute(key, compute))
+
+    async def invalidate_tree(self, tree_id: str) -> None:
+        """Инвалидация всех результатов дерева после записи новой версии данных"""
+        tree_id = str(tree_id)
+        if self.backend is not None:
+            self._tree_versions[tree_id] = await self.backend.incr(self._version_key(tree_id))
+        else:
+            self._tree_versions[tree_id] = self._tree_versions.get(tree_id, 0) + 1
+        for key in [key for key in self._entries if key[0] == tree_id]:
+            del self._entries[key]
+        self.metrics.invalidations += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Получение метрик кэша"""
+        lookups = self.metrics.hits + self.metrics.shared_hits + self.metrics.misses
+        return {
+            **self.metrics.__dict__,
+            'size': len(self._entries),
+            'hit_rate': (self.metrics.hits + self.metrics.shared_hits) / lookups if lookups else 0.0
+        }
+
+    def _start_compute(self, key: Tuple[str, int, str],
+                       compute: Callable[[], Awaitable[Optional[AnalysisResult]]]) -> asyncio.Future:
+        future = asyncio.ensure_future(self._compute(key, compute))
+        self._inflight[key] = future
+        future.add_done_callback(lambda done: self._finish_compute(key, done))
+        return future
+
+    def _finish_compute(self, key: Tuple[str, int, str], future: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        # Ошибка фонового обновления не должна теряться с предупреждением asyncio
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Analysis cache refresh failed for {key[0]}: {future.exception()}")
+
+    async def _compute(self, key: Tuple[str, int, str],
+                       compute: Callable[[], Awaitable[Optional[AnalysisResult]]]) -> Optional[AnalysisResult]:
+        invalidations = self._tree_versions.get(key[0], 0)
+        started = time.monotonic()
+        result = await compute()
+        compute_time = time.monotonic() - started
+        # Результат не кэшируется, если дерево успели инвалидировать во время расчета
+        if result is not None and invalidations == self._tree_versions.get(key[0], 0):
+            self._store_local(key, result, compute_time)
+            await self._set_shared(key, result)
+        return result
+
+    def _should_refresh(self, entry: _CacheEntry) -> bool:
+        """Вероятностное раннее обновление: чем ближе истечение, тем выше шанс"""
+        now = time.monotonic()
+        if now >= entry.expires_at:
+            return True
+        jitter = entry.compute_time * self.early_refresh_beta * -math.log(1.0 - random.random())
+        return now + jitter >= entry.expires_at
+
+    def _store_local(self, key: Tuple[str, int, str], value: AnalysisResult, compute_time: float) -> None:
+        self._entries[key] = _CacheEntry(value, time.monotonic() + self.ttl, compute_time)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.metrics.evictions += 1
+
+    async def _tree_version(self, tree_id: str) -> int:
+        if self.backend is not None:
+            raw = await self.backend.get(self._version_key(tree_id))
+            self._tree_versions[tree_id] = int(raw) if raw else 0
+        return self._tree_versions.get(tree_id, 0)
+
+    async def _get_shared(self, key: Tuple[str, int, str]) -> Optional[AnalysisResult]:
+        if self.backend is None:
+            return None
+        raw = await self.backend.get(self._result_key(key))
+        return self.serializer.loads(raw) if raw else None
+
+    async def _set_shared(self, key: Tuple[str, int, str], value: AnalysisResult) -> None:
+        if self.backend is not None:
+            await self.backend.set(self._result_key(key), self.serializer.dumps(value), self.ttl)
+
+    @staticmethod
+    def _version_key(tree_id: str) -> str:
+        return f"tree-analysis:version:{tree_id}"
+
+    @staticmethod
+    def _result_key(key: Tuple[str, int, str]) -> str:
+        return "tree-analysis:result:{}:{}:{}".format(*key)
@@ -0,0 +1,238 @@
+import csv
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol, Sequence, Tuple
+from uuid import UUID
+from ..domain.batch_processing import BatchData, TreeDataBatch
+from ..domain.entities import TreeData
+from ..domain.services import DataValidationService
+from ..domain.validation import TREE_DATA_INGEST_RULES, RuleSet, tree_data_columns
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+
+class BulkBatchWriter(Protocol):
+    """Хранилище батчей с массовой вставкой (например, BatchRepository)"""
+    async def create_batches(self, batches: Sequence[BatchData]) -> int: ...
+
+async def iter_lines(chunks: AsyncIterator[bytes],
+                     max_line_bytes: int = 64 * 1024) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Разбиение потока байтов на строки (номер строки, содержимое).
+
+    Для строки длиннее max_line_bytes возвращается None. Буфер тоже не
+    превышает max_line_bytes: остаток слишком длинной строки пропускается
+    до перевода строки.
+    """
+    buffer = b''
+    number = 0
+    skipping = False
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            number += 1
+            if skipping or len(line) > max_line_bytes:
+                skipping = False
+                yield number, None
+            else:
+                yield number, line.rstrip(b'\r')
+        if len(buffer) > max_line_bytes:
+            buffer = b''
+            skipping = True
+    if skipping:
+        yield number + 1, None
+    elif buffer.strip():
+        yield number + 1, buffer.rstrip(b'\r')
+
+async def iter_csv_records(lines: AsyncIterator[Tuple[int, Optional[bytes]]],
+                           max_record_bytes: int = 64 * 1024) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Объединение строк CSV в записи (номер первой строки, содержимое).
+
+    Перевод строки внутри поля в кавычках (RFC 4180) продолжает запись.
+    Для записи длиннее max_record_bytes или со слишком длинной строкой
+    возвращается None.
+    """
+    parts: List[bytes] = []
+    start = size = 0
+    quoted = dropped = False
+    async for number, line in lines:
+        if not quoted:
+            parts, start, size, dropped = [], number, 0, False
+        if line is None:
+            # Кавычки пропущенной строки неизвестны: запись на ней заканчивается
+            quoted = False
+            yield start, None
+            continue
+        # Экранированная кавычка ("") не меняет четность
+        quoted ^= line.count(b'"') % 2 == 1
+        size += len(line) + 1
+        dropped = dropped or size > max_record_bytes
+        if not dropped:
+            parts.append(line)
+        if not quoted:
+            yield start, None if dropped else b'\n'.join(parts)
+    if quoted:
+        # Незакрытая кавычка в конце потока - ошибка разбора записи
+        yield start, None if dropped else b'\n'.join(parts)
+
+def tree_data_from_record(record: Dict[str, Any]) -> TreeData:
+    """Преобразование записи выгрузки в TreeData с проверкой типов и диапазонов"""
+    if not isinstance(record, dict):
+        raise ValueError("Record must be an object")
+
+    def required(name: str) -> Any:
+        value = record.get(name)
+        if value is None or value == '':
+            raise ValueError(f"Missing field: {name}")
+        return value
+
+    def number(name: str, minimum: float, maximum: float) -> float:
+        try:
+            value = float(required(name))
+        except (TypeError, ValueError):
+            raise ValueError(f"Field {name} must be a number")
+        if not minimum <= value <= maximum:
+            raise ValueError(f"Field {name} out of range [{minimum}, {maximum}]")
+        return value
+
+    tree_id = str(required('id'))
+    try:
+        UUID(tree_id)
+    except ValueError:
+        raise ValueError("Field id must be a UUID")
+
+    if 'location' in record and 'latitude' not in record:
+        location = record['location']
+        if not isinstance(location, (list, tuple)) or len(location) != 2:
+            raise ValueError("Field location must be [latitude, longitude]")
+        record = {**record, 'latitude': location[0], 'longitude': location[1]}
+
+    try:
+        inspected = datetime.fromisoformat(str(required('last_inspection_date')))
+    except ValueError:
+        raise ValueError("Field last_inspection_date must be an ISO date")
+
+    return TreeData(
+        id=tree_id,
+        species=str(required('species')),
+        height=number('height', 0.0, 150.0),
+        diameter=number('diameter', 0.0, 2000.0),
+        health_status=str(required('health_status')),
+        location_coordinates=(number('latitude', -90.0, 90.0), number('longitude', -180.0, 180.0)),
+        last_inspection_date=inspected,
+        notes=record.get('notes') or None
+    )
+
+def tree_data_batch(tree_data: TreeData) -> TreeDataBatch:
+    """Батч конвейера для записи новой версии дерева"""
+    latitude, longitude = tree_data.location_coordinates
+    return TreeDataBatch(UUID(tree_data.id), {
+        'location': [longitude, latitude],  # trees.location хранит point(долгота, широта)
+        'height': tree_data.height,
+        'species': tree_data.species,
+        'health_status': tree_data.health_status,
+        'diameter': tree_data.diameter,
+        'notes': tree_data.notes,
+        # Дата осмотра станет датой создания версии
+        'last_inspection_date': tree_data.last_inspection_date.isoformat()
+    })
+
+class BulkIngestService:
+    """Потоковая загрузка измерений деревьев (NDJSON или CSV).
+
+    Записи проверяются и передаются в конвейер батчей порциями по chunk_size
+    через одну массовую вставку, поэтому память ограничена размером порции,
+    а не размером выгрузки. Ошибки разбора возвращаются по мере обработки строк,
+    ошибки пакетной проверки (с кодами причин) - при записи порции. Порция
+    проверяется правилами rules: по умолчанию повтором считается только
+    запись с тем же id и той же датой осмотра. Поля CSV в кавычках могут
+    содержать переводы строк; ограничение max_line_bytes действует на
+    строку NDJSON и на запись CSV целиком.
+    """
+
+    def __init__(self, batch_writer: BulkBatchWriter,
+                 validation_service: Optional[DataValidationService] = None,
+                 chunk_size: int = 1000, max_line_bytes: int = 64 * 1024,
+                 rules: RuleSet = TREE_DATA_INGEST_RULES):
+        self.batch_writer = batch_writer
+        self.validation_service = validation_service
+        self.rules = rules
+        self.chunk_size = chunk_size
+        self.max_line_bytes = max_line_bytes
+
+    async def ingest(self, chunks: AsyncIterator[bytes], fmt: str = NDJSON) -> AsyncIterator[Dict[str, Any]]:
+        """Загрузка потока; выдает ошибки по строкам и итоговую сводку"""
+        if fmt not in (NDJSON, CSV):
+            raise ValueError(f"Unsupported format: {fmt}")
+
+        pending: List[Tuple[int, TreeData]] = []
+        accepted = rejected = lines = 0
+        header: Optional[List[str]] = None
+
+        records = iter_lines(chunks, self.max_line_bytes)
+        if fmt == CSV:
+            records = iter_csv_records(records, self.max_line_bytes)
+        async for number, line in records:
+            lines = number + line.count(b'\n') if line else number
+            if line is None:
+                rejected += 1
+                yield {'line': number, 'error': f"Line exceeds {self.max_line_bytes} bytes"}
+                continue
+            if not line.strip():
+                continue
+            if fmt == CSV and header is None:
+                header = next(csv.reader([line.decode('utf-8-sig')], strict=True))
+                continue
+
+            try:
+                tree_data = tree_data_from_record(self._parse(line, fmt, header))
+            except (ValueError, UnicodeDecodeError) as e:
+                rejected += 1
+                yield {'line': number, 'error': str(e)}
+                continue
+
+            pending.append((number, tree_data))
+            if len(pending) >= self.chunk_size:
+                written, errors = await self._write_chunk(pending)
+                for entry in errors:
+                    yield entry
+                accepted += written
+                rejected += len(errors)
+                pending = []
+
+        if pending:
+            written, errors = await self._write_chunk(pending)
+            for entry in errors:
+                yield entry
+            accepted += written
+            rejected += len(errors)
+        yield {'summary': True, 'lines': lines, 'accepted': accepted, 'rejected': rejected}
+
+    async def _write_chunk(self, pending: List[Tuple[int, TreeData]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Пакетная проверка порции и массовая вставка прошедших записей"""
+        errors: List[Dict[str, Any]] = []
+        if self.validation_service is not None:
+            checked = self.validation_service.validate_batch(
+                tree_data_columns([tree_data for _, tree_data in pending]), self.rules)
+            for index in checked.rejected_indices:
+                errors.append({'line': pending[index][0], 'error': 'Invalid tree data',
+                               'reasons': checked.reasons_for(index)})
+            pending = [item for item, ok in zip(pending, checked.mask) if ok]
+        batches: List[BatchData] = [tree_data_batch(tree_data) for _, tree_data in pending]
+        written = await self.batch_writer.create_batches(batches) if batches else 0
+        return written, errors
+
+    @staticmethod
+    def _parse(line: bytes, fmt: str, header: Optional[List[str]]) -> Dict[str, Any]:
+        if fmt == NDJSON:
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON: {e.msg}")
+        try:
+            values = next(csv.reader([line.decode('utf-8')], strict=True))
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV: {e}")
+        if len(values) != len(header):
+            raise ValueError(f"Expected {len(header)} columns, got {len(values)}")
+        return dict(zip(header, values))
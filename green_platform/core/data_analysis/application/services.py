@@ -1,7 +1,11 @@
-from typing import List, Optional
+import asyncio
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
 from ..domain.entities import TreeData, AnalysisResult
 from ..domain.repositories import TreeDataRepository, AnalysisResultRepository
 from ..domain.services import TreeAnalysisService, DataValidationService
+from ..domain.validation import analysis_result_columns, tree_data_columns
+from .cache import AnalysisResultCache
 
 class TreeAnalysisApplicationService:
     """Сервис приложения для анализа данных о деревьях"""
@@ -11,15 +15,28 @@ class TreeAnalysisApplicationService:
         tree_repository: TreeDataRepository,
         analysis_repository: AnalysisResultRepository,
         analysis_service: TreeAnalysisService,
-        validation_service: DataValidationService
+        validation_service: DataValidationService,
+        result_cache: Optional[AnalysisResultCache] = None
     ):
         self.tree_repository = tree_repository
         self.analysis_repository = analysis_repository
         self.analysis_service = analysis_service
         self.validation_service = validation_service
+        self.result_cache = result_cache
     
     async def analyze_tree(self, tree_id: str) -> Optional[AnalysisResult]:
-        """Анализ дерева по его ID"""
+        """Анализ дерева по его ID (с кэшированием по версии дерева и модели)"""
+        if self.result_cache is None:
+            return await self._analyze_tree(tree_id)
+        model_version = getattr(self.analysis_service, 'model_version', None)
+        # Номер версии из хранилища учитывает записи в обход этого сервиса (пакеты, ETL)
+        tree_version = await self.tree_repository.get_version_number(tree_id)
+        return await self.result_cache.get_or_compute(
+            tree_id, model_version, lambda: self._analyze_tree(tree_id), tree_version=tree_version
+        )
+    
+    async def _analyze_tree(self, tree_id: str) -> Optional[AnalysisResult]:
+        """Полный цикл анализа: получение, валидация, расчет и сохранение"""
         # Получение данных о дереве
         tree_data = await self.tree_repository.get_by_id(tree_id)
         if not tree_data:
@@ -50,4 +67,69 @@ class TreeAnalysisApplicationService:
         if not self.validation_service.validate_tree_data(tree_data):
             raise ValueError("Invalid tree data")
             
-        await self.tree_repository.save(tree_data)
\ No newline at end of file
+        await self.tree_repository.save(tree_data)
+        if self.result_cache is not None:
+            await self.result_cache.invalidate_tree(tree_data.id)
+    
+    async def analyze_trees(self, tree_ids: Optional[Sequence[str]] = None,
+                            species: Optional[str] = None, health_status: Optional[str] = None,
+                            batch_size: int = 500, concurrency: int = 4) -> AsyncIterator[Dict[str, Any]]:
+        """Пакетный анализ деревьев по списку ID или по фильтру.
+        
+        Деревья загружаются, анализируются и сохраняются порциями по batch_size;
+        одновременно обрабатывается не больше concurrency порций. Результаты
+        по каждому дереву отдаются по мере готовности порций.
+        """
+        if tree_ids is None:
+            tree_ids = await self.tree_repository.find_ids(species, health_status)
+        tree_ids = list(dict.fromkeys(tree_ids))
+        batches = (tree_ids[start:start + batch_size]
+                   for start in range(0, len(tree_ids), batch_size))
+        
+        running = set()
+        try:
+            while True:
+                # Новые порции запускаются только по мере завершения текущих
+                for batch in batches:
+                    running.add(asyncio.ensure_future(self._analyze_batch(batch)))
+                    if len(running) >= concurrency:
+                        break
+                if not running:
+                    break
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for entry in task.result():
+                        yield entry
+        finally:
+            for task in running:
+                task.cancel()
+    
+    async def _analyze_batch(self, tree_ids: List[str]) -> List[Dict[str, Any]]:
+        """Анализ одной порции: один запрос за деревьями, один вызов модели, одна вставка"""
+        try:
+            trees = {tree.id: tree for tree in await self.tree_repository.get_by_ids(tree_ids)}
+            entries = [{'tree_id': tree_id, 'status': 'not_found'} for tree_id in tree_ids if tree_id not in trees]
+            found = [trees[tree_id] for tree_id in tree_ids if tree_id in trees]
+            
+            # Порция проверяется векторно, причины отклонения возвращаются по каждому дереву
+            checked = self.validation_service.validate_batch(tree_data_columns(found))
+            valid = [tree_data for tree_data, ok in zip(found, checked.mask) if ok]
+            for index in checked.rejected_indices:
+                entries.append({'tree_id': found[index].id, 'status': 'invalid', 'error': 'Invalid tree data',
+                                'reasons': checked.reasons_for(index)})
+            
+            results = await self.analysis_service.analyze_trees_health(valid)
+            checked = self.validation_service.validate_results_batch(analysis_result_columns(results))
+            saved = []
+            for index, result in enumerate(results):
+                if checked.mask[index]:
+                    saved.append(result)
+                    entries.append({'tree_id': result.tree_id, 'status': 'completed', 'result': asdict(result)})
+                else:
+                    entries.append({'tree_id': result.tree_id, 'status': 'invalid',
+                                    'error': 'Invalid analysis result', 'reasons': checked.reasons_for(index)})
+            await self.analysis_repository.save_many(saved)
+            return entries
+        except Exception as e:
+            print(f"Error analyzing batch of {len(tree_ids)} trees: {e}")
+            return [{'tree_id': tree_id, 'status': 'failed', 'error': str(e)} for tree_id in tree_ids]
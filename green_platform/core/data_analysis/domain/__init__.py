@@ -6,5 +6,8 @@ from .entities import *
 # Repository interface imports
 from .repositories import *
 
+# Batch validation imports
+from .validation import *
+
 # Domain service imports
 from .services import *
\ No newline at end of file
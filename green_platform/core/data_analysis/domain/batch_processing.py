@@ -1,7 +1,9 @@
 from abc import ABC, abstractmethod
-from typing import Protocol, Dict, Any, TypeVar, Generic
+from dataclasses import dataclass
+from enum import Enum
+from typing import Protocol, Dict, Any, List, Optional, Sequence, TypeVar, Generic
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timezone
 
 T = TypeVar('T')
 
@@ -38,7 +40,10 @@ class TreeDataBatch(BatchData):
             'location': data['location'],
             'height': data['height'],
             'species': data['species'],
-            'health_status': data['health_status']
+            'health_status': data['health_status'],
+            'diameter': data.get('diameter'),
+            'notes': data.get('notes'),
+            'last_inspection_date': data.get('last_inspection_date')
         }
 
 class AnalysisResultBatch(BatchData):
@@ -50,4 +55,52 @@ class AnalysisResultBatch(BatchData):
             'analysis_id': data['analysis_id'],
             'status': data['status'],
             'details': data['details']
-        }
\ No newline at end of file
+        }
+
+class CoalescePolicy(Enum):
+    # Одна версия: каждое поле берется из последнего батча, где оно задано
+    LAST_WRITER_WINS = "last_writer_wins"
+    # Версия на каждый батч, но одной транзакцией и одним выделением номеров
+    KEEP_ALL = "keep_all"
+
+@dataclass
+class CoalescingConfig:
+    """Объединение ожидающих батчей tree_data одного дерева перед записью.
+
+    В группу попадают батчи, созданные не позже window_seconds после
+    обрабатываемого, но не больше max_batches.
+    """
+    window_seconds: float = 5.0
+    policy: CoalescePolicy = CoalescePolicy.LAST_WRITER_WINS
+    max_batches: int = 100
+
+    def __post_init__(self):
+        if self.window_seconds < 0:
+            raise ValueError("window_seconds must not be negative")
+        if self.max_batches < 1:
+            raise ValueError("max_batches must be at least 1")
+
+def inspection_date(payload: Dict[str, Any]) -> Optional[datetime]:
+    """Дата осмотра из данных батча tree_data (ISO-строка); без пояса считается UTC"""
+    value = payload.get('last_inspection_date')
+    if value is None:
+        return None
+    inspected = datetime.fromisoformat(value)
+    return inspected if inspected.tzinfo else inspected.replace(tzinfo=timezone.utc)
+
+def coalesce_tree_data(payloads: Sequence[Dict[str, Any]],
+                       policy: CoalescePolicy = CoalescePolicy.LAST_WRITER_WINS) -> List[Dict[str, Any]]:
+    """Данные версий для записи из батчей tree_data.
+
+    Батчи упорядочиваются по дате осмотра (батчи без даты - в порядке
+    создания перед датированными), поэтому версии пишутся в хронологическом
+    порядке, а при объединении побеждает самый поздний осмотр.
+    """
+    epoch = datetime.min.replace(tzinfo=timezone.utc)
+    payloads = sorted(payloads, key=lambda payload: inspection_date(payload) or epoch)
+    if policy is CoalescePolicy.KEEP_ALL:
+        return [dict(payload) for payload in payloads]
+    merged: Dict[str, Any] = {}
+    for payload in payloads:
+        merged.update((field, value) for field, value in payload.items() if value is not None)
+    return [merged] if merged else []
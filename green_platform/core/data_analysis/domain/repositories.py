@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Sequence
 from .entities import TreeData, AnalysisResult
 
 class TreeDataRepository(ABC):
@@ -19,6 +19,22 @@ class TreeDataRepository(ABC):
     async def get_all(self) -> List[TreeData]:
         """Получить все данные о деревьях"""
         pass
+    
+    async def get_by_ids(self, tree_ids: Sequence[str]) -> List[TreeData]:
+        """Получить данные о нескольких деревьях (реализации выполняют один запрос)"""
+        trees = [await self.get_by_id(tree_id) for tree_id in tree_ids]
+        return [tree for tree in trees if tree is not None]
+    
+    async def get_version_number(self, tree_id: str) -> Optional[int]:
+        """Получить номер актуальной версии дерева (None - дерево не найдено или версии не ведутся)"""
+        return None
+    
+    async def find_ids(self, species: Optional[str] = None,
+                       health_status: Optional[str] = None) -> List[str]:
+        """Получить ID деревьев по фильтру"""
+        return [tree.id for tree in await self.get_all()
+                if (species is None or tree.species == species)
+                and (health_status is None or tree.health_status == health_status)]
 
 class AnalysisResultRepository(ABC):
     """Интерфейс репозитория для работы с результатами анализа"""
@@ -28,6 +44,11 @@ class AnalysisResultRepository(ABC):
         """Сохранить результат анализа"""
         pass
     
+    async def save_many(self, results: Sequence[AnalysisResult]) -> None:
+        """Сохранить несколько результатов анализа (реализации выполняют одну вставку)"""
+        for result in results:
+            await self.save(result)
+    
     @abstractmethod
     async def get_by_tree_id(self, tree_id: str) -> List[AnalysisResult]:
         """Получить все результаты анализа для конкретного дерева"""
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional, Sequence
 from .entities import TreeData, AnalysisResult
+from .validation import (ANALYSIS_RESULT_RULES, TREE_DATA_RULES, BatchValidationResult, Columns,
+                         RuleSet, validate_columns)
 
 class TreeAnalysisService(ABC):
     """Сервис для анализа данных о деревьях"""
@@ -10,6 +12,10 @@ class TreeAnalysisService(ABC):
         """Анализ состояния здоровья дерева"""
         pass
     
+    async def analyze_trees_health(self, trees: Sequence[TreeData]) -> List[AnalysisResult]:
+        """Анализ группы деревьев (реализации выполняют один пакетный вызов модели)"""
+        return [await self.analyze_tree_health(tree_data) for tree_data in trees]
+    
     @abstractmethod
     async def generate_recommendations(self, analysis_result: AnalysisResult) -> List[str]:
         """Генерация рекомендаций по уходу за деревом"""
@@ -23,6 +29,9 @@ class TreeAnalysisService(ABC):
 class DataValidationService(ABC):
     """Сервис для валидации данных"""
     
+    tree_data_rules: RuleSet = TREE_DATA_RULES
+    analysis_result_rules: RuleSet = ANALYSIS_RESULT_RULES
+    
     @abstractmethod
     def validate_tree_data(self, tree_data: TreeData) -> bool:
         """Проверка корректности данных о дереве"""
@@ -31,4 +40,13 @@ class DataValidationService(ABC):
     @abstractmethod
     def validate_analysis_result(self, result: AnalysisResult) -> bool:
         """Проверка корректности результатов анализа"""
-        pass
\ No newline at end of file
+        pass
+    
+    def validate_batch(self, columns: Columns, rules: Optional[RuleSet] = None) -> BatchValidationResult:
+        """Векторная проверка пакета данных о деревьях (колонки или DataFrame)"""
+        return validate_columns(columns, rules or self.tree_data_rules)
+    
+    def validate_results_batch(self, columns: Columns,
+                               rules: Optional[RuleSet] = None) -> BatchValidationResult:
+        """Векторная проверка пакета результатов анализа"""
+        return validate_columns(columns, rules or self.analysis_result_rules)
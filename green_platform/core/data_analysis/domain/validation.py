@@ -0,0 +1,175 @@
+from dataclasses import dataclass, field
+from enum import IntFlag
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, Sequence, Union
+import numpy as np
+from .entities import AnalysisResult, TreeData
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas импортируется при первой проверке: доменный слой загружается
+# каждым процессом, а пакетная валидация нужна не всем
+Columns = Union[Mapping[str, np.ndarray], 'pd.DataFrame']
+
+class ValidationReason(IntFlag):
+    """Причины отклонения записи (битовые флаги, у записи может быть несколько)"""
+    MISSING_ID = 1
+    MISSING_SPECIES = 2
+    NON_POSITIVE_HEIGHT = 4
+    NON_POSITIVE_DIAMETER = 8
+    HEIGHT_OUT_OF_RANGE = 16
+    INVALID_COORDINATES = 32
+    MISSING_HEALTH_STATUS = 64
+    CONFIDENCE_OUT_OF_RANGE = 128
+    MISSING_METRICS = 256
+    MISSING_RECOMMENDATIONS = 512
+    DUPLICATE = 1024
+
+@dataclass
+class ValidationRule:
+    """Правило: векторная проверка, возвращающая маску нарушений"""
+    reason: ValidationReason
+    violations: Callable[[Columns], np.ndarray]
+
+@dataclass
+class RuleSet:
+    """Набор правил валидации"""
+    name: str
+    rules: List[ValidationRule] = field(default_factory=list)
+
+    def without(self, *reasons: ValidationReason) -> 'RuleSet':
+        """Копия набора без правил с указанными причинами"""
+        return RuleSet(self.name, [rule for rule in self.rules if rule.reason not in reasons])
+
+    def with_rules(self, *rules: ValidationRule) -> 'RuleSet':
+        return RuleSet(self.name, self.rules + list(rules))
+
+@dataclass
+class BatchValidationResult:
+    """Результат пакетной валидации: маска корректных строк и коды причин по строкам"""
+    mask: np.ndarray
+    reasons: np.ndarray
+
+    @property
+    def valid_count(self) -> int:
+        return int(self.mask.sum())
+
+    @property
+    def rejected_indices(self) -> np.ndarray:
+        return np.flatnonzero(~self.mask)
+
+    def reasons_for(self, index: int) -> List[str]:
+        """Названия причин отклонения строки"""
+        code = int(self.reasons[index])
+        return [reason.name for reason in ValidationReason if code & reason]
+
+    def reason_counts(self) -> Dict[str, int]:
+        """Число отклоненных строк по каждой причине"""
+        return {reason.name: int(np.count_nonzero(self.reasons & reason))
+                for reason in ValidationReason if np.any(self.reasons & reason)}
+
+def _column(columns: Columns, name: str) -> 'pd.Series':
+    import pandas as pd
+    # Колонки DataFrame не копируются в object-массивы: строковые типы pandas
+    # проверяются быстрее исходных numpy-массивов объектов
+    values = columns[name]
+    return values if isinstance(values, pd.Series) else pd.Series(np.asarray(values), copy=False)
+
+def _numeric(columns: Columns, name: str) -> np.ndarray:
+    import pandas as pd
+    return pd.to_numeric(_column(columns, name), errors='coerce').to_numpy(dtype=np.float64)
+
+def _blank(columns: Columns, name: str) -> np.ndarray:
+    # Пробелы по краям строк убираются при разборе записей, здесь только пропуски и ''
+    values = _column(columns, name)
+    if values.dtype.kind in 'iub':
+        return np.zeros(len(values), dtype=bool)
+    return (values.isna() | values.eq('')).to_numpy(dtype=bool)
+
+def _outside(columns: Columns, name: str, minimum: float, maximum: float) -> np.ndarray:
+    values = _numeric(columns, name)
+    # Сравнение с NaN дает False, поэтому пропуски тоже считаются нарушением
+    return ~((values >= minimum) & (values <= maximum))
+
+def not_positive(name: str) -> Callable[[Columns], np.ndarray]:
+    return lambda columns: ~(_numeric(columns, name) > 0)
+
+def missing(name: str) -> Callable[[Columns], np.ndarray]:
+    return lambda columns: _blank(columns, name)
+
+def out_of_range(name: str, minimum: float, maximum: float) -> Callable[[Columns], np.ndarray]:
+    return lambda columns: _outside(columns, name, minimum, maximum)
+
+def duplicated(*names: str) -> Callable[[Columns], np.ndarray]:
+    """Повторы ключа внутри пакета (первое вхождение считается корректным)"""
+    def check(columns: Columns) -> np.ndarray:
+        import pandas as pd
+        if len(names) > 1:
+            frame = pd.DataFrame({name: _column(columns, name) for name in names})
+            return frame.duplicated(keep='first').to_numpy()
+        # Коды factorize идут в порядке первого появления: строка повторная,
+        # если ее код не больше максимума кодов выше нее. Пропуски (-1) не повторы.
+        codes, _ = pd.factorize(_column(columns, names[0]), use_na_sentinel=True)
+        previous = np.maximum.accumulate(np.concatenate(([-1], codes[:-1])))
+        return (codes <= previous) & (codes >= 0)
+    return check
+
+def invalid_coordinates(columns: Columns) -> np.ndarray:
+    return _outside(columns, 'latitude', -90.0, 90.0) | _outside(columns, 'longitude', -180.0, 180.0)
+
+TREE_DATA_RULES = RuleSet('tree_data', [
+    ValidationRule(ValidationReason.MISSING_ID, missing('id')),
+    ValidationRule(ValidationReason.MISSING_SPECIES, missing('species')),
+    ValidationRule(ValidationReason.MISSING_HEALTH_STATUS, missing('health_status')),
+    ValidationRule(ValidationReason.NON_POSITIVE_HEIGHT, not_positive('height')),
+    ValidationRule(ValidationReason.NON_POSITIVE_DIAMETER, not_positive('diameter')),
+    ValidationRule(ValidationReason.HEIGHT_OUT_OF_RANGE, lambda columns: _numeric(columns, 'height') > 150.0),
+    ValidationRule(ValidationReason.INVALID_COORDINATES, invalid_coordinates),
+    ValidationRule(ValidationReason.DUPLICATE, duplicated('id'))
+])
+
+# При загрузке выгрузок одно дерево может встречаться с разными датами осмотра
+# (история измерений); повтором считается только та же пара (id, дата)
+TREE_DATA_INGEST_RULES = TREE_DATA_RULES.without(ValidationReason.DUPLICATE).with_rules(
+    ValidationRule(ValidationReason.DUPLICATE, duplicated('id', 'last_inspection_date')))
+
+ANALYSIS_RESULT_RULES = RuleSet('analysis_result', [
+    ValidationRule(ValidationReason.MISSING_ID, missing('tree_id')),
+    ValidationRule(ValidationReason.CONFIDENCE_OUT_OF_RANGE, out_of_range('confidence_score', 0.0, 1.0)),
+    ValidationRule(ValidationReason.MISSING_METRICS, lambda columns: ~(_numeric(columns, 'metrics_count') > 0)),
+    ValidationRule(ValidationReason.MISSING_RECOMMENDATIONS,
+                   lambda columns: ~(_numeric(columns, 'recommendations_count') > 0))
+])
+
+def validate_columns(columns: Columns, rules: RuleSet) -> BatchValidationResult:
+    """Векторная проверка пакета записей по набору правил"""
+    import pandas as pd
+    size = len(columns) if isinstance(columns, pd.DataFrame) else len(next(iter(columns.values()), ()))
+    reasons = np.zeros(size, dtype=np.uint32)
+    for rule in rules.rules:
+        reasons[rule.violations(columns)] |= np.uint32(rule.reason)
+    return BatchValidationResult(mask=reasons == 0, reasons=reasons)
+
+def tree_data_columns(trees: Sequence[TreeData]) -> Dict[str, np.ndarray]:
+    """Колонки для validate_columns из списка TreeData"""
+    coordinates = np.array([tree.location_coordinates for tree in trees], dtype=np.float64).reshape(-1, 2)
+    return {
+        'id': np.array([tree.id for tree in trees], dtype=object),
+        'species': np.array([tree.species for tree in trees], dtype=object),
+        'health_status': np.array([tree.health_status for tree in trees], dtype=object),
+        'height': np.array([tree.height for tree in trees], dtype=np.float64),
+        'diameter': np.array([tree.diameter for tree in trees], dtype=np.float64),
+        'latitude': coordinates[:, 0],
+        'longitude': coordinates[:, 1],
+        'last_inspection_date': np.array([tree.last_inspection_date for tree in trees], dtype=object)
+    }
+
+def analysis_result_columns(results: Sequence[AnalysisResult]) -> Dict[str, np.ndarray]:
+    """Колонки для validate_columns из списка AnalysisResult"""
+    return {
+        'tree_id': np.array([result.tree_id for result in results], dtype=object),
+        'confidence_score': np.array([result.confidence_score for result in results], dtype=np.float64),
+        'metrics_count': np.array([len(result.metrics or ()) for result in results], dtype=np.int64),
+        'recommendations_count': np.array([len(result.recommendations or ()) for result in results],
+                                          dtype=np.int64)
+    }
@@ -1,9 +1,10 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from uuid import UUID
 from ...domain.batch_processing import (
     BatchFactory,
     BatchData,
     BatchProcessor,
+    CoalescingConfig,
     TreeDataBatch,
     AnalysisResultBatch
 )
@@ -12,14 +13,15 @@ from .batch_repository import BatchRepository
 class TreeDataBatchFactory(BatchFactory):
     """Фабрика для создания и обработки батчей данных о деревьях"""
     
-    def __init__(self, repository: BatchRepository):
+    def __init__(self, repository: BatchRepository, coalescing: Optional[CoalescingConfig] = None):
         self.repository = repository
+        self.coalescing = coalescing
     
     def create_batch_data(self, tree_id: UUID, data: Dict[str, Any]) -> BatchData:
         return TreeDataBatch(tree_id, data)
     
     def create_processor(self) -> BatchProcessor:
-        return TreeDataBatchProcessor(self.repository)
+        return TreeDataBatchProcessor(self.repository, self.coalescing)
 
 class AnalysisResultBatchFactory(BatchFactory):
     """Фабрика для создания и обработки батчей результатов анализа"""
@@ -34,12 +36,15 @@ class AnalysisResultBatchFactory(BatchFactory):
         return AnalysisResultBatchProcessor(self.repository)
 
 class TreeDataBatchProcessor(BatchProcessor):
-    """Обработчик батчей данных о деревьях"""
+    """Обработчик батчей данных о деревьях; с coalescing объединяет батчи дерева из окна"""
     
-    def __init__(self, repository: BatchRepository):
+    def __init__(self, repository: BatchRepository, coalescing: Optional[CoalescingConfig] = None):
         self.repository = repository
+        self.coalescing = coalescing
     
     async def process(self, batch_id: UUID) -> bool:
+        if self.coalescing is not None:
+            return await self.repository.process_coalesced_tree_data_batch(batch_id, self.coalescing)
         return await self.repository.process_tree_data_batch(batch_id)
 
 class AnalysisResultBatchProcessor(BatchProcessor):
@@ -1,15 +1,21 @@
-from datetime import datetime
-from typing import Optional, List, Dict, Any, Protocol
+import json
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Protocol, Sequence
 from uuid import UUID
 from asyncpg import Pool
 from ...domain.entities import TreeData, AnalysisResult
-from ...domain.batch_processing import BatchData, BatchProcessor, BatchFactory
-from ..transaction import TransactionManager
+from ...domain.batch_processing import (BatchData, BatchProcessor, BatchFactory, CoalescingConfig,
+                                        coalesce_tree_data, inspection_date)
+from ..load_balancer.consistent_hash import slot_sql
+from .rollups import track_rollups
+from .transaction_manager import TransactionManager
 
 class BatchRepositoryProtocol(Protocol):
     """Протокол репозитория для работы с батчами"""
     async def create_batch(self, batch_data: BatchData) -> str: ...
+    async def create_batches(self, batches: Sequence[BatchData]) -> int: ...
     async def get_pending_batches(self, limit: int) -> List[Dict[str, Any]]: ...
+    async def claim_batches(self, slots: Sequence[int], limit: int, stale_after: float) -> List[Dict[str, Any]]: ...
     async def update_batch_status(self, batch_id: UUID, status: str, error_details: Optional[str]) -> bool: ...
     async def cleanup_old_batches(self, days_to_keep: int) -> None: ...
 
@@ -30,6 +36,21 @@ class BatchRepository(BatchRepositoryProtocol):
             """, str(batch_data.tree_id), batch_data.data_type, batch_data.batch_data)
             return batch_id
 
+    async def create_batches(self, batches: Sequence[BatchData]) -> int:
+        """Массовое создание батчей одним запросом"""
+        if not batches:
+            return 0
+        async with self.pool.acquire() as connection:
+            # batch_data передается текстом и приводится к jsonb на стороне сервера
+            result = await connection.execute("""
+                INSERT INTO data_batches (tree_id, data_type, batch_data)
+                SELECT tree_id, data_type, batch_data::jsonb
+                FROM unnest($1::uuid[], $2::varchar[], $3::text[]) AS b(tree_id, data_type, batch_data)
+            """, [str(batch.tree_id) for batch in batches],
+                [batch.data_type for batch in batches],
+                [json.dumps(batch.batch_data) for batch in batches])
+            return int(result.split()[-1])
+
     async def get_pending_batches(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Получение списка необработанных батчей"""
         async with self.pool.acquire() as connection:
@@ -43,6 +64,79 @@ class BatchRepository(BatchRepositoryProtocol):
             """, limit)
             return [dict(row) for row in rows]
 
+    async def claim_batches(self, slots: Sequence[int], limit: int = 10,
+                            stale_after: float = 300.0) -> List[Dict[str, Any]]:
+        """Захват батчей слотов узла с переводом в статус processing.
+
+        Берется только самый ранний незавершенный батч каждого дерева и только
+        если у дерева нет батча в обработке. Обработка, не обновлявшаяся
+        stale_after секунд, считается брошенной: такой батч захватывается
+        заново (с увеличением retry_count) раньше более поздних батчей дерева.
+        Так батчи одного дерева обрабатываются по очереди, даже пока слоты
+        переходят между узлами.
+        """
+        if not slots:
+            return []
+        async with self.pool.acquire() as connection:
+            # Статус перепроверяется после блокировки: батч, захваченный
+            # параллельной транзакцией, пропускается
+            rows = await connection.fetch(f"""
+                WITH first_batch AS (
+                    SELECT DISTINCT ON (c.tree_id) c.batch_id, c.created_at
+                    FROM data_batches c
+                    WHERE (c.status = 'pending'
+                           OR (c.status = 'processing' AND c.updated_at <= NOW() - make_interval(secs => $3)))
+                    AND c.retry_count < 3
+                    AND {slot_sql('c.tree_id')} = ANY($1::int[])
+                    AND NOT EXISTS (
+                        SELECT 1 FROM data_batches p
+                        WHERE p.tree_id = c.tree_id
+                        AND p.status = 'processing'
+                        AND p.updated_at > NOW() - make_interval(secs => $3)
+                    )
+                    ORDER BY c.tree_id, c.created_at
+                ), claimable AS (
+                    SELECT b.batch_id
+                    FROM data_batches b
+                    WHERE b.batch_id IN (SELECT batch_id FROM first_batch)
+                    AND (b.status = 'pending'
+                         OR (b.status = 'processing' AND b.updated_at <= NOW() - make_interval(secs => $3)))
+                    ORDER BY b.created_at
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE data_batches d
+                SET status = 'processing',
+                    retry_count = d.retry_count + CASE WHEN d.status = 'processing' THEN 1 ELSE 0 END
+                FROM claimable
+                WHERE d.batch_id = claimable.batch_id
+                RETURNING d.*
+            """, list(slots), limit, stale_after)
+            return sorted((dict(row) for row in rows), key=lambda row: row['created_at'])
+
+    async def register_worker(self, worker_id: str, weight: int = 1) -> None:
+        """Регистрация узла обработки или продление его heartbeat"""
+        async with self.pool.acquire() as connection:
+            await connection.execute("""
+                INSERT INTO batch_workers (worker_id, weight)
+                VALUES ($1, $2)
+                ON CONFLICT (worker_id) DO UPDATE SET weight = EXCLUDED.weight, heartbeat_at = NOW()
+            """, worker_id, weight)
+
+    async def get_live_workers(self, ttl: float = 30.0) -> Dict[str, int]:
+        """Живые узлы и их веса"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("""
+                SELECT worker_id, weight
+                FROM batch_workers
+                WHERE heartbeat_at > NOW() - make_interval(secs => $1)
+            """, ttl)
+            return {row['worker_id']: row['weight'] for row in rows}
+
+    async def remove_worker(self, worker_id: str) -> None:
+        async with self.pool.acquire() as connection:
+            await connection.execute('DELETE FROM batch_workers WHERE worker_id = $1', worker_id)
+
     async def update_batch_status(self, batch_id: UUID, status: str, error_details: Optional[str] = None) -> bool:
         """Обновление статуса батча"""
         async with self.pool.acquire() as connection:
@@ -58,6 +152,22 @@ class BatchRepository(BatchRepositoryProtocol):
             """, status, error_details, str(batch_id))
             return result == 'UPDATE 1'
 
+    async def update_batches_status(self, batch_ids: Sequence[Any], status: str,
+                                    error_details: Optional[str] = None) -> int:
+        """Обновление статуса нескольких батчей одним запросом"""
+        async with self.pool.acquire() as connection:
+            result = await connection.execute("""
+                UPDATE data_batches
+                SET status = $1,
+                    error_details = $2,
+                    retry_count = CASE
+                        WHEN $1 = 'failed' THEN retry_count + 1
+                        ELSE retry_count
+                    END
+                WHERE batch_id = ANY($3::uuid[])
+            """, status, error_details, list(batch_ids))
+            return int(result.split()[-1])
+
     async def process_tree_data_batch(self, batch_id: UUID) -> bool:
         """Обработка батча с данными о дереве"""
         async with self.transaction_manager.transaction() as connection:
@@ -70,22 +180,27 @@ class BatchRepository(BatchRepositoryProtocol):
                 return False
 
             try:
-                version_id = await connection.fetchval("""
-                    INSERT INTO tree_versions (tree_id, version_number, created_at)
-                    VALUES ($1, (
-                        SELECT COALESCE(MAX(version_number), 0) + 1
-                        FROM tree_versions
-                        WHERE tree_id = $1
-                    ), $2)
-                    RETURNING version_id
-                """, batch['tree_id'], datetime.utcnow())
-
                 tree_data = batch['batch_data']
-                await connection.execute("""
-                    INSERT INTO trees (tree_id, version_id, location, height, species, health_status)
-                    VALUES ($1, $2, $3, $4, $5, $6)
-                """, batch['tree_id'], version_id, tree_data['location'],
-                    tree_data['height'], tree_data['species'], tree_data['health_status'])
+                # Версия датируется осмотром; батчи без даты осмотра - временем обработки
+                inspected = inspection_date(tree_data)
+                async with track_rollups(connection, batch['tree_id']):
+                    version_id = await connection.fetchval("""
+                        INSERT INTO tree_versions (tree_id, version_number, created_at)
+                        VALUES ($1, (
+                            SELECT COALESCE(MAX(version_number), 0) + 1
+                            FROM tree_versions
+                            WHERE tree_id = $1
+                        ), $2)
+                        RETURNING version_id
+                    """, batch['tree_id'], inspected or datetime.utcnow())
+
+                    await connection.execute("""
+                        INSERT INTO trees (tree_id, version_id, location, height, species, health_status,
+                                           diameter, last_inspection_date, notes)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                    """, batch['tree_id'], version_id, tree_data['location'],
+                        tree_data['height'], tree_data['species'], tree_data['health_status'],
+                        tree_data.get('diameter'), inspected, tree_data.get('notes'))
 
                 await self.update_batch_status(batch_id, 'completed')
                 return True
@@ -94,6 +209,100 @@ class BatchRepository(BatchRepositoryProtocol):
                 await self.update_batch_status(batch_id, 'failed', str(e))
                 return False
 
+    async def process_coalesced_tree_data_batch(self, batch_id: UUID,
+                                                config: Optional[CoalescingConfig] = None) -> bool:
+        """Обработка батча с данными о дереве вместе с ожидающими батчами того же дерева.
+
+        Батчи окна блокируются, объединяются по политике config.policy и
+        записываются одной транзакцией; все исходные батчи отмечаются
+        выполненными одним запросом в той же транзакции.
+        """
+        config = config or CoalescingConfig()
+        batch_ids: List[Any] = []
+        try:
+            async with self.transaction_manager.transaction() as connection:
+                batch = await connection.fetchrow("""
+                    SELECT * FROM data_batches
+                    WHERE batch_id = $1 AND data_type = 'tree_data'
+                    FOR UPDATE
+                """, str(batch_id))
+
+                if not batch or batch['status'] == 'completed':
+                    return False
+
+                # Батчи, захваченные другими обработчиками, остаются им
+                rows = await connection.fetch("""
+                    SELECT batch_id, batch_data
+                    FROM data_batches
+                    WHERE tree_id = $1
+                    AND data_type = 'tree_data'
+                    AND status = 'pending'
+                    AND batch_id <> $2
+                    AND created_at >= $3
+                    AND created_at <= $3 + make_interval(secs => $4)
+                    ORDER BY created_at, batch_id
+                    LIMIT $5
+                    FOR UPDATE SKIP LOCKED
+                """, batch['tree_id'], batch['batch_id'], batch['created_at'],
+                    config.window_seconds, config.max_batches - 1)
+
+                batch_ids = [batch['batch_id']] + [row['batch_id'] for row in rows]
+                versions = coalesce_tree_data([batch['batch_data']] + [row['batch_data'] for row in rows],
+                                              config.policy)
+                async with track_rollups(connection, batch['tree_id']):
+                    await self._insert_tree_versions(connection, batch['tree_id'], versions)
+
+                await connection.execute("""
+                    UPDATE data_batches
+                    SET status = 'completed', error_details = NULL
+                    WHERE batch_id = ANY($1::uuid[])
+                """, batch_ids)
+                return True
+
+        except Exception as e:
+            # Транзакция откатана и блокировки сняты: все батчи группы помечаются ошибкой
+            await self.update_batches_status(batch_ids or [str(batch_id)], 'failed', str(e))
+            return False
+
+    async def _insert_tree_versions(self, connection: Any, tree_id: Any,
+                                    versions: Sequence[Dict[str, Any]]) -> None:
+        """Запись нескольких версий дерева с одним выделением номеров версий.
+
+        Версии датируются осмотром, версии без даты осмотра - временем обработки.
+        """
+        if not versions:
+            return
+        now = datetime.utcnow().replace(tzinfo=timezone.utc)
+        inspected = [inspection_date(version) for version in versions]
+        rows = await connection.fetch("""
+            INSERT INTO tree_versions (tree_id, version_number, created_at)
+            SELECT $1, latest.version_number + s.i, s.created_at
+            FROM (
+                SELECT COALESCE(MAX(version_number), 0) AS version_number
+                FROM tree_versions
+                WHERE tree_id = $1
+            ) latest, unnest($2::timestamptz[]) WITH ORDINALITY AS s(created_at, i)
+            RETURNING version_id, version_number
+        """, tree_id, [date or now for date in inspected])
+        version_ids = [row['version_id'] for row in sorted(rows, key=lambda row: row['version_number'])]
+
+        await connection.execute("""
+            INSERT INTO trees (tree_id, version_id, location, height, species, health_status,
+                               diameter, last_inspection_date, notes)
+            SELECT $1, v.version_id, v.location, v.height, v.species, v.health_status,
+                   v.diameter, v.last_inspection_date, v.notes
+            FROM unnest($2::uuid[], $3::point[], $4::numeric[], $5::varchar[], $6::varchar[],
+                        $7::numeric[], $8::timestamptz[], $9::text[])
+                AS v(version_id, location, height, species, health_status, diameter, last_inspection_date, notes)
+        """, tree_id, version_ids,
+            [version['location'] for version in versions],
+            [version['height'] for version in versions],
+            [version['species'] for version in versions],
+            [version['health_status'] for version in versions],
+            [version.get('diameter') for version in versions],
+            inspected,
+            [version.get('notes') for version in versions])
+
     async def process_analysis_result_batch(self, batch_id: UUID) -> bool:
         """Обработка батча с результатами анализа"""
         async with self.transaction_manager.transaction() as connection:
@@ -107,12 +316,14 @@ class BatchRepository(BatchRepositoryProtocol):
 
             try:
                 result_data = batch['batch_data']
-                await connection.execute("""
-                    INSERT INTO analysis_results 
-                    (analysis_id, tree_id, status, details, created_at)
-                    VALUES ($1, $2, $3, $4, $5)
-                """, result_data['analysis_id'], batch['tree_id'],
-                    result_data['status'], result_data['details'], datetime.utcnow())
+                # Новый результат меняет поглощение CO2 дерева в сводках
+                async with track_rollups(connection, batch['tree_id']):
+                    await connection.execute("""
+                        INSERT INTO analysis_results 
+                        (analysis_id, tree_id, status, details, created_at)
+                        VALUES ($1, $2, $3, $4, $5)
+                    """, result_data['analysis_id'], batch['tree_id'],
+                        result_data['status'], result_data['details'], datetime.utcnow())
 
                 await self.update_batch_status(batch_id, 'completed')
                 return True
@@ -16,6 +16,22 @@ CREATE INDEX IF NOT EXISTS idx_data_batches_tree_id ON data_batches(tree_id);
 CREATE INDEX IF NOT EXISTS idx_data_batches_status ON data_batches(status);
 CREATE INDEX IF NOT EXISTS idx_data_batches_created_at ON data_batches(created_at);
 
+-- Слот батча для шардирования по tree_id между узлами (см. load_balancer/consistent_hash.py)
+CREATE INDEX IF NOT EXISTS idx_data_batches_pending_slot
+    ON data_batches ((hashtext(tree_id::text) & 4095), tree_id, created_at)
+    WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_data_batches_processing_tree
+    ON data_batches(tree_id, updated_at)
+    WHERE status = 'processing';
+
+-- Узлы обработки батчей; живыми считаются узлы со свежим heartbeat_at
+CREATE TABLE IF NOT EXISTS batch_workers (
+    worker_id VARCHAR(100) PRIMARY KEY,
+    weight INTEGER NOT NULL DEFAULT 1 CHECK (weight > 0),
+    started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    heartbeat_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
 -- Создание функции для автоматического обновления updated_at
 CREATE OR REPLACE FUNCTION update_batch_updated_at()
 RETURNS TRIGGER AS $$
@@ -22,6 +22,12 @@ CREATE TABLE IF NOT EXISTS trees (
     PRIMARY KEY (tree_id, version_id)
 );
 
+-- Поля TreeData, которые пишет API; строки пакетной загрузки их не заполняют,
+-- дата осмотра тогда берется из версии
+ALTER TABLE trees ADD COLUMN IF NOT EXISTS diameter DECIMAL;
+ALTER TABLE trees ADD COLUMN IF NOT EXISTS last_inspection_date TIMESTAMP WITH TIME ZONE;
+ALTER TABLE trees ADD COLUMN IF NOT EXISTS notes TEXT;
+
 -- Создание индексов для оптимизации запросов
 CREATE INDEX IF NOT EXISTS idx_trees_version_id ON trees(version_id);
 CREATE INDEX IF NOT EXISTS idx_trees_location ON trees USING GIST(location);
@@ -37,6 +43,14 @@ CREATE TABLE IF NOT EXISTS analysis_results (
     created_at TIMESTAMP WITH TIME ZONE NOT NULL
 );
 
+-- Id вставившей транзакции: водяной знак инкрементальных снимков (data_processing/snapshots.py).
+-- В отличие от created_at он не допускает пропуска поздно зафиксированных и задним числом
+-- вставленных строк
+ALTER TABLE tree_versions ADD COLUMN IF NOT EXISTS insert_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS insert_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_tree_versions_insert_xid ON tree_versions(insert_xid);
+CREATE INDEX IF NOT EXISTS idx_analysis_results_insert_xid ON analysis_results(insert_xid);
+
 -- Создание индексов для анализа
 CREATE INDEX IF NOT EXISTS idx_analysis_results_tree_id ON analysis_results(tree_id);
 CREATE INDEX IF NOT EXISTS idx_analysis_results_created_at ON analysis_results(created_at);
@@ -48,20 +62,52 @@ CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 -- Включение расширения для работы с геоданными
 CREATE EXTENSION IF NOT EXISTS postgis;
 
--- Создание функции для очистки старых версий
+-- Создание функции для очистки старых версий одного дерева. Строки trees
+-- ссылаются на tree_versions и удаляются первыми. Для всей таблицы
+-- используется пакетное сжатие (database/version_compaction.py)
 CREATE OR REPLACE FUNCTION cleanup_old_versions(p_tree_id UUID, p_keep_versions INTEGER)
 RETURNS void AS $$
+DECLARE
+    expired UUID[];
 BEGIN
+    SELECT array_agg(version_id) INTO expired
+    FROM (
+        SELECT version_id,
+               ROW_NUMBER() OVER (PARTITION BY tree_id ORDER BY version_number DESC) as rn
+        FROM tree_versions
+        WHERE tree_id = p_tree_id
+    ) ranked
+    WHERE ranked.rn > GREATEST(p_keep_versions, 1);
+
+    IF expired IS NULL THEN
+        RETURN;
+    END IF;
+
+    DELETE FROM trees
+    WHERE tree_id = p_tree_id
+    AND version_id = ANY(expired);
+
     DELETE FROM tree_versions
-    WHERE version_id IN (
-        SELECT version_id
-        FROM (
-            SELECT version_id,
-                   ROW_NUMBER() OVER (PARTITION BY tree_id ORDER BY version_number DESC) as rn
-            FROM tree_versions
-            WHERE tree_id = p_tree_id
-        ) ranked
-        WHERE ranked.rn > p_keep_versions
-    );
+    WHERE version_id = ANY(expired);
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+
+-- Позиции возобновляемых фоновых задач обслуживания (сжатие версий и т.п.)
+CREATE TABLE IF NOT EXISTS maintenance_checkpoints (
+    job_name VARCHAR(100) PRIMARY KEY,
+    position TEXT NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Журнал решений координатора двухфазного коммита (см. two_phase_commit.py).
+-- Координатор записывает commit до второй фазы; восстановление записывает
+-- abort перед откатом транзакции без решения, и первичный ключ не дает
+-- записать второе решение
+CREATE TABLE IF NOT EXISTS two_phase_decisions (
+    transaction_id VARCHAR(64) PRIMARY KEY,
+    participants TEXT[] NOT NULL,
+    outcome VARCHAR(8) NOT NULL DEFAULT 'commit' CHECK (outcome IN ('commit', 'abort')),
+    decided_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    completed_at TIMESTAMP WITH TIME ZONE
+);
+ALTER TABLE two_phase_decisions ADD COLUMN IF NOT EXISTS outcome VARCHAR(8) NOT NULL DEFAULT 'commit';
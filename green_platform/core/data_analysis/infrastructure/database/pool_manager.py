@@ -0,0 +1,237 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+import asyncpg
+from asyncpg import Connection, Pool
+from .postgres_config import PostgresConfig
+
+INGEST = 'ingest'            # запись батчей и данных датчиков
+READ = 'read'                # короткие чтения API
+ANALYTICS = 'analytics'      # сводки, тайлы и тяжелые выборки
+MAINTENANCE = 'maintenance'  # сжатие версий, перестроение сводок
+WORKLOADS = (INGEST, READ, ANALYTICS, MAINTENANCE)
+
+@dataclass
+class PoolMetrics:
+    """Счетчики ожидания соединений пула"""
+    acquires: int = 0
+    timeouts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    health_failures: int = 0
+    recycles: int = 0
+
+    def record_wait(self, seconds: float) -> None:
+        self.acquires += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+class _MeteredAcquire:
+    """Как PoolAcquireContext asyncpg: поддерживает await и async with"""
+
+    def __init__(self, pool: 'MeteredPool', timeout: Optional[float]):
+        self.pool = pool
+        self.timeout = timeout
+        self.connection: Optional[Connection] = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self) -> Connection:
+        self.connection = await self.pool._acquire(self.timeout)
+        return self.connection
+
+    async def __aexit__(self, *exc_info) -> None:
+        connection, self.connection = self.connection, None
+        await self.pool.release(connection)
+
+class MeteredPool:
+    """Пул asyncpg с учетом времени ожидания соединения.
+
+    Передается в репозитории вместо Pool: acquire/release измеряются,
+    остальные методы делегируются пулу.
+    """
+
+    def __init__(self, name: str, pool: Pool, acquire_timeout: Optional[float] = None):
+        self.name = name
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.metrics = PoolMetrics()
+
+    def acquire(self, *, timeout: Optional[float] = None) -> _MeteredAcquire:
+        return _MeteredAcquire(self, timeout if timeout is not None else self.acquire_timeout)
+
+    async def _acquire(self, timeout: Optional[float]) -> Connection:
+        started = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    async def release(self, connection: Connection) -> None:
+        await self._pool.release(connection)
+
+    async def ping(self, timeout: Optional[float] = None) -> bool:
+        """Пробный запрос на свободном соединении; занятый пул не проверяется.
+
+        Соединение берется мимо счетчиков, чтобы проверки не искажали ожидание.
+        """
+        if self._pool.get_idle_size() == 0:
+            return True
+        connection = await self._pool.acquire(timeout=timeout)
+        try:
+            await connection.fetchval('SELECT 1', timeout=timeout)
+        finally:
+            await self._pool.release(connection)
+        return True
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        size, idle = self._pool.get_size(), self._pool.get_idle_size()
+        max_size = self._pool.get_max_size()
+        metrics = self.metrics
+        return {
+            'size': size,
+            'max_size': max_size,
+            'in_use': size - idle,
+            'utilisation': (size - idle) / max_size if max_size else 0.0,
+            'acquires': metrics.acquires,
+            'timeouts': metrics.timeouts,
+            'wait_mean_seconds': metrics.wait_total / metrics.acquires if metrics.acquires else 0.0,
+            'wait_max_seconds': metrics.wait_max,
+            'health_failures': metrics.health_failures,
+            'recycles': metrics.recycles
+        }
+
+class PoolManager:
+    """Отдельные пулы соединений по типам нагрузки из PostgresConfig.
+
+    У каждого пула свой размер и statement_timeout, поэтому долгие
+    аналитические запросы и задачи обслуживания не занимают соединения
+    коротких чтений. Соединения открываются при старте и пересоздаются
+    после POOL_MAX_QUERIES запросов или POOL_RECYCLE_SECONDS простоя;
+    периодическая проверка пересоздает соединения пула после сбоя.
+    """
+
+    def __init__(self, config: Optional[PostgresConfig] = None, workloads: Sequence[str] = WORKLOADS,
+                 init: Optional[Callable[[Connection], Awaitable[None]]] = None,
+                 create_pool: Callable[..., Awaitable[Pool]] = asyncpg.create_pool):
+        self.config = config or PostgresConfig()
+        settings = self.config.get_pool_settings()
+        unknown = set(workloads) - set(settings)
+        if unknown:
+            raise ValueError(f"Unknown workloads: {sorted(unknown)}")
+        # Пул с нулевым размером не создается
+        self.settings = {workload: settings[workload] for workload in workloads if settings[workload]['size'] > 0}
+        total = sum(workload['size'] for workload in self.settings.values())
+        if total > self.config.MAX_CONNECTIONS:
+            raise ValueError(f"Pools need {total} connections, MAX_CONNECTIONS is {self.config.MAX_CONNECTIONS}")
+        self.init = init
+        self._create_pool = create_pool
+        self.pools: Dict[str, MeteredPool] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self, warmup: Optional[Dict[str, Sequence[str]]] = None) -> None:
+        """Открытие всех соединений, подготовка запросов и запуск проверок"""
+        created = await asyncio.gather(*(self._open(workload, settings)
+                                         for workload, settings in self.settings.items()))
+        self.pools = dict(zip(self.settings, created))
+        for workload, statements in (warmup or {}).items():
+            if workload in self.pools:
+                await self.warm(workload, statements)
+        if self.config.POOL_HEALTH_CHECK_INTERVAL > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _open(self, workload: str, settings: Dict[str, Any]) -> MeteredPool:
+        pool = await self._create_pool(
+            dsn=self.config.get_dsn(),
+            min_size=settings['size'],
+            max_size=settings['size'],
+            max_queries=self.config.POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=self.config.POOL_RECYCLE_SECONDS,
+            init=self.init,
+            server_settings={
+                'application_name': f"green_platform:{workload}",
+                'statement_timeout': str(settings['statement_timeout'])
+            }
+        )
+        return MeteredPool(workload, pool, self.config.POOL_ACQUIRE_TIMEOUT)
+
+    def pool(self, workload: str) -> MeteredPool:
+        if workload not in self.pools:
+            raise ValueError(f"Pool {workload} is not started")
+        return self.pools[workload]
+
+    async def warm(self, workload: str, statements: Sequence[str]) -> None:
+        """Подготовка запросов на чтение в кэше запросов каждого соединения пула.
+
+        Connection.prepare не кладет запрос в кэш соединения, который используют
+        fetch/execute репозиториев, поэтому каждый запрос выполняется с
+        NULL-параметрами в транзакции только для чтения.
+        """
+        pool = self.pool(workload)
+
+        async def warm(connection: Connection) -> None:
+            for statement in statements:
+                parameters = max((int(number) for number in re.findall(r'\$(\d+)', statement)), default=0)
+                try:
+                    async with connection.transaction(readonly=True):
+                        await connection.fetch(statement, *([None] * parameters))
+                except asyncpg.PostgresError as e:
+                    print(f"Error preparing warmup statement on {workload} pool: {e}")
+
+        connections = [await pool.acquire() for _ in range(pool.get_size())]
+        try:
+            await asyncio.gather(*(warm(connection) for connection in connections))
+        finally:
+            for connection in connections:
+                await pool.release(connection)
+
+    async def check_health(self) -> Dict[str, bool]:
+        """Пробный запрос в каждом пуле; при сбое соединения пула пересоздаются"""
+        results: Dict[str, bool] = {}
+        for workload, pool in self.pools.items():
+            try:
+                results[workload] = await pool.ping(self.config.POOL_ACQUIRE_TIMEOUT)
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError) as e:
+                print(f"Health check of {workload} pool failed: {e}")
+                pool.metrics.health_failures += 1
+                pool.metrics.recycles += 1
+                await pool.expire_connections()
+                results[workload] = False
+        return results
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.POOL_HEALTH_CHECK_INTERVAL)
+            # Сбой проверки (например, при пересоздании соединений) не останавливает цикл
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"Pool health check failed: {e}")
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Размер, загрузка и ожидание соединений по пулам"""
+        metrics = {workload: pool.get_metrics() for workload, pool in self.pools.items()}
+        for workload, pool_metrics in metrics.items():
+            pool_metrics['statement_timeout'] = self.settings[workload]['statement_timeout']
+        return metrics
+
+    async def close(self, timeout: float = 30.0) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for workload, pool in self.pools.items():
+            try:
+                await asyncio.wait_for(pool.close(), timeout=timeout)
+            except asyncio.TimeoutError:
+                print(f"Timed out closing the {workload} pool, terminating connections")
+                pool.terminate()
+        self.pools = {}
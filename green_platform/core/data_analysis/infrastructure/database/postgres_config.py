@@ -1,5 +1,8 @@
 from typing import Dict, Any
-from pydantic import BaseSettings
+try:
+    from pydantic_settings import BaseSettings
+except ImportError:  # pydantic < 2
+    from pydantic import BaseSettings
 
 class PostgresConfig(BaseSettings):
     """Конфигурация PostgreSQL с поддержкой репликации и двухфазного коммита"""
@@ -9,6 +12,21 @@ class PostgresConfig(BaseSettings):
     MAX_CONNECTIONS: int = 100
     POOL_SIZE: int = 20
     
+    # Пулы по типам нагрузки (pool_manager.py): размер и statement_timeout
+    # в миллисекундах (0 - без ограничения)
+    INGEST_POOL_SIZE: int = 6
+    INGEST_STATEMENT_TIMEOUT: int = 30000
+    READ_POOL_SIZE: int = 10
+    READ_STATEMENT_TIMEOUT: int = 2000
+    ANALYTICS_POOL_SIZE: int = 3
+    ANALYTICS_STATEMENT_TIMEOUT: int = 120000
+    MAINTENANCE_POOL_SIZE: int = 1
+    MAINTENANCE_STATEMENT_TIMEOUT: int = 0
+    POOL_ACQUIRE_TIMEOUT: float = 10.0  # секунды
+    POOL_RECYCLE_SECONDS: float = 1800.0  # простаивающее соединение закрывается
+    POOL_MAX_QUERIES: int = 50000  # соединение пересоздается после стольких запросов
+    POOL_HEALTH_CHECK_INTERVAL: float = 30.0  # секунды, 0 - без проверок
+    
     # Настройки репликации
     REPLICATION_MODE: str = "synchronous"  # synchronous/asynchronous
     STANDBY_SERVERS: list[str] = [
@@ -46,6 +64,16 @@ class PostgresConfig(BaseSettings):
             "synchronous_commit": self.SYNCHRONOUS_COMMIT
         }
     
+    def get_pool_settings(self) -> Dict[str, Dict[str, Any]]:
+        """Получение настроек пулов по типам нагрузки"""
+        return {
+            "ingest": {"size": self.INGEST_POOL_SIZE, "statement_timeout": self.INGEST_STATEMENT_TIMEOUT},
+            "read": {"size": self.READ_POOL_SIZE, "statement_timeout": self.READ_STATEMENT_TIMEOUT},
+            "analytics": {"size": self.ANALYTICS_POOL_SIZE, "statement_timeout": self.ANALYTICS_STATEMENT_TIMEOUT},
+            "maintenance": {"size": self.MAINTENANCE_POOL_SIZE,
+                            "statement_timeout": self.MAINTENANCE_STATEMENT_TIMEOUT}
+        }
+    
     def get_two_phase_commit_settings(self) -> Dict[str, Any]:
         """Получение настроек двухфазного коммита"""
         return {
@@ -0,0 +1,28 @@
+-- Сводки по актуальным версиям деревьев. Обновляются дельтами в транзакциях
+-- записи (database/rollups.py), полностью перестраиваются командой tree_rollups
+
+-- Детальная сводка: вид, состояние, ячейка сетки и день последнего измерения
+CREATE TABLE IF NOT EXISTS tree_rollups (
+    species VARCHAR(100) NOT NULL,
+    health_status VARCHAR(50) NOT NULL,
+    cell_x INTEGER NOT NULL, -- floor(долгота / размер ячейки)
+    cell_y INTEGER NOT NULL, -- floor(широта / размер ячейки)
+    day DATE NOT NULL,
+    tree_count BIGINT NOT NULL DEFAULT 0,
+    height_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    co2_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (species, health_status, cell_x, cell_y, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_tree_rollups_cell ON tree_rollups(cell_x, cell_y);
+CREATE INDEX IF NOT EXISTS idx_tree_rollups_day ON tree_rollups(day);
+
+-- Итоги по виду и состоянию: сводка для дашбордов без обхода детальной таблицы
+CREATE TABLE IF NOT EXISTS tree_rollup_totals (
+    species VARCHAR(100) NOT NULL,
+    health_status VARCHAR(50) NOT NULL,
+    tree_count BIGINT NOT NULL DEFAULT 0,
+    height_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    co2_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (species, health_status)
+);
@@ -0,0 +1,315 @@
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from asyncpg import Connection, Pool
+from .tile_repository import record_tile_changes
+
+CELL_DEGREES = 0.01  # размер ячейки сетки сводок (около 1 км по широте)
+
+# Ключи сводок: детальная (вид, состояние, ячейка, день) и итоговая (вид, состояние)
+RollupKey = Tuple[Any, ...]
+# Значения: число деревьев, сумма высот, сумма поглощения CO2
+RollupValue = Tuple[int, float, float]
+
+# Вклад актуальной версии дерева в сводки; поглощение CO2 берется из
+# последнего результата анализа, как в тайлах карты. Положение дерева
+# нужно для отметки измененных тайлов
+_STATE_COLUMNS = f"""
+    t.species, t.health_status,
+    floor(t.location[0] / {CELL_DEGREES})::int AS cell_x,
+    floor(t.location[1] / {CELL_DEGREES})::int AS cell_y,
+    (v.created_at AT TIME ZONE 'UTC')::date AS day,
+    t.height::float8 AS height,
+    t.location[1] AS latitude, t.location[0] AS longitude
+"""
+
+_LATEST_CO2 = """
+    COALESCE((
+        SELECT (a.details->>'co2_absorption')::float8
+        FROM analysis_results a
+        WHERE a.tree_id = t.tree_id
+        ORDER BY a.created_at DESC
+        LIMIT 1
+    ), 0) AS co2_absorption
+"""
+
+_TREE_STATE = f"""
+    SELECT {_STATE_COLUMNS}, {_LATEST_CO2}
+    FROM trees t
+    JOIN tree_versions v ON t.version_id = v.version_id
+    WHERE t.tree_id = $1
+    ORDER BY v.version_number DESC
+    LIMIT 1
+"""
+
+_TREE_STATES = f"""
+    SELECT DISTINCT ON (t.tree_id) t.tree_id, {_STATE_COLUMNS}, {_LATEST_CO2}
+    FROM trees t
+    JOIN tree_versions v ON t.version_id = v.version_id
+    WHERE t.tree_id = ANY($1::uuid[])
+    ORDER BY t.tree_id, v.version_number DESC
+"""
+
+# Полный пересчет детальной сводки по всем актуальным версиям
+_FRESH_ROLLUPS = f"""
+    WITH latest AS (
+        SELECT DISTINCT ON (t.tree_id) t.tree_id, {_STATE_COLUMNS}
+        FROM trees t
+        JOIN tree_versions v ON t.version_id = v.version_id
+        ORDER BY t.tree_id, v.version_number DESC
+    ), co2 AS (
+        SELECT DISTINCT ON (a.tree_id) a.tree_id, (a.details->>'co2_absorption')::float8 AS co2_absorption
+        FROM analysis_results a
+        ORDER BY a.tree_id, a.created_at DESC
+    )
+    SELECT latest.species, latest.health_status, latest.cell_x, latest.cell_y, latest.day,
+           COUNT(*) AS tree_count, SUM(latest.height) AS height_sum,
+           SUM(COALESCE(co2.co2_absorption, 0)) AS co2_sum
+    FROM latest
+    LEFT JOIN co2 ON co2.tree_id = latest.tree_id
+    GROUP BY latest.species, latest.health_status, latest.cell_x, latest.cell_y, latest.day
+"""
+
+_FRESH_TOTALS = f"""
+    SELECT species, health_status, SUM(tree_count) AS tree_count,
+           SUM(height_sum) AS height_sum, SUM(co2_sum) AS co2_sum
+    FROM ({_FRESH_ROLLUPS}) fresh
+    GROUP BY species, health_status
+"""
+
+_UPSERT_ROLLUPS = """
+    INSERT INTO tree_rollups AS r (species, health_status, cell_x, cell_y, day, tree_count, height_sum, co2_sum)
+    SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::int[], $4::int[], $5::date[],
+                         $6::bigint[], $7::float8[], $8::float8[])
+    ON CONFLICT (species, health_status, cell_x, cell_y, day) DO UPDATE SET
+        tree_count = r.tree_count + EXCLUDED.tree_count,
+        height_sum = r.height_sum + EXCLUDED.height_sum,
+        co2_sum = r.co2_sum + EXCLUDED.co2_sum
+"""
+
+_UPSERT_TOTALS = """
+    INSERT INTO tree_rollup_totals AS r (species, health_status, tree_count, height_sum, co2_sum)
+    SELECT * FROM unnest($1::varchar[], $2::varchar[], $3::bigint[], $4::float8[], $5::float8[])
+    ON CONFLICT (species, health_status) DO UPDATE SET
+        tree_count = r.tree_count + EXCLUDED.tree_count,
+        height_sum = r.height_sum + EXCLUDED.height_sum,
+        co2_sum = r.co2_sum + EXCLUDED.co2_sum
+"""
+
+# Расхождения сводки с пересчетом: строки, которых нет с одной из сторон,
+# или с разными значениями (суммы сравниваются с допуском на округление)
+_MISMATCHES = """
+    SELECT {keys}, COALESCE(stored.tree_count, 0) AS stored_count,
+           COALESCE(fresh.tree_count, 0) AS expected_count,
+           COALESCE(stored.co2_sum, 0) AS stored_co2, COALESCE(fresh.co2_sum, 0) AS expected_co2
+    FROM (SELECT * FROM {table} WHERE tree_count <> 0) stored
+    FULL OUTER JOIN ({fresh}) fresh USING ({keys})
+    WHERE COALESCE(stored.tree_count, 0) <> COALESCE(fresh.tree_count, 0)
+    OR abs(COALESCE(stored.height_sum, 0) - COALESCE(fresh.height_sum, 0)) > 1e-6 * greatest(1, abs(fresh.height_sum))
+    OR abs(COALESCE(stored.co2_sum, 0) - COALESCE(fresh.co2_sum, 0)) > 1e-6 * greatest(1, abs(fresh.co2_sum))
+    ORDER BY {keys}
+"""
+
+_ROLLUP_KEYS = 'species, health_status, cell_x, cell_y, day'
+_TOTAL_KEYS = 'species, health_status'
+
+def rollup_deltas(old: Optional[Dict[str, Any]],
+                  new: Optional[Dict[str, Any]]) -> Dict[RollupKey, RollupValue]:
+    """Изменение детальной сводки при переходе дерева из состояния old в new.
+
+    Состояние - строка _TREE_STATE или None (дерева нет). Нулевые дельты
+    отбрасываются.
+    """
+    deltas: Dict[RollupKey, List[float]] = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        key = (state['species'], state['health_status'], state['cell_x'], state['cell_y'], state['day'])
+        delta = deltas.setdefault(key, [0, 0.0, 0.0])
+        delta[0] += sign
+        delta[1] += sign * float(state['height'])
+        delta[2] += sign * float(state['co2_absorption'] or 0.0)
+    return {key: (int(count), height, co2) for key, (count, height, co2) in deltas.items()
+            if count or height or co2}
+
+def changed_points(old: Optional[Dict[str, Any]],
+                   new: Optional[Dict[str, Any]]) -> List[Tuple[float, float]]:
+    """Положения дерева (широта, долгота) до и после записи, если его состояние изменилось"""
+    if old is not None and new is not None and dict(old) == dict(new):
+        return []
+    return [(state['latitude'], state['longitude']) for state in (old, new) if state is not None]
+
+def total_deltas(deltas: Dict[RollupKey, RollupValue]) -> Dict[RollupKey, RollupValue]:
+    """Дельты итоговой сводки (вид, состояние) из детальных"""
+    totals: Dict[RollupKey, List[float]] = {}
+    for key, values in deltas.items():
+        total = totals.setdefault(key[:2], [0, 0.0, 0.0])
+        for index, value in enumerate(values):
+            total[index] += value
+    return {key: (int(count), height, co2) for key, (count, height, co2) in totals.items()
+            if count or height or co2}
+
+async def apply_rollup_deltas(connection: Connection, deltas: Dict[RollupKey, RollupValue]) -> None:
+    """Применение дельт к обеим сводкам в текущей транзакции.
+
+    Ключи сортируются: параллельные транзакции блокируют строки сводок
+    в одном порядке и не попадают во взаимоблокировку.
+    """
+    if not deltas:
+        return
+    keys = sorted(deltas)
+    await connection.execute(_UPSERT_ROLLUPS, *_columns(keys, deltas, 5))
+    totals = total_deltas(deltas)
+    await connection.execute(_UPSERT_TOTALS, *_columns(sorted(totals), totals, 2))
+
+def _columns(keys: Sequence[RollupKey], deltas: Dict[RollupKey, RollupValue], width: int) -> List[list]:
+    key_columns = [[key[index] for key in keys] for index in range(width)]
+    value_columns = [[deltas[key][index] for key in keys] for index in range(3)]
+    return key_columns + value_columns
+
+@asynccontextmanager
+async def track_rollups(connection: Connection, tree_id: str) -> AsyncIterator[None]:
+    """Обновление сводок и поколений тайлов карты по изменениям дерева внутри блока записи.
+
+    Используется в открытой транзакции: до блока читается прежнее состояние
+    дерева, после - новое, и разница применяется к сводкам той же транзакцией.
+    Тайлы прежнего и нового положения дерева отмечаются измененными.
+    Блокировка по tree_id не дает параллельным записям одного дерева
+    вычислить дельты от одного и того же прежнего состояния.
+    """
+    await connection.execute('SELECT pg_advisory_xact_lock(hashtext($1::text))', str(tree_id))
+    old = await connection.fetchrow(_TREE_STATE, str(tree_id))
+    yield
+    new = await connection.fetchrow(_TREE_STATE, str(tree_id))
+    await apply_rollup_deltas(connection, rollup_deltas(old, new))
+    await record_tile_changes(connection, changed_points(old, new))
+
+@asynccontextmanager
+async def track_rollups_many(connection: Connection, tree_ids: Sequence[str]) -> AsyncIterator[None]:
+    """То же, что track_rollups, для набора деревьев: два запроса состояний на весь набор.
+
+    Блокировки берутся в порядке tree_id, чтобы параллельные записи
+    пересекающихся наборов не попадали во взаимоблокировку.
+    """
+    tree_ids = sorted({str(tree_id) for tree_id in tree_ids})
+    if not tree_ids:
+        yield
+        return
+    await connection.execute("""
+        SELECT pg_advisory_xact_lock(hashtext(id)) FROM unnest($1::text[]) AS id ORDER BY id
+    """, tree_ids)
+    old = {str(row['tree_id']): row for row in await connection.fetch(_TREE_STATES, tree_ids)}
+    yield
+    new = {str(row['tree_id']): row for row in await connection.fetch(_TREE_STATES, tree_ids)}
+    deltas: Dict[RollupKey, List[float]] = {}
+    points: List[Tuple[float, float]] = []
+    for tree_id in tree_ids:
+        points.extend(changed_points(old.get(tree_id), new.get(tree_id)))
+        for key, values in rollup_deltas(old.get(tree_id), new.get(tree_id)).items():
+            total = deltas.setdefault(key, [0, 0.0, 0.0])
+            for index, value in enumerate(values):
+                total[index] += value
+    await apply_rollup_deltas(connection, {key: (int(count), height, co2)
+                                           for key, (count, height, co2) in deltas.items()
+                                           if count or height or co2})
+    await record_tile_changes(connection, points)
+
+class RollupRepository:
+    """Чтение, перестроение и проверка сводок по видам, состоянию, ячейкам и дням.
+
+    Чтение итогов не зависит от числа деревьев: размер сводок ограничен
+    числом сочетаний вида и состояния (а для детальной - ячеек и дней).
+    """
+
+    def __init__(self, pool: Pool):
+        self.pool = pool
+
+    async def get_species_summary(self) -> List[Dict[str, Any]]:
+        """Число деревьев, поглощение CO2, средняя высота и распределение состояний по видам"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("""
+                SELECT species, SUM(tree_count)::bigint AS tree_count, SUM(co2_sum) AS total_co2_absorption,
+                       SUM(height_sum) / NULLIF(SUM(tree_count), 0) AS mean_height,
+                       jsonb_object_agg(health_status, tree_count) AS health_distribution
+                FROM tree_rollup_totals
+                WHERE tree_count > 0
+                GROUP BY species
+                ORDER BY species
+            """)
+            return [dict(row) for row in rows]
+
+    async def get_health_distribution(self, species: Optional[str] = None) -> Dict[str, int]:
+        """Число деревьев по состоянию (всех или одного вида)"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("""
+                SELECT health_status, SUM(tree_count)::bigint AS tree_count
+                FROM tree_rollup_totals
+                WHERE tree_count > 0 AND ($1::text IS NULL OR species = $1)
+                GROUP BY health_status
+            """, species)
+            return {row['health_status']: row['tree_count'] for row in rows}
+
+    async def get_cell_summary(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                               species: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Число деревьев и поглощение CO2 по ячейкам сетки в окне карты"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(f"""
+                SELECT (cell_y + 0.5) * {CELL_DEGREES} AS latitude,
+                       (cell_x + 0.5) * {CELL_DEGREES} AS longitude,
+                       SUM(tree_count)::bigint AS tree_count, SUM(co2_sum) AS total_co2_absorption
+                FROM tree_rollups
+                WHERE cell_x BETWEEN floor($2 / {CELL_DEGREES})::int AND floor($4 / {CELL_DEGREES})::int
+                AND cell_y BETWEEN floor($1 / {CELL_DEGREES})::int AND floor($3 / {CELL_DEGREES})::int
+                AND ($5::text IS NULL OR species = $5)
+                GROUP BY cell_x, cell_y
+                HAVING SUM(tree_count) > 0
+            """, min_lat, min_lon, max_lat, max_lon, species)
+            return [dict(row) for row in rows]
+
+    async def get_daily_summary(self, start_day: date, end_day: date,
+                                species: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Число деревьев по дню последнего измерения (границы включительно)"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch("""
+                SELECT day, SUM(tree_count)::bigint AS tree_count, SUM(co2_sum) AS total_co2_absorption
+                FROM tree_rollups
+                WHERE day BETWEEN $1 AND $2 AND ($3::text IS NULL OR species = $3)
+                GROUP BY day
+                HAVING SUM(tree_count) > 0
+                ORDER BY day
+            """, start_day, end_day, species)
+            return [dict(row) for row in rows]
+
+    async def rebuild(self) -> Dict[str, int]:
+        """Полное перестроение сводок по текущим данным.
+
+        Сводки блокируются до конца транзакции: записи, начатые раньше,
+        применят свои дельты после перестроения поверх его результата.
+        """
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute('LOCK TABLE tree_rollups, tree_rollup_totals IN EXCLUSIVE MODE')
+                await connection.execute('DELETE FROM tree_rollups')
+                await connection.execute('DELETE FROM tree_rollup_totals')
+                rollups = await connection.execute(f"""
+                    INSERT INTO tree_rollups ({_ROLLUP_KEYS}, tree_count, height_sum, co2_sum)
+                    {_FRESH_ROLLUPS}
+                """)
+                totals = await connection.execute(f"""
+                    INSERT INTO tree_rollup_totals ({_TOTAL_KEYS}, tree_count, height_sum, co2_sum)
+                    SELECT {_TOTAL_KEYS}, SUM(tree_count), SUM(height_sum), SUM(co2_sum)
+                    FROM tree_rollups
+                    GROUP BY {_TOTAL_KEYS}
+                """)
+        return {'tree_rollups': int(rollups.split()[-1]), 'tree_rollup_totals': int(totals.split()[-1])}
+
+    async def check(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Сравнение сводок с пересчетом по исходным таблицам; пустые списки - сводки согласованы"""
+        async with self.pool.acquire() as connection:
+            async with connection.transaction(isolation='repeatable_read', readonly=True):
+                rollups = await connection.fetch(_MISMATCHES.format(
+                    keys=_ROLLUP_KEYS, table='tree_rollups', fresh=_FRESH_ROLLUPS))
+                totals = await connection.fetch(_MISMATCHES.format(
+                    keys=_TOTAL_KEYS, table='tree_rollup_totals', fresh=_FRESH_TOTALS))
+        return {'tree_rollups': [dict(row) for row in rollups],
+                'tree_rollup_totals': [dict(row) for row in totals]}
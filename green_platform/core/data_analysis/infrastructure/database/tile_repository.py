@@ -0,0 +1,136 @@
+import math
+from typing import Iterable, Tuple
+from asyncpg import Connection, Pool
+from .....visualization.tiles import AGGREGATE_MAX_ZOOM, MAX_ZOOM, tile_for_point
+
+TILE_EXTENT = 4096  # размер тайла во внутренних координатах MVT
+TILE_BUFFER = 64
+
+# Актуальные версии деревьев в прямоугольнике тайла; отбор по
+# t.location <@ box использует GIST-индекс idx_trees_location.
+# Колонка location хранит point(долгота, широта).
+_TILE_TREES = f"""
+    SELECT t.tree_id::text AS tree_id, t.species, t.health_status,
+           t.height::float8 AS height,
+           (
+               SELECT (a.details->>'co2_absorption')::float8
+               FROM analysis_results a
+               WHERE a.tree_id = t.tree_id
+               ORDER BY a.created_at DESC
+               LIMIT 1
+           ) AS co2_absorption,
+           ST_AsMVTGeom(
+               ST_Transform(ST_SetSRID(t.location::geometry, 4326), 3857),
+               ST_TileEnvelope($1, $2, $3), {TILE_EXTENT}, {TILE_BUFFER}, true
+           ) AS geom
+    FROM trees t
+    JOIN tree_versions v ON t.version_id = v.version_id
+    WHERE t.location <@ box(point($4, $5), point($6, $7))
+    AND v.version_number = (
+        SELECT MAX(version_number) FROM tree_versions WHERE tree_id = t.tree_id
+    )
+"""
+
+# Поколения тайлов с отдельными деревьями увеличиваются в транзакции записи.
+# Тайлы кластеров покрывают тысячи деревьев, и обновление их строк в каждой
+# записи сделало бы их точкой конкуренции: изменения отмечаются на
+# AGGREGATE_MAX_ZOOM и переводятся в поколения всех низких зумов при сбросе
+_BUMP_GENERATIONS = """
+    INSERT INTO tile_generations AS g (z, x, y)
+    SELECT * FROM unnest($1::smallint[], $2::int[], $3::int[])
+    ON CONFLICT (z, x, y) DO UPDATE SET generation = g.generation + 1
+"""
+
+_MARK_AGGREGATE_CHANGES = """
+    INSERT INTO tile_aggregate_changes (x, y)
+    SELECT * FROM unnest($1::int[], $2::int[])
+    ON CONFLICT DO NOTHING
+"""
+
+# Параллельные сбросы забирают разные строки изменений (DELETE ... RETURNING)
+_FLUSH_AGGREGATE_CHANGES = f"""
+    WITH changed AS (
+        DELETE FROM tile_aggregate_changes RETURNING x, y
+    )
+    INSERT INTO tile_generations AS g (z, x, y)
+    SELECT DISTINCT z, changed.x >> ({AGGREGATE_MAX_ZOOM} - z), changed.y >> ({AGGREGATE_MAX_ZOOM} - z)
+    FROM changed CROSS JOIN generate_series(0, {AGGREGATE_MAX_ZOOM}) AS z
+    ORDER BY 1, 2, 3
+    ON CONFLICT (z, x, y) DO UPDATE SET generation = g.generation + 1
+"""
+
+async def record_tile_changes(connection: Connection, points: Iterable[Tuple[float, float]]) -> None:
+    """Отметка изменений тайлов, содержащих точки (широта, долгота), в текущей транзакции.
+
+    Ключи сортируются, чтобы параллельные записи блокировали строки
+    поколений в одном порядке.
+    """
+    points = set(points)
+    if not points:
+        return
+    tiles = sorted({(z, *tile_for_point(latitude, longitude, z))
+                    for latitude, longitude in points for z in range(AGGREGATE_MAX_ZOOM + 1, MAX_ZOOM + 1)})
+    await connection.execute(_BUMP_GENERATIONS, *(list(column) for column in zip(*tiles)))
+    changed = sorted({tile_for_point(latitude, longitude, AGGREGATE_MAX_ZOOM) for latitude, longitude in points})
+    await connection.execute(_MARK_AGGREGATE_CHANGES, *(list(column) for column in zip(*changed)))
+
+def _tile_box(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Прямоугольник тайла с буфером в градусах: (min_lon, min_lat, max_lon, max_lat)"""
+    n = 1 << z
+    buffer = TILE_BUFFER / TILE_EXTENT
+
+    def latitude(row: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    min_lon = max((x - buffer) / n * 360.0 - 180.0, -180.0)
+    max_lon = min((x + 1 + buffer) / n * 360.0 - 180.0, 180.0)
+    return min_lon, latitude(min(y + 1 + buffer, n)), max_lon, latitude(max(y - buffer, 0))
+
+class TileRepository:
+    """Рендер векторных тайлов деревьев (Mapbox Vector Tile) средствами PostGIS и их поколения"""
+
+    def __init__(self, pool: Pool, cluster_grid: int = 64):
+        self.pool = pool
+        self.cluster_grid = cluster_grid  # шаг кластеризации во внутренних координатах тайла
+
+    async def render_point_tile(self, z: int, x: int, y: int) -> bytes:
+        """Тайл с отдельными деревьями (вид, состояние, высота, поглощение CO2)"""
+        async with self.pool.acquire() as connection:
+            data = await connection.fetchval(f"""
+                SELECT ST_AsMVT(tile, 'trees', {TILE_EXTENT}, 'geom')
+                FROM ({_TILE_TREES}) tile
+                WHERE tile.geom IS NOT NULL
+            """, z, x, y, *_tile_box(z, x, y))
+            return bytes(data or b'')
+
+    async def render_aggregate_tile(self, z: int, x: int, y: int) -> bytes:
+        """Тайл с кластерами деревьев: число, сумма CO2, средняя высота, преобладающий вид"""
+        async with self.pool.acquire() as connection:
+            data = await connection.fetchval(f"""
+                SELECT ST_AsMVT(tile, 'tree_clusters', {TILE_EXTENT}, 'geom')
+                FROM (
+                    SELECT ST_Centroid(ST_Collect(trees.geom)) AS geom,
+                           COUNT(*) AS tree_count,
+                           COALESCE(SUM(trees.co2_absorption), 0) AS co2_absorption,
+                           AVG(trees.height) AS mean_height,
+                           MODE() WITHIN GROUP (ORDER BY trees.species) AS dominant_species
+                    FROM ({_TILE_TREES}) trees
+                    WHERE trees.geom IS NOT NULL
+                    GROUP BY ST_SnapToGrid(trees.geom, $8, $8)
+                ) tile
+            """, z, x, y, *_tile_box(z, x, y), float(self.cluster_grid))
+            return bytes(data or b'')
+
+    async def get_generation(self, z: int, x: int, y: int) -> int:
+        """Поколение тайла (0 - деревья в нем не менялись)"""
+        async with self.pool.acquire() as connection:
+            generation = await connection.fetchval("""
+                SELECT generation FROM tile_generations WHERE z = $1 AND x = $2 AND y = $3
+            """, z, x, y)
+            return generation or 0
+
+    async def flush_aggregate_changes(self) -> int:
+        """Новые поколения тайлов низкого зума по накопленным изменениям; число тайлов"""
+        async with self.pool.acquire() as connection:
+            status = await connection.execute(_FLUSH_AGGREGATE_CHANGES)
+            return int(status.split()[-1])
@@ -0,0 +1,19 @@
+-- Поколения тайлов карты (visualization/tiles.py). Обновляются в транзакциях
+-- записи деревьев (database/rollups.py), общие для всех процессов
+
+-- Поколение тайла: кэш тайлов хранит рендер под номером поколения
+CREATE TABLE IF NOT EXISTS tile_generations (
+    z SMALLINT NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    generation BIGINT NOT NULL DEFAULT 1,
+    PRIMARY KEY (z, x, y)
+);
+
+-- Тайлы зума AGGREGATE_MAX_ZOOM с изменениями, еще не переведенными в
+-- поколения тайлов кластеров (сбрасываются периодически TileService)
+CREATE TABLE IF NOT EXISTS tile_aggregate_changes (
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    PRIMARY KEY (x, y)
+);
@@ -1,10 +1,85 @@
-from typing import List, Optional, Dict, Any
+import json
+import math
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from datetime import datetime
 from uuid import UUID
 from asyncpg import Pool
 from ...domain.entities import TreeData, AnalysisResult
 from .transaction_manager import TransactionManager, TransactionStep
 from .postgres_config import PostgresConfig
+from .rollups import track_rollups, track_rollups_many
+
+EARTH_RADIUS_M = 6371008.8
+
+# Колонка trees.location хранит point(долгота, широта); выражения ниже
+# используют GIST-индекс idx_trees_location через операторы <@ и <->
+_LATEST_TREES = """
+    SELECT t.tree_id, t.location[1] AS latitude, t.location[0] AS longitude,
+           t.height, t.species, t.health_status, v.version_number
+    FROM trees t
+    JOIN tree_versions v ON t.version_id = v.version_id
+"""
+
+_LATEST_VERSION_FILTER = """
+    v.version_number = (
+        SELECT MAX(version_number) FROM tree_versions WHERE tree_id = t.tree_id
+    )
+"""
+
+_LATEST_TREES_BY_IDS = """
+    SELECT DISTINCT ON (t.tree_id)
+           t.tree_id::text, t.location[1] AS latitude, t.location[0] AS longitude,
+           t.height::float8 AS height, t.diameter::float8 AS diameter, t.species, t.health_status,
+           COALESCE(t.last_inspection_date, v.created_at) AS last_inspection_date, t.notes,
+           v.version_number
+    FROM trees t
+    JOIN tree_versions v ON t.version_id = v.version_id
+    WHERE t.tree_id = ANY($1::uuid[])
+    ORDER BY t.tree_id, v.version_number DESC
+"""
+
+_LATEST_VERSION_NUMBER = """
+    SELECT MAX(version_number) FROM tree_versions WHERE tree_id = $1::uuid
+"""
+
+_ANALYSIS_RESULTS_BY_TREE = """
+    SELECT a.analysis_id::text, a.tree_id::text, a.status, a.details, a.created_at
+    FROM analysis_results a
+    WHERE a.tree_id = $1
+    ORDER BY a.created_at DESC
+"""
+
+# Запросы горячего пути API для подготовки на соединениях пула чтения
+WARMUP_QUERIES = (_LATEST_TREES_BY_IDS, _LATEST_VERSION_NUMBER, _ANALYSIS_RESULTS_BY_TREE)
+
+def _distance_sql(lat_param: str, lon_param: str) -> str:
+    """SQL-выражение расстояния по гаверсинусу в метрах от точки до t.location"""
+    return f"""
+        2 * {EARTH_RADIUS_M} * asin(sqrt(least(1.0,
+            power(sin(radians(t.location[1] - {lat_param}) / 2), 2)
+            + cos(radians({lat_param})) * cos(radians(t.location[1]))
+            * power(sin(radians(t.location[0] - {lon_param}) / 2), 2)
+        )))
+    """
+
+def _degree_radius_bound(latitude: float, degrees: float) -> float:
+    """Нижняя граница расстояния в метрах до точки, удаленной на degrees по оператору <->.
+
+    Градус долготы короче градуса широты в cos(широты) раз, поэтому граница
+    берется по наибольшей широте окрестности. Для малых радиусов запас 1%
+    покрывает погрешность плоского приближения, для больших - множитель 2/pi.
+    """
+    phi = math.radians(min(90.0, abs(latitude) + degrees))
+    factor = 0.99 if degrees <= 1.0 else 2 / math.pi
+    return EARTH_RADIUS_M * math.radians(degrees) * math.cos(phi) * factor
+
+def _radius_box(latitude: float, longitude: float, radius_m: float) -> Tuple[float, float, float, float]:
+    """Ограничивающий прямоугольник (min_lon, min_lat, max_lon, max_lat) окружности"""
+    delta_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-12)
+    delta_lon = min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return (longitude - delta_lon, latitude - delta_lat,
+            longitude + delta_lon, latitude + delta_lat)
 
 class TreeRepository:
     """Репозиторий для работы с данными о деревьях с поддержкой версионирования"""
@@ -16,23 +91,28 @@ class TreeRepository:
     async def add_tree_data(self, tree_data: TreeData) -> str:
         """Добавление новых данных о дереве с версионированием"""
         async with self.transaction_manager.transaction() as connection:
-            # Создание новой версии записи
-            version_id = await connection.fetchval("""
-                INSERT INTO tree_versions (tree_id, version_number, created_at)
-                VALUES ($1, (
-                    SELECT COALESCE(MAX(version_number), 0) + 1
-                    FROM tree_versions
-                    WHERE tree_id = $1
-                ), $2)
-                RETURNING version_id
-            """, str(tree_data.id), datetime.utcnow())
-            
-            # Сохранение данных дерева
-            await connection.execute("""
-                INSERT INTO trees (tree_id, version_id, location, height, species, health_status)
-                VALUES ($1, $2, $3, $4, $5, $6)
-            """, str(tree_data.id), version_id, tree_data.location,
-                tree_data.height, tree_data.species, tree_data.health_status)
+            # Сводки по видам и состоянию обновляются в той же транзакции
+            async with track_rollups(connection, str(tree_data.id)):
+                # Создание новой версии записи
+                version_id = await connection.fetchval("""
+                    INSERT INTO tree_versions (tree_id, version_number, created_at)
+                    VALUES ($1, (
+                        SELECT COALESCE(MAX(version_number), 0) + 1
+                        FROM tree_versions
+                        WHERE tree_id = $1
+                    ), $2)
+                    RETURNING version_id
+                """, str(tree_data.id), datetime.utcnow())
+                
+                # Сохранение данных дерева; location хранит point(долгота, широта)
+                latitude, longitude = tree_data.location_coordinates
+                await connection.execute("""
+                    INSERT INTO trees (tree_id, version_id, location, height, species, health_status,
+                                       diameter, last_inspection_date, notes)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                """, str(tree_data.id), version_id, (longitude, latitude),
+                    tree_data.height, tree_data.species, tree_data.health_status,
+                    tree_data.diameter, tree_data.last_inspection_date, tree_data.notes)
             
             return version_id
     
@@ -60,6 +140,32 @@ class TreeRepository:
             
             return TreeData(**row) if row else None
     
+    async def get_latest_trees(self, tree_ids: Sequence[str]) -> List[Dict[str, Any]]:
+        """Актуальные версии нескольких деревьев одним запросом"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(_LATEST_TREES_BY_IDS, [str(tree_id) for tree_id in tree_ids])
+            return [dict(row) for row in rows]
+    
+    async def get_latest_version_number(self, tree_id: str) -> Optional[int]:
+        """Номер актуальной версии дерева (None, если версий нет)"""
+        async with self.pool.acquire() as connection:
+            return await connection.fetchval(_LATEST_VERSION_NUMBER, str(tree_id))
+    
+    async def find_tree_ids(self, species: Optional[str] = None,
+                            health_status: Optional[str] = None) -> List[str]:
+        """ID деревьев, актуальная версия которых подходит под фильтр"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(f"""
+                SELECT t.tree_id::text
+                FROM trees t
+                JOIN tree_versions v ON t.version_id = v.version_id
+                WHERE ($1::text IS NULL OR t.species = $1)
+                AND ($2::text IS NULL OR t.health_status = $2)
+                AND {_LATEST_VERSION_FILTER}
+                ORDER BY t.tree_id
+            """, species, health_status)
+            return [row[0] for row in rows]
+    
     async def save_analysis_result(self, tree_id: str, result: AnalysisResult) -> bool:
         """Сохранение результатов анализа с использованием Saga"""
         steps = [
@@ -77,6 +183,32 @@ class TreeRepository:
         
         return await self.transaction_manager.execute_saga(steps)
     
+    async def save_analysis_results(self, rows: Sequence[Tuple[str, str, Dict[str, Any], datetime]]) -> None:
+        """Вставка результатов анализа (tree_id, status, details, created_at) одним запросом.
+
+        Новые результаты меняют поглощение CO2 деревьев, поэтому сводки
+        обновляются в той же транзакции.
+        """
+        if not rows:
+            return
+        tree_ids = [str(row[0]) for row in rows]
+        async with self.transaction_manager.transaction() as connection:
+            async with track_rollups_many(connection, tree_ids):
+                # details передаются текстом: кодек jsonb соединения не применяется к массивам
+                await connection.execute("""
+                    INSERT INTO analysis_results (tree_id, status, details, created_at)
+                    SELECT r.tree_id, r.status, r.details::jsonb, r.created_at
+                    FROM unnest($1::uuid[], $2::varchar[], $3::text[], $4::timestamptz[])
+                        AS r(tree_id, status, details, created_at)
+                """, tree_ids, [row[1] for row in rows], [json.dumps(row[2]) for row in rows],
+                    [row[3] for row in rows])
+    
+    async def get_latest_analysis_results(self, tree_id: str) -> List[Dict[str, Any]]:
+        """Результаты анализа дерева от новых к старым"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(_ANALYSIS_RESULTS_BY_TREE, str(tree_id))
+            return [dict(row) for row in rows]
+    
     async def get_analysis_history(self, tree_id: str) -> List[Dict[str, Any]]:
         """Получение истории анализов дерева"""
         async with self.pool.acquire() as connection:
@@ -90,6 +222,109 @@ class TreeRepository:
             
             return [dict(row) for row in rows]
     
+    async def find_trees_within_radius(self, latitude: float, longitude: float,
+                                       radius_m: float) -> List[Dict[str, Any]]:
+        """Актуальные версии деревьев в радиусе radius_m метров, по возрастанию расстояния"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(f"""
+                SELECT * FROM (
+                    SELECT t.tree_id, t.location[1] AS latitude, t.location[0] AS longitude,
+                           t.height, t.species, t.health_status, v.version_number,
+                           {_distance_sql('$1', '$2')} AS distance_m
+                    FROM trees t
+                    JOIN tree_versions v ON t.version_id = v.version_id
+                    WHERE t.location <@ box(point($3, $4), point($5, $6))
+                    AND {_LATEST_VERSION_FILTER}
+                ) candidates
+                WHERE distance_m <= $7
+                ORDER BY distance_m
+            """, latitude, longitude, *_radius_box(latitude, longitude, radius_m), radius_m)
+            return [dict(row) for row in rows]
+    
+    async def find_nearest_trees(self, latitude: float, longitude: float, k: int,
+                                 oversample: int = 4) -> List[Dict[str, Any]]:
+        """k ближайших деревьев (KNN-обход GIST-индекса с уточнением по гаверсинусу)"""
+        results = await self.find_nearest_trees_batch([(latitude, longitude)], k, oversample)
+        return results[0]
+    
+    async def find_nearest_trees_batch(self, points: Sequence[Tuple[float, float]], k: int,
+                                       oversample: int = 4, max_oversample: int = 1024) -> List[List[Dict[str, Any]]]:
+        """Пакетный поиск k ближайших деревьев за один запрос к базе данных.
+
+        Оператор <-> упорядочивает по расстоянию в градусах, поэтому из индекса
+        берется k * oversample кандидатов, которые затем ранжируются в метрах.
+        Если k-е расстояние в метрах больше границы, гарантированной радиусом
+        кандидатов в градусах (вдали от экватора), запрос для этих точек
+        повторяется с вдвое большим числом кандидатов.
+        """
+        if not points:
+            return []
+        results: List[List[Dict[str, Any]]] = [[] for _ in points]
+        pending = list(range(len(points)))
+        while pending:
+            limit = k * oversample
+            rows = await self._nearest_candidates([points[index] for index in pending], k, limit)
+            found: Dict[int, List[Dict[str, Any]]] = {}
+            for row in rows:
+                record = dict(row)
+                found.setdefault(pending[record.pop('query_index') - 1], []).append(record)
+
+            retry = []
+            for index in pending:
+                records = found.get(index, [])
+                exact = (not records or records[0]['candidate_count'] < limit or len(records) < k
+                         or records[-1]['distance_m'] <= _degree_radius_bound(points[index][0],
+                                                                              records[0]['candidate_bound']))
+                if exact or oversample >= max_oversample:
+                    for record in records:
+                        del record['candidate_bound'], record['candidate_count'], record['degree_distance']
+                    results[index] = records
+                else:
+                    retry.append(index)
+            pending = retry
+            oversample *= 2
+        return results
+
+    async def _nearest_candidates(self, points: Sequence[Tuple[float, float]], k: int, limit: int) -> List[Any]:
+        latitudes = [float(lat) for lat, _ in points]
+        longitudes = [float(lon) for _, lon in points]
+        async with self.pool.acquire() as connection:
+            # Радиус и число кандидатов считаются до отбора k ближайших в метрах
+            return await connection.fetch(f"""
+                SELECT q.query_index, nearest.*
+                FROM unnest($1::float8[], $2::float8[]) WITH ORDINALITY AS q(lat, lon, query_index)
+                CROSS JOIN LATERAL (
+                    SELECT candidates.*,
+                           MAX(candidates.degree_distance) OVER () AS candidate_bound,
+                           COUNT(*) OVER () AS candidate_count
+                    FROM (
+                        SELECT t.tree_id, t.location[1] AS latitude, t.location[0] AS longitude,
+                               t.height, t.species, t.health_status, v.version_number,
+                               {_distance_sql('q.lat', 'q.lon')} AS distance_m,
+                               t.location <-> point(q.lon, q.lat) AS degree_distance
+                        FROM trees t
+                        JOIN tree_versions v ON t.version_id = v.version_id
+                        WHERE {_LATEST_VERSION_FILTER}
+                        ORDER BY t.location <-> point(q.lon, q.lat)
+                        LIMIT $3
+                    ) candidates
+                    ORDER BY distance_m
+                    LIMIT $4
+                ) nearest
+                ORDER BY q.query_index, nearest.distance_m
+            """, latitudes, longitudes, limit, k)
+    
+    async def find_trees_in_bbox(self, min_lat: float, min_lon: float,
+                                 max_lat: float, max_lon: float) -> List[Dict[str, Any]]:
+        """Актуальные версии деревьев в окне карты"""
+        async with self.pool.acquire() as connection:
+            rows = await connection.fetch(f"""
+                {_LATEST_TREES}
+                WHERE t.location <@ box(point($1, $2), point($3, $4))
+                AND {_LATEST_VERSION_FILTER}
+            """, min_lon, min_lat, max_lon, max_lat)
+            return [dict(row) for row in rows]
+    
     async def _save_analysis_data(self, tree_id: str, result: AnalysisResult) -> None:
         """Сохранение данных анализа"""
         async with self.pool.acquire() as connection:
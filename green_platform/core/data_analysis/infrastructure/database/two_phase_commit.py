@@ -0,0 +1,238 @@
+import asyncio
+import re
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from asyncpg import Connection, Pool
+from .postgres_config import PostgresConfig
+from .transaction_manager import TransactionState
+
+GID_PREFIX = 'gp2pc'
+
+# Исходы в журнале решений
+COMMIT = 'commit'
+ABORT = 'abort'
+
+# Работа участника: выполняется внутри открытой транзакции его соединения
+ParticipantWork = Callable[[Connection], Awaitable[Any]]
+
+# Имена участников и id транзакций входят в gid и в текст команд PREPARE/COMMIT
+_IDENTIFIER = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+_IN_DOUBT = """
+    SELECT gid
+    FROM pg_prepared_xacts
+    WHERE database = current_database()
+    AND gid LIKE $1
+    AND prepared < NOW() - make_interval(secs => $2)
+"""
+
+def _gid(transaction_id: str, participant: str) -> str:
+    return f"{GID_PREFIX}:{transaction_id}:{participant}"
+
+def _parse_gid(gid: str) -> Optional[str]:
+    """transaction_id из gid координатора"""
+    parts = gid.split(':')
+    return parts[1] if len(parts) == 3 and parts[0] == GID_PREFIX else None
+
+@dataclass
+class TwoPhaseResult:
+    """Итог распределенной транзакции"""
+    transaction_id: str
+    state: TransactionState
+    participants: List[str]
+    errors: Dict[str, str] = field(default_factory=dict)
+    prepare_seconds: float = 0.0
+    commit_seconds: float = 0.0
+
+    @property
+    def committed(self) -> bool:
+        return self.state is TransactionState.COMMITTED
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = asdict(self)
+        result['state'] = self.state.value
+        return result
+
+class TwoPhaseCommitCoordinator:
+    """Координатор двухфазного коммита для нескольких пулов-участников.
+
+    PREPARE TRANSACTION и COMMIT PREPARED выполняются на участниках
+    параллельно, поэтому задержка определяется самым медленным участником.
+    Решение о фиксации записывается в two_phase_decisions пула журнала до
+    второй фазы (presumed abort): при восстановлении подготовленные
+    транзакции с записанным решением фиксируются, остальные откатываются.
+    Перед откатом восстановление само записывает решение abort: первичный
+    ключ журнала не даст координатору, у которого первая фаза еще идет,
+    записать commit, и он тоже откатит транзакцию.
+    Число одновременно подготовленных транзакций на участнике ограничено
+    max_prepared (по умолчанию MAX_PREPARED_TRANSACTIONS из PostgresConfig)
+    и серверным max_prepared_transactions.
+    """
+
+    def __init__(self, log_pool: Pool, participants: Dict[str, Pool], max_prepared: Optional[int] = None,
+                 recovery_grace: float = 60.0, log_retention_days: int = 7,
+                 config: Optional[PostgresConfig] = None):
+        for name in participants:
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"Invalid participant name: {name!r}")
+        if max_prepared is None:
+            max_prepared = (config or PostgresConfig()).MAX_PREPARED_TRANSACTIONS
+        if max_prepared < 1:
+            raise ValueError("max_prepared must be at least 1")
+        self.log_pool = log_pool
+        self.participants = participants
+        self.max_prepared = max_prepared
+        # Моложе recovery_grace секунд транзакция может быть в работе у другого процесса
+        self.recovery_grace = recovery_grace
+        self.log_retention_days = log_retention_days
+        self._slots: Dict[str, asyncio.Semaphore] = {
+            name: asyncio.Semaphore(max_prepared) for name in participants}
+
+    async def start(self) -> Dict[str, int]:
+        """Учет серверных лимитов и восстановление зависших транзакций при запуске"""
+        for name, pool in self.participants.items():
+            async with pool.acquire() as connection:
+                server_limit = int(await connection.fetchval("SELECT current_setting('max_prepared_transactions')"))
+            if server_limit < 1:
+                raise ValueError(f"Participant {name} has max_prepared_transactions = 0, 2PC is disabled")
+            self._slots[name] = asyncio.Semaphore(min(self.max_prepared, server_limit))
+        return await self.recover()
+
+    async def execute(self, work: Dict[str, ParticipantWork],
+                      transaction_id: Optional[str] = None) -> TwoPhaseResult:
+        """Выполнение работы на участниках одной распределенной транзакцией"""
+        unknown = set(work) - set(self.participants)
+        if unknown:
+            raise ValueError(f"Unknown participants: {sorted(unknown)}")
+        transaction_id = transaction_id or uuid.uuid4().hex
+        if not _IDENTIFIER.match(transaction_id):
+            raise ValueError(f"Invalid transaction id: {transaction_id!r}")
+        names = sorted(work)
+        result = TwoPhaseResult(transaction_id, TransactionState.STARTED, names)
+
+        # Слоты берутся в одном порядке, чтобы параллельные транзакции не ждали друг друга по кругу
+        for name in names:
+            await self._slots[name].acquire()
+        try:
+            started = time.perf_counter()
+            outcomes = await asyncio.gather(*(self._prepare(name, transaction_id, work[name]) for name in names),
+                                            return_exceptions=True)
+            result.prepare_seconds = time.perf_counter() - started
+            prepared = [name for name, outcome in zip(names, outcomes) if outcome is None]
+            for name, outcome in zip(names, outcomes):
+                if outcome is not None:
+                    result.errors[name] = str(outcome)
+
+            started = time.perf_counter()
+            if not result.errors:
+                try:
+                    await self._log_decision(transaction_id, names)
+                except Exception as e:
+                    result.errors['decision_log'] = str(e)
+            if result.errors:
+                await self._finish(prepared, transaction_id, 'ROLLBACK PREPARED', result)
+                result.state = TransactionState.ROLLED_BACK
+            else:
+                result.state = TransactionState.COMMITTED
+                if await self._finish(names, transaction_id, 'COMMIT PREPARED', result):
+                    await self._complete_decisions([transaction_id])
+            result.commit_seconds = time.perf_counter() - started
+            return result
+        finally:
+            for name in names:
+                self._slots[name].release()
+
+    async def _prepare(self, name: str, transaction_id: str, work: ParticipantWork) -> None:
+        async with self.participants[name].acquire() as connection:
+            await connection.execute('BEGIN')
+            try:
+                await work(connection)
+                await connection.execute(f"PREPARE TRANSACTION '{_gid(transaction_id, name)}'")
+            except BaseException:
+                if connection.is_in_transaction():
+                    await connection.execute('ROLLBACK')
+                raise
+
+    async def _log_decision(self, transaction_id: str, names: List[str]) -> None:
+        async with self.log_pool.acquire() as connection:
+            # Нарушение первичного ключа означает, что восстановление уже записало abort
+            await connection.execute("""
+                INSERT INTO two_phase_decisions (transaction_id, participants, outcome)
+                VALUES ($1, $2, $3)
+            """, transaction_id, names, COMMIT)
+
+    async def _complete_decisions(self, transaction_ids: List[str]) -> None:
+        async with self.log_pool.acquire() as connection:
+            await connection.execute("""
+                UPDATE two_phase_decisions SET completed_at = NOW()
+                WHERE transaction_id = ANY($1::varchar[])
+            """, transaction_ids)
+
+    async def _finish(self, names: List[str], transaction_id: str, command: str,
+                      result: TwoPhaseResult) -> bool:
+        """Вторая фаза на участниках; неудачи остаются восстановлению"""
+        async def finish(name: str) -> None:
+            async with self.participants[name].acquire() as connection:
+                await connection.execute(f"{command} '{_gid(transaction_id, name)}'")
+
+        outcomes = await asyncio.gather(*(finish(name) for name in names), return_exceptions=True)
+        for name, outcome in zip(names, outcomes):
+            if outcome is not None:
+                print(f"Error in {command} {transaction_id} on {name}: {outcome}")
+                result.errors[name] = str(outcome)
+        return all(outcome is None for outcome in outcomes)
+
+    async def recover(self) -> Dict[str, int]:
+        """Разрешение подготовленных транзакций координатора по журналу решений"""
+        in_doubt: Dict[str, List[str]] = {}
+        for name, pool in self.participants.items():
+            async with pool.acquire() as connection:
+                rows = await connection.fetch(_IN_DOUBT, f"{GID_PREFIX}:%", self.recovery_grace)
+            for row in rows:
+                transaction_id = _parse_gid(row['gid'])
+                if transaction_id is not None:
+                    in_doubt.setdefault(name, []).append(transaction_id)
+
+        transaction_ids = sorted({tid for tids in in_doubt.values() for tid in tids})
+        async with self.log_pool.acquire() as connection:
+            await connection.execute("""
+                DELETE FROM two_phase_decisions
+                WHERE completed_at < NOW() - make_interval(days => $1)
+            """, self.log_retention_days)
+            # Транзакции без решения сначала получают решение abort; если координатор
+            # успел записать commit, вставка пропускается и остается его решение
+            await connection.execute("""
+                INSERT INTO two_phase_decisions (transaction_id, participants, outcome)
+                SELECT transaction_id, '{}', $2 FROM unnest($1::varchar[]) AS transaction_id
+                ON CONFLICT (transaction_id) DO NOTHING
+            """, transaction_ids, ABORT)
+            rows = await connection.fetch("""
+                SELECT transaction_id, outcome FROM two_phase_decisions
+                WHERE transaction_id = ANY($1::varchar[])
+            """, transaction_ids)
+        decided = {row['transaction_id'] for row in rows if row['outcome'] == COMMIT}
+
+        async def resolve(name: str, transaction_id: str) -> str:
+            command = 'COMMIT PREPARED' if transaction_id in decided else 'ROLLBACK PREPARED'
+            async with self.participants[name].acquire() as connection:
+                await connection.execute(f"{command} '{_gid(transaction_id, name)}'")
+            return 'committed' if transaction_id in decided else 'rolled_back'
+
+        tasks = [(name, tid) for name, tids in in_doubt.items() for tid in tids]
+        outcomes = await asyncio.gather(*(resolve(name, tid) for name, tid in tasks), return_exceptions=True)
+        summary = {'committed': 0, 'rolled_back': 0, 'failed': 0}
+        unresolved = set()
+        for (name, transaction_id), outcome in zip(tasks, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"Error resolving {transaction_id} on {name}: {outcome}")
+                summary['failed'] += 1
+                unresolved.add(transaction_id)
+            else:
+                summary[outcome] += 1
+
+        resolved = sorted(set(transaction_ids) - unresolved)
+        if resolved:
+            await self._complete_decisions(resolved)
+        return summary
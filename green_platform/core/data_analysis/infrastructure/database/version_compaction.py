@@ -0,0 +1,192 @@
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+from asyncpg import Connection, Pool, PostgresError
+
+JOB_NAME = 'tree_version_compaction'
+
+# Версии порции деревьев, которые не покрывает политика хранения:
+# не входят в keep_last последних и не являются контрольной точкой месяца
+# (последней версией календарного месяца в пределах checkpoint_months).
+# Деревья перебираются по возрастанию tree_id начиная после позиции $1
+_EXPIRED_VERSIONS = """
+    WITH chunk AS (
+        SELECT tree_id
+        FROM tree_versions
+        WHERE $1::uuid IS NULL OR tree_id > $1::uuid
+        GROUP BY tree_id
+        ORDER BY tree_id
+        LIMIT $2
+    ), ranked AS (
+        SELECT v.version_id, v.created_at,
+               ROW_NUMBER() OVER (PARTITION BY v.tree_id ORDER BY v.version_number DESC) AS rn,
+               ROW_NUMBER() OVER (PARTITION BY v.tree_id, date_trunc('month', v.created_at)
+                                  ORDER BY v.version_number DESC) AS month_rn
+        FROM tree_versions v
+        JOIN chunk ON chunk.tree_id = v.tree_id
+    )
+    SELECT (SELECT COUNT(*) FROM chunk) AS tree_count,
+           (SELECT tree_id::text FROM chunk ORDER BY tree_id DESC LIMIT 1) AS last_tree_id,
+           COALESCE((
+               SELECT array_agg(version_id) FROM ranked
+               WHERE rn > $3
+               AND NOT (month_rn = 1 AND ($4::int IS NULL OR (
+                   $4 > 0 AND created_at >= date_trunc('month', now()) - make_interval(months => $4 - 1)
+               )))
+           ), '{}') AS expired
+"""
+
+# Строки trees ссылаются на tree_versions и удаляются первыми; размер
+# удаленных кортежей считается до удаления
+_DELETE = """
+    WITH removed AS (
+        DELETE FROM {table} r
+        WHERE r.version_id = ANY($1::uuid[])
+        RETURNING pg_column_size(r.*) AS size
+    )
+    SELECT COUNT(*) AS row_count, COALESCE(SUM(size), 0)::bigint AS size FROM removed
+"""
+
+_MEASURE = """
+    SELECT COUNT(*) AS row_count, COALESCE(SUM(pg_column_size(r.*)), 0)::bigint AS size
+    FROM {table} r
+    WHERE r.version_id = ANY($1::uuid[])
+"""
+
+_TABLE_BYTES = "SELECT pg_total_relation_size('trees') + pg_total_relation_size('tree_versions')"
+
+@dataclass
+class RetentionPolicy:
+    """Политика хранения версий дерева.
+
+    keep_last последних версий хранятся всегда. Из более старых остается
+    последняя версия каждого календарного месяца за checkpoint_months
+    месяцев (None - за все время, 0 - контрольные точки не хранятся).
+    """
+    keep_last: int = 5
+    checkpoint_months: Optional[int] = 12
+
+    def __post_init__(self):
+        if self.keep_last < 1:
+            raise ValueError("keep_last must be at least 1: the latest version is always kept")
+        if self.checkpoint_months is not None and self.checkpoint_months < 0:
+            raise ValueError("checkpoint_months must not be negative")
+
+@dataclass
+class CompactionReport:
+    """Итог запуска сжатия"""
+    trees_scanned: int = 0
+    versions_deleted: int = 0
+    tree_rows_deleted: int = 0
+    bytes_reclaimed: int = 0  # размер удаленных кортежей trees и tree_versions
+    chunks: int = 0
+    completed: bool = False
+    position: Optional[str] = None  # последний обработанный tree_id
+    dry_run: bool = False
+    table_bytes_before: int = 0
+    table_bytes_after: int = 0
+    elapsed_seconds: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+class VersionCompactor:
+    """Пакетное сжатие истории версий по всей таблице tree_versions.
+
+    Деревья обрабатываются порциями по chunk_size в отдельных транзакциях;
+    позиция сохраняется в maintenance_checkpoints той же транзакцией, поэтому
+    прерванный запуск продолжается с места остановки. Между порциями делается
+    пауза, а lock_timeout не дает задаче надолго блокировать запись.
+    Освобожденное место переиспользуется после VACUUM (autovacuum);
+    вернуть его файловой системе может только VACUUM FULL.
+    """
+
+    def __init__(self, pool: Pool, policy: Optional[RetentionPolicy] = None, chunk_size: int = 1000,
+                 pause: float = 0.1, lock_timeout: str = '2s', max_retries: int = 3):
+        self.pool = pool
+        self.policy = policy or RetentionPolicy()
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.lock_timeout = lock_timeout
+        self.max_retries = max_retries
+
+    async def run(self, max_chunks: Optional[int] = None, dry_run: bool = False,
+                  restart: bool = False) -> CompactionReport:
+        """Сжатие от сохраненной позиции до конца таблицы или max_chunks порций.
+
+        В режиме dry_run ничего не удаляется и позиция не сохраняется.
+        """
+        started = time.perf_counter()
+        report = CompactionReport(dry_run=dry_run)
+        async with self.pool.acquire() as connection:
+            report.table_bytes_before = await connection.fetchval(_TABLE_BYTES)
+            if restart and not dry_run:
+                await connection.execute('DELETE FROM maintenance_checkpoints WHERE job_name = $1', JOB_NAME)
+            elif not restart:
+                report.position = await connection.fetchval(
+                    'SELECT position FROM maintenance_checkpoints WHERE job_name = $1', JOB_NAME)
+
+            while max_chunks is None or report.chunks < max_chunks:
+                tree_count = await self._compact_chunk_with_retry(connection, report, dry_run)
+                if tree_count == 0:
+                    report.completed = True
+                    break
+                report.chunks += 1
+                if self.pause:
+                    await asyncio.sleep(self.pause)
+
+            if report.completed and not dry_run:
+                # Следующий запуск начинает новый проход с начала таблицы
+                await connection.execute('DELETE FROM maintenance_checkpoints WHERE job_name = $1', JOB_NAME)
+            report.table_bytes_after = await connection.fetchval(_TABLE_BYTES)
+        report.elapsed_seconds = time.perf_counter() - started
+        return report
+
+    async def _compact_chunk_with_retry(self, connection: Connection, report: CompactionReport,
+                                        dry_run: bool) -> int:
+        attempt = 0
+        while True:
+            try:
+                return await self._compact_chunk(connection, report, dry_run)
+            except PostgresError as e:
+                # Чаще всего lock_timeout: порция повторяется после паузы
+                attempt += 1
+                if attempt >= self.max_retries:
+                    raise
+                print(f"Version compaction chunk after {report.position} failed (attempt {attempt}): {e}")
+                await asyncio.sleep(self.pause * 2 ** attempt)
+
+    async def _compact_chunk(self, connection: Connection, report: CompactionReport, dry_run: bool) -> int:
+        """Одна порция деревьев в одной транзакции; возвращает число деревьев в порции"""
+        async with connection.transaction():
+            await connection.execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+            chunk = await connection.fetchrow(_EXPIRED_VERSIONS, report.position, self.chunk_size,
+                                              self.policy.keep_last, self.policy.checkpoint_months)
+            if chunk['tree_count'] == 0:
+                return 0
+
+            expired: List[Any] = list(chunk['expired'])
+            if expired:
+                template = _MEASURE if dry_run else _DELETE
+                trees = await connection.fetchrow(template.format(table='trees'), expired)
+                versions = await connection.fetchrow(template.format(table='tree_versions'), expired)
+                tree_rows, version_rows = trees['row_count'], versions['row_count']
+                size = trees['size'] + versions['size']
+            else:
+                tree_rows = version_rows = size = 0
+
+            if not dry_run:
+                await connection.execute("""
+                    INSERT INTO maintenance_checkpoints (job_name, position, updated_at)
+                    VALUES ($1, $2, NOW())
+                    ON CONFLICT (job_name) DO UPDATE SET position = EXCLUDED.position, updated_at = NOW()
+                """, JOB_NAME, chunk['last_tree_id'])
+
+        # Счетчики обновляются только после успешной фиксации порции
+        report.position = chunk['last_tree_id']
+        report.trees_scanned += chunk['tree_count']
+        report.versions_deleted += version_rows
+        report.tree_rows_deleted += tree_rows
+        report.bytes_reclaimed += size
+        return chunk['tree_count']
@@ -0,0 +1,145 @@
+import hashlib
+from bisect import bisect_right
+from typing import Any, Dict, Generic, List, Optional, Protocol, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# Батчи распределяются по слотам hashtext(tree_id::text) & (SLOT_COUNT - 1),
+# а слоты - по узлам кольца. Число слотов фиксировано, поэтому узлы
+# договариваются о владении слотами, а не о хешах отдельных деревьев
+SLOT_COUNT = 4096
+
+def slot_sql(column: str = 'tree_id') -> str:
+    """SQL-выражение слота батча (совпадает с индексом idx_data_batches_pending_slot)"""
+    return f"(hashtext({column}::text) & {SLOT_COUNT - 1})"
+
+def _hash64(value: str) -> int:
+    """Стабильный между процессами и узлами 64-битный хеш"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class HashRing(Generic[T]):
+    """Кольцо согласованного хеширования с виртуальными узлами.
+
+    Каждый узел занимает replicas * weight точек кольца; ключ принадлежит
+    первой точке по часовой стрелке. При добавлении или удалении узла
+    переходит только доля ключей, пропорциональная его весу. Кольцо
+    детерминировано: узлы с одинаковым списком участников строят одинаковое
+    распределение слотов.
+    """
+
+    def __init__(self, replicas: int = 128):
+        self.replicas = replicas
+        self.nodes: Dict[str, Optional[T]] = {}
+        self.weights: Dict[str, int] = {}
+        self._points: List[int] = []
+        self._owners: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.nodes
+
+    def add_node(self, node_id: str, node: Optional[T] = None, weight: int = 1) -> None:
+        if weight < 1:
+            raise ValueError("Node weight must be positive")
+        self.nodes[node_id] = node
+        self.weights[node_id] = weight
+        self._rebuild()
+
+    def remove_node(self, node_id: str) -> None:
+        if node_id in self.nodes:
+            del self.nodes[node_id]
+            del self.weights[node_id]
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        points: List[Tuple[int, str]] = sorted(
+            (_hash64(f"{node_id}#{replica}"), node_id)
+            for node_id, weight in self.weights.items()
+            for replica in range(self.replicas * weight))
+        self._points = [point for point, _ in points]
+        self._owners = [node_id for _, node_id in points]
+
+    def _owner(self, hashed: int) -> Optional[str]:
+        if not self._points:
+            return None
+        return self._owners[bisect_right(self._points, hashed) % len(self._points)]
+
+    def get_node_id(self, key: str) -> Optional[str]:
+        """Узел, которому принадлежит ключ (например, tree_id)"""
+        return self._owner(_hash64(str(key)))
+
+    def get_node(self, key: str) -> Optional[T]:
+        node_id = self.get_node_id(key)
+        return self.nodes[node_id] if node_id is not None else None
+
+    def slot_owner(self, slot: int) -> Optional[str]:
+        return self._owner(_hash64(f"slot:{slot}"))
+
+    def slot_assignments(self) -> Dict[str, List[int]]:
+        """Слоты каждого узла"""
+        assignments: Dict[str, List[int]] = {node_id: [] for node_id in self.nodes}
+        for slot in range(SLOT_COUNT):
+            owner = self.slot_owner(slot)
+            if owner is not None:
+                assignments[owner].append(slot)
+        return assignments
+
+    def slots_for(self, node_id: str) -> List[int]:
+        return [slot for slot in range(SLOT_COUNT) if self.slot_owner(slot) == node_id]
+
+class ShardMembership(Protocol):
+    """Источник списка узлов и захвата батчей (BatchRepository)"""
+    async def register_worker(self, worker_id: str, weight: int) -> None: ...
+    async def get_live_workers(self, ttl: float) -> Dict[str, int]: ...
+    async def remove_worker(self, worker_id: str) -> None: ...
+    async def claim_batches(self, slots: Sequence[int], limit: int, stale_after: float) -> List[Dict[str, Any]]: ...
+
+class ShardCoordinator:
+    """Владение слотами батчей для одного узла.
+
+    refresh() продлевает heartbeat узла и перестраивает кольцо по живым
+    узлам; claim() захватывает батчи только своих слотов. Батчи одного
+    дерева попадают на один узел, поэтому узлы не конкурируют за выделение
+    номера версии и статусы батчей. refresh() вызывается чаще, чем
+    истекает ttl.
+    """
+
+    def __init__(self, repository: ShardMembership, worker_id: str, weight: int = 1,
+                 ttl: float = 30.0, stale_after: float = 300.0, replicas: int = 128):
+        self.repository = repository
+        self.worker_id = worker_id
+        self.weight = weight
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.replicas = replicas
+        self.ring: HashRing[None] = HashRing(replicas)
+        self.owned_slots: List[int] = []
+
+    async def refresh(self) -> Dict[str, List[int]]:
+        """Обновление состава кольца; возвращает полученные и отданные слоты"""
+        await self.repository.register_worker(self.worker_id, self.weight)
+        workers = await self.repository.get_live_workers(self.ttl)
+        workers.setdefault(self.worker_id, self.weight)
+
+        if workers != self.ring.weights:
+            ring: HashRing[None] = HashRing(self.replicas)
+            for worker_id, weight in sorted(workers.items()):
+                ring.add_node(worker_id, weight=weight)
+            self.ring = ring
+        owned = self.ring.slots_for(self.worker_id)
+        previous = set(self.owned_slots)
+        changes = {'gained': [slot for slot in owned if slot not in previous],
+                   'lost': sorted(previous.difference(owned))}
+        self.owned_slots = owned
+        return changes
+
+    async def claim(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return await self.repository.claim_batches(self.owned_slots, limit, self.stale_after)
+
+    async def leave(self) -> None:
+        """Выход из кольца: слоты узла сразу переходят к остальным"""
+        await self.repository.remove_worker(self.worker_id)
+        self.ring.remove_node(self.worker_id)
+        self.owned_slots = []
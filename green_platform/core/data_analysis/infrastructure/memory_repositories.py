@@ -0,0 +1,206 @@
+import os
+import pickle
+import tempfile
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from ..domain.entities import AnalysisResult, TreeData
+from ..domain.repositories import AnalysisResultRepository, TreeDataRepository
+
+class SnapshotFile:
+    """Необязательное сохранение состояния хранилища в памяти в локальный файл.
+
+    Снимок записывается атомарно (временный файл и rename) после каждых
+    flush_every изменений или явным вызовом flush. Файл читается только
+    самим узлом, поэтому используется pickle.
+    """
+
+    def __init__(self, path: Optional[str] = None, flush_every: Optional[int] = None):
+        self.path = path
+        self.flush_every = flush_every
+        self._pending = 0
+
+    def load(self) -> Optional[Any]:
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as handle:
+            return pickle.load(handle)
+
+    def save(self, state: Any) -> None:
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as handle:
+                pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self._pending = 0
+
+    def changed(self, state: Callable[[], Any], count: int = 1) -> None:
+        """Учет изменений; при достижении flush_every снимок сохраняется"""
+        self._pending += count
+        if self.path and self.flush_every and self._pending >= self.flush_every:
+            self.save(state())
+
+class SortedIndex:
+    """Упорядоченный индекс (ключ, id) для выборок по диапазону за O(log n + k)"""
+
+    def __init__(self):
+        self._entries: List[Tuple[Any, Any]] = []
+
+    def add(self, key: Any, item_id: Any) -> None:
+        entry = (key, item_id)
+        # Записи обычно приходят по возрастанию даты: добавление в конец без сдвига
+        if not self._entries or entry >= self._entries[-1]:
+            self._entries.append(entry)
+        else:
+            insort(self._entries, entry)
+
+    def remove(self, key: Any, item_id: Any) -> None:
+        position = bisect_left(self._entries, (key, item_id))
+        if position < len(self._entries) and self._entries[position] == (key, item_id):
+            del self._entries[position]
+
+    def range(self, start: Any, end: Any) -> List[Any]:
+        """id записей с start <= ключ < end"""
+        low = bisect_left(self._entries, (start,))
+        high = bisect_left(self._entries, (end,))
+        return [item_id for _, item_id in self._entries[low:high]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class InMemoryTreeDataRepository(TreeDataRepository):
+    """Хранилище данных о деревьях в памяти процесса с историей версий.
+
+    Хэш-индексы: по id дерева и по виду и состоянию актуальной версии.
+    Подходит для тестов, бенчмарков и пограничных узлов без стабильной связи.
+    """
+
+    def __init__(self, snapshot: Optional[SnapshotFile] = None):
+        self.snapshot = snapshot or SnapshotFile()
+        self._versions: Dict[str, List[TreeData]] = {}
+        self._by_species: Dict[str, Set[str]] = defaultdict(set)
+        self._by_health_status: Dict[str, Set[str]] = defaultdict(set)
+        state = self.snapshot.load()
+        if state is not None:
+            self._restore(state)
+
+    async def save(self, tree_data: TreeData) -> None:
+        """Сохранение новой версии дерева"""
+        self._add_version(tree_data)
+        self.snapshot.changed(self._state)
+
+    async def save_many(self, trees: Sequence[TreeData]) -> None:
+        for tree_data in trees:
+            self._add_version(tree_data)
+        self.snapshot.changed(self._state, len(trees))
+
+    async def get_by_id(self, tree_id: str) -> Optional[TreeData]:
+        versions = self._versions.get(tree_id)
+        return versions[-1] if versions else None
+
+    async def get_by_ids(self, tree_ids: Sequence[str]) -> List[TreeData]:
+        versions = self._versions
+        return [versions[tree_id][-1] for tree_id in tree_ids if tree_id in versions]
+
+    async def get_all(self) -> List[TreeData]:
+        return [versions[-1] for versions in self._versions.values()]
+
+    async def get_version_number(self, tree_id: str) -> Optional[int]:
+        versions = self._versions.get(tree_id)
+        return len(versions) if versions else None
+
+    async def find_ids(self, species: Optional[str] = None,
+                       health_status: Optional[str] = None) -> List[str]:
+        """ID деревьев по фильтру актуальной версии (пересечение индексов)"""
+        candidates = [index.get(value, set()) for index, value in
+                      ((self._by_species, species), (self._by_health_status, health_status)) if value is not None]
+        if not candidates:
+            return sorted(self._versions)
+        return sorted(set.intersection(*sorted(candidates, key=len)))
+
+    async def get_history(self, tree_id: str) -> List[TreeData]:
+        """Все версии дерева от первой к последней"""
+        return list(self._versions.get(tree_id, []))
+
+    async def get_version(self, tree_id: str, version_number: int) -> Optional[TreeData]:
+        """Версия дерева по номеру (нумерация с 1, как в tree_versions)"""
+        versions = self._versions.get(tree_id, [])
+        return versions[version_number - 1] if 0 < version_number <= len(versions) else None
+
+    def flush(self) -> None:
+        self.snapshot.save(self._state())
+
+    def _add_version(self, tree_data: TreeData) -> None:
+        versions = self._versions.setdefault(tree_data.id, [])
+        if versions:
+            self._unindex(versions[-1])
+        versions.append(tree_data)
+        self._by_species[tree_data.species].add(tree_data.id)
+        self._by_health_status[tree_data.health_status].add(tree_data.id)
+
+    def _unindex(self, tree_data: TreeData) -> None:
+        for index, value in ((self._by_species, tree_data.species),
+                             (self._by_health_status, tree_data.health_status)):
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(tree_data.id)
+                if not ids:
+                    del index[value]
+
+    def _state(self) -> Dict[str, Any]:
+        # В снимок попадают только версии, вторичные индексы перестраиваются при загрузке
+        return {'versions': self._versions}
+
+    def _restore(self, state: Dict[str, Any]) -> None:
+        for versions in state['versions'].values():
+            for tree_data in versions:
+                self._add_version(tree_data)
+
+class InMemoryAnalysisResultRepository(AnalysisResultRepository):
+    """Хранилище результатов анализа в памяти: хэш-индекс по дереву и индекс по дате анализа"""
+
+    def __init__(self, snapshot: Optional[SnapshotFile] = None):
+        self.snapshot = snapshot or SnapshotFile()
+        self._results: List[AnalysisResult] = []
+        self._by_tree: Dict[str, List[int]] = defaultdict(list)
+        self._by_date = SortedIndex()
+        state = self.snapshot.load()
+        if state is not None:
+            for result in state['results']:
+                self._add(result)
+
+    async def save(self, result: AnalysisResult) -> None:
+        self._add(result)
+        self.snapshot.changed(self._state)
+
+    async def save_many(self, results: Sequence[AnalysisResult]) -> None:
+        for result in results:
+            self._add(result)
+        self.snapshot.changed(self._state, len(results))
+
+    async def get_by_tree_id(self, tree_id: str) -> List[AnalysisResult]:
+        return [self._results[position] for position in self._by_tree.get(tree_id, [])]
+
+    async def get_by_date_range(self, start: datetime, end: datetime) -> List[AnalysisResult]:
+        """Результаты с start <= analysis_date < end в порядке даты"""
+        return [self._results[position] for position in self._by_date.range(start, end)]
+
+    def flush(self) -> None:
+        self.snapshot.save(self._state())
+
+    def _add(self, result: AnalysisResult) -> None:
+        position = len(self._results)
+        self._results.append(result)
+        self._by_tree[result.tree_id].append(position)
+        self._by_date.add(result.analysis_date, position)
+
+    def _state(self) -> Dict[str, Any]:
+        return {'results': self._results}
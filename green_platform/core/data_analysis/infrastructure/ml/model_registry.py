@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+ModelLoader = Callable[[str], Any]
+
+
+def load_memory_mapped(path: str) -> Any:
+    """Загрузка модели с отображением массивов numpy в память (mmap)"""
+    import joblib
+    # Массивы модели читаются через mmap: процессы, созданные через fork,
+    # разделяют одни и те же страницы файла вместо копий в куче
+    return joblib.load(path, mmap_mode='r')
+
+
+def save_for_memory_mapping(model: Any, path: str) -> str:
+    """Сохранение модели в формате, пригодном для загрузки через mmap"""
+    import joblib
+    # Сжатие несовместимо с mmap, поэтому модель сохраняется без него
+    joblib.dump(model, path, compress=0)
+    return path
+
+
+def _current_rss() -> int:
+    """Текущий RSS процесса в байтах (0, если недоступно)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+@dataclass
+class ModelVersionMetrics:
+    """Метрики загруженной версии модели"""
+    version: str
+    path: str
+    load_time: float = 0.0  # время загрузки в секундах
+    memory_bytes: int = 0  # прирост RSS процесса при загрузке
+    mapped_bytes: int = 0  # размер файла, разделяемого через mmap
+    loaded_at: Optional[datetime] = None
+    last_used: Optional[datetime] = None
+    active_leases: int = 0
+    total_leases: int = 0
+
+
+class _LoadedModel:
+    """Загруженная версия модели со счетчиком активных запросов"""
+
+    def __init__(self, model: Any, metrics: ModelVersionMetrics):
+        self.model = model
+        self.metrics = metrics
+
+
+class ModelRegistry:
+    """Реестр версий моделей с ленивой загрузкой и атомарной подменой активной версии"""
+
+    def __init__(self, loader: ModelLoader = load_memory_mapped, max_idle_versions: int = 1):
+        self.loader = loader
+        self.max_idle_versions = max_idle_versions  # сколько неактивных версий держать прогретыми
+        self._paths: Dict[str, str] = {}
+        self._loaded: Dict[str, _LoadedModel] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._active_version: Optional[str] = None
+        self._evicted_versions = 0
+        _registries.add(self)
+
+    def register(self, version: str, path: str, activate: bool = False) -> None:
+        """Регистрация версии модели без ее загрузки"""
+        with self._lock:
+            self._paths[version] = path
+            if self._active_version is None:
+                self._active_version = version
+        if activate:
+            self.activate(version)
+
+    @property
+    def active_version(self) -> Optional[str]:
+        """Текущая активная версия модели"""
+        return self._active_version
+
+    def versions(self) -> List[str]:
+        """Список зарегистрированных версий"""
+        return list(self._paths)
+
+    def find_version(self, path: str) -> Optional[str]:
+        """Версия, зарегистрированная для файла модели"""
+        with self._lock:
+            return next((version for version, version_path in self._paths.items() if version_path == path), None)
+
+    def activate(self, version: str, preload: bool = True) -> None:
+        """Атомарное переключение на новую версию модели.
+
+        Новая версия загружается до переключения, поэтому запросы никогда не
+        ждут холодной загрузки. Запросы, уже удерживающие старую версию,
+        дорабатывают на ней; версия выгружается после их завершения.
+        """
+        if version not in self._paths:
+            raise KeyError(f"Model version {version} is not registered")
+        if preload:
+            self._ensure_loaded(version)
+        with self._lock:
+            self._active_version = version
+        self.evict_unused()
+
+    def warm(self, version: Optional[str] = None) -> Any:
+        """Прогрев модели до fork рабочих процессов"""
+        return self._ensure_loaded(self._resolve(version)).model
+
+    def get(self, version: Optional[str] = None) -> Any:
+        """Получение модели (загружается при первом обращении)"""
+        loaded = self._ensure_loaded(self._resolve(version))
+        loaded.metrics.last_used = datetime.utcnow()
+        return loaded.model
+
+    @contextmanager
+    def lease(self, version: Optional[str] = None) -> Iterator[Any]:
+        """Захват модели на время запроса: версия не будет выгружена до выхода"""
+        resolved = self._resolve(version)
+        while True:
+            loaded = self._ensure_loaded(resolved)
+            with self._lock:
+                # Версия могла быть выгружена между загрузкой и захватом
+                if self._loaded.get(resolved) is loaded:
+                    loaded.metrics.active_leases += 1
+                    loaded.metrics.total_leases += 1
+                    loaded.metrics.last_used = datetime.utcnow()
+                    break
+        try:
+            yield loaded.model
+        finally:
+            with self._lock:
+                loaded.metrics.active_leases -= 1
+            if resolved != self._active_version:
+                self.evict_unused()
+
+    def evict_unused(self) -> List[str]:
+        """Выгрузка неактивных версий без активных запросов"""
+        with self._lock:
+            idle = sorted(
+                (
+                    loaded for version, loaded in self._loaded.items()
+                    if version != self._active_version and loaded.metrics.active_leases == 0
+                ),
+                key=lambda loaded: loaded.metrics.last_used or datetime.min,
+                reverse=True
+            )
+            evicted = [loaded.metrics.version for loaded in idle[self.max_idle_versions:]]
+            for version in evicted:
+                del self._loaded[version]
+            self._evicted_versions += len(evicted)
+            return evicted
+
+    def unregister(self, version: str) -> None:
+        """Удаление версии из реестра"""
+        with self._lock:
+            if version == self._active_version:
+                raise ValueError("Cannot unregister the active model version")
+            self._paths.pop(version, None)
+            loaded = self._loaded.get(version)
+            if loaded and loaded.metrics.active_leases == 0:
+                del self._loaded[version]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Получение метрик загрузки и памяти по версиям"""
+        with self._lock:
+            versions = {version: dict(loaded.metrics.__dict__) for version, loaded in self._loaded.items()}
+        return {
+            'active_version': self._active_version,
+            'registered_versions': len(self._paths),
+            'loaded_versions': len(versions),
+            'evicted_versions': self._evicted_versions,
+            'total_memory_bytes': sum(m['memory_bytes'] for m in versions.values()),
+            'total_mapped_bytes': sum(m['mapped_bytes'] for m in versions.values()),
+            'versions': versions
+        }
+
+    def _resolve(self, version: Optional[str]) -> str:
+        resolved = version or self._active_version
+        if resolved is None:
+            raise LookupError("No model version is registered")
+        if resolved not in self._paths:
+            raise KeyError(f"Model version {resolved} is not registered")
+        return resolved
+
+    def _ensure_loaded(self, version: str) -> _LoadedModel:
+        """Однократная загрузка версии в рамках процесса"""
+        loaded = self._loaded.get(version)
+        if loaded is not None:
+            return loaded
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(version, threading.Lock())
+
+        with load_lock:
+            # Повторная проверка: версию мог загрузить конкурирующий поток
+            loaded = self._loaded.get(version)
+            if loaded is not None:
+                return loaded
+
+            path = self._paths[version]
+            rss_before = _current_rss()
+            start_time = time.perf_counter()
+            model = self.loader(path)
+            load_time = time.perf_counter() - start_time
+
+            metrics = ModelVersionMetrics(
+                version=version,
+                path=path,
+                load_time=load_time,
+                memory_bytes=max(_current_rss() - rss_before, 0),
+                mapped_bytes=os.path.getsize(path) if os.path.exists(path) else 0,
+                loaded_at=datetime.utcnow()
+            )
+            loaded = _LoadedModel(model, metrics)
+            with self._lock:
+                self._loaded[version] = loaded
+            return loaded
+
+    def _reset_locks(self) -> None:
+        """Сброс блокировок в дочернем процессе после fork"""
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        for loaded in self._loaded.values():
+            loaded.metrics.active_leases = 0
+
+
+_registries: 'weakref.WeakSet[ModelRegistry]' = weakref.WeakSet()
+_default_registry: Optional[ModelRegistry] = None
+
+
+def _reset_registries_after_fork() -> None:
+    for registry in list(_registries):
+        registry._reset_locks()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_registries_after_fork)
+
+
+def get_model_registry() -> ModelRegistry:
+    """Общий для процесса реестр моделей"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ModelRegistry()
+    return _default_registry
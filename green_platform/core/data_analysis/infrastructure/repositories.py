@@ -1,35 +1,86 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence
+from asyncpg import Pool
 from ..domain.repositories import TreeDataRepository, AnalysisResultRepository
 from ..domain.entities import TreeData, AnalysisResult
+from .database.transaction_manager import TransactionManager
+from .database.tree_repository import TreeRepository
+
+# Поля details, в которых хранятся рекомендации и уверенность; остальные - метрики
+_RESULT_FIELDS = ('recommendations', 'confidence_score')
+
+def _tree_data(row: Dict[str, Any]) -> TreeData:
+    return TreeData(
+        id=row['tree_id'],
+        species=row['species'],
+        height=row['height'],
+        diameter=row['diameter'],
+        health_status=row['health_status'],
+        location_coordinates=(row['latitude'], row['longitude']),
+        last_inspection_date=row['last_inspection_date'],
+        notes=row['notes']
+    )
+
+def _analysis_result(row: Dict[str, Any]) -> AnalysisResult:
+    details = dict(row['details'])
+    return AnalysisResult(
+        tree_id=row['tree_id'],
+        analysis_date=row['created_at'],
+        metrics={name: value for name, value in details.items() if name not in _RESULT_FIELDS},
+        recommendations=details.get('recommendations', []),
+        confidence_score=details.get('confidence_score', 0.0)
+    )
 
 class SQLTreeDataRepository(TreeDataRepository):
-    """Реализация репозитория для хранения данных о деревьях в SQL базе данных"""
-    
-    def __init__(self, db_connection):
+    """Реализация репозитория для хранения данных о деревьях в SQL базе данных.
+
+    Чтения идут через pool, запись новой версии - через transaction_manager
+    (например, пула записи).
+    """
+
+    def __init__(self, db_connection: Pool, transaction_manager: Optional[TransactionManager] = None):
         self.db = db_connection
-    
+        self.queries = TreeRepository(db_connection, transaction_manager or TransactionManager(db_connection))
+
     async def save(self, tree_data: TreeData) -> None:
-        # TODO: Реализовать сохранение в базу данных
-        pass
-    
+        await self.queries.add_tree_data(tree_data)
+
     async def get_by_id(self, tree_id: str) -> Optional[TreeData]:
-        # TODO: Реализовать получение из базы данных
-        pass
-    
+        trees = await self.get_by_ids([tree_id])
+        return trees[0] if trees else None
+
     async def get_all(self) -> List[TreeData]:
-        # TODO: Реализовать получение всех записей
-        pass
+        return await self.get_by_ids(await self.find_ids())
+
+    async def get_version_number(self, tree_id: str) -> Optional[int]:
+        return await self.queries.get_latest_version_number(tree_id)
+
+    async def get_by_ids(self, tree_ids: Sequence[str]) -> List[TreeData]:
+        if not tree_ids:
+            return []
+        return [_tree_data(row) for row in await self.queries.get_latest_trees(tree_ids)]
+
+    async def find_ids(self, species: Optional[str] = None,
+                       health_status: Optional[str] = None) -> List[str]:
+        return await self.queries.find_tree_ids(species, health_status)
 
 class SQLAnalysisResultRepository(AnalysisResultRepository):
     """Реализация репозитория для хранения результатов анализа в SQL базе данных"""
-    
-    def __init__(self, db_connection):
+
+    def __init__(self, db_connection: Pool, transaction_manager: Optional[TransactionManager] = None):
         self.db = db_connection
-    
+        self.queries = TreeRepository(db_connection, transaction_manager or TransactionManager(db_connection))
+
     async def save(self, result: AnalysisResult) -> None:
-        # TODO: Реализовать сохранение в базу данных
-        pass
-    
+        await self.save_many([result])
+
+    async def save_many(self, results: Sequence[AnalysisResult]) -> None:
+        await self.queries.save_analysis_results([
+            (result.tree_id, 'completed',
+             {**result.metrics, 'recommendations': result.recommendations,
+              'confidence_score': result.confidence_score},
+             result.analysis_date)
+            for result in results
+        ])
+
     async def get_by_tree_id(self, tree_id: str) -> List[AnalysisResult]:
-        # TODO: Реализовать получение из базы данных
-        pass
\ No newline at end of file
+        return [_analysis_result(row) for row in await self.queries.get_latest_analysis_results(tree_id)]
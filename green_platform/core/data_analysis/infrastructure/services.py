@@ -1,21 +1,79 @@
-from typing import List
+import asyncio
+from datetime import datetime
+from typing import List, Optional, Sequence
+import numpy as np
 from ..domain.services import TreeAnalysisService, DataValidationService
 from ..domain.entities import TreeData, AnalysisResult
+from ..domain.validation import RuleSet
+from .ml.model_registry import ModelRegistry, get_model_registry
 
 class MLTreeAnalysisService(TreeAnalysisService):
     """Реализация сервиса анализа деревьев с использованием машинного обучения"""
     
-    def __init__(self, model_path: str):
-        # TODO: Инициализация ML модели
+    def __init__(self, model_path: str, model_registry: Optional[ModelRegistry] = None,
+                 model_version: Optional[str] = None):
         self.model_path = model_path
+        # Модель загружается один раз на процесс через общий реестр
+        self.model_registry = model_registry or get_model_registry()
+        self._pinned_version = model_version
+        self._own_version = model_version or self.model_registry.find_version(model_path) or model_path
+        if self._own_version not in self.model_registry.versions():
+            self.model_registry.register(self._own_version, model_path)
+        # Подмену активной версии в реестре отслеживает только сервис, созданный
+        # для активной модели; сервис с другим model_path обслуживает свою модель
+        self._follows_active = model_version is None and self.model_registry.active_version == self._own_version
+    
+    @property
+    def model_version(self) -> Optional[str]:
+        """Версия модели, которой будут обслуживаться новые запросы"""
+        if self._follows_active:
+            return self.model_registry.active_version
+        return self._own_version
     
     async def analyze_tree_health(self, tree_data: TreeData) -> AnalysisResult:
-        # TODO: Реализовать анализ с использованием ML модели
-        pass
+        """Анализ состояния здоровья дерева с использованием ML модели"""
+        return (await self.analyze_trees_health([tree_data]))[0]
+    
+    async def analyze_trees_health(self, trees: Sequence[TreeData]) -> List[AnalysisResult]:
+        """Анализ группы деревьев одним вызовом модели"""
+        if not trees:
+            return []
+        version = self.model_version
+        features = np.array([[tree.height, tree.diameter] for tree in trees], dtype=np.float64)
+        # Прогноз выполняется в пуле потоков и не блокирует цикл событий
+        health_scores = await asyncio.to_thread(self._predict, version, features)
+        
+        analysis_date = datetime.utcnow()
+        results = []
+        for tree_data, health_score in zip(trees, health_scores):
+            health_score = float(health_score)
+            result = AnalysisResult(
+                tree_id=tree_data.id,
+                analysis_date=analysis_date,
+                metrics={
+                    'health_score': health_score,
+                    'model_version': version
+                },
+                recommendations=[],
+                confidence_score=min(max(health_score, 0.0), 1.0)
+            )
+            result.recommendations = await self.generate_recommendations(result)
+            results.append(result)
+        return results
+    
+    def _predict(self, version: Optional[str], features: np.ndarray) -> np.ndarray:
+        # Модель удерживается до конца прогноза и не выгружается при подмене версии
+        with self.model_registry.lease(version) as model:
+            return model.predict(features)
     
     async def generate_recommendations(self, analysis_result: AnalysisResult) -> List[str]:
-        # TODO: Реализовать генерацию рекомендаций
-        pass
+        """Генерация рекомендаций по уходу за деревом"""
+        health_score = analysis_result.metrics.get('health_score', 0.0)
+        if health_score < 0.4:
+            return ["Требуется осмотр специалистом"]
+        if health_score < 0.7:
+            return ["Рекомендуется плановый уход"]
+        return ["Дерево в хорошем состоянии"]
     
     async def calculate_growth_metrics(self, tree_data: TreeData) -> dict:
         # TODO: Реализовать расчет метрик
@@ -24,6 +82,14 @@ class MLTreeAnalysisService(TreeAnalysisService):
 class TreeDataValidationService(DataValidationService):
     """Реализация сервиса валидации данных о деревьях"""
     
+    def __init__(self, tree_data_rules: Optional[RuleSet] = None,
+                 analysis_result_rules: Optional[RuleSet] = None):
+        # Наборы правил пакетной проверки можно заменить, например без проверки повторов
+        if tree_data_rules is not None:
+            self.tree_data_rules = tree_data_rules
+        if analysis_result_rules is not None:
+            self.analysis_result_rules = analysis_result_rules
+    
     def validate_tree_data(self, tree_data: TreeData) -> bool:
         # Проверка обязательных полей
         if not all([tree_data.id, tree_data.species, tree_data.height, tree_data.diameter]):
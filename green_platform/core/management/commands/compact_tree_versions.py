@@ -0,0 +1,42 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand
+from ...data_analysis.infrastructure.database.pool_manager import MAINTENANCE, PoolManager
+from ...data_analysis.infrastructure.database.postgres_config import PostgresConfig
+from ...data_analysis.infrastructure.database.version_compaction import RetentionPolicy, VersionCompactor
+
+class Command(BaseCommand):
+    help = "Сжатие истории версий деревьев по политике хранения (порциями, с возобновлением)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=5, help='число последних версий, которые хранятся всегда')
+        parser.add_argument('--checkpoint-months', type=int, default=12,
+                            help='месяцы, за которые хранится последняя версия месяца (0 - не хранить)')
+        parser.add_argument('--all-checkpoints', action='store_true',
+                            help='хранить последнюю версию каждого месяца за все время')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='деревьев в одной транзакции')
+        parser.add_argument('--pause', type=float, default=0.1, help='пауза между порциями, секунды')
+        parser.add_argument('--max-chunks', type=int, help='остановиться после N порций (продолжение при следующем запуске)')
+        parser.add_argument('--dry-run', action='store_true', help='только подсчитать версии и место')
+        parser.add_argument('--restart', action='store_true', help='начать проход с начала таблицы')
+        parser.add_argument('--dsn', help='строка подключения (по умолчанию из PostgresConfig)')
+
+    def handle(self, *args, **options):
+        policy = RetentionPolicy(options['keep'],
+                                 None if options['all_checkpoints'] else options['checkpoint_months'])
+        config = PostgresConfig(DATABASE_URL=options['dsn']) if options['dsn'] else PostgresConfig()
+        report = asyncio.run(self._run(config, policy, options))
+        self.stdout.write(json.dumps(report, indent=2))
+
+    async def _run(self, config: PostgresConfig, policy: RetentionPolicy, options) -> dict:
+        # Пул обслуживания: свой statement_timeout и имя приложения в pg_stat_activity
+        pools = PoolManager(config, workloads=(MAINTENANCE,))
+        await pools.start()
+        try:
+            pool = pools.pool(MAINTENANCE)
+            compactor = VersionCompactor(pool, policy, chunk_size=options['chunk_size'], pause=options['pause'])
+            report = await compactor.run(options['max_chunks'], dry_run=options['dry_run'],
+                                         restart=options['restart'])
+            return report.to_dict()
+        finally:
+            await pools.close()
@@ -0,0 +1,41 @@
+import asyncio
+import json
+from django.core.management.base import BaseCommand, CommandError
+from ...data_analysis.infrastructure.database.pool_manager import MAINTENANCE, PoolManager
+from ...data_analysis.infrastructure.database.postgres_config import PostgresConfig
+from ...data_analysis.infrastructure.database.rollups import RollupRepository
+
+class Command(BaseCommand):
+    help = "Перестроение и проверка сводок по видам, состоянию, ячейкам и дням"
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['rebuild', 'check'])
+        parser.add_argument('--dsn', help='строка подключения (по умолчанию из PostgresConfig)')
+
+    def handle(self, *args, **options):
+        config = PostgresConfig(DATABASE_URL=options['dsn']) if options['dsn'] else PostgresConfig()
+        asyncio.run(self._run(options['action'], config))
+
+    async def _run(self, action: str, config: PostgresConfig) -> None:
+        # Пул обслуживания: свой statement_timeout и имя приложения в pg_stat_activity
+        pools = PoolManager(config, workloads=(MAINTENANCE,))
+        await pools.start()
+        try:
+            pool = pools.pool(MAINTENANCE)
+            repository = RollupRepository(pool)
+            if action == 'rebuild':
+                counts = await repository.rebuild()
+                self.stdout.write(f"Rebuilt rollups: {counts['tree_rollups']} rows, "
+                                  f"{counts['tree_rollup_totals']} totals")
+                return
+
+            mismatches = await repository.check()
+            for table, rows in mismatches.items():
+                for row in rows:
+                    self.stdout.write(f"{table}: {json.dumps(row, default=str, ensure_ascii=False)}")
+            total = sum(len(rows) for rows in mismatches.values())
+            if total:
+                raise CommandError(f"Rollups are inconsistent: {total} mismatched rows, run 'tree_rollups rebuild'")
+            self.stdout.write("Rollups are consistent")
+        finally:
+            await pools.close()
@@ -0,0 +1,22 @@
+from typing import Any, Dict, List
+from .pipeline import Pipeline, Stage, StageFunction
+from .readers import DEFAULT_CHUNK_SIZE, read_file
+from .transforms import Deduplicator, prepare
+
+def build_pipeline(path: str, sink: StageFunction, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   prepare_parallelism: int = 2, sink_parallelism: int = 1,
+                   queue_size: int = 4) -> Pipeline:
+    """Конвейер загрузки файла инвентаризации: чтение, очистка, дедупликация, запись"""
+    return Pipeline(read_file(path, chunk_size), [
+        Stage('prepare', prepare, parallelism=prepare_parallelism, in_thread=True, queue_size=queue_size),
+        Stage('deduplicate', Deduplicator(), queue_size=queue_size),
+        Stage('sink', sink, parallelism=sink_parallelism, queue_size=queue_size)
+    ])
+
+async def backfill(path: str, sink: StageFunction, **options: Any) -> List[Dict[str, Any]]:
+    """Загрузка исторической выгрузки с выводом статистики по стадиям"""
+    stats = await build_pipeline(path, sink, **options).run()
+    for stage in stats:
+        print(f"{stage['name']}: {stage['rows_in']} -> {stage['rows_out']} rows, "
+              f"{stage['rows_per_second']:.0f} rows/s")
+    return stats
@@ -0,0 +1,136 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
+import pandas as pd
+
+Chunk = pd.DataFrame
+StageFunction = Callable[[Chunk], Union[Optional[Chunk], Awaitable[Optional[Chunk]]]]
+
+_END = object()  # маркер конца потока между стадиями
+
+@dataclass
+class StageStats:
+    """Статистика стадии конвейера"""
+    name: str
+    parallelism: int
+    chunks: int = 0
+    rows_in: int = 0
+    rows_out: int = 0
+    busy_time: float = 0.0  # суммарное время обработки порций всеми воркерами
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_in / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'parallelism': self.parallelism,
+            'chunks': self.chunks,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'dropped': self.rows_in - self.rows_out,
+            'busy_time': self.busy_time,
+            'elapsed': self.elapsed,
+            'rows_per_second': self.rows_per_second
+        }
+
+@dataclass
+class Stage:
+    """Стадия конвейера: функция над порцией строк.
+
+    Функция может быть синхронной или корутиной; синхронные функции с
+    in_thread=True выполняются в пуле потоков (векторные операции pandas и
+    numpy отпускают GIL). Стадии с состоянием (например, дедупликация)
+    должны иметь parallelism=1. None вместо порции означает, что дальше
+    ничего не передается.
+    """
+    name: str
+    function: StageFunction
+    parallelism: int = 1
+    in_thread: bool = False
+    queue_size: int = 4  # максимум порций, ожидающих эту стадию
+
+class Pipeline:
+    """Потоковый конвейер обработки данных с ограниченными очередями между стадиями.
+
+    Источник выдает порции (DataFrame) и блокируется, когда следующая стадия
+    не успевает: в памяти одновременно находится не больше queue_size порций
+    на стадию плюс обрабатываемые, независимо от размера входных файлов.
+    """
+
+    def __init__(self, source: AsyncIterator[Chunk], stages: List[Stage]):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.source = source
+        self.stages = stages
+        self.stats = [StageStats(stage.name, stage.parallelism) for stage in stages]
+
+    async def run(self) -> List[Dict[str, Any]]:
+        """Запуск конвейера до исчерпания источника; возвращает статистику стадий"""
+        queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        tasks = [asyncio.ensure_future(self._feed(queues[0]))]
+        for index, stage in enumerate(self.stages):
+            output = queues[index + 1] if index + 1 < len(queues) else None
+            tasks.append(asyncio.ensure_future(
+                self._run_stage(stage, self.stats[index], queues[index], output)))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return self.get_metrics()
+
+    def get_metrics(self) -> List[Dict[str, Any]]:
+        return [stats.to_dict() for stats in self.stats]
+
+    async def _feed(self, queue: asyncio.Queue) -> None:
+        async for chunk in self.source:
+            if len(chunk):
+                await queue.put(chunk)
+        await queue.put(_END)
+
+    async def _run_stage(self, stage: Stage, stats: StageStats, input_queue: asyncio.Queue,
+                         output_queue: Optional[asyncio.Queue]) -> None:
+        async def worker() -> None:
+            while True:
+                chunk = await input_queue.get()
+                if chunk is _END:
+                    # Маркер возвращается в очередь для остальных воркеров стадии
+                    await input_queue.put(_END)
+                    return
+                if stats.started_at is None:
+                    stats.started_at = time.perf_counter()
+
+                started = time.perf_counter()
+                if stage.in_thread:
+                    result = await asyncio.to_thread(stage.function, chunk)
+                else:
+                    result = stage.function(chunk)
+                if asyncio.iscoroutine(result):
+                    result = await result
+                stats.busy_time += time.perf_counter() - started
+                stats.chunks += 1
+                stats.rows_in += len(chunk)
+
+                if result is not None and len(result):
+                    stats.rows_out += len(result)
+                    if output_queue is not None:
+                        await output_queue.put(result)
+
+        await asyncio.gather(*(worker() for _ in range(stage.parallelism)))
+        stats.finished_at = time.perf_counter()
+        if output_queue is not None:
+            await output_queue.put(_END)
@@ -0,0 +1,47 @@
+import asyncio
+import os
+from typing import AsyncIterator, Iterator
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 50000
+
+async def iterate_in_thread(chunks: Iterator[pd.DataFrame]) -> AsyncIterator[pd.DataFrame]:
+    """Чтение порций синхронного итератора в пуле потоков, не блокируя цикл событий"""
+    end = object()
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, end)
+        if chunk is end:
+            return
+        yield chunk
+
+def read_csv(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, **options) -> AsyncIterator[pd.DataFrame]:
+    """Порционное чтение CSV"""
+    return iterate_in_thread(iter(pd.read_csv(path, chunksize=chunk_size, **options)))
+
+def read_ndjson(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[pd.DataFrame]:
+    """Порционное чтение NDJSON (по одному JSON-объекту на строку)"""
+    return iterate_in_thread(iter(pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False)))
+
+def read_parquet(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[pd.DataFrame]:
+    """Порционное чтение Parquet по группам строк (требуется pyarrow)"""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet files requires pyarrow")
+
+    def batches() -> Iterator[pd.DataFrame]:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+
+    return iterate_in_thread(batches())
+
+def read_file(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[pd.DataFrame]:
+    """Выбор читателя по расширению файла"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return read_csv(path, chunk_size)
+    if extension in ('.ndjson', '.jsonl'):
+        return read_ndjson(path, chunk_size)
+    if extension == '.parquet':
+        return read_parquet(path, chunk_size)
+    raise ValueError(f"Unsupported file format: {extension}")
@@ -0,0 +1,109 @@
+import json
+from typing import List, Optional
+from uuid import UUID
+import pandas as pd
+from asyncpg import Pool
+from ..core.data_analysis.application.ingest import BulkBatchWriter
+from ..core.data_analysis.domain.batch_processing import TreeDataBatch
+from ..core.data_analysis.infrastructure.database.rollups import track_rollups_many
+
+# Набор строк записывается в tree_versions и trees одним запросом. Номера
+# версий назначаются с учетом уже существующих версий и повторов дерева
+# внутри порции; trees.location хранит point(долгота, широта), дата
+# измерения становится и датой осмотра.
+_INSERT_TREE_VERSIONS = """
+    WITH input AS (
+        SELECT i.*, row_number() OVER (PARTITION BY i.tree_id ORDER BY i.measured_at, i.ord) AS n
+        FROM unnest($1::uuid[], $2::float8[], $3::float8[], $4::float8[], $5::text[], $6::text[],
+                    $7::timestamptz[], $8::float8[], $9::text[])
+             WITH ORDINALITY AS i(tree_id, longitude, latitude, height, species, health_status,
+                                  measured_at, diameter, notes, ord)
+    ),
+    base AS (
+        SELECT v.tree_id, MAX(v.version_number) AS version_number
+        FROM tree_versions v
+        WHERE v.tree_id IN (SELECT tree_id FROM input)
+        GROUP BY v.tree_id
+    ),
+    numbered AS (
+        SELECT i.*, COALESCE(b.version_number, 0) + i.n AS version_number
+        FROM input i
+        LEFT JOIN base b ON b.tree_id = i.tree_id
+    ),
+    versions AS (
+        INSERT INTO tree_versions (tree_id, version_number, created_at)
+        SELECT tree_id, version_number, measured_at FROM numbered
+        RETURNING version_id, tree_id, version_number
+    )
+    INSERT INTO trees (tree_id, version_id, location, height, species, health_status,
+                       diameter, last_inspection_date, notes)
+    SELECT n.tree_id, v.version_id, point(n.longitude, n.latitude), n.height, n.species, n.health_status,
+           n.diameter, n.measured_at, n.notes
+    FROM numbered n
+    JOIN versions v ON v.tree_id = n.tree_id AND v.version_number = n.version_number
+"""
+
+def _notes(chunk: pd.DataFrame) -> List[Optional[str]]:
+    """Заметки порции; колонка notes необязательна, пропуски передаются как NULL"""
+    if 'notes' not in chunk.columns:
+        return [None] * len(chunk)
+    return [str(note) if pd.notna(note) else None for note in chunk['notes'].tolist()]
+
+class DataBatchSink:
+    """Запись порций в конвейер батчей (data_batches) массовой вставкой"""
+
+    def __init__(self, batch_writer: BulkBatchWriter):
+        self.batch_writer = batch_writer
+        self.rows_written = 0
+
+    async def __call__(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        batches: List[TreeDataBatch] = [
+            TreeDataBatch(UUID(tree_id), {
+                'location': [longitude, latitude],
+                'height': height,
+                'species': species,
+                'health_status': health_status,
+                'diameter': diameter,
+                'notes': notes,
+                'last_inspection_date': measured_at.isoformat()
+            })
+            for tree_id, longitude, latitude, height, species, health_status, diameter, notes, measured_at in zip(
+                chunk['tree_id'], chunk['longitude'].tolist(), chunk['latitude'].tolist(),
+                chunk['height'].tolist(), chunk['species'], chunk['health_status'],
+                chunk['diameter'].tolist(), _notes(chunk), chunk['measurement_date'])
+        ]
+        self.rows_written += await self.batch_writer.create_batches(batches)
+        return chunk
+
+class TreeSink:
+    """Прямая запись порций в trees с созданием новых версий деревьев.
+
+    Для исторических выгрузок: created_at версии берется из даты измерения.
+    Сводки обновляются в той же транзакции по разнице состояний деревьев
+    порции до и после вставки; блокировки деревьев порции также не дают
+    параллельным воркерам назначить одинаковые номера версий.
+    """
+
+    def __init__(self, pool: Pool):
+        self.pool = pool
+        self.rows_written = 0
+
+    async def __call__(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        tree_ids = chunk['tree_id'].astype(str).tolist()
+        async with self.pool.acquire() as connection:
+            async with connection.transaction():
+                async with track_rollups_many(connection, tree_ids):
+                    result = await connection.execute(
+                        _INSERT_TREE_VERSIONS,
+                        tree_ids,
+                        chunk['longitude'].tolist(),
+                        chunk['latitude'].tolist(),
+                        chunk['height'].tolist(),
+                        chunk['species'].astype(str).tolist(),
+                        chunk['health_status'].astype(str).tolist(),
+                        chunk['measurement_date'].dt.to_pydatetime().tolist(),
+                        chunk['diameter'].tolist(),
+                        _notes(chunk)
+                    )
+        self.rows_written += int(result.split()[-1])
+        return chunk
@@ -0,0 +1,444 @@
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from itertools import groupby
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+from uuid import uuid4
+import numpy as np
+from asyncpg import Pool
+from ..tree_analysis.domain.columnar import TreeColumns
+from ..tree_analysis.domain.timeseries import MeasurementRollup
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ARROW = 'arrow'
+PARQUET = 'parquet'
+
+TREES = 'trees'
+RESULTS = 'analysis_results'
+MANIFEST = '_manifest.json'
+# Агрегаты измерений по дням, месяцам и годам; файл каждой выгрузки указан в ее записи описи
+ROLLUP = '_rollup-{export_id}.json'
+
+# Водяной знак - id транзакции (xid8), а не время: строки выгружаются по
+# insert_xid транзакции, которая их вставила. Все транзакции с id меньше xmin
+# снимка базы завершены, поэтому окно [прежний знак, xmin) уже не пополнится
+# ни поздно зафиксированными строками, ни задним числом (created_at в прошлом).
+
+# Последнее состояние деревьев, версии которых вставлены в окне водяных знаков.
+# Строки упорядочены по разделам (вид, дата), поэтому при записи открыт только
+# один файл. Колонка location хранит point(долгота, широта).
+_SNAPSHOT_TREES = """
+    SELECT tree_id, version_number, updated_at, latitude, longitude, height, species, health_status,
+           species AS partition_species, (updated_at AT TIME ZONE 'UTC')::date AS partition_date
+    FROM (
+        SELECT DISTINCT ON (t.tree_id)
+               t.tree_id::text AS tree_id, v.version_number, v.created_at AS updated_at,
+               t.location[1] AS latitude, t.location[0] AS longitude, t.height::float8 AS height,
+               t.species, t.health_status
+        FROM tree_versions v
+        JOIN trees t ON t.version_id = v.version_id
+        WHERE v.insert_xid >= $1::text::xid8 AND v.insert_xid < $2::text::xid8
+        ORDER BY t.tree_id, v.version_number DESC
+    ) latest
+    ORDER BY species, partition_date
+"""
+
+_SNAPSHOT_RESULTS = """
+    SELECT a.analysis_id::text, a.tree_id::text, a.status, a.created_at,
+           (a.details->>'health_score')::float8 AS health_score,
+           (a.details->>'trunk_diameter')::float8 AS trunk_diameter,
+           (a.details->>'crown_density')::float8 AS crown_density,
+           (a.details->>'co2_absorption')::float8 AS co2_absorption,
+           (a.details->>'biomass')::float8 AS biomass,
+           (a.details->>'age')::int8 AS age,
+           a.details::text AS details,
+           NULL AS partition_species, (a.created_at AT TIME ZONE 'UTC')::date AS partition_date
+    FROM analysis_results a
+    WHERE a.insert_xid >= $1::text::xid8 AND a.insert_xid < $2::text::xid8
+    ORDER BY partition_date
+"""
+
+def _require_pyarrow() -> None:
+    if pa is None:
+        raise ImportError("Snapshots require pyarrow")
+
+def _schemas() -> Dict[str, Any]:
+    timestamp = pa.timestamp('us', tz='UTC')
+    return {
+        TREES: pa.schema([
+            ('tree_id', pa.string()), ('version_number', pa.int32()), ('updated_at', timestamp),
+            ('latitude', pa.float64()), ('longitude', pa.float64()), ('height', pa.float64()),
+            ('species', pa.string()), ('health_status', pa.string())
+        ]),
+        RESULTS: pa.schema([
+            ('analysis_id', pa.string()), ('tree_id', pa.string()), ('status', pa.string()),
+            ('created_at', timestamp), ('health_score', pa.float64()), ('trunk_diameter', pa.float64()),
+            ('crown_density', pa.float64()), ('co2_absorption', pa.float64()), ('biomass', pa.float64()),
+            ('age', pa.int64()), ('details', pa.string())
+        ])
+    }
+
+def open_table(path: str) -> 'pa.Table':
+    """Чтение файла снимка: Arrow IPC отображается в память без копирования, Parquet - с mmap"""
+    _require_pyarrow()
+    if path.endswith('.parquet'):
+        return pq.read_table(path, memory_map=True)
+    return ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+@dataclass
+class SnapshotManifest:
+    """Опись снимков: водяной знак и файлы каждой выгрузки.
+
+    Читатели видят только файлы из описи, поэтому незавершенная выгрузка
+    (опись не обновлена) не влияет на результаты.
+    """
+    watermark: Optional[str] = None
+    exports: List[Dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def load(cls, root: str) -> 'SnapshotManifest':
+        path = os.path.join(root, MANIFEST)
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as handle:
+            return cls(**json.load(handle))
+
+    def save(self, root: str) -> None:
+        path = os.path.join(root, MANIFEST)
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(asdict(self), handle, indent=2)
+        os.replace(path + '.tmp', path)
+
+    @property
+    def watermark_xid(self) -> str:
+        """Нижняя граница следующей выгрузки; опись с водяным знаком-временем выгружается заново"""
+        return self.watermark if self.watermark and self.watermark.isdigit() else '0'
+
+    def files(self, dataset: str) -> List[str]:
+        return [path for export in self.exports for path in export['files'].get(dataset, [])]
+
+    @property
+    def rollup(self) -> Optional[str]:
+        """Файл агрегатов измерений последней выгрузки"""
+        return self.exports[-1].get('rollup') if self.exports else None
+
+class _PartitionWriter:
+    """Запись упорядоченных по разделам строк: один открытый файл за раз"""
+
+    def __init__(self, root: str, dataset: str, schema: 'pa.Schema', export_id: str, fmt: str):
+        self.root = root
+        self.dataset = dataset
+        self.schema = schema
+        self.export_id = export_id
+        self.fmt = fmt
+        self.files: List[str] = []
+        self.rows = 0
+        self._partition = None
+        self._writer = None
+        self._path: Optional[str] = None
+
+    def write(self, partition: tuple, rows: Sequence[Sequence[Any]]) -> None:
+        if partition != self._partition:
+            self._close_file()
+            self._open_file(partition)
+        columns = list(zip(*rows))
+        batch = pa.record_batch([pa.array(values, type=f.type) for values, f in zip(columns, self.schema)],
+                                schema=self.schema)
+        if self.fmt == PARQUET:
+            self._writer.write_batch(batch)
+        else:
+            self._writer.write(batch)
+        self.rows += len(rows)
+
+    def _open_file(self, partition: tuple) -> None:
+        species, date = partition
+        parts = [self.dataset]
+        if species is not None:
+            parts.append(f"species={quote(species, safe='')}")
+        parts.append(f"date={date.isoformat()}")
+        directory = os.path.join(self.root, *parts)
+        os.makedirs(directory, exist_ok=True)
+        relative = os.path.join(*parts, f"part-{self.export_id}.{self.fmt}")
+        self._path = os.path.join(self.root, relative)
+        if self.fmt == PARQUET:
+            self._writer = pq.ParquetWriter(self._path + '.tmp', self.schema)
+        else:
+            # Без сжатия: файл читается отображением в память без декодирования
+            self._writer = ipc.new_file(self._path + '.tmp', self.schema)
+        self._partition = partition
+        self.files.append(relative)
+
+    def _close_file(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            os.replace(self._path + '.tmp', self._path)
+            self._writer = None
+
+    def close(self) -> None:
+        self._close_file()
+
+    def abort(self) -> None:
+        """Удаление файлов незавершенной выгрузки"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for relative in self.files:
+            path = os.path.join(self.root, relative)
+            for candidate in (path, path + '.tmp'):
+                if os.path.exists(candidate):
+                    os.remove(candidate)
+
+class SnapshotExporter:
+    """Инкрементальная выгрузка снимков деревьев и результатов анализа из PostgreSQL.
+
+    Выгружаются только версии и результаты, вставленные транзакциями с id
+    от водяного знака предыдущей выгрузки до xmin текущего снимка базы.
+    Транзакции, еще не завершенные к выгрузке, попадают в следующую.
+    Деревья разбиваются на разделы по виду и дате, результаты - по дате.
+    """
+
+    def __init__(self, pool: Pool, root: str, fmt: str = ARROW, batch_size: int = 50000):
+        _require_pyarrow()
+        if fmt not in (ARROW, PARQUET):
+            raise ValueError(f"Unsupported snapshot format: {fmt}")
+        self.pool = pool
+        self.root = root
+        self.fmt = fmt
+        self.batch_size = batch_size
+
+    async def export(self) -> Dict[str, Any]:
+        """Выгрузка изменений с последнего снимка; возвращает запись описи"""
+        os.makedirs(self.root, exist_ok=True)
+        manifest = SnapshotManifest.load(self.root)
+        export_id = uuid4().hex
+        schemas = _schemas()
+        writers = {dataset: _PartitionWriter(self.root, dataset, schemas[dataset], export_id, self.fmt)
+                   for dataset in (TREES, RESULTS)}
+        try:
+            async with self.pool.acquire() as connection:
+                # Оба набора читаются из одного согласованного снимка базы
+                async with connection.transaction(isolation='repeatable_read', readonly=True):
+                    upper = await connection.fetchval("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+                    for dataset, query in ((TREES, _SNAPSHOT_TREES), (RESULTS, _SNAPSHOT_RESULTS)):
+                        cursor = await connection.cursor(query, manifest.watermark_xid, upper)
+                        while True:
+                            rows = await cursor.fetch(self.batch_size)
+                            if not rows:
+                                break
+                            self._write_rows(writers[dataset], rows)
+            for writer in writers.values():
+                writer.close()
+            rollup_path = self._update_rollup(manifest, export_id, writers)
+        except BaseException:
+            for writer in writers.values():
+                writer.abort()
+            raise
+
+        entry = {
+            'export_id': export_id,
+            'format': self.fmt,
+            'watermark': upper,
+            'exported_at': datetime.now(timezone.utc).isoformat(),
+            'rows': {dataset: writer.rows for dataset, writer in writers.items()},
+            'files': {dataset: writer.files for dataset, writer in writers.items()},
+            'rollup': rollup_path
+        }
+        previous = manifest.rollup
+        manifest.exports.append(entry)
+        manifest.watermark = entry['watermark']
+        manifest.save(self.root)
+        # Прежние агрегаты не нужны, как только опись указывает на новые
+        if previous and os.path.exists(os.path.join(self.root, previous)):
+            os.remove(os.path.join(self.root, previous))
+        return entry
+
+    def _update_rollup(self, manifest: 'SnapshotManifest', export_id: str,
+                       writers: Dict[str, '_PartitionWriter']) -> str:
+        """Агрегаты прежних выгрузок, дополненные строками этой выгрузки.
+
+        Если прежние выгрузки сделаны без агрегатов, они строятся по всем файлам
+        описи. Запись описи ссылается на новый файл, поэтому прерванная выгрузка
+        не учитывает строки дважды.
+        """
+        if manifest.rollup:
+            with open(os.path.join(self.root, manifest.rollup)) as handle:
+                rollup = MeasurementRollup.from_dict(json.load(handle))
+            trees, results = writers[TREES].files, writers[RESULTS].files
+        else:
+            rollup = MeasurementRollup()
+            trees = manifest.files(TREES) + writers[TREES].files
+            results = manifest.files(RESULTS) + writers[RESULTS].files
+        add_to_rollup(rollup, self.root, trees, results, manifest.files(TREES) + writers[TREES].files)
+
+        relative = ROLLUP.format(export_id=export_id)
+        path = os.path.join(self.root, relative)
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(rollup.to_dict(), handle)
+        os.replace(path + '.tmp', path)
+        return relative
+
+    @staticmethod
+    def _write_rows(writer: _PartitionWriter, rows: Sequence[Any]) -> None:
+        # Две последние колонки запроса - ключ раздела, в файл не пишутся
+        for partition, group in groupby(map(tuple, rows), key=lambda row: row[-2:]):
+            writer.write(partition, [row[:-2] for row in group])
+
+def _latest(table: 'pa.Table', key: str, order: str) -> 'pa.Table':
+    """Последняя строка по order для каждого значения key"""
+    if len(table) < 2:
+        return table
+    table = table.take(pc.sort_indices(table, sort_keys=[(key, 'ascending'), (order, 'descending')]))
+    keys = table.column(key).combine_chunks()
+    first = np.ones(len(table), dtype=bool)
+    first[1:] = pc.not_equal(keys.slice(1), keys.slice(0, len(keys) - 1)).to_numpy(zero_copy_only=False)
+    return table.filter(pa.array(first))
+
+def _read_columns(root: str, paths: Sequence[str], dataset: str, columns: List[str]) -> 'pa.Table':
+    tables = [open_table(os.path.join(root, path)).select(columns) for path in paths]
+    if not tables:
+        return _schemas()[dataset].empty_table().select(columns)
+    return pa.concat_tables(tables)
+
+def _floats(column: 'pa.ChunkedArray') -> np.ndarray:
+    return np.asarray(pc.fill_null(column, float('nan')).to_numpy(), dtype=np.float64)
+
+def add_to_rollup(rollup: MeasurementRollup, root: str, trees_files: Sequence[str],
+                  results_files: Sequence[str], species_files: Sequence[str]) -> MeasurementRollup:
+    """Измерения файлов снимка в агрегатах.
+
+    Высота берется из выгруженных версий деревьев (по строке на дерево и
+    выгрузку), диаметр ствола и поглощение CO2 - из результатов анализа. Вид
+    дерева для результата определяется последней версией в species_files.
+    """
+    trees = _read_columns(root, trees_files, TREES, ['tree_id', 'species', 'updated_at', 'height'])
+    if len(trees):
+        rollup.add_measurements(trees.column('tree_id').to_pylist(), trees.column('species').to_pylist(),
+                                trees.column('updated_at').to_numpy(), {'height': _floats(trees.column('height'))})
+    results = _read_columns(root, results_files, RESULTS,
+                            ['tree_id', 'created_at', 'trunk_diameter', 'co2_absorption'])
+    if len(results):
+        latest = _latest(_read_columns(root, species_files, TREES, ['tree_id', 'version_number', 'species']),
+                         'tree_id', 'version_number')
+        species = dict(zip(latest.column('tree_id').to_pylist(), latest.column('species').to_pylist()))
+        ids = results.column('tree_id').to_pylist()
+        rollup.add_measurements(ids, [species.get(tree_id) for tree_id in ids],
+                                results.column('created_at').to_numpy(),
+                                {metric: _floats(results.column(metric))
+                                 for metric in ('trunk_diameter', 'co2_absorption')})
+    return rollup
+
+class SnapshotReader:
+    """Чтение снимков для отчетов без обращения к OLTP-базе"""
+
+    def __init__(self, root: str):
+        _require_pyarrow()
+        self.root = root
+        self._manifest_mtime: Optional[float] = None
+        self.manifest = SnapshotManifest()
+        self._rollup: Optional[Tuple[Tuple[Optional[str], Optional[str]], MeasurementRollup]] = None
+        self.refresh()
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self.manifest.watermark
+
+    def refresh(self) -> bool:
+        """Перечитывание описи после новой выгрузки; True, если она изменилась"""
+        path = os.path.join(self.root, MANIFEST)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime == self._manifest_mtime:
+            return False
+        self._manifest_mtime = mtime
+        self.manifest = SnapshotManifest.load(self.root)
+        return True
+
+    def read(self, dataset: str, species: Optional[Sequence[str]] = None) -> 'pa.Table':
+        """Все строки набора; фильтр по видам отбрасывает разделы без открытия файлов"""
+        files = self.manifest.files(dataset)
+        if species is not None:
+            wanted = set(species)
+            files = [path for path in files if self._partition_species(path) in wanted]
+        tables = [open_table(os.path.join(self.root, path)) for path in files]
+        if not tables:
+            return _schemas()[dataset].empty_table()
+        return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+
+    def latest_trees(self, species: Optional[Sequence[str]] = None) -> 'pa.Table':
+        """Последнее состояние деревьев (одна выгрузка уже содержит по строке на дерево).
+
+        Дерево могло сменить вид между выгрузками, а прежняя строка осталась в
+        разделе старого вида. Поэтому при нескольких выгрузках строки сначала
+        сводятся по tree_id во всех разделах и только затем фильтруются по видам.
+        """
+        if len(self.manifest.exports) <= 1:
+            return self.read(TREES, species)
+        table = _latest(self.read(TREES), 'tree_id', 'version_number')
+        if species is not None:
+            table = table.filter(pc.is_in(table.column('species'), value_set=pa.array(list(species), pa.string())))
+        return table
+
+    def latest_results(self) -> 'pa.Table':
+        """Последний результат анализа каждого дерева"""
+        return _latest(self.read(RESULTS), 'tree_id', 'created_at')
+
+    def measurement_rollup(self) -> MeasurementRollup:
+        """Агрегаты измерений по дням, месяцам и годам, которые ведет SnapshotExporter.
+
+        Файл читается один раз на выгрузку; снимки без агрегатов (сделанные до
+        их появления) дают агрегаты по всем файлам описи.
+        """
+        path = self.manifest.rollup
+        key = (path, self.manifest.watermark)
+        if self._rollup is None or self._rollup[0] != key:
+            if path:
+                with open(os.path.join(self.root, path)) as handle:
+                    rollup = MeasurementRollup.from_dict(json.load(handle))
+            else:
+                rollup = add_to_rollup(MeasurementRollup(), self.root, self.manifest.files(TREES),
+                                       self.manifest.files(RESULTS), self.manifest.files(TREES))
+            self._rollup = (key, rollup)
+        return self._rollup[1]
+
+    def tree_columns(self, species: Optional[Sequence[str]] = None) -> TreeColumns:
+        """Колоночный набор для сервисов анализа и VisualizationService"""
+        trees = self.latest_trees(species)
+        results = self.latest_results().select(
+            ['tree_id', 'trunk_diameter', 'crown_density', 'age', 'co2_absorption', 'biomass'])
+        trees = trees.join(results, 'tree_id', join_type='left outer')
+
+        # Деревья без анализа: поглощение и биомасса не учитываются в суммах (0),
+        # размеры кроны и ствола неизвестны (NaN), возраст 0
+        fill: Dict[str, Callable[['pa.ChunkedArray'], Any]] = {
+            'co2_absorption': lambda column: pc.fill_null(column, 0.0),
+            'biomass': lambda column: pc.fill_null(column, 0.0),
+            'age': lambda column: pc.fill_null(column, 0),
+            'trunk_diameter': lambda column: pc.fill_null(column, float('nan')),
+            'crown_density': lambda column: pc.fill_null(column, float('nan'))
+        }
+        names = {'tree_id': 'ids', 'health_status': 'health_condition', 'updated_at': 'measurement_date'}
+        columns = {names.get(name, name): fill[name](trees.column(name)) if name in fill else trees.column(name)
+                   for name in trees.column_names}
+        return TreeColumns.from_arrow(pa.table(columns))
+
+    @staticmethod
+    def _partition_species(path: str) -> Optional[str]:
+        for part in path.split(os.sep):
+            if part.startswith('species='):
+                return unquote(part[len('species='):])
+        return None
+
+async def export_snapshot(pool: Pool, root: str, **options: Any) -> Dict[str, Any]:
+    """Выгрузка снимка с выводом числа строк по наборам"""
+    entry = await SnapshotExporter(pool, root, **options).export()
+    print(f"snapshot {entry['export_id']} up to {entry['watermark']}: "
+          f"{entry['rows'][TREES]} trees, {entry['rows'][RESULTS]} analysis results")
+    return entry
@@ -0,0 +1,116 @@
+from typing import Dict, Optional, Sequence, Set
+import numpy as np
+import pandas as pd
+
+# Синонимы колонок из разных источников инвентаризации
+COLUMN_ALIASES = {
+    'id': 'tree_id',
+    'lat': 'latitude',
+    'lon': 'longitude',
+    'lng': 'longitude',
+    'height_m': 'height',
+    'diameter_cm': 'diameter',
+    'trunk_diameter': 'diameter',
+    'health': 'health_status',
+    'health_condition': 'health_status',
+    'last_inspection_date': 'measurement_date',
+    'date': 'measurement_date'
+}
+
+REQUIRED_COLUMNS = ('tree_id', 'species', 'height', 'diameter', 'health_status',
+                    'latitude', 'longitude', 'measurement_date')
+
+# Множители перевода в метры (высота) и сантиметры (диаметр)
+HEIGHT_UNITS = {'m': 1.0, 'cm': 0.01, 'ft': 0.3048}
+DIAMETER_UNITS = {'cm': 1.0, 'mm': 0.1, 'm': 100.0, 'in': 2.54}
+
+# Допустимые диапазоны значений после нормализации единиц
+VALUE_RANGES = {
+    'height': (0.0, 150.0),
+    'diameter': (0.0, 2000.0),
+    'latitude': (-90.0, 90.0),
+    'longitude': (-180.0, 180.0)
+}
+
+def normalize_columns(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Приведение имен колонок к единой схеме"""
+    columns = {column: str(column).strip().lower() for column in chunk.columns}
+    chunk = chunk.rename(columns=columns)
+    return chunk.rename(columns={alias: name for alias, name in COLUMN_ALIASES.items()
+                                 if alias in chunk.columns and name not in chunk.columns})
+
+def _unit_factors(units: pd.Series, factors: Dict[str, float]) -> np.ndarray:
+    # Пустая единица означает базовую (м для высоты, см для диаметра)
+    normalized = units.fillna('').astype(str).str.strip().str.lower()
+    return normalized.map({'': 1.0, **factors}).astype('float64').to_numpy()
+
+def convert_units(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Перевод высоты в метры и диаметра в сантиметры по колонкам height_unit и diameter_unit.
+
+    Строки с неизвестной единицей получают NaN и отбрасываются при очистке.
+    """
+    chunk = chunk.copy()
+    for column, unit_column, factors in (('height', 'height_unit', HEIGHT_UNITS),
+                                         ('diameter', 'diameter_unit', DIAMETER_UNITS)):
+        if column not in chunk.columns:
+            continue
+        values = pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=np.float64)
+        if unit_column in chunk.columns:
+            values = values * _unit_factors(chunk[unit_column], factors)
+            chunk = chunk.drop(columns=unit_column)
+        chunk[column] = values
+    return chunk
+
+def clean(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Векторная очистка порции: типы, пробелы и регистр, обязательные поля, диапазоны"""
+    missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    chunk = chunk.loc[:, [column for column in chunk.columns
+                          if column in REQUIRED_COLUMNS or column == 'notes']].copy()
+    chunk['tree_id'] = chunk['tree_id'].astype('string').str.strip().str.lower()
+    chunk['species'] = chunk['species'].astype('string').str.strip()
+    chunk['health_status'] = chunk['health_status'].astype('string').str.strip().str.lower()
+    chunk['measurement_date'] = pd.to_datetime(chunk['measurement_date'], errors='coerce', utc=True)
+
+    valid = np.ones(len(chunk), dtype=bool)
+    for column, (minimum, maximum) in VALUE_RANGES.items():
+        values = pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=np.float64)
+        chunk[column] = values
+        valid &= (values >= minimum) & (values <= maximum)
+    valid &= chunk['height'].to_numpy() > 0
+    valid &= chunk['diameter'].to_numpy() > 0
+    valid &= chunk['tree_id'].str.fullmatch(
+        r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}').fillna(False).to_numpy(dtype=bool)
+    for column in ('species', 'health_status'):
+        valid &= (chunk[column].fillna('') != '').to_numpy(dtype=bool)
+    valid &= chunk['measurement_date'].notna().to_numpy()
+    return chunk[valid]
+
+class Deduplicator:
+    """Удаление повторов по ключу (по умолчанию дерево и дата измерения) внутри и между порциями.
+
+    Хранятся только 64-битные хэши увиденных ключей, поэтому память растет
+    с числом уникальных записей, а не с объемом данных. Стадия с состоянием,
+    в конвейере используется с parallelism=1.
+    """
+
+    def __init__(self, key_columns: Sequence[str] = ('tree_id', 'measurement_date'),
+                 seen: Optional[Set[int]] = None):
+        self.key_columns = list(key_columns)
+        self.seen: Set[int] = seen if seen is not None else set()
+        self.duplicates = 0
+
+    def __call__(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        hashes = pd.util.hash_pandas_object(chunk[self.key_columns], index=False).to_numpy()
+        first = ~pd.Series(hashes).duplicated().to_numpy()
+        seen = self.seen
+        first &= np.fromiter((value not in seen for value in hashes.tolist()), dtype=bool, count=len(hashes))
+        seen.update(hashes[first].tolist())
+        self.duplicates += int(len(chunk) - first.sum())
+        return chunk[first]
+
+def prepare(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Нормализация схемы, единиц и очистка одной порции"""
+    return clean(convert_units(normalize_columns(chunk)))
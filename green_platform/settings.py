@@ -61,6 +61,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'green_platform.wsgi.application'
+ASGI_APPLICATION = 'green_platform.asgi.application'
 
 DATABASES = {
     'default': {
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, fields
+from typing import Any, Iterable, List
+import numpy as np
+from .entities import TreeAnalysis
+
+@dataclass
+class TreeColumns:
+    """Колоночное представление набора деревьев (по одному массиву numpy на признак)"""
+    ids: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    height: np.ndarray
+    trunk_diameter: np.ndarray
+    crown_density: np.ndarray
+    age: np.ndarray
+    co2_absorption: np.ndarray
+    biomass: np.ndarray
+    species: np.ndarray
+    health_condition: np.ndarray
+    measurement_date: np.ndarray
+
+    @classmethod
+    def from_trees(cls, trees: Iterable[TreeAnalysis]) -> 'TreeColumns':
+        """Извлечение колонок за один проход по списку деревьев"""
+        columns: List[list] = [[] for _ in range(12)]
+        (ids, latitude, longitude, height, trunk_diameter, crown_density, age,
+         co2_absorption, biomass, species, health_condition, measurement_date) = columns
+        for tree in trees:
+            c = tree.characteristics
+            ids.append(str(tree.id))
+            latitude.append(c.location_latitude)
+            longitude.append(c.location_longitude)
+            height.append(c.height)
+            trunk_diameter.append(c.trunk_diameter)
+            crown_density.append(c.crown_density)
+            age.append(c.age)
+            co2_absorption.append(c.co2_absorption)
+            biomass.append(c.biomass)
+            species.append(c.species)
+            health_condition.append(c.health_condition)
+            measurement_date.append(tree.measurement_date)
+
+        return cls(
+            ids=np.array(ids, dtype=object),
+            latitude=np.array(latitude, dtype=np.float64),
+            longitude=np.array(longitude, dtype=np.float64),
+            height=np.array(height, dtype=np.float64),
+            trunk_diameter=np.array(trunk_diameter, dtype=np.float64),
+            crown_density=np.array(crown_density, dtype=np.float64),
+            age=np.array(age, dtype=np.int64),
+            co2_absorption=np.array(co2_absorption, dtype=np.float64),
+            biomass=np.array(biomass, dtype=np.float64),
+            species=np.array(species, dtype=object),
+            health_condition=np.array(health_condition, dtype=object),
+            measurement_date=np.array(measurement_date, dtype='datetime64[us]')
+        )
+
+    @classmethod
+    def from_arrow(cls, table: Any) -> 'TreeColumns':
+        """Колонки из таблицы Arrow с именами полей TreeColumns.
+
+        Числовые колонки из одного фрагмента без пропусков возвращаются без
+        копирования (например, из отображенного в память файла снимка),
+        такие массивы доступны только для чтения.
+        """
+        dtypes = {'ids': object, 'species': object, 'health_condition': object,
+                  'age': np.int64, 'measurement_date': 'datetime64[us]'}
+        values = {}
+        for f in fields(cls):
+            column = table.column(f.name)
+            column = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+            values[f.name] = np.asarray(column.to_numpy(zero_copy_only=False),
+                                        dtype=dtypes.get(f.name, np.float64))
+        return cls(**values)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, indices: np.ndarray) -> 'TreeColumns':
+        """Подмножество деревьев по позиционным индексам"""
+        return TreeColumns(**{f.name: getattr(self, f.name)[indices] for f in fields(self)})
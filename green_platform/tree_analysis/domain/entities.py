@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional, List
 from uuid import UUID, uuid4
@@ -22,19 +22,19 @@ class TreeCharacteristics:
 @dataclass
 class TreeAnalysis:
     """Анализ дерева с уникальным идентификатором и временем измерения"""
-    id: UUID = uuid4()
     characteristics: TreeCharacteristics
     measurement_date: datetime
+    id: UUID = field(default_factory=uuid4)
     notes: Optional[str] = None
     environmental_impact_score: Optional[float] = None
 
 @dataclass
 class AnalysisResult:
     """Результаты анализа группы деревьев"""
-    analysis_id: UUID = uuid4()
     trees: List[TreeAnalysis]
     total_co2_absorption: float
     average_health_score: float
     biodiversity_index: float
     analysis_date: datetime
+    analysis_id: UUID = field(default_factory=uuid4)
     recommendations: Optional[str] = None
\ No newline at end of file
@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import List, Protocol
+from typing import Any, ContextManager, Iterable, Iterator, List, Optional, Protocol, Union
 from datetime import datetime
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
 from .entities import TreeAnalysis, AnalysisResult, TreeCharacteristics
+from .columnar import TreeColumns
+from .sketches import TreeStatsSketch
+from .timeseries import MeasurementRollup
 
 class DataProcessingStrategy(Protocol):
     """Протокол для стратегий обработки данных"""
@@ -15,6 +17,11 @@ class AnalysisStrategy(Protocol):
     def analyze(self, characteristics: List[TreeCharacteristics]) -> float:
         pass
 
+class ModelProvider(Protocol):
+    """Протокол источника обученных моделей (например, ModelRegistry)"""
+    def lease(self, version: Optional[str] = None) -> ContextManager[Any]:
+        pass
+
 class BatchProcessor:
     """Обработчик пакетных операций с данными"""
     def __init__(self, processing_strategy: DataProcessingStrategy):
@@ -30,22 +37,44 @@ class BatchProcessor:
 
 class TreeAnalysisService:
     """Сервис для анализа данных о деревьях"""
-    def __init__(self, batch_processor: BatchProcessor):
+    def __init__(self, batch_processor: BatchProcessor,
+                 model_provider: Optional[ModelProvider] = None):
         self.batch_processor = batch_processor
-        self._ml_model = RandomForestRegressor()
+        # Общая для процесса модель из реестра; локальная модель - только без реестра
+        # и создается при первом прогнозе, чтобы импорт сервиса не загружал scikit-learn
+        self.model_provider = model_provider
+        self._ml_model = None
 
     def calculate_environmental_impact(self, trees: List[TreeAnalysis]) -> float:
         """Расчет влияния на окружающую среду"""
         processed_data = self.batch_processor.process_batch(trees)
         return float(np.mean(processed_data[:, -1]))
 
-    def predict_growth(self, tree: TreeAnalysis) -> float:
-        """Прогнозирование роста дерева"""
+    def predict_growth(self, tree: TreeAnalysis, rollup: Optional[MeasurementRollup] = None) -> float:
+        """Прогнозирование роста дерева.
+
+        По агрегатам измерений rollup прогноз - наблюдаемый прирост высоты в
+        метрах в год (estimate_growth_rate); модель используется, только если
+        истории нет ни у дерева, ни у вида.
+        """
+        if rollup is not None:
+            rate = self.estimate_growth_rate(tree, rollup)
+            if rate is not None:
+                return rate
         features = np.array([[tree.characteristics.height,
                             tree.characteristics.trunk_diameter,
                             tree.characteristics.crown_density,
                             tree.characteristics.age]])
-        return float(self._ml_model.predict(features)[0])
+        if self.model_provider is None:
+            return float(self._local_model().predict(features)[0])
+        with self.model_provider.lease() as model:
+            return float(model.predict(features)[0])
+
+    def _local_model(self) -> Any:
+        if self._ml_model is None:
+            from sklearn.ensemble import RandomForestRegressor
+            self._ml_model = RandomForestRegressor()
+        return self._ml_model
 
     def create_analysis_result(self, trees: List[TreeAnalysis]) -> AnalysisResult:
         """Создание результата анализа группы деревьев"""
@@ -62,6 +91,42 @@ class TreeAnalysisService:
             analysis_date=datetime.now()
         )
 
+    def build_stats_sketch(self, trees: Iterable[TreeAnalysis],
+                           sketch: Optional[TreeStatsSketch] = None) -> TreeStatsSketch:
+        """Приближенные агрегаты по потоку деревьев без материализации списка.
+
+        Переданный скетч дополняется, что позволяет объединять батчи,
+        рабочие процессы и дни через TreeStatsSketch.merge.
+        """
+        return (sketch or TreeStatsSketch()).add_many(trees)
+
+    def create_approximate_summary(self, trees: Iterable[TreeAnalysis]) -> dict:
+        """Биоразнообразие, индексы Шеннона/Симпсона и квантили с оценками ошибок"""
+        return self.build_stats_sketch(trees).summary()
+
+    def create_columnar_summary(self, columns: TreeColumns) -> dict:
+        """То же по колоночному набору (например, из снимка SnapshotReader.tree_columns)"""
+        return TreeStatsSketch().add_columns(columns).summary()
+
+    def build_measurement_rollup(self, trees: Union[Iterable[TreeAnalysis], TreeColumns],
+                                 rollup: Optional[MeasurementRollup] = None) -> MeasurementRollup:
+        """Агрегаты измерений по дням, месяцам и годам для деревьев и видов.
+
+        Переданные агрегаты дополняются, как в build_stats_sketch.
+        """
+        rollup = rollup or MeasurementRollup()
+        if isinstance(trees, TreeColumns):
+            return rollup.add_columns(trees)
+        return rollup.add_many(trees)
+
+    def estimate_growth_rate(self, tree: TreeAnalysis, rollup: MeasurementRollup) -> Optional[float]:
+        """Прирост высоты в метрах в год по истории измерений дерева, а при
+        недостатке истории - по виду"""
+        rate = rollup.growth_rate('tree', str(tree.id))
+        if rate is None:
+            rate = rollup.growth_rate('species', tree.characteristics.species)
+        return rate
+
 class StandardDataProcessing(DataProcessingStrategy):
     """Стандартная стратегия обработки данных"""
     def process_data(self, data: np.ndarray) -> np.ndarray:
@@ -78,4 +143,107 @@ class AdvancedDataProcessing(DataProcessingStrategy):
             np.square(normalized),  # квадратичные характеристики
             np.exp(normalized)      # экспоненциальные характеристики
         ])
-        return derived_features
\ No newline at end of file
+        return derived_features
+
+def iter_chunks(data: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    """Разбиение массива (в том числе np.memmap) на фрагменты без копирования"""
+    for start in range(0, data.shape[0], chunk_size):
+        yield data[start:start + chunk_size]
+
+class StreamingDataProcessing(DataProcessingStrategy):
+    """Потоковый вариант AdvancedDataProcessing для данных, не помещающихся в память.
+
+    Статистики нормализации накапливаются по фрагментам методом Уэлфорда
+    (с объединением по Чану), а производные признаки записываются на месте
+    в заранее выделенный выходной массив или отдаются генератором.
+    """
+    def __init__(self, chunk_size: int = 65536, dtype: Any = np.float64):
+        self.chunk_size = chunk_size
+        self.dtype = np.dtype(dtype)  # тип выходных признаков (float32 вдвое экономит память)
+        self.reset()
+
+    def reset(self) -> None:
+        """Сброс накопленных статистик"""
+        self.count = 0
+        self._mean: Optional[np.ndarray] = None
+        self._m2: Optional[np.ndarray] = None
+
+    def partial_fit(self, chunk: np.ndarray) -> 'StreamingDataProcessing':
+        """Обновление среднего и дисперсии по очередному фрагменту"""
+        # Статистики всегда накапливаются в float64 для численной устойчивости
+        chunk = np.asarray(chunk, dtype=np.float64)
+        n = chunk.shape[0]
+        if n == 0:
+            return self
+
+        chunk_mean = chunk.mean(axis=0)
+        centered = chunk - chunk_mean
+        np.square(centered, out=centered)
+        chunk_m2 = centered.sum(axis=0)
+
+        if self.count == 0:
+            self._mean, self._m2, self.count = chunk_mean, chunk_m2, n
+            return self
+
+        total = self.count + n
+        delta = chunk_mean - self._mean
+        self._mean += delta * (n / total)
+        self._m2 += chunk_m2 + np.square(delta) * (self.count * n / total)
+        self.count = total
+        return self
+
+    def fit(self, chunks: Iterable[np.ndarray]) -> 'StreamingDataProcessing':
+        """Расчет статистик нормализации по потоку фрагментов"""
+        self.reset()
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+    @property
+    def mean(self) -> np.ndarray:
+        self._check_fitted()
+        return self._mean
+
+    @property
+    def std(self) -> np.ndarray:
+        self._check_fitted()
+        return np.sqrt(self._m2 / self.count)
+
+    def transform(self, chunk: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Расчет признаков фрагмента: нормализованные, квадратичные и экспоненциальные"""
+        self._check_fitted()
+        n, width = chunk.shape
+        if out is None:
+            out = np.empty((n, 3 * width), dtype=self.dtype)
+        elif out.shape != (n, 3 * width):
+            raise ValueError(f"Output shape {out.shape} does not match {(n, 3 * width)}")
+
+        # Все операции пишут в срезы выходного массива без промежуточных копий
+        normalized = out[:, :width]
+        np.subtract(chunk, self._mean, out=normalized, casting='same_kind')
+        np.divide(normalized, self.std, out=normalized, casting='same_kind')
+        np.square(normalized, out=out[:, width:2 * width])
+        np.exp(normalized, out=out[:, 2 * width:])
+        return out
+
+    def transform_chunks(self, chunks: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """Генератор признаков по фрагментам"""
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+    def transform_into(self, data: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """Запись признаков в заранее выделенный массив (например, np.memmap на диске)"""
+        for start in range(0, data.shape[0], self.chunk_size):
+            stop = start + self.chunk_size
+            self.transform(data[start:stop], out=out[start:stop])
+        return out
+
+    def process_data(self, data: np.ndarray) -> np.ndarray:
+        """Совместимый с DataProcessingStrategy расчет признаков в два прохода по фрагментам"""
+        self.fit(iter_chunks(data, self.chunk_size))
+        out = np.empty((data.shape[0], 3 * data.shape[1]), dtype=self.dtype)
+        return self.transform_into(data, out)
+
+    def _check_fitted(self) -> None:
+        if self.count == 0:
+            raise ValueError("StreamingDataProcessing is not fitted")
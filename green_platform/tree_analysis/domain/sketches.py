@@ -0,0 +1,417 @@
+import base64
+import hashlib
+import math
+import random
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from .entities import TreeAnalysis
+from .columnar import TreeColumns
+
+def _hash64(value: str) -> int:
+    """Стабильный между процессами 64-битный хеш (hash() рандомизирован)"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class HyperLogLog:
+    """Оценка числа различных значений (HyperLogLog)"""
+
+    def __init__(self, precision: int = 12):
+        if not 4 <= precision <= 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, value: str) -> None:
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        remainder = (hashed << self.precision) & ((1 << 64) - 1)
+        rank = 64 - self.precision + 1 if remainder == 0 else 65 - remainder.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    @property
+    def relative_error(self) -> float:
+        """Стандартная относительная ошибка оценки"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.power(2.0, -self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # Линейный подсчет для малых мощностей
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'precision': self.precision,
+                'registers': base64.b64encode(self.registers.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HyperLogLog':
+        sketch = cls(data['precision'])
+        sketch.registers = np.frombuffer(base64.b64decode(data['registers']), dtype=np.uint8).copy()
+        return sketch
+
+class CountMinSketch:
+    """Оценка частот сверху: ошибка не более epsilon * N с вероятностью 1 - delta"""
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1 / delta)))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, value: str) -> np.ndarray:
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return np.array([(h1 + row * h2) % self.width for row in range(self.depth)], dtype=np.int64)
+
+    def add(self, value: str, count: int = 1) -> None:
+        self.table[np.arange(self.depth), self._columns(value)] += count
+        self.total += count
+
+    def estimate(self, value: str) -> int:
+        return int(self.table[np.arange(self.depth), self._columns(value)].min())
+
+    @property
+    def error_bound(self) -> float:
+        """Максимальная переоценка частоты (абсолютная)"""
+        return self.epsilon * self.total
+
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        if self.table.shape != other.table.shape:
+            raise ValueError("Cannot merge CountMinSketch sketches with different dimensions")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'epsilon': self.epsilon, 'delta': self.delta, 'total': self.total,
+                'table': base64.b64encode(self.table.tobytes()).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CountMinSketch':
+        sketch = cls(data['epsilon'], data['delta'])
+        sketch.table = np.frombuffer(base64.b64decode(data['table']),
+                                     dtype=np.int64).reshape(sketch.depth, sketch.width).copy()
+        sketch.total = data['total']
+        return sketch
+
+class SpaceSaving:
+    """Частые элементы (Space-Saving): переоценка каждого счетчика не более N / capacity"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.total = 0
+
+    def add(self, value: str, count: int = 1) -> None:
+        self.total += count
+        if value in self.counts:
+            self.counts[value] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[value] = count
+            self.errors[value] = 0
+            return
+        # Вытеснение минимального счетчика с наследованием его значения
+        victim = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(victim)
+        self.errors.pop(victim)
+        self.counts[value] = floor + count
+        self.errors[value] = floor
+
+    @property
+    def exact(self) -> bool:
+        """Счетчики точные, пока не было вытеснений"""
+        return not any(self.errors.values())
+
+    @property
+    def error_bound(self) -> float:
+        return 0.0 if self.exact else self.total / self.capacity
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """Объединение по схеме mergeable summaries (Agarwal et al.)"""
+        own_floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        other_floor = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        counts, errors = {}, {}
+        for value in set(self.counts) | set(other.counts):
+            counts[value] = self.counts.get(value, own_floor) + other.counts.get(value, other_floor)
+            errors[value] = (self.errors.get(value, own_floor) + other.errors.get(value, other_floor))
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.counts = {value: counts[value] for value in kept}
+        self.errors = {value: errors[value] for value in kept}
+        self.total += other.total
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'capacity': self.capacity, 'total': self.total,
+                'counts': self.counts, 'errors': self.errors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpaceSaving':
+        sketch = cls(data['capacity'])
+        sketch.counts = dict(data['counts'])
+        sketch.errors = dict(data['errors'])
+        sketch.total = data['total']
+        return sketch
+
+class KllSketch:
+    """Квантильный скетч KLL с объединяемыми компакторами"""
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.min_value = math.inf
+        self.max_value = -math.inf
+        self.compactors: List[List[float]] = [[]]
+        self._random = random.Random(seed)
+
+    @property
+    def rank_error(self) -> float:
+        """Нормированная ошибка ранга (двусторонняя, ~99% доверия)"""
+        return 2.446 / self.k ** 0.9433
+
+    def update(self, value: float) -> None:
+        self.compactors[0].append(value)
+        self.n += 1
+        self.min_value = min(self.min_value, value)
+        self.max_value = max(self.max_value, value)
+        if len(self.compactors[0]) >= self._capacity(0):
+            self._compress()
+
+    def update_many(self, values: Iterable[float]) -> None:
+        values = np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=np.float64)
+        if values.size == 0:
+            return
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        step = self._capacity(0)
+        for start in range(0, values.size, step):
+            chunk = values[start:start + step]
+            self.compactors[0].extend(chunk.tolist())
+            self.n += chunk.size
+            self._compress()
+
+    def merge(self, other: 'KllSketch') -> 'KllSketch':
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for level, items in enumerate(other.compactors):
+            self.compactors[level].extend(items)
+        self.n += other.n
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.n == 0:
+            return None
+        if q <= 0:
+            return self.min_value
+        if q >= 1:
+            return self.max_value
+        items, weights = self._weighted_items()
+        cumulative = np.cumsum(weights)
+        position = int(np.searchsorted(cumulative, q * cumulative[-1], side='left'))
+        return float(items[min(position, len(items) - 1)])
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        return [self.quantile(q) for q in qs]
+
+    def _weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate([np.asarray(c, dtype=np.float64) for c in self.compactors])
+        weights = np.concatenate([np.full(len(c), 1 << level, dtype=np.int64)
+                                  for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(int(math.ceil(self.k * (2 / 3) ** depth)), 2)
+
+    def _compress(self) -> None:
+        while sum(map(len, self.compactors)) >= sum(self._capacity(l) for l in range(len(self.compactors))):
+            for level, items in enumerate(self.compactors):
+                if len(items) >= self._capacity(level):
+                    if level + 1 == len(self.compactors):
+                        self.compactors.append([])
+                    items.sort()
+                    # Нечетный элемент остается на текущем уровне
+                    leftover = [items.pop()] if len(items) % 2 else []
+                    offset = self._random.getrandbits(1)
+                    self.compactors[level + 1].extend(items[offset::2])
+                    self.compactors[level] = leftover
+                    break
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'n': self.n, 'min': self.min_value, 'max': self.max_value,
+                'compactors': self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KllSketch':
+        sketch = cls(data['k'])
+        sketch.n = data['n']
+        sketch.min_value = data['min']
+        sketch.max_value = data['max']
+        sketch.compactors = [list(c) for c in data['compactors']]
+        return sketch
+
+class TreeStatsSketch:
+    """Объединяемые приближенные агрегаты по деревьям для масштаба города и региона.
+
+    Скетчи можно строить по батчам, рабочим процессам и дням, сериализовать
+    через to_dict() и объединять через merge(); каждый результат summary()
+    сопровождается оценкой ошибки.
+    """
+
+    QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+    NUMERIC_FIELDS = ('height', 'biomass', 'co2_absorption')
+
+    def __init__(self, hll_precision: int = 12, heavy_hitters: int = 1024,
+                 cms_epsilon: float = 0.001, kll_k: int = 200):
+        self.tree_count = 0
+        self.total_co2_absorption = 0.0
+        self.species_distinct = HyperLogLog(hll_precision)
+        self.species_frequencies = CountMinSketch(cms_epsilon)
+        self.species_heavy_hitters = SpaceSaving(heavy_hitters)
+        # Категорий состояния здоровья мало, поэтому они считаются точно
+        self.health_counts: Counter = Counter()
+        self.quantile_sketches = {name: KllSketch(kll_k) for name in self.NUMERIC_FIELDS}
+
+    def add(self, tree: TreeAnalysis) -> None:
+        c = tree.characteristics
+        self.tree_count += 1
+        self.total_co2_absorption += c.co2_absorption
+        self._add_species(c.species, 1)
+        self.health_counts[c.health_condition] += 1
+        self.quantile_sketches['height'].update(c.height)
+        self.quantile_sketches['biomass'].update(c.biomass)
+        self.quantile_sketches['co2_absorption'].update(c.co2_absorption)
+
+    def add_many(self, trees: Iterable[TreeAnalysis]) -> 'TreeStatsSketch':
+        for tree in trees:
+            self.add(tree)
+        return self
+
+    def add_columns(self, columns: TreeColumns) -> 'TreeStatsSketch':
+        """Обновление по колоночному набору: виды и состояния агрегируются до обновления скетчей"""
+        self.tree_count += len(columns)
+        self.total_co2_absorption += float(columns.co2_absorption.sum())
+        species, counts = np.unique(columns.species.astype(str), return_counts=True)
+        for value, count in zip(species.tolist(), counts.tolist()):
+            self._add_species(value, count)
+        self.health_counts.update(Counter(columns.health_condition.tolist()))
+        for name in self.NUMERIC_FIELDS:
+            self.quantile_sketches[name].update_many(getattr(columns, name))
+        return self
+
+    def merge(self, other: 'TreeStatsSketch') -> 'TreeStatsSketch':
+        self.tree_count += other.tree_count
+        self.total_co2_absorption += other.total_co2_absorption
+        self.species_distinct.merge(other.species_distinct)
+        self.species_frequencies.merge(other.species_frequencies)
+        self.species_heavy_hitters.merge(other.species_heavy_hitters)
+        self.health_counts.update(other.health_counts)
+        for name, sketch in self.quantile_sketches.items():
+            sketch.merge(other.quantile_sketches[name])
+        return self
+
+    def species_count(self, species: str) -> Dict[str, float]:
+        """Оценка числа деревьев вида с верхней границей ошибки"""
+        return {'value': self.species_frequencies.estimate(species),
+                'error': self.species_frequencies.error_bound}
+
+    def summary(self) -> Dict[str, Any]:
+        """Приближенные показатели с оценками ошибок"""
+        n = self.tree_count
+        distinct = self.species_distinct.estimate()
+        hll_error = self.species_distinct.relative_error
+        shannon, simpson, diversity_error, simpson_error = self._diversity(distinct)
+        healthy = self.health_counts.get('healthy', 0)
+
+        return {
+            'tree_count': {'value': n, 'error': 0},
+            'total_co2_absorption': {'value': self.total_co2_absorption, 'error': 0.0},
+            'average_health_score': {'value': healthy / n if n else 0.0, 'error': 0.0},
+            'distinct_species': {'value': distinct, 'error': distinct * hll_error},
+            'biodiversity_index': {'value': distinct / n if n else 0.0,
+                                   'error': distinct * hll_error / n if n else 0.0},
+            'shannon_index': {'value': shannon, 'error': diversity_error},
+            'simpson_index': {'value': simpson, 'error': simpson_error},
+            'top_species': {'value': self.species_heavy_hitters.top(10),
+                            'error': self.species_heavy_hitters.error_bound},
+            'health_distribution': {'value': dict(self.health_counts), 'error': 0},
+            'quantiles': {
+                name: {
+                    'value': dict(zip(self.QUANTILES, sketch.quantiles(self.QUANTILES))),
+                    'rank_error': sketch.rank_error
+                }
+                for name, sketch in self.quantile_sketches.items()
+            }
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'tree_count': self.tree_count,
+            'total_co2_absorption': self.total_co2_absorption,
+            'species_distinct': self.species_distinct.to_dict(),
+            'species_frequencies': self.species_frequencies.to_dict(),
+            'species_heavy_hitters': self.species_heavy_hitters.to_dict(),
+            'health_counts': dict(self.health_counts),
+            'quantile_sketches': {name: s.to_dict() for name, s in self.quantile_sketches.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TreeStatsSketch':
+        sketch = cls()
+        sketch.tree_count = data['tree_count']
+        sketch.total_co2_absorption = data['total_co2_absorption']
+        sketch.species_distinct = HyperLogLog.from_dict(data['species_distinct'])
+        sketch.species_frequencies = CountMinSketch.from_dict(data['species_frequencies'])
+        sketch.species_heavy_hitters = SpaceSaving.from_dict(data['species_heavy_hitters'])
+        sketch.health_counts = Counter(data['health_counts'])
+        sketch.quantile_sketches = {name: KllSketch.from_dict(s)
+                                    for name, s in data['quantile_sketches'].items()}
+        return sketch
+
+    def _add_species(self, species: str, count: int) -> None:
+        self.species_distinct.add(species)
+        self.species_frequencies.add(species, count)
+        self.species_heavy_hitters.add(species, count)
+
+    def _diversity(self, distinct: float) -> Tuple[float, float, float, float]:
+        """Индексы Шеннона и Симпсона по частым видам с границами ошибки"""
+        n = self.tree_count
+        if n == 0:
+            return 0.0, 0.0, 0.0, 0.0
+        hitters = self.species_heavy_hitters
+        counts = np.array(list(hitters.counts.values()), dtype=np.float64)
+        p = np.minimum(counts / n, 1.0)
+        shannon = float(-np.sum(p * np.log(p)))
+        simpson = float(1.0 - np.sum(p * p))
+        if hitters.exact:
+            return shannon, simpson, 0.0, 0.0
+
+        # Масса неотслеживаемых видов дает не больше, чем равномерное распределение по ним
+        tail_mass = max(1.0 - float(p.sum()), 0.0)
+        untracked = max(distinct - len(counts), 1.0)
+        relative_error = hitters.error_bound / n
+        shannon_error = tail_mass * math.log(max(untracked, 2.0)) + relative_error * len(counts)
+        simpson_error = 2 * relative_error + tail_mass ** 2
+        return shannon, simpson, shannon_error, simpson_error
@@ -0,0 +1,231 @@
+from typing import List, Optional, Tuple
+import numpy as np
+from .columnar import TreeColumns
+
+EARTH_RADIUS_M = 6371008.8  # средний радиус Земли в метрах
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Расстояние по дуге большого круга в метрах (векторизовано)"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def radius_bounding_box(latitude: float, longitude: float,
+                        radius_m: float) -> Tuple[float, float, float, float]:
+    """Ограничивающий прямоугольник (min_lat, min_lon, max_lat, max_lon) для окружности"""
+    delta_lat = np.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = max(np.cos(np.radians(latitude)), 1e-12)
+    delta_lon = min(np.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return (latitude - delta_lat, longitude - delta_lon,
+            latitude + delta_lat, longitude + delta_lon)
+
+def radius_bounding_box_arrays(latitude: np.ndarray, longitude: np.ndarray, radius_m: float):
+    """Векторизованный вариант radius_bounding_box для массива центров"""
+    delta_lat = np.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = np.maximum(np.cos(np.radians(latitude)), 1e-12)
+    delta_lon = np.minimum(np.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return latitude - delta_lat, longitude - delta_lon, latitude + delta_lat, longitude + delta_lon
+
+class GridSpatialIndex:
+    """Сеточный пространственный индекс для запросов по радиусу, k ближайших и окну карты.
+
+    Координаты проецируются в локальную равнопромежуточную проекцию (метры),
+    точки сортируются по ячейкам плотной сетки над охватом данных, а таблица
+    смещений ячеек позволяет находить кандидатов индексированием массива без
+    перебора всех деревьев. Точные расстояния считаются по формуле
+    гаверсинуса. Рассчитан на масштаб города.
+    """
+
+    def __init__(self, latitude: np.ndarray, longitude: np.ndarray, cell_size_m: float = 100.0,
+                 max_cells: Optional[int] = None):
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        self._cos_origin = np.cos(np.radians(float(np.mean(self.latitude)) if len(self) else 0.0))
+
+        x, y = self._project(self.latitude, self.longitude)
+        self._min_x, self._min_y = (float(x.min()), float(y.min())) if len(self) else (0.0, 0.0)
+        span_x = float(x.max()) - self._min_x if len(self) else 0.0
+        span_y = float(y.max()) - self._min_y if len(self) else 0.0
+
+        # Ячейка укрупняется, если плотная сетка не помещается в лимит
+        max_cells = max_cells or max(4 * len(self), 1 << 20)
+        self.cell_size_m = max(cell_size_m, np.sqrt(span_x * span_y / max_cells))
+        self._nx = int(span_x // self.cell_size_m) + 1
+        self._ny = int(span_y // self.cell_size_m) + 1
+
+        cell_x, cell_y = self._cells(self.latitude, self.longitude)
+        keys = cell_x * self._ny + cell_y
+        self._order = np.argsort(keys, kind='stable')
+        self._cell_starts = np.concatenate((
+            [0], np.cumsum(np.bincount(keys, minlength=self._nx * self._ny))
+        ))
+
+    @classmethod
+    def from_columns(cls, columns: TreeColumns, cell_size_m: float = 100.0) -> 'GridSpatialIndex':
+        return cls(columns.latitude, columns.longitude, cell_size_m)
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+    def within_radius(self, latitude: float, longitude: float, radius_m: float) -> np.ndarray:
+        """Индексы деревьев в радиусе radius_m метров, упорядоченные по расстоянию"""
+        indices, distances = self._within_radius(latitude, longitude, radius_m)
+        return indices[np.argsort(distances, kind='stable')]
+
+    def nearest(self, latitude: float, longitude: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k ближайших деревьев: (индексы, расстояния в метрах)"""
+        k = min(k, len(self))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        radius = self.cell_size_m
+        while True:
+            indices, distances = self._within_radius(latitude, longitude, radius)
+            # Найденных кандидатов достаточно: дальше радиуса поиска ближе не будет
+            if len(indices) >= k:
+                break
+            if radius > np.pi * EARTH_RADIUS_M:
+                indices = np.arange(len(self))
+                distances = haversine_m(latitude, longitude, self.latitude, self.longitude)
+                break
+            radius *= 2
+
+        nearest = np.argsort(distances, kind='stable')[:k]
+        return indices[nearest], distances[nearest]
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+        """Индексы деревьев в прямоугольном окне карты"""
+        candidates = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        lat = self.latitude[candidates]
+        lon = self.longitude[candidates]
+        mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return np.sort(candidates[mask])
+
+    def within_radius_batch(self, latitudes: np.ndarray, longitudes: np.ndarray,
+                            radius_m: float) -> List[np.ndarray]:
+        """Пакетный поиск по радиусу: для каждого центра индексы, упорядоченные по расстоянию"""
+        queries, trees, distances = self.radius_pairs(latitudes, longitudes, radius_m)
+        order = np.lexsort((distances, queries))
+        bounds = np.cumsum(np.bincount(queries, minlength=len(latitudes)))[:-1]
+        return np.split(trees[order], bounds)
+
+    def nearest_batch(self, latitudes: np.ndarray, longitudes: np.ndarray,
+                      k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Пакетный поиск k ближайших: массивы формы (число точек, k)"""
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        k = min(k, len(self))
+        indices = np.full((len(latitudes), k), -1, dtype=np.int64)
+        distances = np.full((len(latitudes), k), np.inf)
+        if k == 0:
+            return indices, distances
+
+        pending = np.arange(len(latitudes))
+        radius = self.cell_size_m
+        while pending.size and radius <= np.pi * EARTH_RADIUS_M:
+            queries, trees, dist = self.radius_pairs(latitudes[pending], longitudes[pending], radius)
+            counts = np.bincount(queries, minlength=len(pending))
+            done = counts >= k
+            if done.any():
+                selected = done[queries]
+                queries, trees, dist = queries[selected], trees[selected], dist[selected]
+                order = np.lexsort((dist, queries))
+                group_sizes = counts[done]
+                group_starts = np.cumsum(group_sizes) - group_sizes
+                rank = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+                keep = order[rank < k]
+                rows = pending[queries[keep]]
+                cols = rank[rank < k]
+                indices[rows, cols] = trees[keep]
+                distances[rows, cols] = dist[keep]
+            pending = pending[~done]
+            radius *= 2
+
+        # Точки дальше половины окружности Земли: полный перебор
+        for row in pending:
+            indices[row], distances[row] = self.nearest(latitudes[row], longitudes[row], k)
+        return indices, distances
+
+    def neighbour_counts(self, radius_m: float) -> np.ndarray:
+        """Число соседей в радиусе для каждого дерева (без учета самого дерева)"""
+        queries, _, _ = self.radius_pairs(self.latitude, self.longitude, radius_m)
+        return np.bincount(queries, minlength=len(self)) - 1
+
+    def radius_pairs(self, latitudes: np.ndarray, longitudes: np.ndarray, radius_m: float,
+                     chunk_size: int = 65536) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Векторизованный поиск пар (запрос, дерево, расстояние) в радиусе radius_m.
+
+        Диапазоны ячеек для всех запросов находятся одним вызовом searchsorted
+        на столбец сетки, а пары разворачиваются через np.repeat без цикла
+        по запросам. Запросы обрабатываются пачками по chunk_size.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        parts = []
+        for offset in range(0, len(latitudes), chunk_size):
+            lat = latitudes[offset:offset + chunk_size]
+            lon = longitudes[offset:offset + chunk_size]
+            queries, trees = self._candidate_pairs(*radius_bounding_box_arrays(lat, lon, radius_m))
+            distances = haversine_m(lat[queries], lon[queries], self.latitude[trees], self.longitude[trees])
+            mask = distances <= radius_m
+            parts.append((queries[mask] + offset, trees[mask], distances[mask]))
+
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def _within_radius(self, latitude: float, longitude: float,
+                       radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        candidates = self._candidates(*radius_bounding_box(latitude, longitude, radius_m))
+        distances = haversine_m(latitude, longitude,
+                                self.latitude[candidates], self.longitude[candidates])
+        mask = distances <= radius_m
+        return candidates[mask], distances[mask]
+
+    def _candidates(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> np.ndarray:
+        """Деревья из ячеек сетки, пересекающих прямоугольник"""
+        _, trees = self._candidate_pairs(np.array([min_lat]), np.array([min_lon]),
+                                         np.array([max_lat]), np.array([max_lon]))
+        return trees
+
+    def _candidate_pairs(self, min_lat: np.ndarray, min_lon: np.ndarray, max_lat: np.ndarray,
+                         max_lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Пары (запрос, дерево-кандидат) для набора прямоугольников"""
+        if len(self) == 0 or len(min_lat) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        x0, y0 = self._cells(min_lat, min_lon)
+        x1, y1 = self._cells(max_lat, max_lon)
+        query_ids = np.arange(len(min_lat))
+        queries, positions = [], []
+        for column in range(int((x1 - x0).max()) + 1):
+            cell_x = x0 + column
+            # Ячейки одного столбца сетки занимают непрерывный диапазон позиций
+            active = (cell_x <= x1) & (y0 <= y1)
+            base = np.where(active, cell_x, 0) * self._ny
+            start = self._cell_starts[base + y0]
+            stop = self._cell_starts[base + y1 + 1]
+            lengths = np.where(active, stop - start, 0)
+            total = int(lengths.sum())
+            if total == 0:
+                continue
+            # Развертка диапазонов [start, stop) в плоский массив позиций
+            queries.append(np.repeat(query_ids, lengths))
+            offsets = np.repeat(start - (np.cumsum(lengths) - lengths), lengths)
+            positions.append(offsets + np.arange(total))
+
+        if not queries:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(queries), self._order[np.concatenate(positions)]
+
+    def _project(self, latitude: np.ndarray, longitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.radians(longitude) * EARTH_RADIUS_M * self._cos_origin
+        y = np.radians(latitude) * EARTH_RADIUS_M
+        return x, y
+
+    def _cells(self, latitude: np.ndarray, longitude: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Номера ячеек, ограниченные охватом сетки"""
+        x, y = self._project(latitude, longitude)
+        cell_x = np.floor((x - self._min_x) / self.cell_size_m).astype(np.int64)
+        cell_y = np.floor((y - self._min_y) / self.cell_size_m).astype(np.int64)
+        return np.clip(cell_x, 0, self._nx - 1), np.clip(cell_y, 0, self._ny - 1)
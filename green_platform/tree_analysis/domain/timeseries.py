@@ -0,0 +1,308 @@
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+import numpy as np
+from .entities import TreeAnalysis
+from .columnar import TreeColumns
+
+# Разрешения от мелкого к крупному и соответствующие единицы datetime64
+RESOLUTIONS = ('day', 'month', 'year')
+_UNITS = {'day': 'D', 'month': 'M', 'year': 'Y'}
+
+# Ряды строятся по отдельному дереву и по виду
+SCOPES = ('tree', 'species')
+
+METRICS = ('height', 'trunk_diameter', 'co2_absorption')
+# Строка корзины: число измерений, затем для каждой метрики число известных
+# значений, min, max и сумма. Пропуски (NaN) не входят ни в min/max, ни в сумму
+_METRIC_WIDTH = 4
+_WIDTH = 1 + _METRIC_WIDTH * len(METRICS)
+
+def _offset(index: int) -> int:
+    return 1 + _METRIC_WIDTH * index
+
+DEFAULT_MAX_POINTS = 500
+
+DateLike = Union[date, datetime, np.datetime64, str]
+
+def _bucket(value: DateLike, resolution: str) -> int:
+    """Номер корзины разрешения (число дней, месяцев или лет от 1970 года)"""
+    return int(np.datetime64(value).astype(f'datetime64[{_UNITS[resolution]}]').astype(np.int64))
+
+def choose_resolution(start: DateLike, end: DateLike, max_points: int = DEFAULT_MAX_POINTS) -> str:
+    """Самое мелкое разрешение, при котором период укладывается в max_points корзин"""
+    for resolution in RESOLUTIONS[:-1]:
+        if _bucket(end, resolution) - _bucket(start, resolution) + 1 <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Индексы точек, отобранных алгоритмом Largest-Triangle-Three-Buckets.
+
+    Первая и последняя точки сохраняются; из каждой промежуточной корзины
+    берется точка, образующая наибольший треугольник с уже выбранной точкой
+    и средним следующей корзины. Форма графика сохраняется лучше, чем при
+    равномерном прореживании.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        mean_x = x[end:next_end].mean()
+        mean_y = y[end:next_end].mean()
+        area = np.abs((x[selected] - mean_x) * (y[start:end] - y[selected])
+                      - (x[selected] - x[start:end]) * (mean_y - y[selected]))
+        selected = start + int(np.argmax(area))
+        indices[i + 1] = selected
+    return indices
+
+# Позиция строки корзины: код ключа ряда в старших 32 битах, номер корзины в младших
+_BUCKET_BITS = 32
+_BUCKET_OFFSET = 1 << 31
+
+def _position(codes: Union[int, np.ndarray], buckets: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+    return (np.int64(codes) << _BUCKET_BITS) | (np.int64(buckets) + _BUCKET_OFFSET)
+
+class _Table:
+    """Корзины одного разрешения и области, отсортированные по позиции (код ряда, корзина)"""
+
+    def __init__(self, positions: Optional[np.ndarray] = None, rows: Optional[np.ndarray] = None):
+        self.positions = np.array([], dtype=np.int64) if positions is None else positions
+        self.rows = np.empty((0, _WIDTH), dtype=np.float64) if rows is None else rows
+
+    def combine(self, positions: np.ndarray, rows: np.ndarray) -> None:
+        """Добавление строк с объединением совпадающих корзин.
+
+        Устойчивая сортировка целочисленных позиций сливает уже упорядоченную
+        таблицу с новой порцией почти за линейное время.
+        """
+        if len(positions) == 0:
+            return
+        positions = np.concatenate([self.positions, positions])
+        rows = np.concatenate([self.rows, rows])
+        order = np.argsort(positions, kind='stable')
+        positions, rows = positions[order], rows[order]
+        change = np.empty(len(positions), dtype=bool)
+        change[:1] = True
+        np.not_equal(positions[1:], positions[:-1], out=change[1:])
+        starts = np.flatnonzero(change)
+
+        combined = np.empty((len(starts), _WIDTH), dtype=np.float64)
+        combined[:, 0] = np.add.reduceat(rows[:, 0], starts)
+        combined[:, 1::4] = np.add.reduceat(rows[:, 1::4], starts)
+        # fmin/fmax пропускают NaN: корзина получает NaN, только если значений нет вовсе
+        combined[:, 2::4] = np.fmin.reduceat(rows[:, 2::4], starts)
+        combined[:, 3::4] = np.fmax.reduceat(rows[:, 3::4], starts)
+        combined[:, 4::4] = np.add.reduceat(rows[:, 4::4], starts)
+        self.positions, self.rows = positions[starts], combined
+
+    def series(self, code: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Номера корзин и строки одного ряда"""
+        found = slice(int(np.searchsorted(self.positions, code << _BUCKET_BITS, side='left')),
+                      int(np.searchsorted(self.positions, (code + 1) << _BUCKET_BITS, side='left')))
+        buckets = (self.positions[found] & ((1 << _BUCKET_BITS) - 1)) - _BUCKET_OFFSET
+        return buckets, self.rows[found]
+
+class MeasurementRollup:
+    """Агрегаты измерений по корзинам дня, месяца и года для каждого дерева и вида.
+
+    Корзина хранит число измерений и для высоты, диаметра ствола и
+    поглощения CO2 - число известных значений, минимум, максимум и сумму;
+    пропущенные значения (NaN) не портят агрегаты. Агрегаты объединяются (merge)
+    и сериализуются (to_dict), как скетчи, поэтому их можно строить по
+    батчам и рабочим процессам и хранить между запусками. Добавление
+    пересобирает таблицы корзин, поэтому измерения выгоднее добавлять
+    крупными наборами.
+    """
+
+    def __init__(self, resolutions: Iterable[str] = RESOLUTIONS, scopes: Iterable[str] = SCOPES):
+        self.resolutions = tuple(resolutions)
+        self.scopes = tuple(scopes)
+        # Коды ключей рядов (id дерева или вид) в порядке появления
+        self.names: Dict[str, List[str]] = {scope: [] for scope in self.scopes}
+        self._codes: Dict[str, Dict[str, int]] = {scope: {} for scope in self.scopes}
+        self.tables: Dict[Tuple[str, str], _Table] = {
+            (resolution, scope): _Table() for resolution in self.resolutions for scope in self.scopes}
+
+    def _encode(self, scope: str, names: Iterable[str]) -> np.ndarray:
+        codes, known = self._codes[scope], self.names[scope]
+        result = []
+        for name in names:
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(known)
+                known.append(name)
+            result.append(code)
+        return np.array(result, dtype=np.int64)
+
+    def add_many(self, trees: Iterable[TreeAnalysis]) -> 'MeasurementRollup':
+        return self.add_columns(TreeColumns.from_trees(trees))
+
+    def add_columns(self, columns: TreeColumns) -> 'MeasurementRollup':
+        """Добавление измерений колоночного набора"""
+        return self.add_measurements(columns.ids, columns.species, columns.measurement_date,
+                                     {metric: getattr(columns, metric) for metric in METRICS})
+
+    def add_measurements(self, ids: Sequence[Any], species: Sequence[Optional[str]], dates: Sequence[Any],
+                         values: Mapping[str, Sequence[float]]) -> 'MeasurementRollup':
+        """Добавление измерений с частью метрик (например, только высоты версий деревьев).
+
+        Отсутствующие в values метрики и значения NaN считаются неизвестными;
+        измерения с видом None не попадают в ряды видов.
+        """
+        dates = np.asarray(dates, dtype='datetime64[us]')
+        valid = ~np.isnat(dates)
+        if not valid.any():
+            return self
+        dates = dates[valid]
+        # Отдельное измерение - корзина из одной строки: min = max = сумма = значение
+        rows = np.zeros((len(dates), _WIDTH), dtype=np.float64)
+        rows[:, 0] = 1.0
+        for index, metric in enumerate(METRICS):
+            offset = _offset(index)
+            column = np.full(len(dates), np.nan) if metric not in values else \
+                np.asarray(values[metric], dtype=np.float64)[valid]
+            known = ~np.isnan(column)
+            rows[:, offset] = known
+            rows[:, offset + 1] = column
+            rows[:, offset + 2] = column
+            rows[:, offset + 3] = np.where(known, column, 0.0)
+        keys = {'tree': np.asarray(ids, dtype=object)[valid], 'species': np.asarray(species, dtype=object)[valid]}
+        for scope in self.scopes:
+            selected = np.not_equal(keys[scope], None)
+            if not selected.any():
+                continue
+            names, inverse = np.unique(keys[scope][selected].astype(str), return_inverse=True)
+            codes = self._encode(scope, names.tolist())[inverse]
+            for resolution in self.resolutions:
+                buckets = dates[selected].astype(f'datetime64[{_UNITS[resolution]}]').astype(np.int64)
+                self.tables[(resolution, scope)].combine(_position(codes, buckets), rows[selected])
+        return self
+
+    def merge(self, other: 'MeasurementRollup') -> 'MeasurementRollup':
+        for scope in self.scopes:
+            if scope not in other.scopes:
+                continue
+            # Коды другого набора переводятся в коды этого
+            mapping = self._encode(scope, other.names[scope])
+            for resolution in self.resolutions:
+                table = other.tables.get((resolution, scope))
+                if table is None or len(table.positions) == 0:
+                    continue
+                codes = mapping[table.positions >> _BUCKET_BITS]
+                buckets = (table.positions & ((1 << _BUCKET_BITS) - 1)) - _BUCKET_OFFSET
+                self.tables[(resolution, scope)].combine(_position(codes, buckets), table.rows)
+        return self
+
+    def _series(self, resolution: str, scope: str, key: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Корзины и строки одного ряда (по возрастанию корзины)"""
+        table = self.tables.get((resolution, scope))
+        code = self._codes.get(scope, {}).get(key)
+        if table is None or code is None:
+            return np.array([], dtype=np.int64), np.empty((0, _WIDTH))
+        return table.series(code)
+
+    def extent(self, scope: str, key: str) -> Optional[Tuple[np.datetime64, np.datetime64]]:
+        """Первая и последняя корзины ряда в самом мелком доступном разрешении"""
+        for resolution in RESOLUTIONS:
+            buckets, _ = self._series(resolution, scope, key)
+            if len(buckets):
+                unit = _UNITS[resolution]
+                return np.datetime64(int(buckets[0]), unit), np.datetime64(int(buckets[-1]), unit)
+        return None
+
+    def query(self, scope: str, key: str, start: Optional[DateLike] = None, end: Optional[DateLike] = None,
+              resolution: Optional[str] = None, max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Any]:
+        """Ряд агрегатов за период [start, end] для графика.
+
+        Без явного resolution выбирается самое мелкое разрешение, при котором
+        период укладывается в max_points корзин; если точек все равно больше,
+        ряд прореживается LTTB по средней высоте. Для каждой метрики
+        возвращается и число известных значений ({metric}_count); среднее
+        корзины без значений - NaN.
+        """
+        extent = self.extent(scope, key)
+        if extent is None:
+            return self._empty(resolution or RESOLUTIONS[0])
+        start = extent[0] if start is None else start
+        end = extent[1] if end is None else end
+        if resolution is None:
+            available = [name for name in RESOLUTIONS if name in self.resolutions]
+            chosen = choose_resolution(start, end, max_points)
+            resolution = next((name for name in available if RESOLUTIONS.index(name) >= RESOLUTIONS.index(chosen)),
+                              available[-1])
+
+        buckets, rows = self._series(resolution, scope, key)
+        found = slice(int(np.searchsorted(buckets, _bucket(start, resolution), side='left')),
+                      int(np.searchsorted(buckets, _bucket(end, resolution), side='right')))
+        buckets, rows = buckets[found], rows[found]
+        if len(buckets) == 0:
+            return self._empty(resolution)
+
+        times = buckets.astype(f'datetime64[{_UNITS[resolution]}]').astype('datetime64[D]')
+        if len(rows) > max_points:
+            heights = self._means(rows, 0)
+            # Корзины без высоты не должны определять выбор точек
+            fill = float(np.nanmean(heights)) if (~np.isnan(heights)).any() else 0.0
+            keep = lttb(times.astype(np.int64), np.where(np.isnan(heights), fill, heights), max_points)
+            rows, times = rows[keep], times[keep]
+
+        series: Dict[str, Any] = {'resolution': resolution, 'time': times, 'count': rows[:, 0].astype(np.int64)}
+        for index, metric in enumerate(METRICS):
+            offset = _offset(index)
+            series[f'{metric}_count'] = rows[:, offset].astype(np.int64)
+            series[f'{metric}_min'] = rows[:, offset + 1]
+            series[f'{metric}_max'] = rows[:, offset + 2]
+            series[f'{metric}_mean'] = self._means(rows, index)
+        return series
+
+    @staticmethod
+    def _means(rows: np.ndarray, index: int) -> np.ndarray:
+        offset = _offset(index)
+        counts = rows[:, offset]
+        return np.divide(rows[:, offset + 3], counts, out=np.full(len(rows), np.nan), where=counts > 0)
+
+    def growth_rate(self, scope: str, key: str, start: Optional[DateLike] = None,
+                    end: Optional[DateLike] = None, metric: str = 'height') -> Optional[float]:
+        """Скорость роста метрики в единицах в год: взвешенная по числу измерений
+        линейная регрессия средних по месячным корзинам"""
+        series = self.query(scope, key, start, end, resolution='month' if 'month' in self.resolutions else None)
+        known = series[f'{metric}_count'] > 0
+        if known.sum() < 2:
+            return None
+        years = series['time'][known].astype(np.int64) / 365.2425
+        return float(np.polyfit(years, series[f'{metric}_mean'][known], 1,
+                                w=np.sqrt(series[f'{metric}_count'][known]))[0])
+
+    @staticmethod
+    def _empty(resolution: str) -> Dict[str, Any]:
+        series: Dict[str, Any] = {'resolution': resolution, 'time': np.array([], dtype='datetime64[D]'),
+                                  'count': np.array([], dtype=np.int64)}
+        for metric in METRICS:
+            series[f'{metric}_count'] = np.array([], dtype=np.int64)
+            for suffix in ('min', 'max', 'mean'):
+                series[f'{metric}_{suffix}'] = np.array([], dtype=np.float64)
+        return series
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'resolutions': list(self.resolutions), 'scopes': list(self.scopes), 'names': self.names,
+                'tables': [[resolution, scope, table.positions.tolist(), table.rows.tolist()]
+                           for (resolution, scope), table in self.tables.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'MeasurementRollup':
+        rollup = cls(data['resolutions'], data['scopes'])
+        for scope, names in data['names'].items():
+            rollup._encode(scope, names)
+        for resolution, scope, positions, rows in data['tables']:
+            rollup.tables[(resolution, scope)] = _Table(
+                np.array(positions, dtype=np.int64), np.array(rows, dtype=np.float64).reshape(-1, _WIDTH))
+        return rollup
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from ...core.data_analysis.infrastructure.memory_repositories import SnapshotFile, SortedIndex
+from ..domain.entities import AnalysisResult, TreeAnalysis
+from ..domain.repositories import AnalysisResultRepository, TreeAnalysisRepository
+
+def parse_date_range(start_date: str, end_date: str) -> Tuple[datetime, datetime]:
+    """Границы периода в ISO-формате как полуинтервал [start, end).
+
+    Обе границы включаются; дата без времени в конце периода означает весь день.
+    """
+    start = datetime.fromisoformat(start_date)
+    end = datetime.fromisoformat(end_date)
+    if len(end_date) == 10:
+        return start, end + timedelta(days=1)
+    return start, end + timedelta(microseconds=1)
+
+class InMemoryTreeAnalysisRepository(TreeAnalysisRepository):
+    """Анализы деревьев в памяти процесса: хэш-индекс по id и история изменений"""
+
+    def __init__(self, snapshot: Optional[SnapshotFile] = None):
+        self.snapshot = snapshot or SnapshotFile()
+        self._versions: Dict[UUID, List[TreeAnalysis]] = {}
+        state = self.snapshot.load()
+        if state is not None:
+            self._versions = state['versions']
+
+    async def save(self, tree_analysis: TreeAnalysis) -> TreeAnalysis:
+        self._versions.setdefault(tree_analysis.id, []).append(tree_analysis)
+        self.snapshot.changed(self._state)
+        return tree_analysis
+
+    async def get_by_id(self, analysis_id: UUID) -> Optional[TreeAnalysis]:
+        versions = self._versions.get(analysis_id)
+        return versions[-1] if versions else None
+
+    async def get_all(self) -> List[TreeAnalysis]:
+        return [versions[-1] for versions in self._versions.values()]
+
+    async def update(self, tree_analysis: TreeAnalysis) -> TreeAnalysis:
+        """Новая версия существующего анализа; предыдущие остаются в истории"""
+        versions = self._versions.get(tree_analysis.id)
+        if not versions:
+            raise ValueError(f"Tree analysis {tree_analysis.id} not found")
+        versions.append(tree_analysis)
+        self.snapshot.changed(self._state)
+        return tree_analysis
+
+    async def delete(self, analysis_id: UUID) -> bool:
+        if self._versions.pop(analysis_id, None) is None:
+            return False
+        self.snapshot.changed(self._state)
+        return True
+
+    async def get_history(self, analysis_id: UUID) -> List[TreeAnalysis]:
+        """Все версии анализа от первой к последней"""
+        return list(self._versions.get(analysis_id, []))
+
+    def flush(self) -> None:
+        self.snapshot.save(self._state())
+
+    def _state(self) -> Dict[str, Any]:
+        return {'versions': self._versions}
+
+class InMemoryAnalysisResultRepository(AnalysisResultRepository):
+    """Результаты анализа в памяти: хэш-индекс по analysis_id и упорядоченный индекс по дате"""
+
+    def __init__(self, snapshot: Optional[SnapshotFile] = None):
+        self.snapshot = snapshot or SnapshotFile()
+        self._versions: Dict[UUID, List[AnalysisResult]] = {}
+        self._by_date = SortedIndex()
+        state = self.snapshot.load()
+        if state is not None:
+            self._versions = state['versions']
+            for versions in self._versions.values():
+                self._by_date.add(versions[-1].analysis_date, versions[-1].analysis_id)
+
+    async def save_result(self, result: AnalysisResult) -> AnalysisResult:
+        current = self._versions.get(result.analysis_id)
+        if current:
+            self._by_date.remove(current[-1].analysis_date, result.analysis_id)
+        self._versions.setdefault(result.analysis_id, []).append(result)
+        self._by_date.add(result.analysis_date, result.analysis_id)
+        self.snapshot.changed(self._state)
+        return result
+
+    async def get_result_by_id(self, result_id: UUID) -> Optional[AnalysisResult]:
+        versions = self._versions.get(result_id)
+        return versions[-1] if versions else None
+
+    async def get_results_by_date_range(self, start_date: str, end_date: str) -> List[AnalysisResult]:
+        """Результаты за период (границы включительно) в порядке даты анализа"""
+        start, end = parse_date_range(start_date, end_date)
+        return [self._versions[result_id][-1] for result_id in self._by_date.range(start, end)]
+
+    async def update_result(self, result: AnalysisResult) -> AnalysisResult:
+        if result.analysis_id not in self._versions:
+            raise ValueError(f"Analysis result {result.analysis_id} not found")
+        return await self.save_result(result)
+
+    async def get_history(self, result_id: UUID) -> List[AnalysisResult]:
+        """Все версии результата от первой к последней"""
+        return list(self._versions.get(result_id, []))
+
+    def flush(self) -> None:
+        self.snapshot.save(self._state())
+
+    def _state(self) -> Dict[str, Any]:
+        return {'versions': self._versions}
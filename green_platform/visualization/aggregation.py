@@ -0,0 +1,110 @@
+import math
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+TILE_SIZE = 256  # размер тайла в пикселях (Web Mercator)
+MAX_LATITUDE = 85.05112878  # предел широты проекции Web Mercator
+MAX_ZOOM = 22
+VIEWPORT_PX = 1024  # размер окна карты, под который подбирается зум
+
+BBox = Tuple[float, float, float, float]  # (min_lat, min_lon, max_lat, max_lon)
+
+def to_world_pixels(latitude: np.ndarray, longitude: np.ndarray, zoom: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Перевод координат в пиксели мира Web Mercator на заданном зуме"""
+    scale = TILE_SIZE * 2.0 ** zoom
+    lat = np.radians(np.clip(latitude, -MAX_LATITUDE, MAX_LATITUDE))
+    x = (np.asarray(longitude) + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * scale
+    return x, y
+
+def from_world_pixels(x: np.ndarray, y: np.ndarray, zoom: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Обратное преобразование пикселей мира в широту и долготу"""
+    scale = TILE_SIZE * 2.0 ** zoom
+    longitude = x / scale * 360.0 - 180.0
+    latitude = np.degrees(np.arctan(np.sinh(math.pi * (1.0 - 2.0 * y / scale))))
+    return latitude, longitude
+
+def bbox_mask(latitude: np.ndarray, longitude: np.ndarray, bbox: Optional[BBox]) -> np.ndarray:
+    """Маска точек внутри окна карты"""
+    if bbox is None:
+        return np.ones(len(latitude), dtype=bool)
+    min_lat, min_lon, max_lat, max_lon = bbox
+    return (latitude >= min_lat) & (latitude <= max_lat) & (longitude >= min_lon) & (longitude <= max_lon)
+
+def fit_zoom(latitude: np.ndarray, longitude: np.ndarray, bbox: Optional[BBox] = None,
+             viewport_px: float = VIEWPORT_PX) -> float:
+    """Наибольший целый зум, при котором окно bbox (или все точки) помещается в viewport_px"""
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        latitude, longitude = np.array([min_lat, max_lat]), np.array([min_lon, max_lon])
+    if len(latitude) == 0:
+        return 0.0
+    x, y = to_world_pixels(np.asarray(latitude, dtype=np.float64), np.asarray(longitude, dtype=np.float64), 0)
+    extent = max(float(np.ptp(x)), float(np.ptp(y)))
+    if extent == 0.0:
+        return float(MAX_ZOOM)
+    return float(min(MAX_ZOOM, max(0, math.floor(math.log2(viewport_px / extent)))))
+
+def _hex_cells(x: np.ndarray, y: np.ndarray, size: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Шестиугольное разбиение: индексы ячеек и их центры.
+
+    Центры шестиугольников образуют две прямоугольные решетки (четные и
+    нечетные ряды со сдвигом на половину ширины); точка относится к ближайшему
+    из двух кандидатов, что точно соответствует ячейкам Вороного.
+    """
+    dx = size * math.sqrt(3)
+    dy = size * 1.5
+    even_column = np.round(x / dx)
+    even_pair = np.round(y / (2 * dy))
+    odd_column = np.round(x / dx - 0.5)
+    odd_pair = np.round(y / (2 * dy) - 0.5)
+
+    even_distance = (x - even_column * dx) ** 2 + (y - even_pair * 2 * dy) ** 2
+    odd_distance = (x - (odd_column + 0.5) * dx) ** 2 + (y - (odd_pair + 0.5) * 2 * dy) ** 2
+    odd = odd_distance < even_distance
+
+    column = np.where(odd, odd_column, even_column).astype(np.int64)
+    row = np.where(odd, 2 * odd_pair + 1, 2 * even_pair).astype(np.int64)
+    center_x = (column + odd * 0.5) * dx
+    center_y = row * dy
+    return column, row, center_x, center_y
+
+def aggregate_points(latitude: np.ndarray, longitude: np.ndarray, values: np.ndarray,
+                     zoom: float, cell_px: float = 40.0, shape: str = 'hex',
+                     bbox: Optional[BBox] = None) -> Dict[str, np.ndarray]:
+    """Агрегация точек по ячейкам экранного размера: сумма, среднее и число точек.
+
+    Ячейки строятся в пикселях Web Mercator текущего зума, поэтому их число
+    ограничено площадью окна карты в пикселях, а не числом деревьев.
+    """
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    mask = bbox_mask(latitude, longitude, bbox)
+    x, y = to_world_pixels(latitude[mask], longitude[mask], zoom)
+    values = values[mask]
+
+    if shape == 'hex':
+        # Радиус шестиугольника подбирается так, чтобы его площадь равнялась квадрату cell_px
+        size = cell_px / math.sqrt(1.5 * math.sqrt(3))
+        column, row, center_x, center_y = _hex_cells(x, y, size)
+    elif shape == 'square':
+        column = np.floor(x / cell_px).astype(np.int64)
+        row = np.floor(y / cell_px).astype(np.int64)
+        center_x = (column + 0.5) * cell_px
+        center_y = (row + 0.5) * cell_px
+    else:
+        raise ValueError(f"Unknown bin shape: {shape}")
+
+    if len(column) == 0:
+        empty = np.empty(0)
+        return {'lat': empty, 'lon': empty, 'count': np.empty(0, dtype=np.int64),
+                'sum': empty, 'mean': empty}
+
+    keys = np.stack([column, row], axis=1)
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    count = np.bincount(inverse)
+    total = np.bincount(inverse, weights=values)
+    cell_lat, cell_lon = from_world_pixels(center_x[first], center_y[first], zoom)
+    return {'lat': cell_lat, 'lon': cell_lon, 'count': count, 'sum': total, 'mean': total / count}
@@ -0,0 +1,132 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, Callable, Dict, List, Optional, Protocol, Sequence
+from uuid import UUID
+from ..tree_analysis.domain.columnar import TreeColumns
+from ..tree_analysis.domain.entities import AnalysisResult
+from ..tree_analysis.domain.repositories import AnalysisResultRepository
+from ..tree_analysis.domain.timeseries import MeasurementRollup
+from .aggregation import BBox
+from .cache import ChartCache, ChartKey, ChartPayload, etag_matches
+from .services import CHART_TYPES, VisualizationService
+
+def create_router() -> APIRouter:
+    """Новый роутер API; маршруты регистрирует register_routes"""
+    return APIRouter(prefix="/api/v1/visualization", tags=["visualization"])
+
+router = create_router()
+
+class SnapshotSource(Protocol):
+    """Источник колоночных снимков деревьев (например, SnapshotReader)"""
+    watermark: Optional[str]
+    def refresh(self) -> bool: ...
+    def tree_columns(self, species: Optional[Sequence[str]] = None) -> TreeColumns: ...
+    def measurement_rollup(self) -> MeasurementRollup: ...
+
+def _parse_bbox(bbox: Optional[List[float]]) -> Optional[BBox]:
+    """Окно карты из параметра bbox=min_lat&bbox=min_lon&bbox=max_lat&bbox=max_lon"""
+    if bbox is None:
+        return None
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise HTTPException(status_code=422, detail="bbox must be min_lat, min_lon, max_lat, max_lon")
+    return tuple(bbox)
+
+class VisualizationAPI:
+    """API графиков с кэшированием и условными запросами.
+
+    Графики по analysis_id регистрируются при заданном хранилище результатов
+    анализа, панель по снимку - при заданном источнике снимков.
+    """
+
+    def __init__(self, result_repository: Optional[AnalysisResultRepository] = None,
+                 chart_cache: Optional[ChartCache] = None,
+                 snapshot_source: Optional[SnapshotSource] = None):
+        self.result_repository = result_repository
+        self.chart_cache = chart_cache or ChartCache()
+        self.snapshot_source = snapshot_source
+
+    async def register_routes(self, router: APIRouter) -> None:
+        """Регистрация маршрутов API"""
+
+        if self.snapshot_source is not None:
+            @router.get("/dashboards/snapshot")
+            async def get_snapshot_dashboard(request: Request, species: Optional[List[str]] = Query(None),
+                                             zoom: Optional[float] = None, bin_shape: str = 'hex',
+                                             cell_px: float = 40.0, bbox: Optional[List[float]] = Query(None)):
+                """Графики по последнему снимку деревьев (без запросов к базе).
+
+                График роста строится по агрегатам измерений снимка.
+                """
+                await run_in_threadpool(self.snapshot_source.refresh)
+                if self.snapshot_source.watermark is None:
+                    raise HTTPException(status_code=404, detail="No snapshot has been exported yet")
+
+                window = _parse_bbox(bbox)
+                params = {'zoom': zoom, 'bbox': window, 'bin_shape': bin_shape, 'cell_px': cell_px,
+                          'species': sorted(species) if species else None}
+                # Снимок неизменен до следующей выгрузки, поэтому водяной знак входит в ключ
+                key = ChartCache.make_key('dashboard', f"snapshot:{self.snapshot_source.watermark}", params)
+                payload = self.chart_cache.peek(key)
+                if payload is None:
+                    def build() -> Dict[str, Any]:
+                        columns = self.snapshot_source.tree_columns(species)
+                        return VisualizationService.build_dashboard(
+                            columns, zoom=zoom, bbox=window, bin_shape=bin_shape, cell_px=cell_px,
+                            rollup=self.snapshot_source.measurement_rollup())
+                    payload = await run_in_threadpool(self.chart_cache.get_or_render, key, build)
+                return self._chart_response(request, payload)
+
+        if self.result_repository is not None:
+            @router.get("/charts/{analysis_id}/{chart_type}")
+            async def get_chart(analysis_id: UUID, chart_type: str, request: Request,
+                                zoom: Optional[float] = None, bin_shape: Optional[str] = None,
+                                cell_px: Optional[float] = None, bbox: Optional[List[float]] = Query(None)):
+                """График результата анализа (JSON Plotly) с поддержкой ETag"""
+                if chart_type not in CHART_TYPES:
+                    raise HTTPException(status_code=404, detail=f"Unknown chart type: {chart_type}")
+
+                params = {}
+                if chart_type == 'environmental_impact_map':
+                    params = {name: value for name, value in
+                              (('zoom', zoom), ('bin_shape', bin_shape), ('cell_px', cell_px),
+                               ('bbox', _parse_bbox(bbox)))
+                              if value is not None}
+                key = ChartCache.make_key(chart_type, str(analysis_id), params)
+
+                payload = await self._get_payload(
+                    key, analysis_id, lambda result: VisualizationService.render_chart(chart_type, result, **params))
+                return self._chart_response(request, payload)
+
+            @router.get("/dashboards/{analysis_id}")
+            async def get_dashboard(analysis_id: UUID, request: Request, zoom: Optional[float] = None,
+                                    bin_shape: str = 'hex', cell_px: float = 40.0,
+                                    bbox: Optional[List[float]] = Query(None)):
+                """Все графики результата анализа одним ответом с поддержкой ETag"""
+                params = {'zoom': zoom, 'bbox': _parse_bbox(bbox), 'bin_shape': bin_shape, 'cell_px': cell_px}
+                key = ChartCache.make_key('dashboard', str(analysis_id), params)
+                payload = await self._get_payload(
+                    key, analysis_id, lambda result: VisualizationService.build_dashboard(result.trees, **params))
+                return self._chart_response(request, payload)
+
+    async def _get_payload(self, key: ChartKey, analysis_id: UUID,
+                           build: Callable[[AnalysisResult], Dict[str, Any]]) -> ChartPayload:
+        """Готовый график из кэша; результат анализа загружается только при промахе"""
+        payload = self.chart_cache.peek(key)
+        if payload is not None:
+            return payload
+
+        result = await self.result_repository.get_result_by_id(analysis_id)
+        if result is None:
+            raise HTTPException(status_code=404, detail="Analysis result not found")
+        try:
+            # Построение и сериализация фигуры не блокируют цикл событий
+            return await run_in_threadpool(self.chart_cache.get_or_render, key, lambda: build(result))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @staticmethod
+    def _chart_response(request: Request, payload: ChartPayload) -> Response:
+        headers = {"ETag": payload.etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), payload.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=payload.body, media_type="application/json", headers=headers)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from .encoding import dumps
+
+ChartKey = Tuple[str, str, str]  # (тип графика, идентичность входных данных, параметры)
+
+def make_etag(body: bytes) -> str:
+    """ETag по содержимому сериализованного графика"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (в том числе списков и слабых ETag)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+def serialize_figure(figure: Dict[str, Any]) -> bytes:
+    """Сериализация словаря фигуры Plotly (включая массивы numpy) в JSON"""
+    return dumps(figure)
+
+@dataclass
+class ChartPayload:
+    """Сериализованный график с ETag"""
+    body: bytes
+    etag: str
+
+class ChartCache:
+    """Кэш готовых JSON-графиков: LRU в памяти и на диске с ограничением по байтам.
+
+    Ключ - тип графика, идентичность входных данных (analysis_id или версия
+    набора деревьев) и параметры построения. Идентичность выбирает вызывающий
+    код: одинаковая идентичность обязана означать одинаковые входные данные.
+    На диске графики лежат в каталоге своей идентичности, поэтому invalidate
+    удаляет и записи, сделанные до перезапуска процесса.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: 'OrderedDict[str, Tuple[str, ChartPayload]]' = OrderedDict()
+        self._identities: Dict[str, Set[str]] = {}
+        self._size = 0
+        # Файлы дискового уровня в порядке последнего обращения: путь -> размер
+        self._disk_entries: 'OrderedDict[str, int]' = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(chart_type: str, identity: str, params: Optional[Dict[str, Any]] = None) -> ChartKey:
+        return chart_type, str(identity), json.dumps(params or {}, sort_keys=True, default=str)
+
+    def peek(self, key: ChartKey) -> Optional[ChartPayload]:
+        """Получение графика из памяти или с диска без построения"""
+        digest = self._digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+
+        payload = self._read_disk(key, digest)
+        if payload is not None:
+            self.disk_hits += 1
+            self._store_memory(key, digest, payload)
+        return payload
+
+    def get_or_render(self, key: ChartKey, render: Callable[[], Dict[str, Any]]) -> ChartPayload:
+        """Получение графика из кэша или его построение и сериализация"""
+        payload = self.peek(key)
+        if payload is not None:
+            return payload
+
+        self.misses += 1
+        body = serialize_figure(render())
+        payload = ChartPayload(body=body, etag=make_etag(body))
+        digest = self._digest(key)
+        self._store_memory(key, digest, payload)
+        self._write_disk(key, digest, payload)
+        return payload
+
+    def invalidate(self, identity: str) -> int:
+        """Удаление всех графиков, построенных по указанным входным данным"""
+        identity = str(identity)
+        with self._lock:
+            digests = self._identities.pop(identity, set())
+            for digest in digests:
+                _, payload = self._entries.pop(digest)
+                self._size -= len(payload.body)
+        removed = set(digests)
+        if self.disk_dir:
+            directory = self._identity_dir(identity)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                names = []
+            for name in names:
+                if name.endswith('.json'):
+                    self._remove_disk(os.path.join(directory, name))
+                    removed.add(name[:-5])
+        return len(removed)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'size_bytes': self._size,
+            'disk_entries': len(self._disk_entries),
+            'disk_size_bytes': self._disk_size,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'disk_evictions': self.disk_evictions
+        }
+
+    def _store_memory(self, key: ChartKey, digest: str, payload: ChartPayload) -> None:
+        if len(payload.body) > self.max_bytes:
+            return
+        identity = key[1]
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._size -= len(previous[1].body)
+            self._entries[digest] = (identity, payload)
+            self._size += len(payload.body)
+            self._identities.setdefault(identity, set()).add(digest)
+            while self._size > self.max_bytes:
+                evicted_digest, (evicted_identity, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self.evictions += 1
+                # Индекс идентичностей описывает только записи в памяти
+                digests = self._identities.get(evicted_identity)
+                if digests is not None:
+                    digests.discard(evicted_digest)
+                    if not digests:
+                        del self._identities[evicted_identity]
+
+    @staticmethod
+    def _digest(key: ChartKey) -> str:
+        return hashlib.sha256('\x1f'.join(key).encode('utf-8')).hexdigest()
+
+    def _identity_dir(self, identity: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32])
+
+    def _disk_path(self, key: ChartKey, digest: str) -> str:
+        return os.path.join(self._identity_dir(key[1]), f'{digest}.json')
+
+    def _load_disk_index(self) -> None:
+        """Учет файлов, оставшихся от прошлых запусков, от старых к новым"""
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(files):
+            self._disk_entries[path] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def _read_disk(self, key: ChartKey, digest: str) -> Optional[ChartPayload]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key, digest)
+        try:
+            with open(path, 'rb') as handle:
+                body = handle.read()
+        except OSError:
+            return None
+        with self._lock:
+            if path in self._disk_entries:
+                self._disk_entries.move_to_end(path)
+        return ChartPayload(body=body, etag=make_etag(body))
+
+    def _write_disk(self, key: ChartKey, digest: str, payload: ChartPayload) -> None:
+        if not self.disk_dir or len(payload.body) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(handle, 'wb') as temp:
+            temp.write(payload.body)
+        os.replace(temp_path, path)
+        with self._lock:
+            self._disk_size -= self._disk_entries.pop(path, 0)
+            self._disk_entries[path] = len(payload.body)
+            self._disk_size += len(payload.body)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        evicted = []
+        with self._lock:
+            while self._disk_size > self.max_disk_bytes and self._disk_entries:
+                path, size = self._disk_entries.popitem(last=False)
+                self._disk_size -= size
+                self.disk_evictions += 1
+                evicted.append(path)
+        for path in evicted:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remove_disk(self, path: str) -> None:
+        with self._lock:
+            self._disk_size -= self._disk_entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
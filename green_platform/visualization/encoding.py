@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Any
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него используется стандартный json
+    orjson = None
+
+# Типы массивов, которые Plotly.js принимает в виде {'dtype', 'bdata'}
+_TYPED_ARRAY_CODES = {
+    np.dtype(np.float64): 'f8', np.dtype(np.float32): 'f4',
+    np.dtype(np.int32): 'i4', np.dtype(np.uint32): 'u4',
+    np.dtype(np.int16): 'i2', np.dtype(np.uint16): 'u2',
+    np.dtype(np.int8): 'i1', np.dtype(np.uint8): 'u1'
+}
+_INT32 = np.iinfo(np.int32)
+
+def typed_array(values: np.ndarray) -> Any:
+    """Числовой массив в виде типизированного base64-блока Plotly; прочие массивы - списком"""
+    if values.dtype == np.bool_:
+        values = values.astype(np.uint8)
+    elif values.dtype.kind in 'iu' and values.dtype not in _TYPED_ARRAY_CODES:
+        # 64-битные целые Plotly.js не поддерживает
+        fits = values.size == 0 or (values.min() >= _INT32.min and values.max() <= _INT32.max)
+        values = values.astype(np.int32 if fits else np.float64)
+
+    code = _TYPED_ARRAY_CODES.get(values.dtype)
+    if code is None or values.ndim > 2:
+        return _plain(values.tolist())
+
+    data = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<')).tobytes()
+    encoded = {'dtype': code, 'bdata': base64.b64encode(data).decode('ascii')}
+    if values.ndim == 2:
+        encoded['shape'] = f'{values.shape[0]},{values.shape[1]}'
+    return encoded
+
+def to_typed_arrays(obj: Any) -> Any:
+    """Замена массивов numpy в словаре фигуры на типизированные блоки"""
+    if isinstance(obj, np.ndarray):
+        return typed_array(obj)
+    if isinstance(obj, dict):
+        return {key: to_typed_arrays(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_typed_arrays(value) for value in obj]
+    return obj
+
+def _plain(obj: Any) -> Any:
+    if isinstance(obj, list):
+        return [_plain(value) for value in obj]
+    return _default(obj) if isinstance(obj, (np.generic, datetime, date)) else obj
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, np.generic):
+        return obj.item() if not isinstance(obj, np.datetime64) else str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj: Any) -> bytes:
+    """Компактная сериализация фигур и панелей в JSON"""
+    obj = to_typed_arrays(obj)
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
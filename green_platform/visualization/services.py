@@ -1,23 +1,135 @@
-from typing import List, Dict, Any
-import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
+from typing import List, Dict, Any, Optional, Union
 from ..tree_analysis.domain.entities import TreeAnalysis, AnalysisResult
+from ..tree_analysis.domain.columnar import TreeColumns
+from ..tree_analysis.domain.timeseries import DEFAULT_MAX_POINTS, MeasurementRollup
+from .aggregation import BBox, aggregate_points, bbox_mask, fit_zoom
+
+# Plotly и pandas импортируются внутри построения графиков: процессы,
+# которые не рисуют графики (воркеры, команды manage.py), их не загружают
+
+# Начиная с этого зума карта показывает отдельные деревья, ниже - агрегаты по ячейкам
+POINT_ZOOM_THRESHOLD = 15
+
+# Графики, которые строятся по всему результату анализа, а не по списку деревьев
+RESULT_CHARTS = {'co2_absorption', 'biodiversity'}
+CHART_TYPES = ('growth', 'co2_absorption', 'biodiversity', 'health_distribution',
+               'environmental_impact_map')
 
 class VisualizationService:
     """Сервис для создания визуализаций данных о деревьях"""
 
+    @classmethod
+    def render_chart(cls, chart_type: str, result: AnalysisResult, **params: Any) -> Dict[str, Any]:
+        """Строит график указанного типа по результату анализа"""
+        builders = {
+            'growth': cls.create_growth_chart,
+            'co2_absorption': cls.create_co2_absorption_chart,
+            'biodiversity': cls.create_biodiversity_chart,
+            'health_distribution': cls.create_health_distribution,
+            'environmental_impact_map': cls.create_environmental_impact_map
+        }
+        if chart_type not in builders:
+            raise ValueError(f"Unknown chart type: {chart_type}")
+        source = result if chart_type in RESULT_CHARTS else result.trees
+        return builders[chart_type](source, **params)
+
+    @staticmethod
+    def build_dashboard(trees: Union[List[TreeAnalysis], TreeColumns], zoom: Optional[float] = None,
+                        bbox: Optional[BBox] = None, bin_shape: str = 'hex', cell_px: float = 40.0,
+                        point_zoom_threshold: float = POINT_ZOOM_THRESHOLD,
+                        rollup: Optional[MeasurementRollup] = None) -> Dict[str, Dict[str, Any]]:
+        """Создает все графики панели по одному извлечению колонок.
+
+        С агрегатами измерений rollup график роста строится по истории
+        измерений (см. create_growth_chart). Результат сериализуется через
+        encoding.dumps: числовые массивы фигур передаются как типизированные
+        base64-блоки Plotly.
+        """
+        columns = trees if isinstance(trees, TreeColumns) else TreeColumns.from_trees(trees)
+        return {
+            'growth': VisualizationService._growth_figure(columns, rollup),
+            'co2_absorption': VisualizationService._co2_absorption_figure(columns),
+            'biodiversity': VisualizationService._biodiversity_figure(columns),
+            'health_distribution': VisualizationService._health_distribution_figure(columns),
+            'environmental_impact_map': VisualizationService._impact_map_figure(
+                columns, zoom, bbox, bin_shape, cell_px, point_zoom_threshold)
+        }
+
     @staticmethod
-    def create_growth_chart(trees: List[TreeAnalysis]) -> Dict[str, Any]:
-        """Создает график роста деревьев"""
-        df = pd.DataFrame([
-            {
-                'height': tree.characteristics.height,
-                'age': tree.characteristics.age,
-                'species': tree.characteristics.species
-            } for tree in trees
+    def create_growth_chart(trees: List[TreeAnalysis], rollup: Optional[MeasurementRollup] = None,
+                            max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Any]:
+        """Создает график роста деревьев.
+
+        С агрегатами измерений (MeasurementRollup) - динамика средней высоты
+        видов выборки, не больше max_points точек на вид; без них или без
+        истории по видам выборки - зависимость высоты от возраста.
+        """
+        return VisualizationService._growth_figure(TreeColumns.from_trees(trees), rollup, max_points)
+
+    @staticmethod
+    def create_growth_history_chart(series: Dict[str, Any], metric: str = 'height',
+                                    title: str = 'Динамика высоты деревьев') -> Dict[str, Any]:
+        """Создает график многолетней динамики по ряду MeasurementRollup.query.
+
+        Ряд уже агрегирован по корзинам и прорежен, поэтому размер графика не
+        зависит от длины истории: средняя линия и полоса от минимума до максимума.
+        """
+        import plotly.graph_objects as go
+        time = series['time']
+        fig = go.Figure([
+            go.Scatter(x=time, y=series[f'{metric}_max'], mode='lines', line={'width': 0},
+                       showlegend=False, hoverinfo='skip'),
+            go.Scatter(x=time, y=series[f'{metric}_min'], mode='lines', line={'width': 0},
+                       fill='tonexty', fillcolor='rgba(46, 139, 87, 0.2)', name='Минимум - максимум'),
+            go.Scatter(x=time, y=series[f'{metric}_mean'], mode='lines+markers',
+                       line={'color': 'seagreen'}, name='Среднее',
+                       customdata=series['count'], hovertemplate='%{y:.2f} (измерений: %{customdata})')
         ])
+        fig.update_layout(title=title, xaxis_title='Дата', yaxis_title='Высота (м)' if metric == 'height' else metric)
+        return fig.to_dict()
+
+    @staticmethod
+    def create_co2_absorption_chart(result: AnalysisResult) -> Dict[str, Any]:
+        """Создает график поглощения CO2"""
+        return VisualizationService._co2_absorption_figure(TreeColumns.from_trees(result.trees))
+
+    @staticmethod
+    def create_biodiversity_chart(result: AnalysisResult) -> Dict[str, Any]:
+        """Создает круговую диаграмму биоразнообразия"""
+        return VisualizationService._biodiversity_figure(TreeColumns.from_trees(result.trees))
+
+    @staticmethod
+    def create_health_distribution(trees: List[TreeAnalysis]) -> Dict[str, Any]:
+        """Создает диаграмму распределения состояния здоровья деревьев"""
+        return VisualizationService._health_distribution_figure(TreeColumns.from_trees(trees))
+
+    @staticmethod
+    def create_environmental_impact_map(trees: List[TreeAnalysis], zoom: Optional[float] = None,
+                                        bbox: Optional[BBox] = None, bin_shape: str = 'hex',
+                                        cell_px: float = 40.0,
+                                        point_zoom_threshold: float = POINT_ZOOM_THRESHOLD) -> Dict[str, Any]:
+        """Создает карту экологического влияния деревьев.
 
+        Отдельные деревья выводятся только для окна bbox при zoom не ниже
+        point_zoom_threshold. Иначе поглощение CO2 агрегируется по шестиугольным
+        или квадратным ячейкам размером cell_px пикселей (сумма, среднее и число
+        деревьев), и размер ответа определяется разрешением экрана, а не числом
+        деревьев; без zoom он подбирается по окну или по всем деревьям.
+        """
+        return VisualizationService._impact_map_figure(TreeColumns.from_trees(trees), zoom, bbox,
+                                                       bin_shape, cell_px, point_zoom_threshold)
+
+    @staticmethod
+    def _growth_figure(columns: TreeColumns, rollup: Optional[MeasurementRollup] = None,
+                       max_points: int = DEFAULT_MAX_POINTS) -> Dict[str, Any]:
+        if rollup is not None:
+            figure = VisualizationService._species_growth_figure(rollup, sorted(set(columns.species.tolist())),
+                                                                 max_points)
+            if figure is not None:
+                return figure
+        import pandas as pd
+        import plotly.express as px
+        df = pd.DataFrame({'height': columns.height, 'age': columns.age, 'species': columns.species})
         fig = px.scatter(df, x='age', y='height', color='species',
                         title='Зависимость высоты деревьев от возраста',
                         labels={'age': 'Возраст (лет)',
@@ -26,15 +138,29 @@ class VisualizationService:
         return fig.to_dict()
 
     @staticmethod
-    def create_co2_absorption_chart(result: AnalysisResult) -> Dict[str, Any]:
-        """Создает график поглощения CO2"""
-        df = pd.DataFrame([
-            {
-                'species': tree.characteristics.species,
-                'co2': tree.characteristics.co2_absorption
-            } for tree in result.trees
-        ])
+    def _species_growth_figure(rollup: MeasurementRollup, species: List[str],
+                               max_points: int) -> Optional[Dict[str, Any]]:
+        import plotly.graph_objects as go
+        traces = []
+        for name in species:
+            series = rollup.query('species', name, max_points=max_points)
+            known = series['height_count'] > 0
+            if known.any():
+                traces.append(go.Scatter(x=series['time'][known], y=series['height_mean'][known], mode='lines',
+                                         name=name, customdata=series['height_count'][known],
+                                         hovertemplate='%{y:.2f} (измерений: %{customdata})'))
+        if not traces:
+            return None
+        fig = go.Figure(traces)
+        fig.update_layout(title='Динамика средней высоты деревьев по видам', xaxis_title='Дата',
+                          yaxis_title='Высота (м)', legend_title='Вид дерева')
+        return fig.to_dict()
 
+    @staticmethod
+    def _co2_absorption_figure(columns: TreeColumns) -> Dict[str, Any]:
+        import pandas as pd
+        import plotly.express as px
+        df = pd.DataFrame({'species': columns.species, 'co2': columns.co2_absorption})
         fig = px.bar(df.groupby('species').sum().reset_index(),
                      x='species', y='co2',
                      title='Поглощение CO2 по видам деревьев',
@@ -43,22 +169,20 @@ class VisualizationService:
         return fig.to_dict()
 
     @staticmethod
-    def create_biodiversity_chart(result: AnalysisResult) -> Dict[str, Any]:
-        """Создает круговую диаграмму биоразнообразия"""
-        species_count = pd.Series([tree.characteristics.species for tree in result.trees])\
-            .value_counts()
-
+    def _biodiversity_figure(columns: TreeColumns) -> Dict[str, Any]:
+        import pandas as pd
+        import plotly.graph_objects as go
+        species_count = pd.Series(columns.species).value_counts()
         fig = go.Figure(data=[go.Pie(labels=species_count.index,
                                     values=species_count.values,
                                     title='Распределение видов деревьев')])
         return fig.to_dict()
 
     @staticmethod
-    def create_health_distribution(trees: List[TreeAnalysis]) -> Dict[str, Any]:
-        """Создает диаграмму распределения состояния здоровья деревьев"""
-        health_count = pd.Series([tree.characteristics.health_condition for tree in trees])\
-            .value_counts()
-
+    def _health_distribution_figure(columns: TreeColumns) -> Dict[str, Any]:
+        import pandas as pd
+        import plotly.express as px
+        health_count = pd.Series(columns.health_condition).value_counts()
         fig = px.bar(x=health_count.index, y=health_count.values,
                      title='Распределение состояния здоровья деревьев',
                      labels={'x': 'Состояние здоровья',
@@ -66,16 +190,23 @@ class VisualizationService:
         return fig.to_dict()
 
     @staticmethod
-    def create_environmental_impact_map(trees: List[TreeAnalysis]) -> Dict[str, Any]:
-        """Создает карту экологического влияния деревьев"""
-        df = pd.DataFrame([
-            {
-                'lat': tree.characteristics.location_latitude,
-                'lon': tree.characteristics.location_longitude,
-                'impact': tree.characteristics.co2_absorption,
-                'species': tree.characteristics.species
-            } for tree in trees
-        ])
+    def _impact_map_figure(columns: TreeColumns, zoom: Optional[float], bbox: Optional[BBox],
+                           bin_shape: str, cell_px: float, point_zoom_threshold: float) -> Dict[str, Any]:
+        # Без окна карты точки не ограничены экраном: зум не выше того, при котором видны все деревья
+        fitted = fit_zoom(columns.latitude, columns.longitude, bbox)
+        zoom = fitted if zoom is None else (zoom if bbox is not None else min(zoom, fitted))
+        if bbox is None or zoom < point_zoom_threshold:
+            return VisualizationService._aggregated_impact_map(columns, zoom, bbox, bin_shape, cell_px)
+
+        import pandas as pd
+        import plotly.express as px
+        mask = bbox_mask(columns.latitude, columns.longitude, bbox)
+        df = pd.DataFrame({
+            'lat': columns.latitude[mask],
+            'lon': columns.longitude[mask],
+            'impact': columns.co2_absorption[mask],
+            'species': columns.species[mask]
+        })
 
         fig = px.scatter_mapbox(df,
                                lat='lat',
@@ -85,4 +216,34 @@ class VisualizationService:
                                hover_data=['species'],
                                title='Карта экологического влияния деревьев',
                                mapbox_style='carto-positron')
-        return fig.to_dict()
\ No newline at end of file
+        return fig.to_dict()
+
+    @staticmethod
+    def _aggregated_impact_map(columns: TreeColumns, zoom: float, bbox: Optional[BBox],
+                               bin_shape: str, cell_px: float) -> Dict[str, Any]:
+        """Карта агрегатов поглощения CO2 по ячейкам экранного размера"""
+        import pandas as pd
+        import plotly.express as px
+        cells = aggregate_points(columns.latitude, columns.longitude, columns.co2_absorption,
+                                 zoom, cell_px=cell_px, shape=bin_shape, bbox=bbox)
+        df = pd.DataFrame({
+            'lat': cells['lat'],
+            'lon': cells['lon'],
+            'impact': cells['sum'],
+            'mean_impact': cells['mean'],
+            'trees': cells['count']
+        })
+
+        fig = px.scatter_mapbox(df,
+                               lat='lat',
+                               lon='lon',
+                               color='impact',
+                               size='trees',
+                               hover_data=['mean_impact', 'trees'],
+                               zoom=zoom,
+                               title='Карта экологического влияния деревьев',
+                               labels={'impact': 'Поглощение CO2 (кг/год)',
+                                       'mean_impact': 'Среднее на дерево (кг/год)',
+                                       'trees': 'Количество деревьев'},
+                               mapbox_style='carto-positron')
+        return fig.to_dict()
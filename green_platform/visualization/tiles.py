@@ -0,0 +1,238 @@
+import asyncio
+import math
+import os
+import tempfile
+from typing import Dict, Iterator, Optional, Protocol, Set, Tuple
+
+MAX_LATITUDE = 85.05112878
+TILE_MEDIA_TYPE = 'application/vnd.mapbox-vector-tile'
+
+# Зумы пирамиды: до AGGREGATE_MAX_ZOOM - кластеры, крупнее - отдельные деревья.
+# Записи деревьев отмечают изменения тайлов по этим же границам
+AGGREGATE_MAX_ZOOM = 12
+MAX_ZOOM = 20
+
+TileKey = Tuple[int, int, int]
+
+def tile_for_point(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """Номер тайла (x, y) схемы XYZ, содержащего точку"""
+    n = 1 << zoom
+    lat = math.radians(min(max(latitude, -MAX_LATITUDE), MAX_LATITUDE))
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat) + 1.0 / math.cos(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Границы тайла (min_lat, min_lon, max_lat, max_lon)"""
+    n = 1 << zoom
+
+    def latitude(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
+
+def tiles_covering(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                   zoom: int) -> Iterator[Tuple[int, int]]:
+    """Все тайлы зума, пересекающие прямоугольник"""
+    x0, y0 = tile_for_point(max_lat, min_lon, zoom)
+    x1, y1 = tile_for_point(min_lat, max_lon, zoom)
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            yield x, y
+
+class TileRenderer(Protocol):
+    """Источник тайлов и их поколений (например, TileRepository поверх PostGIS).
+
+    Поколение тайла растет при изменении деревьев в нем. Поколения хранятся
+    в базе и увеличиваются в транзакциях записи деревьев, поэтому запись
+    любым путем (API, пакеты, ETL) видна всем процессам.
+    """
+    async def render_point_tile(self, z: int, x: int, y: int) -> bytes: ...
+    async def render_aggregate_tile(self, z: int, x: int, y: int) -> bytes: ...
+    async def get_generation(self, z: int, x: int, y: int) -> int: ...
+    async def flush_aggregate_changes(self) -> int: ...
+
+class DiskTileCache:
+    """Кэш тайлов на локальном диске с ключом z/x/y и поколением данных тайла.
+
+    Файл тайла называется по поколению ({root}/z/x/y/generation.mvt), поэтому
+    новое поколение в базе делает устаревшими только тайлы, содержащие
+    измененные деревья. Рендер, начатый до изменения, записывается под старым
+    поколением и не может выдать себя за актуальный тайл. Запись атомарна
+    (os.replace).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def get(self, z: int, x: int, y: int, generation: int) -> Optional[bytes]:
+        try:
+            with open(self._tile_path(z, x, y, generation), 'rb') as handle:
+                return handle.read()
+        except OSError:
+            return None
+
+    def get_latest(self, z: int, x: int, y: int) -> Optional[Tuple[int, bytes]]:
+        """Последний сохраненный тайл любого поколения (для выдачи до перерасчета)"""
+        generations = sorted(self._stored_generations(z, x, y), reverse=True)
+        for generation in generations:
+            data = self.get(z, x, y, generation)
+            if data is not None:
+                return generation, data
+        return None
+
+    def put(self, z: int, x: int, y: int, generation: int, data: bytes) -> bool:
+        """Сохранение тайла; False, если уже сохранено более новое поколение"""
+        stored = self._stored_generations(z, x, y)
+        if any(newer > generation for newer in stored):
+            return False
+        self._atomic_write(self._tile_path(z, x, y, generation), data)
+        for stale in stored:
+            if stale < generation:
+                self._remove(self._tile_path(z, x, y, stale))
+        return True
+
+    def _stored_generations(self, z: int, x: int, y: int) -> Set[int]:
+        try:
+            names = os.listdir(self._tile_dir(z, x, y))
+        except OSError:
+            return set()
+        return {int(name[:-4]) for name in names if name.endswith('.mvt') and name[:-4].isdigit()}
+
+    def _tile_dir(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.root, str(z), str(x), str(y))
+
+    def _tile_path(self, z: int, x: int, y: int, generation: int) -> str:
+        return os.path.join(self._tile_dir(z, x, y), f'{generation}.mvt')
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                temp.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            DiskTileCache._remove(temp_path)
+            raise
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+class TileService:
+    """Пирамида векторных тайлов деревьев.
+
+    Тайлы до aggregate_max_zoom содержат кластеры (число деревьев, сумма CO2,
+    преобладающий вид) и рассчитываются заранее через precompute(); тайлы
+    крупнее рендерятся по запросу из отдельных деревьев. Устаревший тайл
+    низкого зума отдается из кэша, пока его перерасчет идет в фоне, поэтому
+    панорамирование карты не запускает запросы по всей таблице.
+
+    Тайлы низкого зума покрывают тысячи деревьев, поэтому их изменения
+    копятся в базе и переводятся в новые поколения не чаще раза в
+    aggregate_invalidation_interval секунд (цикл, запускаемый start()).
+    Сброс общий: изменения, накопленные любым процессом, применяет первый
+    сработавший цикл.
+    """
+
+    def __init__(self, renderer: TileRenderer, cache: DiskTileCache,
+                 aggregate_max_zoom: int = AGGREGATE_MAX_ZOOM, max_zoom: int = MAX_ZOOM,
+                 aggregate_invalidation_interval: float = 30.0):
+        self.renderer = renderer
+        self.cache = cache
+        self.aggregate_max_zoom = aggregate_max_zoom
+        self.max_zoom = max_zoom
+        self.aggregate_invalidation_interval = aggregate_invalidation_interval
+        self._rendering: Dict[Tuple[int, int, int, int], asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def get_tile(self, z: int, x: int, y: int) -> bytes:
+        """Получение тайла из кэша или его рендер"""
+        if not 0 <= z <= self.max_zoom or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError(f"Tile {z}/{x}/{y} is out of range")
+
+        generation = await self.renderer.get_generation(z, x, y)
+        data = self.cache.get(z, x, y, generation)
+        if data is not None:
+            return data
+
+        if z <= self.aggregate_max_zoom:
+            stale = self.cache.get_latest(z, x, y)
+            if stale is not None:
+                self._start_render((z, x, y), generation)
+                return stale[1]
+        return await asyncio.shield(self._start_render((z, x, y), generation))
+
+    async def precompute(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                         max_zoom: Optional[int] = None, concurrency: int = 4) -> int:
+        """Предварительный расчет агрегированных тайлов для охвата инвентаризации"""
+        semaphore = asyncio.Semaphore(concurrency)
+        max_zoom = self.aggregate_max_zoom if max_zoom is None else max_zoom
+
+        async def render(key: TileKey) -> None:
+            async with semaphore:
+                generation = await self.renderer.get_generation(*key)
+                if self.cache.get(*key, generation) is None:
+                    await asyncio.shield(self._start_render(key, generation))
+
+        keys = [(z, x, y) for z in range(max_zoom + 1)
+                for x, y in tiles_covering(min_lat, min_lon, max_lat, max_lon, z)]
+        await asyncio.gather(*(render(key) for key in keys))
+        return len(keys)
+
+    def start(self) -> None:
+        """Запуск периодического сброса изменений тайлов низкого зума"""
+        if self._flush_task is None and self.aggregate_invalidation_interval > 0:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Остановка цикла; накопленные изменения сбрасываются сразу"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._flush()
+
+    async def flush_invalidations(self) -> int:
+        """Новые поколения тайлов низкого зума по накопленным изменениям деревьев"""
+        return await self.renderer.flush_aggregate_changes()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.aggregate_invalidation_interval)
+            await self._flush()
+
+    async def _flush(self) -> None:
+        # Сбой сброса не останавливает цикл: изменения остаются в базе до следующего
+        try:
+            await self.flush_invalidations()
+        except Exception as e:
+            print(f"Error flushing aggregate tile changes: {e}")
+
+    def _start_render(self, key: TileKey, generation: int) -> asyncio.Future:
+        # Одновременные запросы одного поколения тайла ждут единственного рендера
+        render_key = (*key, generation)
+        future = self._rendering.get(render_key)
+        if future is None:
+            future = asyncio.ensure_future(self._render_and_store(key, generation))
+            self._rendering[render_key] = future
+            future.add_done_callback(lambda done: self._finish_render(render_key, done))
+        return future
+
+    def _finish_render(self, render_key: Tuple[int, int, int, int], future: asyncio.Future) -> None:
+        self._rendering.pop(render_key, None)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error rendering tile {'/'.join(map(str, render_key[:3]))}: {future.exception()}")
+
+    async def _render_and_store(self, key: TileKey, generation: int) -> bytes:
+        z, x, y = key
+        if z <= self.aggregate_max_zoom:
+            data = await self.renderer.render_aggregate_tile(z, x, y)
+        else:
+            data = await self.renderer.render_point_tile(z, x, y)
+        self.cache.put(z, x, y, generation, bytes(data or b''))
+        return bytes(data or b'')
@@ -0,0 +1,120 @@
+import asyncio
+import unittest
+from datetime import datetime
+from green_platform.core.data_analysis.application.cache import AnalysisResultCache
+from green_platform.core.data_analysis.application.services import TreeAnalysisApplicationService
+from green_platform.core.data_analysis.domain.entities import AnalysisResult, TreeData
+from green_platform.core.data_analysis.infrastructure.memory_repositories import (InMemoryAnalysisResultRepository,
+                                                                                  InMemoryTreeDataRepository)
+
+class InMemoryBackend:
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ttl):
+        self.values[key] = value
+
+    async def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+        return int(self.values[key])
+
+class CountingAnalysisService:
+    model_version = 'v1'
+
+    def __init__(self):
+        self.calls = 0
+
+    async def analyze_tree_health(self, tree_data):
+        self.calls += 1
+        return AnalysisResult(tree_id=tree_data.id, analysis_date=datetime(2024, 1, 1),
+                              metrics={'health_score': tree_data.height / 30.0}, recommendations=[],
+                              confidence_score=0.9)
+
+class AcceptAll:
+    def validate_tree_data(self, tree_data):
+        return True
+
+    def validate_analysis_result(self, result):
+        return True
+
+class TestAnalysisResultCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = 0
+
+    async def _compute(self):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return AnalysisResult(tree_id='tree-1', analysis_date=datetime(2024, 1, 1),
+                              metrics={'health_score': 0.9}, recommendations=['ok'],
+                              confidence_score=0.9)
+
+    async def test_hit_after_miss(self):
+        cache = AnalysisResultCache()
+        first = await cache.get_or_compute('tree-1', 'v1', self._compute)
+        second = await cache.get_or_compute('tree-1', 'v1', self._compute)
+        self.assertIs(first, second)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.get_metrics()['hits'], 1)
+
+    async def test_concurrent_misses_are_coalesced(self):
+        cache = AnalysisResultCache()
+        results = await asyncio.gather(*[
+            cache.get_or_compute('tree-1', 'v1', self._compute) for _ in range(20)
+        ])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len({id(result) for result in results}), 1)
+
+    async def test_invalidation_and_model_version(self):
+        cache = AnalysisResultCache()
+        await cache.get_or_compute('tree-1', 'v1', self._compute)
+        await cache.get_or_compute('tree-1', 'v2', self._compute)
+        self.assertEqual(self.calls, 2)
+        await cache.invalidate_tree('tree-1')
+        await cache.get_or_compute('tree-1', 'v1', self._compute)
+        self.assertEqual(self.calls, 3)
+
+    async def test_lru_bound(self):
+        cache = AnalysisResultCache(max_entries=2)
+        for tree_id in ('a', 'b', 'c'):
+            await cache.get_or_compute(tree_id, 'v1', self._compute)
+        metrics = cache.get_metrics()
+        self.assertEqual(metrics['size'], 2)
+        self.assertEqual(metrics['evictions'], 1)
+
+    async def test_shared_backend_between_workers(self):
+        backend = InMemoryBackend()
+        worker_a = AnalysisResultCache(backend=backend)
+        worker_b = AnalysisResultCache(backend=backend)
+        await worker_a.get_or_compute('tree-1', 'v1', self._compute)
+        await worker_b.get_or_compute('tree-1', 'v1', self._compute)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(worker_b.get_metrics()['shared_hits'], 1)
+
+        await worker_a.invalidate_tree('tree-1')
+        await worker_b.get_or_compute('tree-1', 'v1', self._compute)
+        self.assertEqual(self.calls, 2)
+
+class TestCachedTreeAnalysis(unittest.IsolatedAsyncioTestCase):
+    async def test_write_bypassing_service_changes_key(self):
+        trees = InMemoryTreeDataRepository()
+        analysis = CountingAnalysisService()
+        service = TreeAnalysisApplicationService(trees, InMemoryAnalysisResultRepository(), analysis,
+                                                 AcceptAll(), result_cache=AnalysisResultCache())
+        tree = TreeData(id='tree-1', species='oak', height=12.0, diameter=30.0, health_status='good',
+                        location_coordinates=(55.75, 37.62), last_inspection_date=datetime(2024, 1, 1))
+        await trees.save(tree)
+        await service.analyze_tree('tree-1')
+        await service.analyze_tree('tree-1')
+        self.assertEqual(analysis.calls, 1)
+
+        # Запись напрямую в хранилище, как при пакетной обработке или ETL
+        await trees.save(TreeData(**{**tree.__dict__, 'height': 24.0}))
+        result = await service.analyze_tree('tree-1')
+        self.assertEqual(analysis.calls, 2)
+        self.assertEqual(result.metrics['health_score'], 0.8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from green_platform import asgi
+from green_platform.asgi import model_path_from_env
+
+class TestModelPathFromEnv(unittest.TestCase):
+    def test_missing_model_is_a_configuration_error(self):
+        with mock.patch.dict(os.environ, {'MODEL_PATH': '/nonexistent/model.joblib'}):
+            with self.assertRaisesRegex(ValueError, 'MODEL_PATH'):
+                model_path_from_env()
+
+    def test_existing_model_path(self):
+        with tempfile.NamedTemporaryFile(suffix='.joblib') as model:
+            with mock.patch.dict(os.environ, {'MODEL_PATH': model.name}):
+                self.assertEqual(model_path_from_env(), model.name)
+
+class FakePools:
+    def __init__(self, *args, **kwargs):
+        self.closed = False
+
+    async def start(self, warmup=None):
+        pass
+
+    def pool(self, workload):
+        return SimpleNamespace(workload=workload)
+
+    async def close(self, timeout=30.0):
+        self.closed = True
+
+class FakeAnalysisService:
+    model_version = 'v1'
+
+    def __init__(self, model_path):
+        self.model_registry = SimpleNamespace(warm=lambda version: None)
+
+async def post(app, path, body):
+    """Статус ответа приложения на POST-запрос (прямой вызов ASGI)"""
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+             'headers': [(b'content-type', b'application/json'), (b'host', b'test')],
+             'client': ('127.0.0.1', 1), 'server': ('test', 80)}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return next(message['status'] for message in sent if message['type'] == 'http.response.start')
+
+class TestApplicationRoutes(unittest.IsolatedAsyncioTestCase):
+    async def test_lifespan_runs_do_not_duplicate_routes(self):
+        with mock.patch.multiple(asgi, PoolManager=FakePools, MLTreeAnalysisService=FakeAnalysisService,
+                                 model_path_from_env=lambda: 'model.joblib'), \
+                mock.patch.dict(os.environ, {'TILE_CACHE_DIR': '', 'SNAPSHOT_DIR': ''}):
+            first, second = asgi.create_application(), asgi.create_application()
+            outer_routes = len(first.routes)
+            seen = []
+            for app in (first, first, second):
+                async with app.router.lifespan_context(app):
+                    operations = sorted((path, method) for path, methods in
+                                        app.state.routes.openapi()['paths'].items() for method in methods)
+                    seen.append((len(app.state.routes.routes), operations))
+                self.assertIsNone(app.state.routes)
+            self.assertEqual(seen[0], seen[1])
+            self.assertEqual(seen[0], seen[2])
+            self.assertIn(('/api/v1/analysis/trees', 'post'), seen[0][1])
+            self.assertEqual(len(first.routes), outer_routes)
+
+    async def test_requests_reach_routes_of_running_lifespan(self):
+        with mock.patch.multiple(asgi, PoolManager=FakePools, MLTreeAnalysisService=FakeAnalysisService,
+                                 model_path_from_env=lambda: 'model.joblib'), \
+                mock.patch.dict(os.environ, {'TILE_CACHE_DIR': '', 'SNAPSHOT_DIR': ''}):
+            app = asgi.create_application()
+            self.assertEqual(await post(app, '/api/v1/analysis/trees', b'{}'), 503)
+            async with app.router.lifespan_context(app):
+                # Тело не проходит проверку модели TreeData: ответ дают маршруты API
+                self.assertEqual(await post(app, '/api/v1/analysis/trees', b'{}'), 422)
+
+if __name__ == '__main__':
+    unittest.main()
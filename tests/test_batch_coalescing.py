@@ -0,0 +1,140 @@
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from green_platform.core.data_analysis.domain.batch_processing import (CoalescePolicy, CoalescingConfig,
+                                                                       coalesce_tree_data)
+from green_platform.core.data_analysis.infrastructure.database.batch_factories import TreeDataBatchFactory
+from green_platform.core.data_analysis.infrastructure.database.batch_repository import BatchRepository
+
+def _payload(height, health_status='healthy', species='oak'):
+    return {'location': (37.6, 55.7), 'height': height, 'species': species, 'health_status': health_status}
+
+class TestCoalesceTreeData(unittest.TestCase):
+    def test_last_writer_wins_per_field(self):
+        payloads = [_payload(10.0, 'healthy'), _payload(11.0, None), {'height': None, 'species': 'maple'}]
+        self.assertEqual(coalesce_tree_data(payloads), [
+            {'location': (37.6, 55.7), 'height': 11.0, 'species': 'maple', 'health_status': 'healthy'}])
+
+    def test_keep_all_keeps_every_payload(self):
+        payloads = [_payload(10.0), _payload(11.0)]
+        self.assertEqual(coalesce_tree_data(payloads, CoalescePolicy.KEEP_ALL), payloads)
+
+    def test_payloads_ordered_by_inspection_date(self):
+        later = {**_payload(12.0), 'last_inspection_date': '2024-06-01T00:00:00+00:00'}
+        earlier = {**_payload(10.0, 'stressed'), 'last_inspection_date': '2024-05-01T03:00:00+03:00'}
+        self.assertEqual([payload['height'] for payload in
+                          coalesce_tree_data([later, earlier], CoalescePolicy.KEEP_ALL)], [10.0, 12.0])
+        # Последний по дате осмотр побеждает, даже если его батч создан раньше
+        self.assertEqual(coalesce_tree_data([later, earlier])[0]['height'], 12.0)
+
+    def test_config_validation(self):
+        with self.assertRaises(ValueError):
+            CoalescingConfig(window_seconds=-1)
+        with self.assertRaises(ValueError):
+            CoalescingConfig(max_batches=0)
+
+class FakeConnection:
+    """Окно из батча b1 и ожидающих батчей того же дерева; фиксирует записанные версии"""
+
+    def __init__(self, pending, fail_insert=False):
+        self.anchor = {'batch_id': 'b1', 'tree_id': 't1', 'status': 'processing',
+                       'created_at': datetime(2024, 5, 1), 'batch_data': _payload(10.0)}
+        self.pending = pending
+        self.fail_insert = fail_insert
+        self.version_count = 0
+        self.tree_rows = None
+        self.statuses = {}
+        self.window_args = None
+
+    async def fetchrow(self, query, *args):
+        if 'FROM data_batches' in query:
+            return self.anchor
+        return None
+
+    async def fetch(self, query, *args):
+        if 'FOR UPDATE SKIP LOCKED' in query:
+            self.window_args = args
+            return self.pending[:args[4]]
+        if 'INSERT INTO tree_versions' in query:
+            if self.fail_insert:
+                raise RuntimeError('duplicate version')
+            self.version_count = len(args[1])
+            self.created_at = args[1]
+            return [{'version_id': f'v{number}', 'version_number': number}
+                    for number in reversed(range(1, len(args[1]) + 1))]
+        return []
+
+    async def execute(self, query, *args):
+        if 'INSERT INTO trees' in query:
+            self.tree_rows = args
+        elif 'UPDATE data_batches' in query:
+            status = 'completed' if "status = 'completed'" in query else args[0]
+            for batch_id in args[-1]:
+                self.statuses[batch_id] = status
+        return 'UPDATE 1'
+
+class FakeTransactionManager:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield self.connection
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+def _repository(connection):
+    return BatchRepository(FakePool(connection), FakeTransactionManager(connection))
+
+class TestCoalescedProcessing(unittest.IsolatedAsyncioTestCase):
+    async def test_window_is_written_as_one_version(self):
+        connection = FakeConnection([{'batch_id': 'b2', 'batch_data': _payload(11.0, 'stressed')},
+                                     {'batch_id': 'b3', 'batch_data': _payload(12.0, None)}])
+        processed = await _repository(connection).process_coalesced_tree_data_batch(
+            'b1', CoalescingConfig(window_seconds=10))
+        self.assertTrue(processed)
+        self.assertEqual(connection.version_count, 1)
+        self.assertEqual(connection.tree_rows[1:6], (['v1'], [(37.6, 55.7)], [12.0], ['oak'], ['stressed']))
+        self.assertEqual(connection.statuses, {'b1': 'completed', 'b2': 'completed', 'b3': 'completed'})
+        self.assertEqual(connection.window_args[3:], (10, 99))
+
+    async def test_keep_all_writes_versions_in_order(self):
+        connection = FakeConnection([{'batch_id': 'b2',
+                                      'batch_data': {**_payload(11.0), 'diameter': 32.0, 'notes': 'дупло'}}])
+        config = CoalescingConfig(policy=CoalescePolicy.KEEP_ALL, max_batches=2)
+        self.assertTrue(await _repository(connection).process_coalesced_tree_data_batch('b1', config))
+        self.assertEqual(connection.version_count, 2)
+        self.assertEqual(connection.tree_rows[1], ['v1', 'v2'])
+        self.assertEqual(connection.tree_rows[3], [10.0, 11.0])
+        self.assertEqual((connection.tree_rows[6], connection.tree_rows[8]), ([None, 32.0], [None, 'дупло']))
+
+    async def test_versions_dated_by_inspection(self):
+        connection = FakeConnection([{'batch_id': 'b2', 'batch_data': {
+            **_payload(11.0), 'last_inspection_date': '2024-04-01T10:00:00'}}])
+        connection.anchor['batch_data'] = {**_payload(10.0), 'last_inspection_date': '2024-05-01T10:00:00'}
+        config = CoalescingConfig(policy=CoalescePolicy.KEEP_ALL, max_batches=2)
+        self.assertTrue(await _repository(connection).process_coalesced_tree_data_batch('b1', config))
+        dates = [datetime(2024, 4, 1, 10, tzinfo=timezone.utc), datetime(2024, 5, 1, 10, tzinfo=timezone.utc)]
+        self.assertEqual(connection.created_at, dates)
+        self.assertEqual(connection.tree_rows[3], [11.0, 10.0])
+        self.assertEqual(connection.tree_rows[7], dates)
+
+    async def test_failure_marks_whole_group_failed(self):
+        connection = FakeConnection([{'batch_id': 'b2', 'batch_data': _payload(11.0)}], fail_insert=True)
+        self.assertFalse(await _repository(connection).process_coalesced_tree_data_batch('b1'))
+        self.assertEqual(connection.statuses, {'b1': 'failed', 'b2': 'failed'})
+
+    async def test_factory_enables_coalescing(self):
+        connection = FakeConnection([])
+        processor = TreeDataBatchFactory(_repository(connection), CoalescingConfig()).create_processor()
+        self.assertTrue(await processor.process('b1'))
+        self.assertEqual(connection.statuses, {'b1': 'completed'})
+
+if __name__ == '__main__':
+    unittest.main()
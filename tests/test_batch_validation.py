@@ -0,0 +1,118 @@
+import time
+import unittest
+from datetime import datetime
+from uuid import uuid4
+import numpy as np
+import pandas as pd
+from green_platform.core.data_analysis.application.ingest import BulkIngestService
+from green_platform.core.data_analysis.domain.entities import AnalysisResult, TreeData
+from green_platform.core.data_analysis.domain.validation import (ValidationReason, analysis_result_columns,
+                                                                 tree_data_columns)
+from green_platform.core.data_analysis.infrastructure.services import TreeDataValidationService
+
+def make_columns(count):
+    return {
+        'id': np.array([str(uuid4()) for _ in range(count)], dtype=object),
+        'species': np.array(['Дуб'] * count, dtype=object),
+        'health_status': np.array(['good'] * count, dtype=object),
+        'height': np.full(count, 12.0),
+        'diameter': np.full(count, 40.0),
+        'latitude': np.full(count, 55.75),
+        'longitude': np.full(count, 37.62)
+    }
+
+class FakeBatchWriter:
+    def __init__(self):
+        self.batches = []
+
+    async def create_batches(self, batches):
+        self.batches.extend(batches)
+        return len(batches)
+
+class TestBatchValidation(unittest.TestCase):
+    def setUp(self):
+        self.service = TreeDataValidationService()
+
+    def test_reason_codes(self):
+        columns = make_columns(6)
+        columns['species'][0] = ''
+        columns['height'][1] = 0
+        columns['diameter'][2] = -3
+        columns['latitude'][3] = 95
+        columns['id'][4] = columns['id'][5]
+        columns['species'][1] = None
+
+        result = self.service.validate_batch(columns)
+        self.assertEqual(result.mask.tolist(), [False, False, False, False, True, False])
+        self.assertEqual(result.reasons_for(0), ['MISSING_SPECIES'])
+        self.assertEqual(result.reasons_for(1), ['MISSING_SPECIES', 'NON_POSITIVE_HEIGHT'])
+        self.assertEqual(result.reasons_for(2), ['NON_POSITIVE_DIAMETER'])
+        self.assertEqual(result.reasons_for(3), ['INVALID_COORDINATES'])
+        self.assertEqual(result.reasons_for(5), ['DUPLICATE'])
+        self.assertEqual(result.reason_counts()['MISSING_SPECIES'], 2)
+
+    def test_dataframe_and_custom_rule_set(self):
+        frame = pd.DataFrame(make_columns(4))
+        frame.loc[3, 'id'] = frame.loc[0, 'id']
+        self.assertEqual(self.service.validate_batch(frame).valid_count, 3)
+
+        rules = self.service.tree_data_rules.without(ValidationReason.DUPLICATE)
+        self.assertTrue(TreeDataValidationService(tree_data_rules=rules).validate_batch(frame).mask.all())
+
+    def test_entities_to_columns(self):
+        tree = TreeData(str(uuid4()), 'Липа', 8.0, 20.0, 'good', (55.0, 37.0), datetime.now())
+        self.assertTrue(self.service.validate_batch(tree_data_columns([tree])).mask.all())
+
+        results = [AnalysisResult(tree.id, datetime.now(), {'health_score': 0.9}, ['Полив'], 0.9),
+                   AnalysisResult(tree.id, datetime.now(), {}, ['Полив'], 1.5)]
+        checked = self.service.validate_results_batch(analysis_result_columns(results))
+        self.assertEqual(checked.mask.tolist(), [True, False])
+        self.assertEqual(checked.reasons_for(1), ['CONFIDENCE_OUT_OF_RANGE', 'MISSING_METRICS'])
+
+    def test_million_rows(self):
+        frame = pd.DataFrame(make_columns(1000))
+        frame = pd.concat([frame] * 1000, ignore_index=True)
+        frame['id'] = [str(uuid4()) for _ in range(len(frame))]
+        started = time.perf_counter()
+        result = self.service.validate_batch(frame)
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertEqual(result.valid_count, 1000000)
+
+class TestIngestValidation(unittest.IsolatedAsyncioTestCase):
+    async def test_rejected_rows_report_reasons(self):
+        writer = FakeBatchWriter()
+        service = BulkIngestService(writer, TreeDataValidationService(), chunk_size=10)
+        tree_id = str(uuid4())
+        lines = [
+            f'{{"id": "{tree_id}", "species": "Дуб", "height": 10, "diameter": 30, "health_status": "good", '
+            f'"latitude": 55.7, "longitude": 37.6, "last_inspection_date": "2024-05-01"}}'
+        ] * 2
+
+        async def chunks():
+            yield '\n'.join(lines).encode()
+
+        report = [entry async for entry in service.ingest(chunks())]
+        self.assertEqual(report[0], {'line': 2, 'error': 'Invalid tree data', 'reasons': ['DUPLICATE']})
+        self.assertEqual(report[-1]['accepted'], 1)
+        self.assertEqual(report[-1]['rejected'], 1)
+        self.assertEqual(len(writer.batches), 1)
+
+    async def test_repeated_tree_with_new_inspection_is_accepted(self):
+        writer = FakeBatchWriter()
+        service = BulkIngestService(writer, TreeDataValidationService(), chunk_size=10)
+        tree_id = str(uuid4())
+        lines = [
+            f'{{"id": "{tree_id}", "species": "Дуб", "height": {height}, "diameter": 30, "health_status": "good", '
+            f'"latitude": 55.7, "longitude": 37.6, "last_inspection_date": "{date}"}}'
+            for height, date in ((10, '2024-05-01'), (11, '2024-06-01'))
+        ]
+
+        async def chunks():
+            yield '\n'.join(lines).encode()
+
+        report = [entry async for entry in service.ingest(chunks())]
+        self.assertEqual(report, [{'summary': True, 'lines': 2, 'accepted': 2, 'rejected': 0}])
+        self.assertEqual(len(writer.batches), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from benchmarks.generator import BLOCK_SIZE, SyntheticTrees
+from benchmarks.suite import BENCHMARKS, compare, run_suite
+from green_platform.core.data_analysis.infrastructure.services import TreeDataValidationService
+
+class TestSyntheticTrees(unittest.TestCase):
+    def test_deterministic_across_ranges(self):
+        trees = SyntheticTrees(BLOCK_SIZE + 100, seed=7)
+        whole = trees.arrays()
+        tail = trees.arrays(BLOCK_SIZE - 50, BLOCK_SIZE + 100)
+        np.testing.assert_array_equal(whole['height'][BLOCK_SIZE - 50:], tail['height'])
+        np.testing.assert_array_equal(SyntheticTrees(BLOCK_SIZE + 100, seed=7).arrays()['species'],
+                                      whole['species'])
+        self.assertFalse(np.array_equal(SyntheticTrees(100, seed=8).arrays()['height'], whole['height'][:100]))
+
+    def test_entities_match_columns(self):
+        trees = SyntheticTrees(50)
+        tree_data = list(trees.tree_data())
+        columns = trees.tree_columns()
+        analyses = list(trees.tree_analyses(10, 20))
+        self.assertEqual(tree_data[10].id, columns.ids[10])
+        self.assertEqual(str(analyses[0].id), columns.ids[10])
+        self.assertEqual(analyses[0].characteristics.height, columns.height[10])
+        self.assertEqual(next(trees.batch_payloads(3, 4)).batch_data['location'],
+                         [tree_data[3].location_coordinates[1], tree_data[3].location_coordinates[0]])
+        self.assertTrue(TreeDataValidationService().validate_batch(trees.validation_columns()).mask.all())
+
+class TestSuite(unittest.TestCase):
+    def test_every_benchmark_runs(self):
+        report = run_suite([200], repeat=1)
+        names = {item['name'] for item in report['results']}
+        expected = {bench.name for bench in BENCHMARKS if bench.requires is None}
+        self.assertEqual(names, expected)
+        self.assertIn('charts.environmental_impact_map', names)
+
+    def test_compare_reports_regressions(self):
+        baseline = {'results': [{'name': 'a', 'scale': 1000, 'seconds': 1.0},
+                                {'name': 'b', 'scale': 1000, 'seconds': 1.0}]}
+        report = {'results': [{'name': 'a', 'scale': 1000, 'seconds': 1.1},
+                              {'name': 'b', 'scale': 1000, 'seconds': 1.5},
+                              {'name': 'c', 'scale': 1000, 'seconds': 9.0}]}
+        regressions = compare(report, baseline, tolerance=0.2)
+        self.assertEqual([item['name'] for item in regressions], ['b'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+from datetime import datetime
+import numpy as np
+from green_platform.core.data_analysis.application.services import TreeAnalysisApplicationService
+from green_platform.core.data_analysis.domain.entities import TreeData
+from green_platform.core.data_analysis.domain.repositories import AnalysisResultRepository, TreeDataRepository
+from green_platform.core.data_analysis.infrastructure.ml.model_registry import ModelRegistry
+from green_platform.core.data_analysis.infrastructure.services import MLTreeAnalysisService, TreeDataValidationService
+
+class HeightModel:
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, features):
+        self.batches.append(len(features))
+        return np.clip(np.asarray(features)[:, 0] / 30.0, 0.0, 1.0)
+
+class InMemoryTrees(TreeDataRepository):
+    def __init__(self, trees):
+        self.trees = {tree.id: tree for tree in trees}
+        self.queries = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def save(self, tree_data):
+        self.trees[tree_data.id] = tree_data
+
+    async def get_by_id(self, tree_id):
+        return self.trees.get(tree_id)
+
+    async def get_all(self):
+        return list(self.trees.values())
+
+    async def get_by_ids(self, tree_ids):
+        self.queries += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return [self.trees[tree_id] for tree_id in tree_ids if tree_id in self.trees]
+
+class InMemoryResults(AnalysisResultRepository):
+    def __init__(self):
+        self.results = []
+        self.inserts = 0
+
+    async def save(self, result):
+        self.results.append(result)
+
+    async def get_by_tree_id(self, tree_id):
+        return [result for result in self.results if result.tree_id == tree_id]
+
+    async def save_many(self, results):
+        self.inserts += 1
+        self.results.extend(results)
+
+def make_tree(index, height=15.0, species='Дуб'):
+    return TreeData(id=f'tree-{index}', species=species, height=height, diameter=30.0,
+                    health_status='good', location_coordinates=(55.75, 37.62),
+                    last_inspection_date=datetime(2024, 5, 1))
+
+class TestBulkAnalyze(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.model = HeightModel()
+        registry = ModelRegistry(loader=lambda path: self.model)
+        self.trees = InMemoryTrees([make_tree(i, species='Дуб' if i % 2 else 'Липа') for i in range(95)]
+                                   + [make_tree(95, height=-1.0)])
+        self.results = InMemoryResults()
+        self.service = TreeAnalysisApplicationService(
+            self.trees, self.results,
+            MLTreeAnalysisService('models/v1.joblib', model_registry=registry),
+            TreeDataValidationService()
+        )
+
+    async def collect(self, *args, **kwargs):
+        return [entry async for entry in self.service.analyze_trees(*args, **kwargs)]
+
+    async def test_batched_fetch_inference_and_save(self):
+        ids = [f'tree-{i}' for i in range(96)] + ['missing']
+        entries = await self.collect(ids, batch_size=10, concurrency=3)
+        statuses = {entry['tree_id']: entry['status'] for entry in entries}
+        self.assertEqual(len(statuses), 97)
+        self.assertEqual(statuses['missing'], 'not_found')
+        self.assertEqual(statuses['tree-95'], 'invalid')
+        self.assertEqual(sum(status == 'completed' for status in statuses.values()), 95)
+
+        self.assertEqual(self.trees.queries, 10)
+        self.assertEqual(self.results.inserts, 10)
+        self.assertLessEqual(self.trees.max_in_flight, 3)
+        self.assertEqual(max(self.model.batches), 10)
+        self.assertEqual(len(self.results.results), 95)
+
+    async def test_filter(self):
+        entries = await self.collect(species='Дуб', batch_size=100)
+        self.assertEqual(len(entries), 48)
+        completed = next(entry for entry in entries if entry['status'] == 'completed')['result']
+        self.assertAlmostEqual(completed['metrics']['health_score'], 0.5)
+
+    async def test_failed_batch_is_reported(self):
+        async def broken(results):
+            raise RuntimeError('database unavailable')
+        self.results.save_many = broken
+        entries = await self.collect(['tree-1', 'tree-2'])
+        self.assertEqual({entry['status'] for entry in entries}, {'failed'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import json
+import unittest
+from uuid import uuid4
+from green_platform.core.data_analysis.application.ingest import BulkIngestService, CSV, iter_csv_records, iter_lines
+
+class FakeBatchWriter:
+    def __init__(self):
+        self.calls = []
+
+    async def create_batches(self, batches):
+        self.calls.append(list(batches))
+        return len(batches)
+
+def record(**overrides):
+    data = {'id': str(uuid4()), 'species': 'Дуб', 'height': 12.5, 'diameter': 40.0,
+            'health_status': 'good', 'latitude': 55.75, 'longitude': 37.62,
+            'last_inspection_date': '2024-05-01T10:00:00'}
+    data.update(overrides)
+    return data
+
+async def stream(body: bytes, chunk_size: int = 7):
+    for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+class TestBulkIngest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.writer = FakeBatchWriter()
+        self.service = BulkIngestService(self.writer, chunk_size=3, max_line_bytes=1024)
+
+    async def test_lines_split_across_chunks(self):
+        lines = await collect(iter_lines(stream(b'a\nbb\r\n\nccc'), max_line_bytes=16))
+        self.assertEqual(lines, [(1, b'a'), (2, b'bb'), (3, b''), (4, b'ccc')])
+
+    async def test_oversized_line_is_skipped(self):
+        body = b'x' * 100 + b'\nok\n'
+        lines = await collect(iter_lines(stream(body, 16), max_line_bytes=32))
+        self.assertEqual(lines, [(1, None), (2, b'ok')])
+
+    async def test_oversized_line_inside_chunk_is_skipped(self):
+        body = b'ok\n' + b'x' * 100 + b'\nok\n'
+        lines = await collect(iter_lines(stream(body, 256), max_line_bytes=32))
+        self.assertEqual(lines, [(1, b'ok'), (2, None), (3, b'ok')])
+
+    async def test_csv_quoted_newlines_continue_record(self):
+        body = b'a,"b\nc ""d""\ne",f\ng,h\n"open'
+        records = await collect(iter_csv_records(iter_lines(stream(body)), max_record_bytes=64))
+        self.assertEqual(records, [(1, b'a,"b\nc ""d""\ne",f'), (4, b'g,h'), (5, b'"open')])
+        records = await collect(iter_csv_records(iter_lines(stream(body)), max_record_bytes=8))
+        self.assertEqual(records, [(1, None), (4, b'g,h'), (5, b'"open')])
+
+    async def test_ndjson_chunks_and_errors(self):
+        rows = [record() for _ in range(7)]
+        rows[2]['height'] = 'high'
+        rows[5]['id'] = 'not-a-uuid'
+        body = b'\n'.join(json.dumps(row).encode() for row in rows) + b'\n{broken\n'
+
+        report = await collect(self.service.ingest(stream(body)))
+        errors = {entry['line']: entry['error'] for entry in report if 'error' in entry}
+        self.assertEqual(set(errors), {3, 6, 8})
+        self.assertEqual(report[-1], {'summary': True, 'lines': 8, 'accepted': 5, 'rejected': 3})
+        self.assertEqual([len(call) for call in self.writer.calls], [3, 2])
+
+        batch = self.writer.calls[0][0]
+        self.assertEqual(batch.data_type, 'tree_data')
+        self.assertEqual(batch.batch_data['location'], [37.62, 55.75])
+        self.assertEqual(batch.batch_data['diameter'], 40.0)
+        self.assertEqual(batch.batch_data['last_inspection_date'], '2024-05-01T10:00:00')
+
+    async def test_csv(self):
+        rows = [record(), record(latitude=95)]
+        header = list(rows[0])
+        body = ','.join(header) + '\n' + '\n'.join(
+            ','.join(str(row[name]) for name in header) for row in rows)
+        report = await collect(self.service.ingest(stream(body.encode()), CSV))
+        self.assertEqual(report[0]['line'], 3)
+        self.assertIn('latitude', report[0]['error'])
+        self.assertEqual(report[-1]['accepted'], 1)
+
+    async def test_csv_notes_with_newlines(self):
+        row = record(notes='дупло\nна высоте 2 м')
+        header = list(row)
+        body = ','.join(header) + '\n' + ','.join('"{}"'.format(str(row[name])) for name in header) + '\n"broken'
+        report = await collect(self.service.ingest(stream(body.encode()), CSV))
+        self.assertEqual(report[-1], {'summary': True, 'lines': 4, 'accepted': 1, 'rejected': 1})
+        self.assertEqual(report[0]['line'], 4)
+        self.assertIn('Invalid CSV', report[0]['error'])
+
+if __name__ == '__main__':
+    unittest.main()
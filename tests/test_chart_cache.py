@@ -0,0 +1,132 @@
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from fastapi import APIRouter
+from green_platform.tree_analysis.infrastructure.memory_repositories import InMemoryAnalysisResultRepository
+from green_platform.tree_analysis.domain.entities import AnalysisResult, TreeAnalysis, TreeCharacteristics
+from green_platform.visualization.api import VisualizationAPI
+from green_platform.visualization.cache import ChartCache, etag_matches
+from green_platform.visualization.services import VisualizationService
+
+def make_result(count=5):
+    trees = [
+        TreeAnalysis(
+            characteristics=TreeCharacteristics(
+                height=10.0 + i, trunk_diameter=30.0, crown_density=0.5, age=20 + i,
+                species='Дуб' if i % 2 else 'Липа', location_latitude=55.75 + i * 0.001,
+                location_longitude=37.62, health_condition='good', co2_absorption=20.0 + i,
+                biomass=500.0
+            ),
+            measurement_date=datetime(2024, 5, 1)
+        ) for i in range(count)
+    ]
+    return AnalysisResult(trees=trees, total_co2_absorption=110.0, average_health_score=0.8,
+                          biodiversity_index=0.7, analysis_date=datetime(2024, 5, 2))
+
+class TestChartCache(unittest.TestCase):
+    def setUp(self):
+        self.renders = 0
+
+    def render(self, size=10):
+        def build():
+            self.renders += 1
+            return {'data': [{'type': 'bar', 'y': list(range(size))}]}
+        return build
+
+    def test_identical_requests_render_once(self):
+        cache = ChartCache()
+        key = ChartCache.make_key('growth', 'a1', {'zoom': 3})
+        first = cache.get_or_render(key, self.render())
+        second = cache.get_or_render(ChartCache.make_key('growth', 'a1', {'zoom': 3}), self.render())
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(first.etag, second.etag)
+        self.assertEqual(json.loads(first.body)['data'][0]['type'], 'bar')
+
+    def test_params_are_part_of_key(self):
+        cache = ChartCache()
+        cache.get_or_render(ChartCache.make_key('map', 'a1', {'zoom': 3}), self.render())
+        cache.get_or_render(ChartCache.make_key('map', 'a1', {'zoom': 4}), self.render())
+        self.assertEqual(self.renders, 2)
+
+    def test_lru_bounded_by_bytes(self):
+        cache = ChartCache(max_bytes=2000)
+        for identity in range(20):
+            cache.get_or_render(ChartCache.make_key('growth', str(identity)), self.render(100))
+        self.assertLessEqual(cache.get_metrics()['size_bytes'], 2000)
+        self.assertGreater(cache.get_metrics()['evictions'], 0)
+        self.assertIsNone(cache.peek(ChartCache.make_key('growth', '0')))
+
+    def test_disk_tier_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            key = ChartCache.make_key('growth', 'a1')
+            original = ChartCache(disk_dir=directory).get_or_render(key, self.render())
+            restored = ChartCache(disk_dir=directory).peek(key)
+            self.assertEqual(restored.etag, original.etag)
+            self.assertEqual(restored.body, original.body)
+
+    def test_invalidate_identity(self):
+        cache = ChartCache()
+        cache.get_or_render(ChartCache.make_key('growth', 'a1'), self.render())
+        cache.get_or_render(ChartCache.make_key('biodiversity', 'a1'), self.render())
+        cache.get_or_render(ChartCache.make_key('growth', 'a2'), self.render())
+        self.assertEqual(cache.invalidate('a1'), 2)
+        self.assertIsNone(cache.peek(ChartCache.make_key('growth', 'a1')))
+        self.assertIsNotNone(cache.peek(ChartCache.make_key('growth', 'a2')))
+
+    def test_eviction_prunes_identity_index(self):
+        cache = ChartCache(max_bytes=2000)
+        for identity in range(20):
+            cache.get_or_render(ChartCache.make_key('growth', str(identity)), self.render(100))
+        self.assertEqual(sum(len(digests) for digests in cache._identities.values()), len(cache._entries))
+
+    def test_disk_invalidation_and_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # График крупнее памяти хранится только на диске и все равно инвалидируется
+            key = ChartCache.make_key('growth', 'big')
+            ChartCache(max_bytes=10, disk_dir=directory).get_or_render(key, self.render(100))
+            restarted = ChartCache(max_bytes=10, disk_dir=directory)
+            self.assertIsNotNone(restarted.peek(key))
+            self.assertEqual(restarted.invalidate('big'), 1)
+            self.assertIsNone(restarted.peek(key))
+            self.assertEqual(restarted.get_metrics()['disk_size_bytes'], 0)
+
+            cache = ChartCache(disk_dir=directory, max_disk_bytes=1500)
+            for identity in range(10):
+                cache.get_or_render(ChartCache.make_key('growth', str(identity)), self.render(100))
+            self.assertLessEqual(cache.get_metrics()['disk_size_bytes'], 1500)
+            self.assertGreater(cache.get_metrics()['disk_evictions'], 0)
+            self.assertLessEqual(ChartCache(disk_dir=directory).get_metrics()['disk_size_bytes'], 1500)
+
+    def test_etag_matching(self):
+        self.assertTrue(etag_matches('"abc"', '"abc"'))
+        self.assertTrue(etag_matches('W/"abc", "def"', '"abc"'))
+        self.assertTrue(etag_matches('*', '"abc"'))
+        self.assertFalse(etag_matches(None, '"abc"'))
+        self.assertFalse(etag_matches('"def"', '"abc"'))
+
+    def test_rendered_charts_are_cacheable(self):
+        cache = ChartCache()
+        result = make_result()
+        for chart_type in ('growth', 'co2_absorption', 'biodiversity', 'health_distribution'):
+            payload = cache.get_or_render(
+                ChartCache.make_key(chart_type, str(result.analysis_id)),
+                lambda: VisualizationService.render_chart(chart_type, result))
+            self.assertIn('data', json.loads(payload.body))
+        with self.assertRaises(ValueError):
+            VisualizationService.render_chart('unknown', result)
+
+class TestVisualizationRoutes(unittest.IsolatedAsyncioTestCase):
+    async def routes(self, api):
+        router = APIRouter()
+        await api.register_routes(router)
+        return sorted(route.path for route in router.routes)
+
+    async def test_routes_follow_configured_sources(self):
+        snapshots = object()
+        self.assertEqual(await self.routes(VisualizationAPI(snapshot_source=snapshots)), ['/dashboards/snapshot'])
+        self.assertEqual(await self.routes(VisualizationAPI(InMemoryAnalysisResultRepository())),
+                         ['/charts/{analysis_id}/{chart_type}', '/dashboards/{analysis_id}'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+from contextlib import asynccontextmanager
+from green_platform.core.data_analysis.infrastructure.database.batch_repository import BatchRepository
+from green_platform.core.data_analysis.infrastructure.load_balancer.consistent_hash import (SLOT_COUNT, HashRing,
+                                                                                            ShardCoordinator)
+
+def _ring(*node_ids):
+    ring = HashRing()
+    for node_id in node_ids:
+        ring.add_node(node_id)
+    return ring
+
+class TestHashRing(unittest.TestCase):
+    def test_every_slot_has_one_owner(self):
+        assignments = _ring('a', 'b', 'c').slot_assignments()
+        slots = sorted(slot for owned in assignments.values() for slot in owned)
+        self.assertEqual(slots, list(range(SLOT_COUNT)))
+        for owned in assignments.values():
+            self.assertGreater(len(owned), SLOT_COUNT / 3 * 0.7)
+
+    def test_assignment_is_deterministic(self):
+        first, second = _ring('a', 'b', 'c'), _ring('c', 'a', 'b')
+        self.assertEqual(first.slot_assignments(), second.slot_assignments())
+        self.assertEqual(first.get_node_id('tree-1'), second.get_node_id('tree-1'))
+
+    def test_join_moves_only_slots_to_new_node(self):
+        ring = _ring('a', 'b', 'c', 'd')
+        before = {slot: ring.slot_owner(slot) for slot in range(SLOT_COUNT)}
+        ring.add_node('e')
+        moved = [slot for slot in range(SLOT_COUNT) if ring.slot_owner(slot) != before[slot]]
+        self.assertEqual({ring.slot_owner(slot) for slot in moved}, {'e'})
+        self.assertLess(len(moved), SLOT_COUNT * 0.3)
+
+    def test_leave_moves_only_slots_of_removed_node(self):
+        ring = _ring('a', 'b', 'c')
+        before = {slot: ring.slot_owner(slot) for slot in range(SLOT_COUNT)}
+        ring.remove_node('b')
+        for slot in range(SLOT_COUNT):
+            if before[slot] != 'b':
+                self.assertEqual(ring.slot_owner(slot), before[slot])
+
+    def test_weight_and_empty_ring(self):
+        self.assertIsNone(HashRing().get_node('tree-1'))
+        ring = HashRing()
+        ring.add_node('small')
+        ring.add_node('large', weight=3)
+        assignments = ring.slot_assignments()
+        self.assertGreater(len(assignments['large']), 2 * len(assignments['small']))
+        with self.assertRaises(ValueError):
+            ring.add_node('broken', weight=0)
+
+class FakeMembership:
+    def __init__(self):
+        self.workers = {}
+        self.claims = []
+
+    async def register_worker(self, worker_id, weight):
+        self.workers[worker_id] = weight
+
+    async def get_live_workers(self, ttl):
+        return dict(self.workers)
+
+    async def remove_worker(self, worker_id):
+        self.workers.pop(worker_id, None)
+
+    async def claim_batches(self, slots, limit, stale_after):
+        self.claims.append((list(slots), limit, stale_after))
+        return []
+
+class TestShardCoordinator(unittest.IsolatedAsyncioTestCase):
+    async def test_nodes_split_slots_and_rebalance(self):
+        membership = FakeMembership()
+        first = ShardCoordinator(membership, 'node-1')
+        second = ShardCoordinator(membership, 'node-2')
+
+        changes = await first.refresh()
+        self.assertEqual(len(changes['gained']), SLOT_COUNT)
+        await second.refresh()
+        changes = await first.refresh()
+        self.assertEqual(set(changes['lost']), set(second.owned_slots))
+        self.assertFalse(set(first.owned_slots) & set(second.owned_slots))
+        self.assertEqual(len(first.owned_slots) + len(second.owned_slots), SLOT_COUNT)
+
+        await second.leave()
+        self.assertEqual(second.owned_slots, [])
+        changes = await first.refresh()
+        self.assertEqual(len(first.owned_slots), SLOT_COUNT)
+        self.assertEqual(changes['lost'], [])
+
+    async def test_claim_uses_owned_slots(self):
+        membership = FakeMembership()
+        coordinator = ShardCoordinator(membership, 'node-1', stale_after=60.0)
+        await coordinator.refresh()
+        await coordinator.claim(5)
+        slots, limit, stale_after = membership.claims[-1]
+        self.assertEqual(slots, coordinator.owned_slots)
+        self.assertEqual((limit, stale_after), (5, 60.0))
+
+class FakeConnection:
+    def __init__(self):
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append((query, args))
+        return [{'batch_id': 'b2', 'created_at': 2}, {'batch_id': 'b1', 'created_at': 1}]
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+class TestClaimBatches(unittest.IsolatedAsyncioTestCase):
+    async def test_claim_query_filters_by_slot_and_tree_order(self):
+        connection = FakeConnection()
+        repository = BatchRepository(FakePool(connection), None)
+        self.assertEqual(await repository.claim_batches([], 10), [])
+        self.assertEqual(connection.queries, [])
+
+        rows = await repository.claim_batches([1, 7], 10)
+        self.assertEqual([row['batch_id'] for row in rows], ['b1', 'b2'])
+        query, args = connection.queries[0]
+        self.assertIn('hashtext(c.tree_id::text) & 4095', query)
+        self.assertIn('DISTINCT ON (c.tree_id)', query)
+        self.assertIn('FOR UPDATE SKIP LOCKED', query)
+        self.assertEqual(args, ([1, 7], 10, 300.0))
+
+    async def test_stale_processing_batch_is_reclaimed_first(self):
+        connection = FakeConnection()
+        await BatchRepository(FakePool(connection), None).claim_batches([1], 10, stale_after=60.0)
+        query, _ = connection.queries[0]
+        first_batch = query[query.index('first_batch AS'):query.index('claimable AS')]
+        # Брошенный батч - кандидат наравне с ожидающими, поэтому он первый по created_at
+        # и захватывается раньше более поздних батчей того же дерева
+        self.assertIn("c.status = 'processing' AND c.updated_at <= NOW() - make_interval(secs => $3)", first_batch)
+        self.assertIn("ORDER BY c.tree_id, c.created_at", first_batch)
+        self.assertIn("b.status = 'processing' AND b.updated_at <= NOW()", query)
+        self.assertIn("retry_count = d.retry_count + CASE WHEN d.status = 'processing' THEN 1 ELSE 0 END", query)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from contextlib import asynccontextmanager
+from datetime import date
+from uuid import uuid4
+import pandas as pd
+from green_platform.data_processing.backfill import build_pipeline
+from green_platform.data_processing.pipeline import Pipeline, Stage
+from green_platform.data_processing.readers import read_csv, read_ndjson
+from green_platform.data_processing.sinks import DataBatchSink, TreeSink
+from green_platform.data_processing.transforms import Deduplicator, prepare
+
+class FakeBatchWriter:
+    def __init__(self):
+        self.batches = []
+
+    async def create_batches(self, batches):
+        self.batches.extend(batches)
+        return len(batches)
+
+def make_rows(count):
+    ids = [str(uuid4()) for _ in range(count)]
+    return [{'id': ids[i], 'species': ' Дуб ', 'height': 1200 + i, 'height_unit': 'cm',
+             'trunk_diameter': 300, 'diameter_unit': 'mm', 'health': 'GOOD',
+             'lat': 55.75, 'lon': 37.62, 'date': '2024-05-01'} for i in range(count)]
+
+async def chunks(frames):
+    for frame in frames:
+        yield frame
+
+class TestTransforms(unittest.TestCase):
+    def test_prepare_normalizes_units_and_schema(self):
+        chunk = prepare(pd.DataFrame(make_rows(3)))
+        self.assertAlmostEqual(chunk['height'].iloc[0], 12.0)
+        self.assertAlmostEqual(chunk['diameter'].iloc[0], 30.0)
+        self.assertEqual(chunk['species'].iloc[0], 'Дуб')
+        self.assertEqual(chunk['health_status'].iloc[0], 'good')
+
+    def test_invalid_rows_dropped(self):
+        rows = make_rows(4)
+        rows[0]['lat'] = 120
+        rows[1]['height_unit'] = 'yards'
+        rows[2]['id'] = 'tree-1'
+        self.assertEqual(len(prepare(pd.DataFrame(rows))), 1)
+
+    def test_deduplication_across_chunks(self):
+        frame = prepare(pd.DataFrame(make_rows(10)))
+        deduplicate = Deduplicator()
+        first = deduplicate(pd.concat([frame.iloc[:6], frame.iloc[:2]]))
+        second = deduplicate(frame.iloc[4:])
+        self.assertEqual(len(first) + len(second), 10)
+        self.assertEqual(deduplicate.duplicates, 4)
+
+class TestPipeline(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded_parallel_stage(self):
+        active = 0
+        peak = 0
+
+        async def slow(chunk):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return chunk
+
+        frames = [pd.DataFrame({'value': range(10)}) for _ in range(12)]
+        pipeline = Pipeline(chunks(frames), [
+            Stage('slow', slow, parallelism=3, queue_size=2),
+            Stage('filter', lambda chunk: chunk[chunk['value'] % 2 == 0])
+        ])
+        stats = await pipeline.run()
+        self.assertEqual(peak, 3)
+        self.assertEqual([stage['rows_in'] for stage in stats], [120, 120])
+        self.assertEqual(stats[1]['rows_out'], 60)
+
+    async def test_stage_error_stops_pipeline(self):
+        def broken(chunk):
+            raise RuntimeError('bad chunk')
+
+        pipeline = Pipeline(chunks([pd.DataFrame({'value': [1]})] * 5), [Stage('broken', broken)])
+        with self.assertRaises(RuntimeError):
+            await pipeline.run()
+
+    async def test_file_backfill(self):
+        rows = make_rows(25)
+        rows.append(dict(rows[0]))
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'inventory.csv')
+            pd.DataFrame(rows).to_csv(csv_path, index=False)
+            ndjson_path = os.path.join(directory, 'inventory.ndjson')
+            with open(ndjson_path, 'w') as handle:
+                handle.write('\n'.join(json.dumps(row) for row in rows))
+
+            self.assertEqual(sum([len(chunk) async for chunk in read_csv(csv_path, chunk_size=10)]), 26)
+            self.assertEqual(sum([len(chunk) async for chunk in read_ndjson(ndjson_path, chunk_size=10)]), 26)
+
+            writer = FakeBatchWriter()
+            stats = await build_pipeline(ndjson_path, DataBatchSink(writer), chunk_size=10).run()
+
+        self.assertEqual(len(writer.batches), 25)
+        self.assertEqual(stats[1]['rows_in'] - stats[1]['rows_out'], 1)
+        self.assertEqual(writer.batches[0].batch_data['location'], [37.62, 55.75])
+        self.assertAlmostEqual(writer.batches[0].batch_data['diameter'], 30.0)
+        self.assertIsNone(writer.batches[0].batch_data['notes'])
+        self.assertEqual(writer.batches[0].batch_data['last_inspection_date'], '2024-05-01T00:00:00+00:00')
+
+def _state(tree_id, species, height):
+    return {'tree_id': tree_id, 'species': species, 'health_status': 'good', 'cell_x': 3762, 'cell_y': 5575,
+            'day': date(2024, 5, 1), 'height': height, 'co2_absorption': 0.0, 'latitude': 55.75, 'longitude': 37.62}
+
+class FakeSinkConnection:
+    """Состояния деревьев до и после вставки порции; записывает обновления сводок"""
+
+    def __init__(self, before, after):
+        self.states = before
+        self.after = after
+        self.rollup_updates = []
+        self.tile_updates = []
+        self.insert_args = None
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetch(self, query, *args):
+        return [state for state in self.states if state['tree_id'] in args[0]]
+
+    async def execute(self, query, *args):
+        if 'INSERT INTO tree_versions' in query:
+            self.states = self.after
+            self.insert_args = args
+            return f'INSERT 0 {len(args[0])}'
+        if 'INSERT INTO tree_rollups ' in query:
+            self.rollup_updates.append(args)
+        if 'INSERT INTO tile_generations' in query:
+            self.tile_updates.append(args)
+        return 'SELECT 1'
+
+class FakeSinkPool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+class TestTreeSink(unittest.IsolatedAsyncioTestCase):
+    async def test_chunk_updates_rollups_in_one_pass(self):
+        first, second = str(uuid4()), str(uuid4())
+        connection = FakeSinkConnection(before=[_state(first, 'Дуб', 10.0)],
+                                        after=[_state(first, 'Дуб', 12.0), _state(second, 'Дуб', 8.0)])
+        chunk = pd.DataFrame({'tree_id': [first, first, second], 'longitude': [37.62] * 3, 'latitude': [55.75] * 3,
+                              'height': [11.0, 12.0, 8.0], 'species': ['Дуб'] * 3, 'health_status': ['good'] * 3,
+                              'measurement_date': pd.to_datetime(['2024-05-01'] * 3, utc=True),
+                              'diameter': [30.0, 31.0, 12.0], 'notes': ['дупло', None, float('nan')]})
+        sink = TreeSink(FakeSinkPool(connection))
+        await sink(chunk)
+        self.assertEqual(sink.rows_written, 3)
+        # Диаметр и заметки попадают в trees вместе с остальными полями измерения
+        self.assertEqual(connection.insert_args[7:], ([30.0, 31.0, 12.0], ['дупло', None, None]))
+        # Одно обновление сводки: +1 дерево, высота 10 -> 12 и новое дерево 8
+        self.assertEqual(len(connection.rollup_updates), 1)
+        self.assertEqual(connection.rollup_updates[0][5:7], ([1], [10.0]))
+        # Тайлы карты отмечаются той же транзакцией: одно положение на восьми точечных зумах
+        self.assertEqual(len(connection.tile_updates), 1)
+        self.assertEqual(len(connection.tile_updates[0][0]), 8)
+
+if __name__ == '__main__':
+    unittest.main()
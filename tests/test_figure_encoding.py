@@ -0,0 +1,53 @@
+import base64
+import json
+import unittest
+from datetime import datetime
+import numpy as np
+from green_platform.visualization.encoding import dumps, typed_array
+from green_platform.visualization.services import VisualizationService
+from test_chart_cache import make_result
+
+def decode(block):
+    values = np.frombuffer(base64.b64decode(block['bdata']), dtype=np.dtype(block['dtype']).newbyteorder('<'))
+    if 'shape' in block:
+        values = values.reshape([int(size) for size in block['shape'].split(',')])
+    return values
+
+class TestFigureEncoding(unittest.TestCase):
+    def test_float_roundtrip(self):
+        values = np.random.default_rng(1).normal(size=1000)
+        block = typed_array(values)
+        self.assertEqual(block['dtype'], 'f8')
+        np.testing.assert_array_equal(decode(block), values)
+
+    def test_int64_narrowed(self):
+        self.assertEqual(typed_array(np.arange(10, dtype=np.int64))['dtype'], 'i4')
+        self.assertEqual(typed_array(np.array([2 ** 40], dtype=np.int64))['dtype'], 'f8')
+
+    def test_matrix_shape(self):
+        values = np.arange(6, dtype=np.float32).reshape(2, 3)
+        block = typed_array(values)
+        self.assertEqual(block['shape'], '2,3')
+        np.testing.assert_array_equal(decode(block), values)
+
+    def test_non_numeric_arrays_stay_lists(self):
+        encoded = json.loads(dumps({'labels': np.array(['Дуб', 'Липа'], dtype=object),
+                                    'date': datetime(2024, 5, 1)}))
+        self.assertEqual(encoded['labels'], ['Дуб', 'Липа'])
+        self.assertTrue(encoded['date'].startswith('2024-05-01'))
+
+    def test_dashboard_matches_individual_charts(self):
+        result = make_result(20)
+        dashboard = VisualizationService.build_dashboard(result.trees)
+        self.assertEqual(set(dashboard), {'growth', 'co2_absorption', 'biodiversity',
+                                          'health_distribution', 'environmental_impact_map'})
+
+        separate = VisualizationService.create_co2_absorption_chart(result)
+        np.testing.assert_allclose(dashboard['co2_absorption']['data'][0]['y'], separate['data'][0]['y'])
+
+        encoded = json.loads(dumps(dashboard))
+        trace = encoded['growth']['data'][0]
+        np.testing.assert_allclose(decode(trace['y']), dashboard['growth']['data'][0]['y'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from green_platform.visualization.aggregation import (
+    aggregate_points,
+    bbox_mask,
+    fit_zoom,
+    from_world_pixels,
+    to_world_pixels
+)
+
+class TestMapAggregation(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.latitude = 55.75 + rng.uniform(-0.1, 0.1, 100000)
+        self.longitude = 37.62 + rng.uniform(-0.1, 0.1, 100000)
+        self.co2 = rng.uniform(5, 50, 100000)
+
+    def test_projection_roundtrip(self):
+        x, y = to_world_pixels(self.latitude[:10], self.longitude[:10], 12)
+        lat, lon = from_world_pixels(x, y, 12)
+        np.testing.assert_allclose(lat, self.latitude[:10])
+        np.testing.assert_allclose(lon, self.longitude[:10])
+
+    def test_aggregates_preserve_totals(self):
+        for shape in ('hex', 'square'):
+            cells = aggregate_points(self.latitude, self.longitude, self.co2, zoom=11, shape=shape)
+            self.assertEqual(cells['count'].sum(), len(self.co2))
+            self.assertAlmostEqual(cells['sum'].sum(), self.co2.sum(), places=4)
+            np.testing.assert_allclose(cells['mean'], cells['sum'] / cells['count'])
+
+    def test_cell_count_bounded_by_viewport(self):
+        bbox = (55.70, 37.55, 55.80, 37.70)
+        x0, y0 = to_world_pixels(np.array([bbox[2]]), np.array([bbox[1]]), 10)
+        x1, y1 = to_world_pixels(np.array([bbox[0]]), np.array([bbox[3]]), 10)
+        viewport_cells = (abs(x1 - x0)[0] / 40 + 2) * (abs(y1 - y0)[0] / 40 + 2)
+        cells = aggregate_points(self.latitude, self.longitude, self.co2, zoom=10,
+                                 cell_px=40, shape='square', bbox=bbox)
+        self.assertLessEqual(len(cells['count']), viewport_cells)
+
+    def test_fit_zoom_keeps_points_in_viewport(self):
+        zoom = fit_zoom(self.latitude, self.longitude, viewport_px=1024)
+        for bounds in (zoom, zoom + 1):
+            x, y = to_world_pixels(self.latitude, self.longitude, bounds)
+            fits = max(np.ptp(x), np.ptp(y)) <= 1024
+            self.assertEqual(fits, bounds == zoom)
+        self.assertEqual(fit_zoom(self.latitude, self.longitude, bbox=(55.70, 37.55, 55.80, 37.70)), 12)
+
+    def test_impact_map_without_bbox_is_aggregated(self):
+        from green_platform.tree_analysis.domain.columnar import TreeColumns
+        from green_platform.visualization.services import VisualizationService
+        n = len(self.co2)
+        columns = TreeColumns(ids=np.arange(n), latitude=self.latitude, longitude=self.longitude,
+                              height=np.zeros(n), trunk_diameter=np.zeros(n), crown_density=np.zeros(n),
+                              age=np.zeros(n), co2_absorption=self.co2, biomass=np.zeros(n),
+                              species=np.full(n, 'oak'), health_condition=np.zeros(n),
+                              measurement_date=np.zeros(n))
+        for zoom in (None, 17):
+            figure = VisualizationService._impact_map_figure(columns, zoom, None, 'square', 40.0, 15)
+            self.assertLess(len(figure['data'][0]['lat']), 1000)
+        bbox = (55.75, 37.62, 55.752, 37.622)
+        figure = VisualizationService._impact_map_figure(columns, 17, bbox, 'square', 40.0, 15)
+        self.assertEqual(len(figure['data'][0]['lat']), bbox_mask(self.latitude, self.longitude, bbox).sum())
+
+    def test_unknown_shape(self):
+        with self.assertRaises(ValueError):
+            aggregate_points(self.latitude, self.longitude, self.co2, zoom=10, shape='circle')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from dataclasses import replace
+from datetime import datetime, timedelta
+from green_platform.core.data_analysis.domain.entities import AnalysisResult as TreeDataResult, TreeData
+from green_platform.core.data_analysis.infrastructure import memory_repositories as core_memory
+from green_platform.core.data_analysis.infrastructure.memory_repositories import InMemoryTreeDataRepository, SnapshotFile
+from green_platform.tree_analysis.domain.entities import AnalysisResult, TreeAnalysis, TreeCharacteristics
+from green_platform.tree_analysis.infrastructure.memory_repositories import (InMemoryAnalysisResultRepository,
+                                                                             InMemoryTreeAnalysisRepository)
+
+START = datetime(2024, 5, 1, 9, 0)
+
+def make_tree(tree_id, species='Липа', health_status='good', height=10.0):
+    return TreeData(id=tree_id, species=species, height=height, diameter=30.0, health_status=health_status,
+                    location_coordinates=(55.75, 37.62), last_inspection_date=START)
+
+def make_result(day, hour=9):
+    return AnalysisResult(trees=[], total_co2_absorption=1.0, average_health_score=0.8, biodiversity_index=0.5,
+                          analysis_date=START.replace(day=day, hour=hour))
+
+class TestInMemoryTreeDataRepository(unittest.IsolatedAsyncioTestCase):
+    async def test_versions_and_indexes(self):
+        repository = InMemoryTreeDataRepository()
+        await repository.save_many([make_tree('a'), make_tree('b', species='Клен'), make_tree('c')])
+        await repository.save(make_tree('a', health_status='poor', height=11.0))
+
+        self.assertEqual((await repository.get_by_id('a')).height, 11.0)
+        self.assertEqual([tree.height for tree in await repository.get_history('a')], [10.0, 11.0])
+        self.assertEqual((await repository.get_version('a', 1)).health_status, 'good')
+        self.assertIsNone(await repository.get_version('a', 3))
+        self.assertEqual(await repository.find_ids(species='Липа', health_status='good'), ['c'])
+        self.assertEqual(await repository.find_ids(health_status='poor'), ['a'])
+        self.assertEqual(await repository.find_ids(species='Дуб'), [])
+        self.assertEqual([tree.id for tree in await repository.get_by_ids(['c', 'x', 'a'])], ['c', 'a'])
+        self.assertEqual(len(await repository.get_all()), 3)
+
+    async def test_results_by_tree_and_date(self):
+        repository = core_memory.InMemoryAnalysisResultRepository()
+        results = [TreeDataResult(tree_id=tree_id, analysis_date=START + timedelta(hours=hours), metrics={},
+                                  recommendations=[], confidence_score=0.9)
+                   for tree_id, hours in (('a', 5), ('b', 1), ('a', 3))]
+        await repository.save_many(results)
+
+        self.assertEqual(await repository.get_by_tree_id('a'), [results[0], results[2]])
+        self.assertEqual(await repository.get_by_date_range(START, START + timedelta(hours=4)),
+                         [results[1], results[2]])
+
+    async def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'trees.pickle')
+            repository = InMemoryTreeDataRepository(SnapshotFile(path, flush_every=2))
+            await repository.save(make_tree('a'))
+            self.assertFalse(os.path.exists(path))
+            await repository.save(make_tree('a', species='Клен'))
+            self.assertTrue(os.path.exists(path))
+
+            restored = InMemoryTreeDataRepository(SnapshotFile(path))
+            self.assertEqual(len(await restored.get_history('a')), 2)
+            self.assertEqual(await restored.find_ids(species='Клен'), ['a'])
+            self.assertEqual(await restored.find_ids(species='Липа'), [])
+
+class TestInMemoryTreeAnalysisRepositories(unittest.IsolatedAsyncioTestCase):
+    async def test_tree_analysis_update_and_delete(self):
+        repository = InMemoryTreeAnalysisRepository()
+        characteristics = TreeCharacteristics(height=10.0, trunk_diameter=30.0, crown_density=0.6, age=20,
+                                              species='Липа', location_latitude=55.75, location_longitude=37.62,
+                                              health_condition='healthy', co2_absorption=20.0, biomass=300.0)
+        analysis = await repository.save(TreeAnalysis(characteristics=characteristics, measurement_date=START))
+        await repository.update(replace(analysis, notes='повторный осмотр'))
+
+        self.assertEqual((await repository.get_by_id(analysis.id)).notes, 'повторный осмотр')
+        self.assertEqual(len(await repository.get_history(analysis.id)), 2)
+        self.assertTrue(await repository.delete(analysis.id))
+        self.assertFalse(await repository.delete(analysis.id))
+        self.assertIsNone(await repository.get_by_id(analysis.id))
+        with self.assertRaises(ValueError):
+            await repository.update(analysis)
+
+    async def test_results_by_date_range(self):
+        repository = InMemoryAnalysisResultRepository()
+        results = [make_result(day) for day in (5, 2, 9, 3)]
+        for result in results:
+            await repository.save_result(result)
+
+        found = await repository.get_results_by_date_range('2024-05-02', '2024-05-05')
+        self.assertEqual([result.analysis_date.day for result in found], [2, 3, 5])
+        found = await repository.get_results_by_date_range('2024-05-02T10:00', '2024-05-05T09:00')
+        self.assertEqual([result.analysis_date.day for result in found], [3, 5])
+
+        # Смена даты при обновлении переносит запись в индексе
+        await repository.update_result(replace(results[2], analysis_date=START.replace(day=4)))
+        found = await repository.get_results_by_date_range('2024-05-04', '2024-05-04')
+        self.assertEqual([result.analysis_id for result in found], [results[2].analysis_id])
+        self.assertEqual(await repository.get_results_by_date_range('2024-05-09', '2024-05-31'), [])
+        with self.assertRaises(ValueError):
+            await repository.update_result(make_result(1))
+
+    async def test_results_snapshot(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.pickle')
+            repository = InMemoryAnalysisResultRepository(SnapshotFile(path))
+            result = await repository.save_result(make_result(7))
+            repository.flush()
+
+            restored = InMemoryAnalysisResultRepository(SnapshotFile(path))
+            self.assertEqual((await restored.get_result_by_id(result.analysis_id)).analysis_date, result.analysis_date)
+            self.assertEqual(len(await restored.get_results_by_date_range('2024-05-07', '2024-05-07')), 1)
+
+if __name__ == '__main__':
+    unittest.main()
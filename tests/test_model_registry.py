@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from green_platform.core.data_analysis.infrastructure.ml.model_registry import ModelRegistry
+from green_platform.core.data_analysis.infrastructure.services import MLTreeAnalysisService
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        self.registry = ModelRegistry(loader=self._load, max_idle_versions=0)
+        self.registry.register('v1', 'models/v1.joblib')
+        self.registry.register('v2', 'models/v2.joblib')
+
+    def _load(self, path):
+        self.loads.append(path)
+        return {'path': path}
+
+    def test_lazy_single_load(self):
+        self.assertEqual(self.loads, [])
+        self.registry.get()
+        self.registry.get('v1')
+        with self.registry.lease() as model:
+            self.assertEqual(model['path'], 'models/v1.joblib')
+        self.assertEqual(self.loads, ['models/v1.joblib'])
+
+    def test_hot_swap_keeps_in_flight_version(self):
+        with self.registry.lease() as old_model:
+            self.registry.activate('v2')
+            self.assertEqual(self.registry.active_version, 'v2')
+            # Старая версия удерживается активным запросом
+            self.assertIn('v1', self.registry.get_metrics()['versions'])
+            self.assertEqual(old_model['path'], 'models/v1.joblib')
+        metrics = self.registry.get_metrics()
+        self.assertNotIn('v1', metrics['versions'])
+        self.assertEqual(metrics['evicted_versions'], 1)
+
+    def test_metrics(self):
+        with self.registry.lease('v2'):
+            metrics = self.registry.get_metrics()
+            self.assertEqual(metrics['versions']['v2']['active_leases'], 1)
+            self.assertGreaterEqual(metrics['versions']['v2']['load_time'], 0)
+        metrics = self.registry.get_metrics()
+        self.assertEqual(metrics['registered_versions'], 2)
+        # Неактивная версия выгружается после завершения запроса
+        self.assertNotIn('v2', metrics['versions'])
+
+    def test_services_with_different_paths_keep_their_models(self):
+        primary = MLTreeAnalysisService('models/v1.joblib', model_registry=self.registry)
+        other = MLTreeAnalysisService('models/other.joblib', model_registry=self.registry)
+        self.assertEqual(primary.model_version, 'v1')
+        self.assertEqual(other.model_version, 'models/other.joblib')
+        # Подмена активной версии касается только сервиса активной модели
+        self.registry.activate('v2')
+        self.assertEqual(primary.model_version, 'v2')
+        self.assertEqual(other.model_version, 'models/other.joblib')
+
+    def test_unknown_version(self):
+        with self.assertRaises(KeyError):
+            self.registry.get('v3')
+
+    def test_memory_mapped_loading(self):
+        try:
+            import numpy as np
+            from green_platform.core.data_analysis.infrastructure.ml.model_registry import (
+                save_for_memory_mapping
+            )
+        except ImportError:
+            self.skipTest('numpy/joblib are not installed')
+        with tempfile.TemporaryDirectory() as directory:
+            path = save_for_memory_mapping({'weights': np.arange(1000.0)},
+                                           os.path.join(directory, 'model.joblib'))
+            registry = ModelRegistry()
+            registry.register('mmap', path)
+            model = registry.get()
+            self.assertIsInstance(model['weights'], np.memmap)
+            self.assertGreater(registry.get_metrics()['total_mapped_bytes'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
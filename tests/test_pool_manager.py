@@ -0,0 +1,138 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from green_platform.core.data_analysis.infrastructure.database.pool_manager import (ANALYTICS, INGEST, MAINTENANCE,
+                                                                                    READ, PoolManager)
+from green_platform.core.data_analysis.infrastructure.database.postgres_config import PostgresConfig
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.warmed = []
+        self.transactions = []
+
+    @asynccontextmanager
+    async def transaction(self, **options):
+        self.transactions.append(options)
+        yield
+
+    async def fetch(self, query, *args):
+        self.warmed.append((query, args))
+        return []
+
+    async def fetchval(self, query, timeout=None):
+        if self.pool.broken:
+            raise OSError('connection reset')
+        return 1
+
+class FakePool:
+    """Пул фиксированного размера: acquire ждет освобождения соединения"""
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.broken = False
+        self.expired = 0
+        self.closed = False
+        self.connections = [FakeConnection(self) for _ in range(kwargs['max_size'])]
+        self._idle = asyncio.Queue()
+        for connection in self.connections:
+            self._idle.put_nowait(connection)
+
+    async def acquire(self, timeout=None):
+        return await asyncio.wait_for(self._idle.get(), timeout)
+
+    async def release(self, connection):
+        self._idle.put_nowait(connection)
+
+    def get_size(self):
+        return len(self.connections)
+
+    def get_idle_size(self):
+        return self._idle.qsize()
+
+    def get_max_size(self):
+        return self.kwargs['max_size']
+
+    async def expire_connections(self):
+        self.expired += 1
+        if self.broken == 'expire':
+            raise RuntimeError('pool is closing')
+
+    async def close(self):
+        self.closed = True
+
+async def fake_create_pool(**kwargs):
+    return FakePool(**kwargs)
+
+def _config(**overrides):
+    settings = dict(READ_POOL_SIZE=2, INGEST_POOL_SIZE=1, ANALYTICS_POOL_SIZE=1, MAINTENANCE_POOL_SIZE=0,
+                    POOL_ACQUIRE_TIMEOUT=0.05, POOL_HEALTH_CHECK_INTERVAL=0)
+    settings.update(overrides)
+    return PostgresConfig(**settings)
+
+class TestPoolManager(unittest.IsolatedAsyncioTestCase):
+    async def test_pools_per_workload_with_own_timeouts(self):
+        manager = PoolManager(_config(), create_pool=fake_create_pool)
+        await manager.start({READ: ['SELECT 1 WHERE $2::int > $1::int'], INGEST: ['SELECT 2']})
+        self.assertEqual(set(manager.pools), {READ, INGEST, ANALYTICS})
+        read = manager.pool(READ)
+        self.assertEqual(read.get_max_size(), 2)
+        self.assertEqual(read._pool.kwargs['server_settings'],
+                         {'application_name': 'green_platform:read', 'statement_timeout': '2000'})
+        self.assertEqual(manager.pool(ANALYTICS)._pool.kwargs['server_settings']['statement_timeout'], '120000')
+        # Запросы выполняются через fetch (попадают в кэш запросов соединения) с NULL-параметрами
+        for connection in read._pool.connections:
+            self.assertEqual(connection.warmed, [('SELECT 1 WHERE $2::int > $1::int', (None, None))])
+            self.assertEqual(connection.transactions, [{'readonly': True}])
+        with self.assertRaises(ValueError):
+            manager.pool(MAINTENANCE)
+        await manager.close()
+        self.assertTrue(read._pool.closed)
+        self.assertEqual(manager.pools, {})
+
+    async def test_analytics_load_does_not_block_reads(self):
+        manager = PoolManager(_config(), create_pool=fake_create_pool)
+        await manager.start()
+        analytics = manager.pool(ANALYTICS)
+        async with analytics.acquire():
+            with self.assertRaises(asyncio.TimeoutError):
+                await analytics.acquire()
+            async with manager.pool(READ).acquire() as connection:
+                self.assertEqual(await connection.fetchval('SELECT 1'), 1)
+            metrics = manager.get_metrics()
+            self.assertEqual(metrics[ANALYTICS]['utilisation'], 1.0)
+            self.assertEqual(metrics[ANALYTICS]['timeouts'], 1)
+        metrics = manager.get_metrics()
+        self.assertEqual(metrics[READ]['acquires'], 1)
+        self.assertEqual(metrics[READ]['in_use'], 0)
+        self.assertEqual(metrics[ANALYTICS]['statement_timeout'], 120000)
+        self.assertGreaterEqual(metrics[ANALYTICS]['wait_max_seconds'], 0.0)
+
+    async def test_health_check_recycles_broken_pool(self):
+        manager = PoolManager(_config(), create_pool=fake_create_pool)
+        await manager.start()
+        manager.pool(INGEST)._pool.broken = True
+        results = await manager.check_health()
+        self.assertEqual(results, {INGEST: False, READ: True, ANALYTICS: True})
+        self.assertEqual(manager.pool(INGEST)._pool.expired, 1)
+        self.assertEqual(manager.get_metrics()[INGEST]['recycles'], 1)
+        self.assertEqual(manager.get_metrics()[INGEST]['acquires'], 0)
+
+    async def test_health_loop_survives_failed_recycle(self):
+        manager = PoolManager(_config(POOL_HEALTH_CHECK_INTERVAL=0.01), create_pool=fake_create_pool)
+        await manager.start()
+        pool = manager.pool(INGEST)._pool
+        pool.broken = 'expire'
+        await asyncio.sleep(0.05)
+        self.assertGreaterEqual(pool.expired, 2)
+        self.assertFalse(manager._health_task.done())
+        await manager.close()
+
+    def test_connection_budget_is_validated(self):
+        with self.assertRaises(ValueError):
+            PoolManager(_config(MAX_CONNECTIONS=3), create_pool=fake_create_pool)
+        with self.assertRaises(ValueError):
+            PoolManager(_config(), workloads=('reports',), create_pool=fake_create_pool)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import date
+from green_platform.core.data_analysis.infrastructure.database.rollups import (rollup_deltas, total_deltas,
+                                                                               track_rollups)
+
+DAY = date(2024, 5, 1)
+
+def state(species='Липа', health_status='good', cell=(3762, 5575), day=DAY, height=10.0, co2=20.0):
+    return {'species': species, 'health_status': health_status, 'cell_x': cell[0], 'cell_y': cell[1],
+            'day': day, 'height': height, 'co2_absorption': co2,
+            'latitude': (cell[1] + 0.5) / 100, 'longitude': (cell[0] + 0.5) / 100}
+
+class FakeConnection:
+    """Состояние дерева меняется при выполнении блока внутри track_rollups"""
+
+    def __init__(self, states):
+        self.states = list(states)
+        self.executed = []
+
+    async def fetchrow(self, query, tree_id):
+        return self.states.pop(0)
+
+    async def execute(self, query, *args):
+        self.executed.append((query, args))
+
+class TestRollupDeltas(unittest.TestCase):
+    def test_new_tree(self):
+        self.assertEqual(rollup_deltas(None, state()),
+                         {('Липа', 'good', 3762, 5575, DAY): (1, 10.0, 20.0)})
+
+    def test_version_moves_tree_between_keys(self):
+        deltas = rollup_deltas(state(), state(health_status='poor', height=11.0, day=date(2024, 5, 2)))
+        self.assertEqual(deltas, {
+            ('Липа', 'good', 3762, 5575, DAY): (-1, -10.0, -20.0),
+            ('Липа', 'poor', 3762, 5575, date(2024, 5, 2)): (1, 11.0, 20.0)
+        })
+        self.assertEqual(total_deltas(deltas), {('Липа', 'good'): (-1, -10.0, -20.0),
+                                                ('Липа', 'poor'): (1, 11.0, 20.0)})
+
+    def test_same_key_keeps_count(self):
+        # Новый результат анализа меняет только поглощение CO2
+        deltas = rollup_deltas(state(co2=20.0), state(co2=25.0))
+        self.assertEqual(deltas, {('Липа', 'good', 3762, 5575, DAY): (0, 0.0, 5.0)})
+        self.assertEqual(rollup_deltas(state(), state()), {})
+
+    def test_cell_change_cancels_in_totals(self):
+        deltas = rollup_deltas(state(), state(cell=(3763, 5575)))
+        self.assertEqual(len(deltas), 2)
+        self.assertEqual(total_deltas(deltas), {})
+
+class TestTrackRollups(unittest.IsolatedAsyncioTestCase):
+    async def test_applies_deltas_in_transaction(self):
+        connection = FakeConnection([state(), state(species='Клен')])
+        async with track_rollups(connection, 'tree-1'):
+            pass
+
+        lock, rollups, totals, tiles, aggregate_tiles = connection.executed
+        self.assertIn('pg_advisory_xact_lock', lock[0])
+        self.assertEqual(lock[1], ('tree-1',))
+        # Ключи отсортированы: ('Клен', ...) раньше ('Липа', ...)
+        self.assertEqual(rollups[1][0], ['Клен', 'Липа'])
+        self.assertEqual(rollups[1][5], [1, -1])
+        self.assertEqual(totals[1][:3], (['Клен', 'Липа'], ['good', 'good'], [1, -1]))
+        # Дерево не переместилось: тайлы одного положения на каждом точечном зуме
+        self.assertIn('tile_generations', tiles[0])
+        self.assertEqual(len(tiles[1][0]), 8)
+        self.assertIn('tile_aggregate_changes', aggregate_tiles[0])
+
+    async def test_no_changes_skip_upserts(self):
+        connection = FakeConnection([None, None])
+        async with track_rollups(connection, 'missing'):
+            pass
+        self.assertEqual(len(connection.executed), 1)
+
+    async def test_failed_write_applies_nothing(self):
+        connection = FakeConnection([state(), state(species='Клен')])
+        with self.assertRaises(RuntimeError):
+            async with track_rollups(connection, 'tree-1'):
+                raise RuntimeError('insert failed')
+        self.assertEqual(len(connection.executed), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import unittest
+import numpy as np
+from green_platform.tree_analysis.domain.sketches import (
+    CountMinSketch,
+    HyperLogLog,
+    KllSketch,
+    SpaceSaving,
+    TreeStatsSketch
+)
+
+class TestSketches(unittest.TestCase):
+    def test_hyperloglog_estimate_within_error(self):
+        sketch = HyperLogLog(precision=12)
+        for i in range(20000):
+            sketch.add(f'species-{i}')
+        self.assertLess(abs(sketch.estimate() - 20000) / 20000, 4 * sketch.relative_error)
+
+    def test_hyperloglog_merge_is_union(self):
+        left, right = HyperLogLog(), HyperLogLog()
+        for i in range(100):
+            left.add(f'oak-{i}')
+            right.add(f'oak-{i + 50}')
+        self.assertAlmostEqual(left.merge(right).estimate(), 150, delta=10)
+
+    def test_count_min_overestimates_within_bound(self):
+        sketch = CountMinSketch(epsilon=0.01)
+        for i in range(1000):
+            sketch.add(f'species-{i % 37}')
+        estimate = sketch.estimate('species-3')
+        self.assertGreaterEqual(estimate, 27)
+        self.assertLessEqual(estimate, 27 + sketch.error_bound)
+
+    def test_space_saving_finds_heavy_hitters(self):
+        sketch = SpaceSaving(capacity=10)
+        for i in range(2000):
+            sketch.add('birch' if i % 3 == 0 else f'rare-{i}')
+        self.assertEqual(sketch.top(1)[0][0], 'birch')
+        self.assertFalse(sketch.exact)
+
+    def test_kll_quantiles_and_merge(self):
+        values = np.random.default_rng(1).normal(20, 5, 50000)
+        left, right = KllSketch(k=200, seed=1), KllSketch(k=200, seed=2)
+        left.update_many(values[:25000])
+        right.update_many(values[25000:])
+        left.merge(right)
+        self.assertEqual(left.n, 50000)
+        for q in (0.1, 0.5, 0.9):
+            estimate = left.quantile(q)
+            rank = np.mean(values <= estimate)
+            self.assertLess(abs(rank - q), left.rank_error)
+
+    def test_tree_stats_sketch_serialization_roundtrip(self):
+        sketch = TreeStatsSketch()
+        sketch.species_distinct.add('oak')
+        sketch.species_heavy_hitters.add('oak', 3)
+        sketch.tree_count = 3
+        restored = TreeStatsSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+        summary = restored.summary()
+        self.assertEqual(summary['tree_count']['value'], 3)
+        self.assertAlmostEqual(summary['distinct_species']['value'], 1.0, places=3)
+        self.assertEqual(summary['shannon_index']['error'], 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import os
+import tempfile
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from uuid import uuid4
+import numpy as np
+from green_platform.data_processing.snapshots import (PARQUET, RESULTS, TREES, SnapshotExporter, SnapshotManifest,
+                                                      SnapshotReader)
+from green_platform.tree_analysis.domain.services import BatchProcessor, StandardDataProcessing, TreeAnalysisService
+from green_platform.visualization.services import VisualizationService
+
+NOW = datetime(2024, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, count):
+        rows, self.rows = self.rows[:count], self.rows[count:]
+        return rows
+
+class FakeConnection:
+    """Строки возвращаются в том же виде и порядке, что и у запросов снимка"""
+
+    def __init__(self, database):
+        self.database = database
+
+    @asynccontextmanager
+    async def transaction(self, **options):
+        yield
+
+    async def fetchval(self, query):
+        return str(self.database.xmin)
+
+    async def cursor(self, query, lower, upper):
+        lower, upper = int(lower), int(upper)
+        if 'tree_versions' in query:
+            latest = {}
+            for xid, row in self.database.versions:
+                if lower <= xid < upper and row[1] > latest.get(row[0], (None, 0))[1]:
+                    latest[row[0]] = row
+            rows = [row + (row[6], row[2].date()) for row in latest.values()]
+        else:
+            rows = [row + (None, row[3].date()) for xid, row in self.database.results if lower <= xid < upper]
+        return FakeCursor(sorted(rows, key=lambda row: (row[-2] or '', row[-1])))
+
+class FakePool:
+    """Строки помечены id вставившей транзакции; xmin - граница завершенных транзакций"""
+
+    def __init__(self):
+        self.xid = 100
+        self.xmin = None
+        self.versions = []
+        self.results = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self.xmin is None:
+            self.xmin = self.xid + 1
+        yield FakeConnection(self)
+
+    def commit_all(self):
+        self.xmin = self.xid + 1
+
+    def add_version(self, tree_id, version, created_at, species='Дуб', height=10.0):
+        self.xid += 1
+        self.versions.append((self.xid, (tree_id, version, created_at, 55.75, 37.62, height, species, 'good')))
+
+    def add_result(self, tree_id, created_at, co2):
+        self.xid += 1
+        self.results.append((self.xid, (str(uuid4()), tree_id, 'completed', created_at, 0.9, 40.0, 0.7, co2,
+                                        500.0, 30, '{}')))
+
+class TestSnapshots(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.pool = FakePool()
+        self.oak, self.lime = str(uuid4()), str(uuid4())
+        self.pool.add_version(self.oak, 1, NOW - timedelta(days=2))
+        self.pool.add_version(self.lime, 1, NOW - timedelta(days=1), species='Липа / мелколистная')
+        self.pool.add_result(self.oak, NOW - timedelta(days=1), 20.0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_partitioned_incremental_export(self):
+        exporter = SnapshotExporter(self.pool, self.root, batch_size=1)
+        first = await exporter.export()
+        self.assertEqual(first['rows'], {TREES: 2, RESULTS: 1})
+        self.assertTrue(any('species=%D0%9B' in path for path in first['files'][TREES]))
+
+        self.pool.add_version(self.oak, 2, NOW, height=11.0)
+        self.pool.add_result(self.oak, NOW, 25.0)
+        self.pool.commit_all()
+        second = await exporter.export()
+        self.assertEqual(second['rows'], {TREES: 1, RESULTS: 1})
+        self.assertEqual(SnapshotManifest.load(self.root).watermark, second['watermark'])
+
+        reader = SnapshotReader(self.root)
+        trees = reader.latest_trees().to_pydict()
+        self.assertEqual(dict(zip(trees['tree_id'], trees['height'])), {self.oak: 11.0, self.lime: 10.0})
+        self.assertEqual(len(reader.read(TREES, species=['Дуб'])), 2)
+
+        columns = reader.tree_columns()
+        by_id = dict(zip(columns.ids.tolist(), columns.co2_absorption.tolist()))
+        self.assertEqual(by_id, {self.oak: 25.0, self.lime: 0.0})
+        self.assertTrue(np.isnan(columns.trunk_diameter[list(columns.ids).index(self.lime)]))
+        summary = TreeAnalysisService(BatchProcessor(StandardDataProcessing())).create_columnar_summary(columns)
+        self.assertEqual(summary['total_co2_absorption']['value'], 25.0)
+        self.assertEqual(set(VisualizationService.build_dashboard(columns)), {
+            'growth', 'co2_absorption', 'biodiversity', 'health_distribution', 'environmental_impact_map'})
+
+    async def test_measurement_rollup_follows_exports(self):
+        exporter = SnapshotExporter(self.pool, self.root)
+        first = await exporter.export()
+        self.pool.add_version(self.oak, 2, NOW, height=11.0)
+        self.pool.add_result(self.oak, NOW, 25.0)
+        self.pool.commit_all()
+        second = await exporter.export()
+        # Каждая выгрузка дополняет агрегаты прежней; прежний файл удаляется
+        self.assertFalse(os.path.exists(os.path.join(self.root, first['rollup'])))
+        self.assertTrue(os.path.exists(os.path.join(self.root, second['rollup'])))
+
+        rollup = SnapshotReader(self.root).measurement_rollup()
+        tree = rollup.query('tree', self.oak, resolution='day')
+        self.assertEqual(tree['height_mean'][tree['height_count'] > 0].tolist(), [10.0, 11.0])
+        self.assertEqual(tree['co2_absorption_mean'][tree['co2_absorption_count'] > 0].tolist(), [20.0, 25.0])
+        # Результаты анализа попадают в ряд вида дерева
+        species = rollup.query('species', 'Дуб', resolution='year')
+        self.assertEqual((species['count'][0], species['height_count'][0], species['trunk_diameter_mean'][0]),
+                         (4, 2, 40.0))
+
+        # Снимок без файла агрегатов читается с построением агрегатов по файлам описи
+        manifest = SnapshotManifest.load(self.root)
+        for export in manifest.exports:
+            export.pop('rollup')
+        manifest.save(self.root)
+        rebuilt = SnapshotReader(self.root).measurement_rollup().query('species', 'Дуб', resolution='year')
+        np.testing.assert_array_equal(rebuilt['count'], species['count'])
+
+    async def test_species_change_between_exports(self):
+        exporter = SnapshotExporter(self.pool, self.root)
+        await exporter.export()
+        self.pool.add_version(self.oak, 2, NOW, species='Сосна')
+        self.pool.commit_all()
+        await exporter.export()
+
+        reader = SnapshotReader(self.root)
+        # Прежняя строка дерева в разделе дуба не считается его текущим состоянием
+        self.assertEqual(len(reader.latest_trees(species=['Дуб'])), 0)
+        self.assertEqual(reader.latest_trees(species=['Сосна']).column('tree_id').to_pylist(), [self.oak])
+        self.assertEqual(reader.tree_columns(species=['Дуб', 'Липа / мелколистная']).ids.tolist(), [self.lime])
+
+    async def test_late_commits_and_backfill_are_not_missed(self):
+        exporter = SnapshotExporter(self.pool, self.root)
+        await exporter.export()
+        # Транзакция еще не завершена: xmin снимка не выше ее id
+        self.pool.add_result(self.lime, NOW + timedelta(hours=1), 30.0)
+        in_flight = self.pool.xid
+        self.pool.add_version(self.oak, 2, NOW - timedelta(days=30), height=9.0)
+        self.pool.xmin = in_flight
+        self.assertEqual((await exporter.export())['rows'], {TREES: 0, RESULTS: 0})
+
+        # Задним числом вставленная версия и поздно зафиксированный результат попадают в следующую выгрузку
+        self.pool.commit_all()
+        self.assertEqual((await exporter.export())['rows'], {TREES: 1, RESULTS: 1})
+        self.assertEqual(SnapshotManifest.load(self.root).watermark, str(self.pool.xmin))
+
+    def test_time_watermark_is_exported_again(self):
+        self.assertEqual(SnapshotManifest(watermark='2024-06-01T12:00:00+00:00').watermark_xid, '0')
+        self.assertEqual(SnapshotManifest(watermark='1234').watermark_xid, '1234')
+
+    async def test_memory_mapped_columns_are_zero_copy(self):
+        await SnapshotExporter(self.pool, self.root).export()
+        columns = SnapshotReader(self.root).tree_columns(species=['Дуб'])
+        self.assertEqual(len(columns), 1)
+        self.assertFalse(columns.latitude.flags.owndata)
+        self.assertFalse(columns.latitude.flags.writeable)
+
+    async def test_parquet_and_failed_export(self):
+        await SnapshotExporter(self.pool, self.root, fmt=PARQUET).export()
+        self.assertEqual(len(SnapshotReader(self.root).tree_columns()), 2)
+
+        class BrokenPool(FakePool):
+            @asynccontextmanager
+            async def acquire(self):
+                raise ConnectionError('database is unavailable')
+                yield
+
+        before = sorted(os.walk(self.root))
+        with self.assertRaises(ConnectionError):
+            await SnapshotExporter(BrokenPool(), self.root, fmt=PARQUET).export()
+        self.assertEqual(sorted(os.walk(self.root)), before)
+
+if __name__ == '__main__':
+    unittest.main()
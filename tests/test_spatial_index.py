@@ -0,0 +1,115 @@
+import math
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime
+import numpy as np
+from green_platform.tree_analysis.domain.entities import TreeAnalysis, TreeCharacteristics
+from green_platform.tree_analysis.domain.columnar import TreeColumns
+from green_platform.core.data_analysis.infrastructure.database.tree_repository import TreeRepository
+from green_platform.tree_analysis.domain.spatial import GridSpatialIndex, haversine_m
+
+class TestGridSpatialIndex(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.latitude = 55.75 + rng.uniform(-0.05, 0.05, 5000)
+        self.longitude = 37.62 + rng.uniform(-0.08, 0.08, 5000)
+        self.index = GridSpatialIndex(self.latitude, self.longitude, cell_size_m=150)
+
+    def _brute_force(self, lat, lon):
+        return haversine_m(lat, lon, self.latitude, self.longitude)
+
+    def test_within_radius_matches_brute_force(self):
+        distances = self._brute_force(55.75, 37.62)
+        expected = np.flatnonzero(distances <= 400)
+        result = self.index.within_radius(55.75, 37.62, 400)
+        self.assertEqual(set(result.tolist()), set(expected.tolist()))
+        self.assertTrue(np.all(np.diff(distances[result]) >= 0))
+
+    def test_nearest_matches_brute_force(self):
+        indices, distances = self.index.nearest(55.76, 37.60, 10)
+        expected = np.argsort(self._brute_force(55.76, 37.60))[:10]
+        self.assertEqual(indices.tolist(), expected.tolist())
+        self.assertEqual(len(distances), 10)
+
+    def test_batch_queries_match_single_queries(self):
+        lats, lons = self.latitude[:50], self.longitude[:50]
+        batch_indices, _ = self.index.nearest_batch(lats, lons, 5)
+        within = self.index.within_radius_batch(lats, lons, 300)
+        for row, (lat, lon) in enumerate(zip(lats, lons)):
+            self.assertEqual(batch_indices[row].tolist(), self.index.nearest(lat, lon, 5)[0].tolist())
+            self.assertEqual(set(within[row].tolist()),
+                             set(self.index.within_radius(lat, lon, 300).tolist()))
+
+    def test_far_query_point(self):
+        indices, _ = self.index.nearest_batch(np.array([0.0]), np.array([0.0]), 3)
+        expected = np.argsort(self._brute_force(0.0, 0.0))[:3]
+        self.assertEqual(indices[0].tolist(), expected.tolist())
+
+    def test_in_bbox(self):
+        result = self.index.in_bbox(55.74, 37.60, 55.76, 37.64)
+        mask = ((self.latitude >= 55.74) & (self.latitude <= 55.76)
+                & (self.longitude >= 37.60) & (self.longitude <= 37.64))
+        self.assertEqual(result.tolist(), np.flatnonzero(mask).tolist())
+
+    def test_neighbour_counts(self):
+        counts = self.index.neighbour_counts(200)
+        expected = int((self._brute_force(self.latitude[0], self.longitude[0]) <= 200).sum()) - 1
+        self.assertEqual(counts[0], expected)
+
+    def test_from_columns(self):
+        tree = TreeAnalysis(
+            characteristics=TreeCharacteristics(
+                height=12.0, trunk_diameter=30.0, crown_density=0.7, age=25, species='oak',
+                location_latitude=55.75, location_longitude=37.62, health_condition='healthy',
+                co2_absorption=20.0, biomass=500.0
+            ),
+            measurement_date=datetime(2024, 5, 1)
+        )
+        columns = TreeColumns.from_trees([tree])
+        index = GridSpatialIndex.from_columns(columns)
+        self.assertEqual(columns.take(index.within_radius(55.75, 37.62, 10)).species.tolist(), ['oak'])
+
+class NearestConnection:
+    """Выполняет запрос кандидатов на Python: порядок <-> в градусах, ранжирование в метрах"""
+
+    def __init__(self, trees):
+        self.trees = trees
+        self.limits = []
+
+    async def fetch(self, query, latitudes, longitudes, limit, k):
+        self.limits.append(limit)
+        rows = []
+        for query_index, (lat, lon) in enumerate(zip(latitudes, longitudes), start=1):
+            candidates = sorted(self.trees, key=lambda tree: math.hypot(tree[1] - lon, tree[0] - lat))[:limit]
+            bound = max(math.hypot(tree[1] - lon, tree[0] - lat) for tree in candidates)
+            ranked = sorted((float(haversine_m(lat, lon, tree[0], tree[1])), tree_id)
+                            for tree_id, tree in ((self.trees.index(tree), tree) for tree in candidates))
+            rows.extend({'query_index': query_index, 'tree_id': tree_id, 'distance_m': distance,
+                         'degree_distance': 0.0, 'candidate_bound': bound, 'candidate_count': len(candidates)}
+                        for distance, tree_id in ranked[:k])
+        return rows
+
+class NearestPool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+class TestNearestTreesBatch(unittest.IsolatedAsyncioTestCase):
+    async def test_high_latitude_neighbours_are_exact(self):
+        # На 70° с.ш. градус долготы втрое короче градуса широты: ближайшие в метрах
+        # деревья лежат к востоку, а по <-> первыми идут деревья к северу
+        trees = [(70.0 + 0.001 * i, 37.0) for i in range(1, 9)] + [(70.0, 37.0 + 0.0015 * i) for i in range(1, 4)]
+        connection = NearestConnection(trees)
+        repository = TreeRepository(NearestPool(connection), None)
+        [nearest] = await repository.find_nearest_trees_batch([(70.0, 37.0)], k=3, oversample=1)
+        distances = sorted(float(haversine_m(70.0, 37.0, lat, lon)) for lat, lon in trees)[:3]
+        self.assertEqual([round(row['distance_m'], 3) for row in nearest], [round(d, 3) for d in distances])
+        self.assertEqual(sorted(row['tree_id'] for row in nearest), [0, 8, 9])
+        self.assertGreater(len(connection.limits), 1)
+        self.assertNotIn('candidate_bound', nearest[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime
+from green_platform.core.data_analysis.domain.entities import AnalysisResult, TreeData
+from green_platform.core.data_analysis.infrastructure.repositories import (SQLAnalysisResultRepository,
+                                                                           SQLTreeDataRepository)
+
+TREE_ROW = {'tree_id': 't1', 'latitude': 55.75, 'longitude': 37.62, 'height': 12.0, 'diameter': 30.0,
+            'species': 'oak', 'health_status': 'healthy', 'last_inspection_date': datetime(2024, 5, 1),
+            'notes': None, 'version_number': 2}
+
+class FakeConnection:
+    """Отвечает на запросы репозитория и записывает выполненные команды"""
+
+    def __init__(self):
+        self.queries = []
+
+    async def fetch(self, query, *args):
+        self.queries.append(query)
+        if 'DISTINCT ON (t.tree_id)' in query and 'version_number' in query and 'diameter' in query:
+            return [TREE_ROW] if 't1' in args[0] else []
+        if 'SELECT t.tree_id::text' in query:
+            return [('t1',)]
+        if 'FROM analysis_results a' in query and 'WHERE a.tree_id = $1' in query:
+            return [{'analysis_id': 'a1', 'tree_id': 't1', 'status': 'completed', 'created_at': datetime(2024, 5, 2),
+                     'details': {'health_score': 0.8, 'recommendations': ['ok'], 'confidence_score': 0.8}}]
+        return []
+
+    async def execute(self, query, *args):
+        self.queries.append(query)
+        self.last_args = args
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+class FakeTransactionManager:
+    def __init__(self, connection):
+        self.connection = connection
+        self.transactions = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.transactions += 1
+        yield self.connection
+
+class TestSQLRepositories(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.transactions = FakeTransactionManager(self.connection)
+
+    async def test_trees_are_read_in_one_query(self):
+        repository = SQLTreeDataRepository(FakePool(self.connection), self.transactions)
+        trees = await repository.get_by_ids(['t1', 't2'])
+        self.assertEqual(len(self.connection.queries), 1)
+        self.assertEqual([tree.id for tree in trees], ['t1'])
+        self.assertEqual(trees[0].location_coordinates, (55.75, 37.62))
+        self.assertEqual(trees[0].diameter, 30.0)
+        self.assertIsNone(await repository.get_by_id('t2'))
+        self.assertEqual(await repository.find_ids(species='oak'), ['t1'])
+
+    async def test_results_are_inserted_in_one_transaction(self):
+        repository = SQLAnalysisResultRepository(FakePool(self.connection), self.transactions)
+        results = [AnalysisResult(tree_id=f't{i}', analysis_date=datetime(2024, 5, 2),
+                                  metrics={'health_score': 0.5}, recommendations=['care'], confidence_score=0.5)
+                   for i in range(3)]
+        await repository.save_many(results)
+        inserts = [query for query in self.connection.queries if 'INSERT INTO analysis_results' in query]
+        self.assertEqual((len(inserts), self.transactions.transactions), (1, 1))
+        self.assertTrue(any('pg_advisory_xact_lock' in query for query in self.connection.queries))
+
+        history = await repository.get_by_tree_id('t1')
+        self.assertEqual(history[0].metrics, {'health_score': 0.8})
+        self.assertEqual(history[0].recommendations, ['ok'])
+        self.assertEqual(history[0].confidence_score, 0.8)
+
+    async def test_new_tree_version_is_written_with_diameter(self):
+        repository = SQLTreeDataRepository(FakePool(self.connection), self.transactions)
+        self.connection.fetchval = self._fetchval
+        self.connection.fetchrow = self._fetchrow
+        await repository.save(TreeData(id='t1', species='oak', height=12.0, diameter=30.0, health_status='healthy',
+                                       location_coordinates=(55.75, 37.62), last_inspection_date=datetime(2024, 5, 1)))
+        insert = next(query for query in self.connection.queries if 'INSERT INTO trees' in query)
+        self.assertIn('diameter', insert)
+        self.assertEqual(self.connection.last_args[2], (37.62, 55.75))
+
+    async def _fetchval(self, query, *args):
+        return 'v1'
+
+    async def _fetchrow(self, query, *args):
+        return None
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,11 @@
+import unittest
+from benchmarks.startup import SCENARIOS, measure
+
+class TestLazyImports(unittest.TestCase):
+    def test_scenarios_do_not_import_heavy_modules(self):
+        for name in SCENARIOS:
+            with self.subTest(scenario=name):
+                self.assertEqual(measure(name)['heavy_modules'], [])
+
+if __name__ == '__main__':
+    unittest.main()
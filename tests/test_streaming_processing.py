@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+from green_platform.tree_analysis.domain.services import (
+    AdvancedDataProcessing,
+    StreamingDataProcessing,
+    iter_chunks
+)
+
+class TestStreamingDataProcessing(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.data = rng.normal(loc=[10.0, 40.0, 0.5, 20.0], scale=[3.0, 10.0, 0.1, 5.0], size=(1003, 4))
+
+    def test_incremental_statistics_match_full_pass(self):
+        processor = StreamingDataProcessing(chunk_size=97)
+        processor.fit(iter_chunks(self.data, 97))
+        np.testing.assert_allclose(processor.mean, self.data.mean(axis=0))
+        np.testing.assert_allclose(processor.std, self.data.std(axis=0))
+
+    def test_matches_advanced_processing(self):
+        expected = AdvancedDataProcessing().process_data(self.data)
+        result = StreamingDataProcessing(chunk_size=128).process_data(self.data)
+        np.testing.assert_allclose(result, expected)
+
+    def test_float32_preallocated_output(self):
+        processor = StreamingDataProcessing(chunk_size=100, dtype=np.float32)
+        processor.fit(iter_chunks(self.data, 100))
+        out = np.empty((self.data.shape[0], 12), dtype=np.float32)
+        result = processor.transform_into(self.data, out)
+        self.assertIs(result, out)
+        expected = AdvancedDataProcessing().process_data(self.data)
+        np.testing.assert_allclose(out, expected, rtol=1e-4, atol=1e-4)
+
+    def test_generator_output(self):
+        processor = StreamingDataProcessing().fit(iter_chunks(self.data, 250))
+        chunks = list(processor.transform_chunks(iter_chunks(self.data, 250)))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(sum(chunk.shape[0] for chunk in chunks), self.data.shape[0])
+
+    def test_transform_requires_fit(self):
+        with self.assertRaises(ValueError):
+            StreamingDataProcessing().transform(self.data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import asyncio
+import tempfile
+import unittest
+from green_platform.core.data_analysis.infrastructure.database.rollups import track_rollups
+from green_platform.core.data_analysis.infrastructure.database.tile_repository import record_tile_changes
+from green_platform.visualization.tiles import (
+    AGGREGATE_MAX_ZOOM,
+    MAX_ZOOM,
+    DiskTileCache,
+    TileService,
+    tile_bounds,
+    tile_for_point
+)
+
+class FakeTileDatabase:
+    """Таблицы поколений и накопленных изменений тайлов; отвечает на запросы record_tile_changes"""
+
+    def __init__(self):
+        self.generations = {}
+        self.aggregate_changes = set()
+
+    async def execute(self, query, *args):
+        if 'tile_aggregate_changes' in query:
+            self.aggregate_changes.update(zip(*args))
+        else:
+            for key in zip(*args):
+                self.generations[key] = self.generations.get(key, 0) + 1
+
+    def flush(self):
+        changed, self.aggregate_changes = self.aggregate_changes, set()
+        keys = {(z, x >> (AGGREGATE_MAX_ZOOM - z), y >> (AGGREGATE_MAX_ZOOM - z))
+                for x, y in changed for z in range(AGGREGATE_MAX_ZOOM + 1)}
+        for key in keys:
+            self.generations[key] = self.generations.get(key, 0) + 1
+        return len(keys)
+
+class FakeRenderer:
+    def __init__(self, database=None):
+        self.database = database or FakeTileDatabase()
+        self.rendered = []
+
+    async def render_point_tile(self, z, x, y):
+        self.rendered.append(('points', z, x, y))
+        return f'points-{z}-{x}-{y}-{len(self.rendered)}'.encode()
+
+    async def render_aggregate_tile(self, z, x, y):
+        self.rendered.append(('clusters', z, x, y))
+        return f'clusters-{z}-{x}-{y}-{len(self.rendered)}'.encode()
+
+    async def get_generation(self, z, x, y):
+        return self.database.generations.get((z, x, y), 0)
+
+    async def flush_aggregate_changes(self):
+        return self.database.flush()
+
+class FakeWriteConnection(FakeTileDatabase):
+    """Транзакция записи дерева: track_rollups читает состояние до и после блока"""
+
+    def __init__(self, database, states):
+        self.database = database
+        self.states = list(states)
+
+    async def fetchrow(self, query, tree_id):
+        return self.states.pop(0)
+
+    async def execute(self, query, *args):
+        if 'tile_' in query:
+            await self.database.execute(query, *args)
+
+def tree_state(latitude, longitude):
+    return {'species': 'oak', 'health_status': 'good', 'cell_x': 0, 'cell_y': 0, 'day': None,
+            'height': 10.0, 'co2_absorption': 0.0, 'latitude': latitude, 'longitude': longitude}
+
+class TestTileMath(unittest.TestCase):
+    def test_point_lies_in_its_tile(self):
+        x, y = tile_for_point(55.75, 37.62, 14)
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(14, x, y)
+        self.assertTrue(min_lat <= 55.75 <= max_lat)
+        self.assertTrue(min_lon <= 37.62 <= max_lon)
+
+    def test_world_tile(self):
+        self.assertEqual(tile_for_point(0.0, 0.0, 0), (0, 0))
+
+class TestTileService(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = FakeTileDatabase()
+        self.renderer = FakeRenderer(self.database)
+        self.service = TileService(self.renderer, DiskTileCache(self.directory.name))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_tiles_are_cached_on_disk(self):
+        first = await self.service.get_tile(15, 100, 200)
+        second = await self.service.get_tile(15, 100, 200)
+        self.assertEqual(first, second)
+        self.assertEqual(self.renderer.rendered, [('points', 15, 100, 200)])
+
+    async def test_precompute_low_zoom(self):
+        count = await self.service.precompute(55.7, 37.5, 55.8, 37.7, max_zoom=3)
+        self.assertEqual(count, 4)
+        self.assertTrue(all(kind == 'clusters' for kind, *_ in self.renderer.rendered))
+
+    async def test_invalidation_affects_only_containing_tiles(self):
+        x, y = tile_for_point(55.75, 37.62, 16)
+        await self.service.get_tile(16, x, y)
+        await self.service.get_tile(16, x + 5, y)
+        await record_tile_changes(self.database, [(55.75, 37.62)])
+        await self.service.get_tile(16, x, y)
+        await self.service.get_tile(16, x + 5, y)
+        self.assertEqual(len(self.renderer.rendered), 3)
+
+    async def test_stale_low_zoom_tile_served_while_refreshing(self):
+        x, y = tile_for_point(55.75, 37.62, 5)
+        original = await self.service.get_tile(5, x, y)
+        await record_tile_changes(self.database, [(55.75, 37.62)])
+        await self.service.flush_invalidations()
+        self.assertEqual(await self.service.get_tile(5, x, y), original)
+        for future in list(self.service._rendering.values()):
+            await future
+        self.assertNotEqual(await self.service.get_tile(5, x, y), original)
+
+    async def test_tree_move_invalidates_old_and_new_tiles(self):
+        # Запись дерева любым путем проходит через track_rollups в своей транзакции
+        connection = FakeWriteConnection(self.database, [tree_state(55.70, 37.50), tree_state(55.75, 37.62)])
+        async with track_rollups(connection, 'tree-1'):
+            pass
+        for latitude, longitude in ((55.75, 37.62), (55.70, 37.50)):
+            key = (16, *tile_for_point(latitude, longitude, 16))
+            self.assertEqual(await self.renderer.get_generation(*key), 1)
+
+    async def test_unchanged_tree_marks_no_tiles(self):
+        connection = FakeWriteConnection(self.database, [tree_state(55.75, 37.62), tree_state(55.75, 37.62)])
+        async with track_rollups(connection, 'tree-1'):
+            pass
+        self.assertEqual(self.database.generations, {})
+
+    async def test_low_zoom_invalidation_is_coalesced_and_shared(self):
+        # Изменения пишут разные процессы; сброс из любого воркера виден всем
+        other_worker = TileService(FakeRenderer(self.database), DiskTileCache(self.directory.name))
+        points = [(55.75, longitude) for longitude in (37.60, 37.61, 37.62)]
+        for point in points:
+            await record_tile_changes(self.database, [point])
+        low = (5, *tile_for_point(55.75, 37.62, 5))
+        self.assertEqual(await self.renderer.get_generation(*low), 0)
+        self.assertEqual(await self.renderer.get_generation(MAX_ZOOM, *tile_for_point(55.75, 37.62, MAX_ZOOM)), 1)
+
+        # Три дерева рядом: на каждом низком зуме один-два общих тайла вместо трех
+        expected = {(z, *tile_for_point(latitude, longitude, z))
+                    for z in range(AGGREGATE_MAX_ZOOM + 1) for latitude, longitude in points}
+        self.assertEqual(await other_worker.flush_invalidations(), len(expected))
+        self.assertLess(len(expected), 3 * (AGGREGATE_MAX_ZOOM + 1))
+        self.assertEqual(await self.renderer.get_generation(*low), 1)
+        self.assertEqual(await self.service.flush_invalidations(), 0)
+
+    async def test_flush_loop_survives_errors(self):
+        calls = []
+
+        async def failing_flush():
+            calls.append(1)
+            raise OSError('connection lost')
+
+        self.renderer.flush_aggregate_changes = failing_flush
+        self.service.aggregate_invalidation_interval = 0.01
+        self.service.start()
+        await asyncio.sleep(0.05)
+        self.assertFalse(self.service._flush_task.done())
+        await self.service.close()
+        self.assertGreater(len(calls), 1)
+
+    def test_stale_render_is_not_stored(self):
+        cache = DiskTileCache(self.directory.name)
+        self.assertTrue(cache.put(1, 0, 0, 2, b'new'))
+        self.assertFalse(cache.put(1, 0, 0, 1, b'old'))
+        self.assertEqual(cache.get_latest(1, 0, 0), (2, b'new'))
+
+    async def test_out_of_range(self):
+        with self.assertRaises(ValueError):
+            await self.service.get_tile(2, 4, 0)
+
+if __name__ == '__main__':
+    unittest.main()
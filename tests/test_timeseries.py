@@ -0,0 +1,136 @@
+import json
+import unittest
+from datetime import datetime, timedelta
+from uuid import UUID
+import numpy as np
+from green_platform.tree_analysis.domain.entities import TreeAnalysis, TreeCharacteristics
+from green_platform.tree_analysis.domain.services import BatchProcessor, StandardDataProcessing, TreeAnalysisService
+from green_platform.tree_analysis.domain.timeseries import MeasurementRollup, choose_resolution, lttb
+from green_platform.visualization.services import VisualizationService
+
+START = datetime(2020, 1, 1)
+
+def measurement(tree_id, days, height, species='Липа'):
+    return TreeAnalysis(
+        characteristics=TreeCharacteristics(height=height, trunk_diameter=height * 2, crown_density=0.5, age=10,
+                                            species=species, location_latitude=55.75, location_longitude=37.62,
+                                            health_condition='healthy', co2_absorption=height / 10, biomass=100.0),
+        measurement_date=START + timedelta(days=days),
+        id=UUID(int=tree_id))
+
+def growing_tree(tree_id, years, per_year=12, rate=0.5, start_height=5.0):
+    """Измерения раз в месяц с приростом rate метров в год"""
+    step = 365 / per_year
+    return [measurement(tree_id, int(i * step), start_height + rate * i / per_year) for i in range(years * per_year)]
+
+class TestLttb(unittest.TestCase):
+    def test_keeps_endpoints_and_peaks(self):
+        x = np.arange(1000, dtype=np.float64)
+        y = np.zeros(1000)
+        y[400], y[700] = 10.0, -10.0
+        indices = lttb(x, y, 50)
+
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertIn(400, indices)
+        self.assertIn(700, indices)
+
+    def test_short_series_is_unchanged(self):
+        np.testing.assert_array_equal(lttb(np.arange(5), np.arange(5), 10), np.arange(5))
+
+class TestMeasurementRollup(unittest.TestCase):
+    def test_bucket_aggregates(self):
+        trees = [measurement(1, 0, 5.0), measurement(1, 10, 7.0), measurement(1, 40, 6.0),
+                 measurement(2, 5, 9.0, species='Клен')]
+        rollup = MeasurementRollup().add_many(trees)
+
+        months = rollup.query('tree', str(trees[0].id), resolution='month')
+        self.assertEqual(months['count'].tolist(), [2, 1])
+        self.assertEqual(months['height_min'].tolist(), [5.0, 6.0])
+        self.assertEqual(months['height_max'].tolist(), [7.0, 6.0])
+        self.assertEqual(months['height_mean'].tolist(), [6.0, 6.0])
+        self.assertEqual(months['time'].astype(str).tolist(), ['2020-01-01', '2020-02-01'])
+
+        species = rollup.query('species', 'Липа', resolution='year')
+        self.assertEqual(species['count'].tolist(), [3])
+        self.assertAlmostEqual(species['co2_absorption_mean'][0], 0.6)
+        self.assertEqual(len(rollup.query('species', 'Дуб')['time']), 0)
+
+    def test_missing_values_do_not_poison_buckets(self):
+        trees = [measurement(1, 0, 5.0, species='Дуб'), measurement(2, 1, 6.0, species='Дуб'),
+                 measurement(3, 2, 7.0, species='Дуб')]
+        trees[1].characteristics.trunk_diameter = float('nan')
+        rollup = MeasurementRollup().add_many(trees)
+        rollup.add_measurements([str(UUID(int=4))], [None], [START], {'trunk_diameter': [30.0]})
+
+        series = rollup.query('species', 'Дуб', resolution='month')
+        self.assertEqual((series['count'][0], series['trunk_diameter_count'][0]), (3, 2))
+        self.assertEqual((series['trunk_diameter_min'][0], series['trunk_diameter_max'][0]), (10.0, 14.0))
+        self.assertEqual(series['trunk_diameter_mean'][0], 12.0)
+        self.assertEqual(series['height_mean'][0], 6.0)
+
+        # Измерение без вида учитывается только в ряду дерева, без высоты - не меняет высоту
+        tree = rollup.query('tree', str(UUID(int=4)), resolution='month')
+        self.assertEqual((tree['height_count'][0], tree['trunk_diameter_mean'][0]), (0, 30.0))
+        self.assertTrue(np.isnan(tree['height_mean'][0]))
+
+    def test_resolution_follows_query_range(self):
+        self.assertEqual(choose_resolution('2020-01-01', '2020-06-30', 500), 'day')
+        self.assertEqual(choose_resolution('2010-01-01', '2020-12-31', 500), 'month')
+        self.assertEqual(choose_resolution('1900-01-01', '2020-12-31', 500), 'year')
+
+        rollup = MeasurementRollup().add_many(growing_tree(1, years=10, per_year=52))
+        series = rollup.query('species', 'Липа', max_points=300)
+        self.assertEqual(series['resolution'], 'month')
+        self.assertEqual(len(series['time']), 120)
+        self.assertEqual(int(series['count'].sum()), 520)
+        # Явное дневное разрешение прореживается до max_points
+        self.assertEqual(len(rollup.query('species', 'Липа', resolution='day', max_points=100)['time']), 100)
+
+    def test_merge_and_serialization(self):
+        first, second = growing_tree(1, years=2), growing_tree(2, years=3)
+        merged = MeasurementRollup().add_many(first).merge(MeasurementRollup().add_many(second))
+        combined = MeasurementRollup().add_many(first + second)
+        restored = MeasurementRollup.from_dict(json.loads(json.dumps(merged.to_dict())))
+
+        for rollup in (merged, restored):
+            for resolution in ('day', 'month', 'year'):
+                expected = combined.query('species', 'Липа', resolution=resolution)
+                actual = rollup.query('species', 'Липа', resolution=resolution)
+                np.testing.assert_array_equal(actual['time'], expected['time'])
+                np.testing.assert_allclose(actual['height_mean'], expected['height_mean'])
+                np.testing.assert_array_equal(actual['count'], expected['count'])
+
+    def test_growth_rate(self):
+        service = TreeAnalysisService(BatchProcessor(StandardDataProcessing()))
+        history = growing_tree(1, years=5, rate=0.4)
+        rollup = service.build_measurement_rollup(history)
+        self.assertAlmostEqual(service.estimate_growth_rate(history[-1], rollup), 0.4, places=2)
+
+        # Дерево с одним измерением оценивается по виду
+        newcomer = measurement(3, 0, 4.0)
+        rollup.add_many([newcomer])
+        self.assertAlmostEqual(service.estimate_growth_rate(newcomer, rollup), 0.4, delta=0.05)
+
+    def test_growth_prediction_and_chart_use_rollup(self):
+        service = TreeAnalysisService(BatchProcessor(StandardDataProcessing()))
+        history = growing_tree(1, years=5, rate=0.4)
+        rollup = service.build_measurement_rollup(history)
+        self.assertAlmostEqual(service.predict_growth(history[-1], rollup), 0.4, places=2)
+
+        figure = VisualizationService.create_growth_chart(history[-1:], rollup=rollup)
+        self.assertEqual([trace['name'] for trace in figure['data']], ['Липа'])
+        self.assertEqual(len(figure['data'][0]['y']), len(rollup.query('species', 'Липа')['time']))
+        # Без истории по видам выборки - прежний график высоты от возраста
+        figure = VisualizationService.create_growth_chart([measurement(2, 0, 3.0, species='Клен')], rollup=rollup)
+        self.assertEqual(figure['data'][0]['mode'], 'markers')
+
+    def test_growth_history_chart(self):
+        rollup = MeasurementRollup().add_many(growing_tree(1, years=20))
+        figure = VisualizationService.create_growth_history_chart(rollup.query('species', 'Липа', max_points=300))
+        self.assertEqual(len(figure['data']), 3)
+        self.assertLessEqual(len(figure['data'][2]['y']), 300)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import asyncio
+import re
+import unittest
+from contextlib import asynccontextmanager
+from green_platform.core.data_analysis.infrastructure.database.postgres_config import PostgresConfig
+from green_platform.core.data_analysis.infrastructure.database.transaction_manager import TransactionState
+from green_platform.core.data_analysis.infrastructure.database.two_phase_commit import (GID_PREFIX,
+                                                                                        TwoPhaseCommitCoordinator)
+
+class FakeParticipant:
+    """Сервер-участник: открытая транзакция сессии, подготовленные и зафиксированные записи"""
+
+    def __init__(self, max_prepared=10, fail_on=None):
+        self.max_prepared = max_prepared
+        self.fail_on = fail_on
+        self.prepared = {}
+        self.committed = []
+        self.peak_prepared = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeParticipantConnection(self)
+
+class FakeParticipantConnection:
+    def __init__(self, server):
+        self.server = server
+        self.pending = None
+
+    def is_in_transaction(self):
+        return self.pending is not None
+
+    async def fetchval(self, query, *args):
+        return str(self.server.max_prepared)
+
+    async def fetch(self, query, *args):
+        return [{'gid': gid} for gid in self.server.prepared if gid.startswith(GID_PREFIX)]
+
+    async def execute(self, query, *args):
+        server = self.server
+        gid = re.search(r"'(.*)'", query).group(1) if "'" in query else None
+        if query == 'BEGIN':
+            self.pending = []
+        elif query == 'ROLLBACK':
+            self.pending = None
+        elif query.startswith('PREPARE TRANSACTION'):
+            if len(server.prepared) >= server.max_prepared:
+                raise RuntimeError('maximum number of prepared transactions reached')
+            server.prepared[gid], self.pending = self.pending, None
+            server.peak_prepared = max(server.peak_prepared, len(server.prepared))
+        elif query.startswith('COMMIT PREPARED'):
+            server.committed.extend(server.prepared.pop(gid))
+        elif query.startswith('ROLLBACK PREPARED'):
+            del server.prepared[gid]
+        else:
+            if server.fail_on and server.fail_on in query:
+                raise RuntimeError('constraint violation')
+            self.pending.append(query)
+
+class FakeLogPool:
+    """Журнал решений: transaction_id -> [исход, завершено]"""
+
+    def __init__(self):
+        self.decisions = {}
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def execute(self, query, *args):
+        if 'ON CONFLICT' in query:
+            for transaction_id in args[0]:
+                self.decisions.setdefault(transaction_id, [args[1], False])
+        elif 'INSERT INTO two_phase_decisions' in query:
+            if args[0] in self.decisions:
+                raise RuntimeError('duplicate key value violates unique constraint')
+            self.decisions[args[0]] = [args[2], False]
+        elif 'SET completed_at' in query:
+            for transaction_id in args[0]:
+                self.decisions[transaction_id][1] = True
+
+    async def fetch(self, query, *args):
+        return [{'transaction_id': tid, 'outcome': self.decisions[tid][0]}
+                for tid in args[0] if tid in self.decisions]
+
+def _write(statement, delay=0.0):
+    async def work(connection):
+        if delay:
+            await asyncio.sleep(delay)
+        await connection.execute(statement)
+    return work
+
+class TestTwoPhaseCommitCoordinator(unittest.IsolatedAsyncioTestCase):
+    async def test_commit_on_all_participants(self):
+        log, first, second = FakeLogPool(), FakeParticipant(), FakeParticipant()
+        coordinator = TwoPhaseCommitCoordinator(log, {'main': first, 'archive': second})
+        result = await coordinator.execute({'main': _write('INSERT main'), 'archive': _write('INSERT archive')},
+                                           transaction_id='t1')
+        self.assertTrue(result.committed)
+        self.assertEqual((first.committed, second.committed), (['INSERT main'], ['INSERT archive']))
+        self.assertEqual((first.prepared, second.prepared), ({}, {}))
+        self.assertEqual(log.decisions, {'t1': ['commit', True]})
+        self.assertEqual(result.to_dict()['state'], 'committed')
+
+    async def test_failed_participant_rolls_back_everyone(self):
+        log, first, second = FakeLogPool(), FakeParticipant(), FakeParticipant(fail_on='INSERT')
+        coordinator = TwoPhaseCommitCoordinator(log, {'main': first, 'archive': second})
+        result = await coordinator.execute({'main': _write('INSERT main'), 'archive': _write('INSERT archive')})
+        self.assertIs(result.state, TransactionState.ROLLED_BACK)
+        self.assertIn('archive', result.errors)
+        self.assertEqual((first.committed, first.prepared, second.prepared), ([], {}, {}))
+        self.assertEqual(log.decisions, {})
+
+    async def test_prepare_runs_in_parallel(self):
+        participants = {f'p{i}': FakeParticipant() for i in range(4)}
+        coordinator = TwoPhaseCommitCoordinator(FakeLogPool(), participants)
+        result = await coordinator.execute({name: _write('UPDATE', delay=0.1) for name in participants})
+        self.assertTrue(result.committed)
+        self.assertLess(result.prepare_seconds, 0.3)
+
+    async def test_prepared_transactions_limited_by_server_setting(self):
+        participant = FakeParticipant(max_prepared=2)
+        coordinator = TwoPhaseCommitCoordinator(FakeLogPool(), {'main': participant}, max_prepared=50)
+        await coordinator.start()
+        results = await asyncio.gather(*(coordinator.execute({'main': _write(f'INSERT {i}', delay=0.01)})
+                                         for i in range(6)))
+        self.assertTrue(all(result.committed for result in results))
+        self.assertLessEqual(participant.peak_prepared, 2)
+        self.assertEqual(len(participant.committed), 6)
+
+    async def test_recovery_resolves_in_doubt_by_decision_log(self):
+        log, participant = FakeLogPool(), FakeParticipant()
+        participant.prepared = {f'{GID_PREFIX}:decided:main': ['INSERT decided'],
+                                f'{GID_PREFIX}:orphan:main': ['INSERT orphan'],
+                                'external:main': ['INSERT external']}
+        log.decisions['decided'] = ['commit', False]
+        summary = await TwoPhaseCommitCoordinator(log, {'main': participant}).start()
+        self.assertEqual(summary, {'committed': 1, 'rolled_back': 1, 'failed': 0})
+        self.assertEqual(participant.committed, ['INSERT decided'])
+        self.assertEqual(list(participant.prepared), ['external:main'])
+        self.assertEqual(log.decisions, {'decided': ['commit', True], 'orphan': ['abort', True]})
+
+    async def test_recovery_during_phase_one_aborts_the_transaction(self):
+        log, fast, slow = FakeLogPool(), FakeParticipant(), FakeParticipant()
+        coordinator = TwoPhaseCommitCoordinator(log, {'fast': fast, 'slow': slow})
+        running = asyncio.ensure_future(coordinator.execute(
+            {'fast': _write('INSERT fast'), 'slow': _write('INSERT slow', delay=0.1)}, transaction_id='t1'))
+        await asyncio.sleep(0.02)
+        # Другой процесс восстанавливает подготовленную транзакцию быстрого участника
+        summary = await TwoPhaseCommitCoordinator(log, {'fast': fast, 'slow': slow}).recover()
+        self.assertEqual(summary['rolled_back'], 1)
+        result = await running
+        self.assertIs(result.state, TransactionState.ROLLED_BACK)
+        self.assertIn('decision_log', result.errors)
+        self.assertEqual((fast.committed, slow.committed, slow.prepared), ([], [], {}))
+        self.assertEqual(log.decisions['t1'][0], 'abort')
+
+    def test_max_prepared_defaults_to_config(self):
+        config = PostgresConfig(MAX_PREPARED_TRANSACTIONS=7)
+        coordinator = TwoPhaseCommitCoordinator(FakeLogPool(), {'main': FakeParticipant()}, config=config)
+        self.assertEqual(coordinator.max_prepared, 7)
+
+    async def test_identifiers_are_validated(self):
+        with self.assertRaises(ValueError):
+            TwoPhaseCommitCoordinator(FakeLogPool(), {"main'; --": FakeParticipant()})
+        coordinator = TwoPhaseCommitCoordinator(FakeLogPool(), {'main': FakeParticipant()})
+        with self.assertRaises(ValueError):
+            await coordinator.execute({'main': _write('INSERT')}, transaction_id="t'1")
+        with self.assertRaises(ValueError):
+            await coordinator.execute({'other': _write('INSERT')})
+
+if __name__ == '__main__':
+    unittest.main()
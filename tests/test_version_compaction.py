@@ -0,0 +1,107 @@
+import unittest
+from contextlib import asynccontextmanager
+from asyncpg import LockNotAvailableError
+from green_platform.core.data_analysis.infrastructure.database.version_compaction import (JOB_NAME, RetentionPolicy,
+                                                                                          VersionCompactor)
+
+class FakeConnection:
+    """Порции деревьев по 2 из отсортированного списка; у каждого дерева по одной устаревшей версии"""
+
+    def __init__(self, tree_ids, checkpoint=None):
+        self.tree_ids = sorted(tree_ids)
+        self.checkpoints = {JOB_NAME: checkpoint} if checkpoint else {}
+        self.deleted = []
+        self.fail_next = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        saved = dict(self.checkpoints), list(self.deleted)
+        try:
+            yield
+        except Exception:
+            self.checkpoints, self.deleted = saved
+            raise
+
+    async def fetchval(self, query, *args):
+        if 'pg_total_relation_size' in query:
+            return 1000 - 10 * len(self.deleted)
+        return self.checkpoints.get(args[0])
+
+    async def execute(self, query, *args):
+        if query.startswith('DELETE FROM maintenance_checkpoints'):
+            self.checkpoints.pop(args[0], None)
+        elif 'INSERT INTO maintenance_checkpoints' in query:
+            self.checkpoints[args[0]] = args[1]
+
+    async def fetchrow(self, query, *args):
+        if 'WITH chunk' in query:
+            position, limit = args[0], args[1]
+            chunk = [tree_id for tree_id in self.tree_ids if position is None or tree_id > position][:limit]
+            return {'tree_count': len(chunk), 'last_tree_id': chunk[-1] if chunk else None,
+                    'expired': [f'{tree_id}-v1' for tree_id in chunk]}
+        if self.fail_next:
+            self.fail_next = False
+            raise LockNotAvailableError('lock timeout')
+        if 'DELETE FROM trees ' in query:
+            self.deleted.extend(args[0])
+        return {'row_count': len(args[0]), 'size': 40 * len(args[0])}
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.connection
+
+class TestRetentionPolicy(unittest.TestCase):
+    def test_latest_version_is_always_kept(self):
+        with self.assertRaises(ValueError):
+            RetentionPolicy(keep_last=0)
+        with self.assertRaises(ValueError):
+            RetentionPolicy(checkpoint_months=-1)
+
+class TestVersionCompactor(unittest.IsolatedAsyncioTestCase):
+    async def test_full_pass_and_report(self):
+        connection = FakeConnection(['a', 'b', 'c', 'd', 'e'])
+        report = await VersionCompactor(FakePool(connection), chunk_size=2, pause=0).run()
+
+        self.assertTrue(report.completed)
+        self.assertEqual((report.chunks, report.trees_scanned), (3, 5))
+        self.assertEqual((report.versions_deleted, report.tree_rows_deleted), (5, 5))
+        self.assertEqual(report.bytes_reclaimed, 400)
+        self.assertEqual(report.table_bytes_before - report.table_bytes_after, 50)
+        # После полного прохода позиция сбрасывается
+        self.assertEqual(connection.checkpoints, {})
+
+    async def test_resume_from_checkpoint(self):
+        connection = FakeConnection(['a', 'b', 'c', 'd', 'e'])
+        compactor = VersionCompactor(FakePool(connection), chunk_size=2, pause=0)
+        first = await compactor.run(max_chunks=1)
+        self.assertFalse(first.completed)
+        self.assertEqual(connection.checkpoints[JOB_NAME], 'b')
+
+        second = await compactor.run()
+        self.assertTrue(second.completed)
+        self.assertEqual(second.trees_scanned, 3)
+        self.assertEqual(connection.deleted, ['a-v1', 'b-v1', 'c-v1', 'd-v1', 'e-v1'])
+
+    async def test_dry_run_changes_nothing(self):
+        connection = FakeConnection(['a', 'b', 'c'], checkpoint='a')
+        report = await VersionCompactor(FakePool(connection), chunk_size=2, pause=0).run(dry_run=True)
+
+        self.assertEqual((report.trees_scanned, report.versions_deleted), (2, 2))
+        self.assertEqual(connection.deleted, [])
+        self.assertEqual(connection.checkpoints, {JOB_NAME: 'a'})
+
+    async def test_failed_chunk_is_retried(self):
+        connection = FakeConnection(['a', 'b'])
+        connection.fail_next = True
+        report = await VersionCompactor(FakePool(connection), chunk_size=2, pause=0).run()
+
+        self.assertTrue(report.completed)
+        self.assertEqual(connection.deleted, ['a-v1', 'b-v1'])
+        self.assertEqual(report.versions_deleted, 2)
+
+if __name__ == '__main__':
+    unittest.main()